@@ -238,6 +238,28 @@ class Config:
         logger.info(f"图片服务商配置验证通过: {provider_name} (type={provider_type})")
         return provider_config
 
+    @classmethod
+    def get_generation_max_concurrent(cls) -> int:
+        """
+        获取图片生成的进程级全局并发上限
+
+        优先读取环境变量 GENERATION_MAX_CONCURRENT，其次读取 image_providers.yaml 顶层的 max_concurrent
+        """
+        from backend.services.scheduler import GenerationScheduler
+
+        value = os.getenv('GENERATION_MAX_CONCURRENT')
+        if not value:
+            try:
+                value = cls.load_image_providers_config().get('max_concurrent')
+            except ValueError:
+                value = None
+
+        try:
+            return max(1, int(value)) if value else GenerationScheduler.DEFAULT_MAX_CONCURRENT
+        except (TypeError, ValueError):
+            logger.warning(f"无效的全局并发配置: {value}，使用默认值")
+            return GenerationScheduler.DEFAULT_MAX_CONCURRENT
+
     @classmethod
     def reload_config(cls):
         """重新加载配置（清除缓存）"""
@@ -1,6 +1,9 @@
 """图片生成器抽象基类"""
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
+from ..utils.b64_stream import write_file_atomic
+from ..utils.rate_limiter import ProviderRateLimits
 
 
 class ImageGeneratorBase(ABC):
@@ -17,6 +20,9 @@ class ImageGeneratorBase(ABC):
         self.api_key = config.get('api_key')
         self.base_url = config.get('base_url')
 
+        # 主动限流（服务商配置 rpm / ipm，未配置时不限流）
+        self.rate_limits = ProviderRateLimits(config)
+
     @abstractmethod
     def generate_image(
         self,
@@ -35,6 +41,63 @@ class ImageGeneratorBase(ABC):
         """
         pass
 
+    async def generate_image_async(
+        self,
+        prompt: str,
+        **kwargs
+    ) -> bytes:
+        """
+        异步生成图片
+
+        默认实现把同步的 generate_image 放到线程中执行；
+        子类应覆盖此方法提供原生异步实现，避免占用线程。
+
+        Args:
+            prompt: 提示词
+            **kwargs: 其他参数（与 generate_image 相同）
+
+        Returns:
+            图片二进制数据
+        """
+        return await asyncio.to_thread(self.generate_image, prompt, **kwargs)
+
+    def generate_image_to_file(
+        self,
+        prompt: str,
+        dest_path: str,
+        **kwargs
+    ) -> int:
+        """
+        生成图片并写入文件（先写临时文件再原子重命名）
+
+        默认实现先得到完整的图片数据再写盘；
+        支持流式响应的子类可以覆盖此方法，边接收边解码写盘。
+
+        Args:
+            prompt: 提示词
+            dest_path: 目标文件路径
+            **kwargs: 其他参数（与 generate_image 相同）
+
+        Returns:
+            写入的图片字节数
+        """
+        image_data = self.generate_image(prompt, **kwargs)
+        write_file_atomic(dest_path, image_data)
+        return len(image_data)
+
+    async def generate_image_to_file_async(
+        self,
+        prompt: str,
+        dest_path: str,
+        **kwargs
+    ) -> int:
+        """
+        异步生成图片并写入文件（参数和返回值同 generate_image_to_file）
+        """
+        image_data = await self.generate_image_async(prompt, **kwargs)
+        await asyncio.to_thread(write_file_atomic, dest_path, image_data)
+        return len(image_data)
+
     @abstractmethod
     def validate_config(self) -> bool:
         """
@@ -1,4 +1,5 @@
 """Google GenAI 图片生成器"""
+import asyncio
 import logging
 import time
 import random
@@ -8,7 +9,8 @@ from typing import Dict, Any, Optional
 from google import genai
 from google.genai import types
 from .base import ImageGeneratorBase
-from ..utils.image_compressor import compress_image
+from ..services.scheduler import attempt_slot
+from ..utils.image_cache import get_image_cache
 
 logger = logging.getLogger(__name__)
 
@@ -279,9 +281,68 @@ def parse_genai_error(error: Exception) -> str:
     )
 
 
+def _retry_wait_time(error: Exception, attempt: int, max_retries: int, base_delay: float) -> float:
+    """
+    根据错误类型计算重试等待时间
+
+    不可重试或重试次数耗尽时，直接抛出解析后的友好错误
+    """
+    error_str = str(error).lower()
+
+    # 不可重试的错误类型
+    non_retryable = [
+        "401", "unauthenticated",  # 认证错误
+        "403", "permission_denied", "forbidden",  # 权限错误
+        "404", "not_found",  # 资源不存在
+        "invalid_argument",  # 参数错误
+        "safety", "blocked", "filter",  # 安全过滤
+    ]
+
+    should_retry = True
+    for keyword in non_retryable:
+        if keyword in error_str:
+            should_retry = False
+            break
+
+    if not should_retry:
+        # 直接抛出，不重试
+        raise Exception(parse_genai_error(error))
+
+    # 重试次数耗尽
+    if attempt >= max_retries - 1:
+        raise Exception(parse_genai_error(error))
+
+    # 可重试的错误
+    if "429" in error_str or "resource_exhausted" in error_str:
+        wait_time = (base_delay ** attempt) + random.uniform(0, 1)
+        logger.warning(f"⏳ 遇到速率限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
+    else:
+        wait_time = min(2 ** attempt, 10) + random.uniform(0, 1)
+        logger.warning(f"⚠️ 请求失败，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
+    return wait_time
+
+
 def retry_on_error(max_retries=5, base_delay=3):
-    """智能重试装饰器，根据错误类型决定是否重试"""
+    """智能重试装饰器，根据错误类型决定是否重试（同时支持同步函数和协程函数）"""
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                last_error = None
+                for attempt in range(max_retries):
+                    try:
+                        # 先取得限流令牌再申请生成槽位（每次尝试单独申请），等待令牌和退避期间都不占用槽位
+                        await args[0].rate_limits.acquire_async(images=True)
+                        async with attempt_slot():
+                            return await func(*args, **kwargs)
+                    except Exception as e:
+                        last_error = e
+                        await asyncio.sleep(_retry_wait_time(e, attempt, max_retries, base_delay))
+
+                # 理论上不会到这里，但保险起见
+                raise Exception(parse_genai_error(last_error))
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             last_error = None
@@ -290,40 +351,7 @@ def retry_on_error(max_retries=5, base_delay=3):
                     return func(*args, **kwargs)
                 except Exception as e:
                     last_error = e
-                    error_str = str(e).lower()
-
-                    # 不可重试的错误类型
-                    non_retryable = [
-                        "401", "unauthenticated",  # 认证错误
-                        "403", "permission_denied", "forbidden",  # 权限错误
-                        "404", "not_found",  # 资源不存在
-                        "invalid_argument",  # 参数错误
-                        "safety", "blocked", "filter",  # 安全过滤
-                    ]
-
-                    should_retry = True
-                    for keyword in non_retryable:
-                        if keyword in error_str:
-                            should_retry = False
-                            break
-
-                    if not should_retry:
-                        # 直接抛出，不重试
-                        raise Exception(parse_genai_error(e))
-
-                    # 可重试的错误
-                    if attempt < max_retries - 1:
-                        if "429" in error_str or "resource_exhausted" in error_str:
-                            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
-                            logger.warning(f"⏳ 遇到速率限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
-                        else:
-                            wait_time = min(2 ** attempt, 10) + random.uniform(0, 1)
-                            logger.warning(f"⚠️ 请求失败，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
-                        time.sleep(wait_time)
-                        continue
-
-                    # 重试次数耗尽
-                    raise Exception(parse_genai_error(e))
+                    time.sleep(_retry_wait_time(e, attempt, max_retries, base_delay))
 
             # 理论上不会到这里，但保险起见
             raise Exception(parse_genai_error(last_error))
@@ -406,6 +434,61 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
             图片二进制数据
         """
         logger.info(f"Google GenAI 生成图片: model={model}, aspect_ratio={aspect_ratio}")
+        contents, generate_content_config = self._build_request(prompt, aspect_ratio, temperature, reference_image)
+        self.rate_limits.acquire(images=True)
+
+        image_data = None
+        logger.debug(f"  开始调用 API: model={model}")
+        for chunk in self.client.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=generate_content_config,
+        ):
+            image_data = self._extract_image_data(chunk)
+            if image_data:
+                break
+
+        return self._check_image_data(image_data)
+
+    @retry_on_error(max_retries=5, base_delay=3)
+    async def generate_image_async(
+        self,
+        prompt: str,
+        aspect_ratio: str = "3:4",
+        temperature: float = 1.0,
+        model: str = "gemini-3-pro-image-preview",
+        reference_image: Optional[bytes] = None,
+        **kwargs
+    ) -> bytes:
+        """异步生成图片（参数同 generate_image，使用 SDK 的 aio 客户端）"""
+        logger.info(f"Google GenAI 异步生成图片: model={model}, aspect_ratio={aspect_ratio}")
+        # 参考图压缩在线程池中执行，不占用共享事件循环
+        contents, generate_content_config = await asyncio.to_thread(
+            self._build_request, prompt, aspect_ratio, temperature, reference_image
+        )
+
+        image_data = None
+        logger.debug(f"  开始调用异步 API: model={model}")
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=generate_content_config,
+        )
+        async for chunk in stream:
+            image_data = self._extract_image_data(chunk)
+            if image_data:
+                break
+
+        return self._check_image_data(image_data)
+
+    def _build_request(
+        self,
+        prompt: str,
+        aspect_ratio: str,
+        temperature: float,
+        reference_image: Optional[bytes]
+    ):
+        """构建请求内容和生成配置"""
         logger.debug(f"  prompt 长度: {len(prompt)} 字符, 有参考图: {reference_image is not None}")
 
         # 构建 parts 列表
@@ -414,8 +497,8 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
         # 如果有参考图，先添加参考图和说明
         if reference_image:
             logger.debug(f"  添加参考图片 ({len(reference_image)} bytes)")
-            # 压缩参考图到 200KB 以内
-            compressed_ref = compress_image(reference_image, max_size_kb=200)
+            # 压缩参考图到 200KB 以内（同一张参考图在各页请求间只压缩一次）
+            compressed_ref = get_image_cache().compress(reference_image, max_size_kb=200)
             logger.debug(f"  参考图压缩后: {len(compressed_ref)} bytes")
             # 添加参考图
             parts.append(types.Part(
@@ -464,21 +547,22 @@ class GoogleGenAIGenerator(ImageGeneratorBase):
             image_config=types.ImageConfig(**image_config_kwargs),
         )
 
-        image_data = None
-        logger.debug(f"  开始调用 API: model={model}")
-        for chunk in self.client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                for part in chunk.candidates[0].content.parts:
-                    # 检查是否有图片数据
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        image_data = part.inline_data.data
-                        logger.debug(f"  收到图片数据: {len(image_data)} bytes")
-                        break
-
+        return contents, generate_content_config
+
+    @staticmethod
+    def _extract_image_data(chunk) -> Optional[bytes]:
+        """从流式响应块中提取图片数据"""
+        if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+            for part in chunk.candidates[0].content.parts:
+                # 检查是否有图片数据
+                if hasattr(part, 'inline_data') and part.inline_data:
+                    logger.debug(f"  收到图片数据: {len(part.inline_data.data)} bytes")
+                    return part.inline_data.data
+        return None
+
+    @staticmethod
+    def _check_image_data(image_data: Optional[bytes]) -> bytes:
+        """校验最终得到的图片数据"""
         if not image_data:
             logger.error("API 返回为空，未生成图片")
             raise ValueError(
@@ -1,19 +1,48 @@
 """Image API 图片生成器"""
+import asyncio
 import logging
+import re
 import time
 import random
 import base64
+from functools import wraps
+import httpx
 import requests
 from typing import Dict, Any, Optional, List, Union
 from .base import ImageGeneratorBase
-from ..utils.image_compressor import compress_image
+from ..services.scheduler import attempt_slot
+from ..utils.b64_stream import (
+    STREAM_CHUNK_SIZE, AsyncBase64JsonFileWriter, Base64JsonFileWriter, write_file_atomic
+)
+from ..utils.http_client import get_async_client, get_pool_size, get_session, get_timeouts
+from ..utils.image_cache import get_image_cache
 
 logger = logging.getLogger(__name__)
 
 
 def retry_on_error(max_retries: int = 3, base_delay: float = 2):
-    """错误重试装饰器"""
+    """错误重试装饰器（同时支持同步函数和协程函数）"""
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                last_error = None
+                for attempt in range(max_retries):
+                    try:
+                        # 先取得限流令牌再申请生成槽位（每次尝试单独申请），等待令牌和退避期间都不占用槽位
+                        await args[0].rate_limits.acquire_async(images=True)
+                        async with attempt_slot():
+                            return await func(*args, **kwargs)
+                    except Exception as e:
+                        last_error = e
+                        if attempt < max_retries - 1:
+                            delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
+                            logger.warning(f"请求失败，{delay:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries}): {str(e)[:100]}")
+                            await asyncio.sleep(delay)
+                raise last_error
+            return async_wrapper
+
+        @wraps(func)
         def wrapper(*args, **kwargs):
             last_error = None
             for attempt in range(max_retries):
@@ -53,6 +82,11 @@ class ImageApiGenerator(ImageGeneratorBase):
             endpoint_type = '/' + endpoint_type
         self.endpoint_type = endpoint_type
 
+        # 连接池与超时配置（连接池大小与调度器中该服务商的并发上限一致）
+        self.pool_size = get_pool_size(config)
+        self.connect_timeout, self.read_timeout, self.download_timeout = get_timeouts(config)
+        self.session = get_session(self.base_url, self.pool_size)
+
         logger.info(f"ImageApiGenerator 初始化完成: base_url={self.base_url}, model={self.model}, endpoint={self.endpoint_type}")
 
     def validate_config(self) -> bool:
@@ -98,6 +132,97 @@ class ImageApiGenerator(ImageGeneratorBase):
         Returns:
             生成的图片二进制数据
         """
+        aspect_ratio, model = self._prepare_request(aspect_ratio, model)
+        self.rate_limits.acquire(images=True)
+
+        # 根据端点类型选择不同的生成方式
+        if self._is_chat_endpoint():
+            return self._generate_via_chat_api(prompt, aspect_ratio, model, reference_image, reference_images)
+        else:
+            return self._generate_via_images_api(prompt, aspect_ratio, model, reference_image, reference_images)
+
+    @retry_on_error(max_retries=3, base_delay=2)
+    async def generate_image_async(
+        self,
+        prompt: str,
+        aspect_ratio: str = None,
+        temperature: float = 1.0,
+        model: str = None,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None,
+        **kwargs
+    ) -> bytes:
+        """异步生成图片（参数同 generate_image）"""
+        aspect_ratio, model = self._prepare_request(aspect_ratio, model)
+
+        if self._is_chat_endpoint():
+            return await self._generate_via_chat_api_async(prompt, aspect_ratio, model, reference_image, reference_images)
+        else:
+            return await self._generate_via_images_api_async(prompt, aspect_ratio, model, reference_image, reference_images)
+
+    @retry_on_error(max_retries=3, base_delay=2)
+    def generate_image_to_file(
+        self,
+        prompt: str,
+        dest_path: str,
+        aspect_ratio: str = None,
+        temperature: float = 1.0,
+        model: str = None,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None,
+        **kwargs
+    ) -> int:
+        """
+        生成图片并写入文件
+
+        images 端点边接收响应边解码写盘，内存中只保留固定大小的缓冲区；
+        chat 端点的图片可能嵌在文本或 URL 中，仍按完整响应解析。
+
+        Args:
+            dest_path: 目标文件路径
+            其余参数同 generate_image
+
+        Returns:
+            写入的图片字节数
+        """
+        aspect_ratio, model = self._prepare_request(aspect_ratio, model)
+        self.rate_limits.acquire(images=True)
+
+        if self._is_chat_endpoint():
+            image_data = self._generate_via_chat_api(prompt, aspect_ratio, model, reference_image, reference_images)
+            write_file_atomic(dest_path, image_data)
+            return len(image_data)
+        return self._stream_images_api_to_file(
+            prompt, dest_path, aspect_ratio, model, reference_image, reference_images
+        )
+
+    @retry_on_error(max_retries=3, base_delay=2)
+    async def generate_image_to_file_async(
+        self,
+        prompt: str,
+        dest_path: str,
+        aspect_ratio: str = None,
+        temperature: float = 1.0,
+        model: str = None,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None,
+        **kwargs
+    ) -> int:
+        """异步生成图片并写入文件（参数同 generate_image_to_file）"""
+        aspect_ratio, model = self._prepare_request(aspect_ratio, model)
+
+        if self._is_chat_endpoint():
+            image_data = await self._generate_via_chat_api_async(
+                prompt, aspect_ratio, model, reference_image, reference_images
+            )
+            await asyncio.to_thread(write_file_atomic, dest_path, image_data)
+            return len(image_data)
+        return await self._stream_images_api_to_file_async(
+            prompt, dest_path, aspect_ratio, model, reference_image, reference_images
+        )
+
+    def _prepare_request(self, aspect_ratio: Optional[str], model: Optional[str]):
+        """校验配置并补全默认参数"""
         self.validate_config()
 
         if aspect_ratio is None:
@@ -107,27 +232,46 @@ class ImageApiGenerator(ImageGeneratorBase):
             model = self.model
 
         logger.info(f"Image API 生成图片: model={model}, aspect_ratio={aspect_ratio}, endpoint={self.endpoint_type}")
+        return aspect_ratio, model
 
-        # 根据端点类型选择不同的生成方式
-        if 'chat' in self.endpoint_type or 'completions' in self.endpoint_type:
-            return self._generate_via_chat_api(prompt, aspect_ratio, model, reference_image, reference_images)
-        else:
-            return self._generate_via_images_api(prompt, aspect_ratio, model, reference_image, reference_images)
+    def _is_chat_endpoint(self) -> bool:
+        """当前端点是否为 chat/completions 类型"""
+        return 'chat' in self.endpoint_type or 'completions' in self.endpoint_type
 
-    def _generate_via_images_api(
+    def _get_headers(self) -> Dict[str, str]:
+        """构建请求头"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """获取当前事件循环的异步 HTTP 客户端"""
+        # 按上游地址共享，服务实例因配置更新重建时复用已有连接池
+        return get_async_client(self.base_url, self.pool_size, self.connect_timeout, self.read_timeout)
+
+    @staticmethod
+    def _collect_reference_images(
+        reference_image: Optional[bytes],
+        reference_images: Optional[List[bytes]]
+    ) -> List[bytes]:
+        """收集所有参考图片"""
+        all_reference_images = []
+        if reference_images and len(reference_images) > 0:
+            all_reference_images.extend(reference_images)
+        if reference_image and reference_image not in all_reference_images:
+            all_reference_images.append(reference_image)
+        return all_reference_images
+
+    def _build_images_payload(
         self,
         prompt: str,
         aspect_ratio: str,
         model: str,
         reference_image: Optional[bytes] = None,
         reference_images: Optional[List[bytes]] = None
-    ) -> bytes:
-        """通过 /v1/images/generations 端点生成图片"""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-
+    ) -> Dict[str, Any]:
+        """构建 /v1/images/generations 请求体"""
         payload = {
             "model": model,
             "prompt": prompt,
@@ -136,25 +280,14 @@ class ImageApiGenerator(ImageGeneratorBase):
             "image_size": self.image_size
         }
 
-        # 收集所有参考图片
-        all_reference_images = []
-        if reference_images and len(reference_images) > 0:
-            all_reference_images.extend(reference_images)
-        if reference_image and reference_image not in all_reference_images:
-            all_reference_images.append(reference_image)
+        all_reference_images = self._collect_reference_images(reference_image, reference_images)
 
         # 如果有参考图片，添加到 image 数组
         if all_reference_images:
             logger.debug(f"  添加 {len(all_reference_images)} 张参考图片")
-            image_uris = []
-            for idx, img_data in enumerate(all_reference_images):
-                compressed_img = compress_image(img_data, max_size_kb=200)
-                logger.debug(f"  参考图 {idx}: {len(img_data)} -> {len(compressed_img)} bytes")
-                base64_image = base64.b64encode(compressed_img).decode('utf-8')
-                data_uri = f"data:image/png;base64,{base64_image}"
-                image_uris.append(data_uri)
-
-            payload["image"] = image_uris
+            # 同一张参考图在各页请求间只压缩和编码一次
+            cache = get_image_cache()
+            payload["image"] = [cache.data_uri(img_data, max_size_kb=200) for img_data in all_reference_images]
 
             ref_count = len(all_reference_images)
             enhanced_prompt = f"""参考提供的 {ref_count} 张图片的风格（色彩、光影、构图、氛围），生成一张新图片。
@@ -168,24 +301,43 @@ class ImageApiGenerator(ImageGeneratorBase):
 4. 如果参考图中有人物或产品，可以适当融入"""
             payload["prompt"] = enhanced_prompt
 
-        api_url = f"{self.base_url}{self.endpoint_type}"
-        logger.debug(f"  发送请求到: {api_url}")
-        response = requests.post(api_url, headers=headers, json=payload, timeout=300)
+        return payload
+
+    @staticmethod
+    def _images_http_error(response, api_url: str) -> Exception:
+        """构造 /v1/images/generations 请求失败的异常（response 需已读取完整内容）"""
+        error_detail = response.text[:500]
+        logger.error(f"Image API 请求失败: status={response.status_code}, error={error_detail}")
+        return Exception(
+            f"Image API 请求失败 (状态码: {response.status_code})\n"
+            f"错误详情: {error_detail}\n"
+            f"请求地址: {api_url}\n"
+            "可能原因：\n"
+            "1. API密钥无效或已过期\n"
+            "2. 请求参数不符合API要求\n"
+            "3. API服务端错误\n"
+            "4. Base URL配置错误\n"
+            "建议：检查API密钥和base_url配置"
+        )
+
+    @staticmethod
+    def _missing_b64_error(response_snippet: str) -> Exception:
+        """构造响应中没有 b64_json 数据的异常"""
+        logger.error(f"无法从响应中提取图片数据: {response_snippet[:200]}")
+        return Exception(
+            f"图片数据提取失败：未找到 b64_json 数据。\n"
+            f"API响应片段: {response_snippet[:500]}\n"
+            "可能原因：\n"
+            "1. API返回格式与预期不符\n"
+            "2. response_format 参数未生效\n"
+            "3. 该模型不支持 b64_json 格式\n"
+            "建议：检查API文档确认返回格式要求"
+        )
 
+    def _parse_images_response(self, response, api_url: str) -> bytes:
+        """解析 /v1/images/generations 响应（兼容 requests 与 httpx 的 Response）"""
         if response.status_code != 200:
-            error_detail = response.text[:500]
-            logger.error(f"Image API 请求失败: status={response.status_code}, error={error_detail}")
-            raise Exception(
-                f"Image API 请求失败 (状态码: {response.status_code})\n"
-                f"错误详情: {error_detail}\n"
-                f"请求地址: {api_url}\n"
-                "可能原因：\n"
-                "1. API密钥无效或已过期\n"
-                "2. 请求参数不符合API要求\n"
-                "3. API服务端错误\n"
-                "4. Base URL配置错误\n"
-                "建议：检查API密钥和base_url配置"
-            )
+            raise self._images_http_error(response, api_url)
 
         result = response.json()
         logger.debug(f"  API 响应: data 长度={len(result.get('data', []))}")
@@ -203,18 +355,29 @@ class ImageApiGenerator(ImageGeneratorBase):
                 logger.info(f"✅ Image API 图片生成成功: {len(image_data)} bytes")
                 return image_data
 
-        logger.error(f"无法从响应中提取图片数据: {str(result)[:200]}")
-        raise Exception(
-            f"图片数据提取失败：未找到 b64_json 数据。\n"
-            f"API响应片段: {str(result)[:500]}\n"
-            "可能原因：\n"
-            "1. API返回格式与预期不符\n"
-            "2. response_format 参数未生效\n"
-            "3. 该模型不支持 b64_json 格式\n"
-            "建议：检查API文档确认返回格式要求"
+        raise self._missing_b64_error(str(result))
+
+    def _generate_via_images_api(
+        self,
+        prompt: str,
+        aspect_ratio: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> bytes:
+        """通过 /v1/images/generations 端点生成图片"""
+        payload = self._build_images_payload(prompt, aspect_ratio, model, reference_image, reference_images)
+
+        api_url = f"{self.base_url}{self.endpoint_type}"
+        logger.debug(f"  发送请求到: {api_url}")
+        response = self.session.post(
+            api_url, headers=self._get_headers(), json=payload,
+            timeout=(self.connect_timeout, self.read_timeout)
         )
 
-    def _generate_via_chat_api(
+        return self._parse_images_response(response, api_url)
+
+    async def _generate_via_images_api_async(
         self,
         prompt: str,
         aspect_ratio: str,
@@ -222,52 +385,126 @@ class ImageApiGenerator(ImageGeneratorBase):
         reference_image: Optional[bytes] = None,
         reference_images: Optional[List[bytes]] = None
     ) -> bytes:
-        """通过 /v1/chat/completions 端点生成图片（如即梦 API）"""
-        import re
+        """通过 /v1/images/generations 端点异步生成图片"""
+        # 参考图压缩和 base64 编码在线程池中执行，不占用共享事件循环
+        payload = await asyncio.to_thread(
+            self._build_images_payload, prompt, aspect_ratio, model, reference_image, reference_images
+        )
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        api_url = f"{self.base_url}{self.endpoint_type}"
+        logger.debug(f"  发送异步请求到: {api_url}")
+        response = await self._get_async_client().post(api_url, headers=self._get_headers(), json=payload)
 
+        # 解析 JSON 和 base64 解码（几 MB）在线程池中执行，不占用共享事件循环
+        return await asyncio.to_thread(self._parse_images_response, response, api_url)
+
+    def _stream_images_api_to_file(
+        self,
+        prompt: str,
+        dest_path: str,
+        aspect_ratio: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> int:
+        """通过 /v1/images/generations 端点生成图片，流式解码 b64_json 直接写入文件"""
+        payload = self._build_images_payload(prompt, aspect_ratio, model, reference_image, reference_images)
+
+        api_url = f"{self.base_url}{self.endpoint_type}"
+        logger.debug(f"  发送流式请求到: {api_url}")
+        with self.session.post(
+            api_url, headers=self._get_headers(), json=payload,
+            timeout=(self.connect_timeout, self.read_timeout), stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise self._images_http_error(response, api_url)
+
+            with Base64JsonFileWriter(dest_path) as writer:
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    writer.feed(chunk)
+                if not writer.found:
+                    raise self._missing_b64_error(writer.preview)
+                size = writer.finish()
+
+        logger.info(f"✅ Image API 图片生成成功: {size} bytes")
+        return size
+
+    async def _stream_images_api_to_file_async(
+        self,
+        prompt: str,
+        dest_path: str,
+        aspect_ratio: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> int:
+        """通过 /v1/images/generations 端点异步生成图片，流式解码 b64_json 直接写入文件"""
+        payload = await asyncio.to_thread(
+            self._build_images_payload, prompt, aspect_ratio, model, reference_image, reference_images
+        )
+
+        api_url = f"{self.base_url}{self.endpoint_type}"
+        logger.debug(f"  发送异步流式请求到: {api_url}")
+        async with self._get_async_client().stream(
+            'POST', api_url, headers=self._get_headers(), json=payload
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise self._images_http_error(response, api_url)
+
+            # 解码写入和 fsync 在线程池中执行，不占用共享事件循环
+            async with AsyncBase64JsonFileWriter(dest_path) as writer:
+                async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                    await writer.feed(chunk)
+                await writer.flush()
+                if not writer.found:
+                    raise self._missing_b64_error(writer.preview)
+                size = await writer.finish()
+
+        logger.info(f"✅ Image API 图片生成成功: {size} bytes")
+        return size
+
+    def _build_chat_payload(
+        self,
+        prompt: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> Dict[str, Any]:
+        """构建 /v1/chat/completions 请求体"""
         # 构建用户消息内容
         user_content: Any = prompt
 
-        # 收集所有参考图片
-        all_reference_images = []
-        if reference_images and len(reference_images) > 0:
-            all_reference_images.extend(reference_images)
-        if reference_image and reference_image not in all_reference_images:
-            all_reference_images.append(reference_image)
+        all_reference_images = self._collect_reference_images(reference_image, reference_images)
 
         # 如果有参考图片，构建多模态消息
         if all_reference_images:
             logger.debug(f"  添加 {len(all_reference_images)} 张参考图片到 chat 消息")
             content_parts = [{"type": "text", "text": prompt}]
 
-            for idx, img_data in enumerate(all_reference_images):
-                compressed_img = compress_image(img_data, max_size_kb=200)
-                logger.debug(f"  参考图 {idx}: {len(img_data)} -> {len(compressed_img)} bytes")
-                base64_image = base64.b64encode(compressed_img).decode('utf-8')
+            cache = get_image_cache()
+            for img_data in all_reference_images:
                 content_parts.append({
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{base64_image}"}
+                    "image_url": {"url": cache.data_uri(img_data, max_size_kb=200)}
                 })
 
             user_content = content_parts
 
-        payload = {
+        return {
             "model": model,
             "messages": [{"role": "user", "content": user_content}],
             "max_tokens": 4096,
             "temperature": 1.0
         }
 
-        api_url = f"{self.base_url}{self.endpoint_type}"
-        logger.info(f"Chat API 生成图片: {api_url}, model={model}")
-
-        response = requests.post(api_url, headers=headers, json=payload, timeout=300)
+    def _parse_chat_response(self, response, api_url: str, model: str) -> Union[bytes, str]:
+        """
+        解析 /v1/chat/completions 响应
 
+        Returns:
+            图片二进制数据，或需要进一步下载的图片 URL（str）
+        """
         if response.status_code != 200:
             error_detail = response.text[:500]
             status_code = response.status_code
@@ -311,7 +548,7 @@ class ImageApiGenerator(ImageGeneratorBase):
                     urls = re.findall(pattern, content)
                     if urls:
                         logger.info(f"从 Markdown 提取到 {len(urls)} 张图片，下载第一张...")
-                        return self._download_image(urls[0])
+                        return urls[0]
 
                     # Markdown 图片 Base64: ![xxx](data:image/...)
                     base64_pattern = r'!\[.*?\]\((data:image\/[^;]+;base64,[^\s\)]+)\)'
@@ -330,7 +567,7 @@ class ImageApiGenerator(ImageGeneratorBase):
                     # 纯 URL
                     if content.startswith("http://") or content.startswith("https://"):
                         logger.info("检测到图片 URL")
-                        return self._download_image(content.strip())
+                        return content.strip()
 
         raise Exception(
             "❌ 无法从 Chat API 响应中提取图片数据\n\n"
@@ -344,11 +581,60 @@ class ImageApiGenerator(ImageGeneratorBase):
             "2. 修改提示词后重试"
         )
 
+    def _generate_via_chat_api(
+        self,
+        prompt: str,
+        aspect_ratio: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> bytes:
+        """通过 /v1/chat/completions 端点生成图片（如即梦 API）"""
+        payload = self._build_chat_payload(prompt, model, reference_image, reference_images)
+
+        api_url = f"{self.base_url}{self.endpoint_type}"
+        logger.info(f"Chat API 生成图片: {api_url}, model={model}")
+
+        response = self.session.post(
+            api_url, headers=self._get_headers(), json=payload,
+            timeout=(self.connect_timeout, self.read_timeout)
+        )
+
+        image = self._parse_chat_response(response, api_url, model)
+        if isinstance(image, str):
+            return self._download_image(image)
+        return image
+
+    async def _generate_via_chat_api_async(
+        self,
+        prompt: str,
+        aspect_ratio: str,
+        model: str,
+        reference_image: Optional[bytes] = None,
+        reference_images: Optional[List[bytes]] = None
+    ) -> bytes:
+        """通过 /v1/chat/completions 端点异步生成图片"""
+        # 参考图压缩和 base64 编码在线程池中执行，不占用共享事件循环
+        payload = await asyncio.to_thread(
+            self._build_chat_payload, prompt, model, reference_image, reference_images
+        )
+
+        api_url = f"{self.base_url}{self.endpoint_type}"
+        logger.info(f"Chat API 异步生成图片: {api_url}, model={model}")
+
+        response = await self._get_async_client().post(api_url, headers=self._get_headers(), json=payload)
+
+        # 解析 JSON 和 base64 解码（几 MB）在线程池中执行，不占用共享事件循环
+        image = await asyncio.to_thread(self._parse_chat_response, response, api_url, model)
+        if isinstance(image, str):
+            return await self._download_image_async(image)
+        return image
+
     def _download_image(self, url: str) -> bytes:
         """下载图片并返回二进制数据"""
         logger.info(f"下载图片: {url[:100]}...")
         try:
-            response = requests.get(url, timeout=60)
+            response = self.session.get(url, timeout=(self.connect_timeout, self.download_timeout))
             if response.status_code == 200:
                 logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
                 return response.content
@@ -358,3 +644,20 @@ class ImageApiGenerator(ImageGeneratorBase):
             raise Exception("❌ 下载图片超时，请重试")
         except Exception as e:
             raise Exception(f"❌ 下载图片失败: {str(e)}")
+
+    async def _download_image_async(self, url: str) -> bytes:
+        """异步下载图片并返回二进制数据"""
+        logger.info(f"下载图片: {url[:100]}...")
+        try:
+            response = await self._get_async_client().get(
+                url, timeout=httpx.Timeout(self.download_timeout, connect=self.connect_timeout)
+            )
+            if response.status_code == 200:
+                logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
+                return response.content
+            else:
+                raise Exception(f"下载图片失败: HTTP {response.status_code}")
+        except httpx.TimeoutException:
+            raise Exception("❌ 下载图片超时，请重试")
+        except Exception as e:
+            raise Exception(f"❌ 下载图片失败: {str(e)}")
@@ -1,49 +1,83 @@
 """OpenAI 兼容接口图片生成器"""
+import asyncio
 import logging
+import re
 import time
 import random
 import base64
 from functools import wraps
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Union
+import httpx
 import requests
 from .base import ImageGeneratorBase
+from ..services.scheduler import attempt_slot
+from ..utils.http_client import get_async_client, get_pool_size, get_session, get_timeouts
 
 logger = logging.getLogger(__name__)
 
 
+def _retry_wait_time(error: Exception, attempt: int, max_retries: int, base_delay: float) -> Optional[float]:
+    """计算重试等待时间，返回 None 表示不再重试"""
+    if attempt >= max_retries - 1:
+        return None
+
+    error_str = str(error)
+    # 检查是否是速率限制错误
+    if "429" in error_str or "rate" in error_str.lower():
+        wait_time = (base_delay ** attempt) + random.uniform(0, 1)
+        logger.warning(f"遇到速率限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
+        return wait_time
+
+    # 其他错误
+    wait_time = 2 ** attempt
+    logger.warning(f"请求失败: {error_str[:100]}，{wait_time}秒后重试")
+    return wait_time
+
+
+def _retry_exhausted_error(max_retries: int) -> Exception:
+    """重试耗尽时的错误"""
+    logger.error(f"图片生成失败: 重试 {max_retries} 次后仍失败")
+    return Exception(
+        f"图片生成失败：重试 {max_retries} 次后仍失败。\n"
+        "可能原因：\n"
+        "1. API持续限流或配额不足\n"
+        "2. 网络连接持续不稳定\n"
+        "3. API服务暂时不可用\n"
+        "建议：稍后再试，或检查API配额和网络状态"
+    )
+
+
 def retry_on_error(max_retries=5, base_delay=3):
-    """错误自动重试装饰器"""
+    """错误自动重试装饰器（同时支持同步函数和协程函数）"""
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_retries):
+                    try:
+                        # 先取得限流令牌再申请生成槽位（每次尝试单独申请），等待令牌和退避期间都不占用槽位
+                        await args[0].rate_limits.acquire_async(images=True)
+                        async with attempt_slot():
+                            return await func(*args, **kwargs)
+                    except Exception as e:
+                        wait_time = _retry_wait_time(e, attempt, max_retries, base_delay)
+                        if wait_time is None:
+                            raise
+                        await asyncio.sleep(wait_time)
+                raise _retry_exhausted_error(max_retries)
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
-                    error_str = str(e)
-                    # 检查是否是速率限制错误
-                    if "429" in error_str or "rate" in error_str.lower():
-                        if attempt < max_retries - 1:
-                            wait_time = (base_delay ** attempt) + random.uniform(0, 1)
-                            logger.warning(f"遇到速率限制，{wait_time:.1f}秒后重试 (尝试 {attempt + 2}/{max_retries})")
-                            time.sleep(wait_time)
-                            continue
-                    # 其他错误或重试耗尽
-                    if attempt < max_retries - 1:
-                        wait_time = 2 ** attempt
-                        logger.warning(f"请求失败: {error_str[:100]}，{wait_time}秒后重试")
-                        time.sleep(wait_time)
-                        continue
-                    raise
-            logger.error(f"图片生成失败: 重试 {max_retries} 次后仍失败")
-            raise Exception(
-                f"图片生成失败：重试 {max_retries} 次后仍失败。\n"
-                "可能原因：\n"
-                "1. API持续限流或配额不足\n"
-                "2. 网络连接持续不稳定\n"
-                "3. API服务暂时不可用\n"
-                "建议：稍后再试，或检查API配额和网络状态"
-            )
+                    wait_time = _retry_wait_time(e, attempt, max_retries, base_delay)
+                    if wait_time is None:
+                        raise
+                    time.sleep(wait_time)
+            raise _retry_exhausted_error(max_retries)
         return wrapper
     return decorator
 
@@ -84,6 +118,11 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
             endpoint_type = '/v1/chat/completions'
         self.endpoint_type = endpoint_type
 
+        # 连接池与超时配置（连接池大小与调度器中该服务商的并发上限一致）
+        self.pool_size = get_pool_size(config)
+        self.connect_timeout, self.read_timeout, self.download_timeout = get_timeouts(config, default_read=180)
+        self.session = get_session(self.base_url, self.pool_size)
+
         logger.info(f"OpenAICompatibleGenerator 初始化完成: base_url={self.base_url}, model={self.default_model}, endpoint={self.endpoint_type}")
 
     def validate_config(self) -> bool:
@@ -116,32 +155,60 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
             model = self.default_model
 
         logger.info(f"OpenAI 兼容 API 生成图片: model={model}, size={size}, endpoint={self.endpoint_type}")
+        self.rate_limits.acquire(images=True)
 
         # 根据端点路径决定使用哪种 API 方式
-        if 'chat' in self.endpoint_type or 'completions' in self.endpoint_type:
+        if self._is_chat_endpoint():
             return self._generate_via_chat_api(prompt, size, model)
         else:
             # 默认使用 images API
             return self._generate_via_images_api(prompt, size, model, quality)
 
-    def _generate_via_images_api(
+    @retry_on_error(max_retries=5, base_delay=3)
+    async def generate_image_async(
         self,
         prompt: str,
-        size: str,
-        model: str,
-        quality: str
+        size: str = "1024x1024",
+        model: str = None,
+        quality: str = "standard",
+        **kwargs
     ) -> bytes:
-        """通过 images API 端点生成"""
+        """异步生成图片（参数同 generate_image）"""
+        if model is None:
+            model = self.default_model
+
+        logger.info(f"OpenAI 兼容 API 异步生成图片: model={model}, size={size}, endpoint={self.endpoint_type}")
+
+        if self._is_chat_endpoint():
+            return await self._generate_via_chat_api_async(prompt, size, model)
+        else:
+            return await self._generate_via_images_api_async(prompt, size, model, quality)
+
+    def _is_chat_endpoint(self) -> bool:
+        """当前端点是否为 chat/completions 类型"""
+        return 'chat' in self.endpoint_type or 'completions' in self.endpoint_type
+
+    def _get_url(self) -> str:
+        """构建请求地址"""
         # 确保端点以 / 开头
         endpoint = self.endpoint_type if self.endpoint_type.startswith('/') else '/' + self.endpoint_type
-        url = f"{self.base_url}{endpoint}"
-        logger.debug(f"  发送请求到: {url}")
+        return f"{self.base_url}{endpoint}"
 
-        headers = {
+    def _get_headers(self) -> Dict[str, str]:
+        """构建请求头"""
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
 
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """获取当前事件循环的异步 HTTP 客户端"""
+        # 按上游地址共享，服务实例因配置更新重建时复用已有连接池
+        return get_async_client(self.base_url, self.pool_size, self.connect_timeout, self.read_timeout)
+
+    @staticmethod
+    def _build_images_payload(prompt: str, size: str, model: str, quality: str) -> Dict[str, Any]:
+        """构建 images API 请求体"""
         payload = {
             "model": model,
             "prompt": prompt,
@@ -154,8 +221,15 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         if quality and model.startswith('dall-e'):
             payload["quality"] = quality
 
-        response = requests.post(url, headers=headers, json=payload, timeout=180)
+        return payload
 
+    def _parse_images_response(self, response, url: str, model: str) -> Union[bytes, str]:
+        """
+        解析 images API 响应（兼容 requests 与 httpx 的 Response）
+
+        Returns:
+            图片二进制数据，或需要进一步下载的图片 URL（str）
+        """
         if response.status_code != 200:
             error_detail = response.text[:500]
             logger.error(f"OpenAI Images API 请求失败: status={response.status_code}, error={error_detail}")
@@ -199,13 +273,7 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         # 处理URL格式
         elif "url" in image_data:
             logger.debug(f"  下载图片 URL...")
-            img_response = requests.get(image_data["url"], timeout=60)
-            if img_response.status_code == 200:
-                logger.info(f"✅ OpenAI Images API 图片生成成功: {len(img_response.content)} bytes")
-                return img_response.content
-            else:
-                logger.error(f"下载图片失败: {img_response.status_code}")
-                raise Exception(f"下载图片失败: {img_response.status_code}")
+            return image_data["url"]
 
         else:
             logger.error(f"无法从响应中提取图片数据: {str(image_data)[:200]}")
@@ -218,31 +286,66 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
                 "建议：检查API文档确认图片返回格式"
             )
 
-    def _generate_via_chat_api(
+    @staticmethod
+    def _check_url_download(img_response) -> bytes:
+        """校验 images API 返回的 URL 图片下载结果"""
+        if img_response.status_code == 200:
+            logger.info(f"✅ OpenAI Images API 图片生成成功: {len(img_response.content)} bytes")
+            return img_response.content
+        logger.error(f"下载图片失败: {img_response.status_code}")
+        raise Exception(f"下载图片失败: {img_response.status_code}")
+
+    def _generate_via_images_api(
         self,
         prompt: str,
         size: str,
-        model: str
+        model: str,
+        quality: str
     ) -> bytes:
-        """
-        通过 chat/completions 端点生成图片
+        """通过 images API 端点生成"""
+        url = self._get_url()
+        logger.debug(f"  发送请求到: {url}")
 
-        支持多种返回格式：
-        1. Markdown 图片链接: ![xxx](url) - 即梦、部分中转站使用
-        2. Base64 data URL: data:image/xxx;base64,xxx
-        3. 纯图片 URL
-        """
-        # 确保端点以 / 开头
-        endpoint = self.endpoint_type if self.endpoint_type.startswith('/') else '/' + self.endpoint_type
-        url = f"{self.base_url}{endpoint}"
-        logger.info(f"Chat API 生成图片: {url}, model={model}")
+        payload = self._build_images_payload(prompt, size, model, quality)
+        response = self.session.post(
+            url, headers=self._get_headers(), json=payload,
+            timeout=(self.connect_timeout, self.read_timeout)
+        )
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        image = self._parse_images_response(response, url, model)
+        if isinstance(image, str):
+            return self._check_url_download(
+                self.session.get(image, timeout=(self.connect_timeout, self.download_timeout))
+            )
+        return image
 
-        payload = {
+    async def _generate_via_images_api_async(
+        self,
+        prompt: str,
+        size: str,
+        model: str,
+        quality: str
+    ) -> bytes:
+        """通过 images API 端点异步生成"""
+        url = self._get_url()
+        logger.debug(f"  发送异步请求到: {url}")
+
+        payload = self._build_images_payload(prompt, size, model, quality)
+        client = self._get_async_client()
+        response = await client.post(url, headers=self._get_headers(), json=payload)
+
+        # 解析 JSON 和 base64 解码（几 MB）在线程池中执行，不占用共享事件循环
+        image = await asyncio.to_thread(self._parse_images_response, response, url, model)
+        if isinstance(image, str):
+            return self._check_url_download(await client.get(
+                image, timeout=httpx.Timeout(self.download_timeout, connect=self.connect_timeout)
+            ))
+        return image
+
+    @staticmethod
+    def _build_chat_payload(prompt: str, model: str) -> Dict[str, Any]:
+        """构建 chat/completions 请求体"""
+        return {
             "model": model,
             "messages": [
                 {
@@ -254,8 +357,18 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
             "temperature": 1.0
         }
 
-        response = requests.post(url, headers=headers, json=payload, timeout=180)
+    def _parse_chat_response(self, response, url: str, model: str) -> Union[bytes, str]:
+        """
+        解析 chat/completions 响应
+
+        支持多种返回格式：
+        1. Markdown 图片链接: ![xxx](url) - 即梦、部分中转站使用
+        2. Base64 data URL: data:image/xxx;base64,xxx
+        3. 纯图片 URL
 
+        Returns:
+            图片二进制数据，或需要进一步下载的图片 URL（str）
+        """
         if response.status_code != 200:
             error_detail = response.text[:500]
             status_code = response.status_code
@@ -300,7 +413,7 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
                     if image_urls:
                         # 下载第一张图片
                         logger.info(f"从 Markdown 提取到 {len(image_urls)} 张图片，下载第一张...")
-                        return self._download_image(image_urls[0])
+                        return image_urls[0]
 
                     # 2. 尝试解析 Base64 data URL
                     if content.startswith("data:image"):
@@ -311,7 +424,7 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
                     # 3. 尝试作为纯 URL 处理
                     if content.startswith("http://") or content.startswith("https://"):
                         logger.info("检测到图片 URL")
-                        return self._download_image(content.strip())
+                        return content.strip()
 
         raise ValueError(
             "❌ 无法从 Chat API 响应中提取图片数据\n\n"
@@ -325,13 +438,52 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
             "2. 修改提示词后重试"
         )
 
+    def _generate_via_chat_api(
+        self,
+        prompt: str,
+        size: str,
+        model: str
+    ) -> bytes:
+        """通过 chat/completions 端点生成图片"""
+        url = self._get_url()
+        logger.info(f"Chat API 生成图片: {url}, model={model}")
+
+        payload = self._build_chat_payload(prompt, model)
+        response = self.session.post(
+            url, headers=self._get_headers(), json=payload,
+            timeout=(self.connect_timeout, self.read_timeout)
+        )
+
+        image = self._parse_chat_response(response, url, model)
+        if isinstance(image, str):
+            return self._download_image(image)
+        return image
+
+    async def _generate_via_chat_api_async(
+        self,
+        prompt: str,
+        size: str,
+        model: str
+    ) -> bytes:
+        """通过 chat/completions 端点异步生成图片"""
+        url = self._get_url()
+        logger.info(f"Chat API 异步生成图片: {url}, model={model}")
+
+        payload = self._build_chat_payload(prompt, model)
+        response = await self._get_async_client().post(url, headers=self._get_headers(), json=payload)
+
+        # 解析 JSON 和 base64 解码（几 MB）在线程池中执行，不占用共享事件循环
+        image = await asyncio.to_thread(self._parse_chat_response, response, url, model)
+        if isinstance(image, str):
+            return await self._download_image_async(image)
+        return image
+
     def _extract_markdown_image_urls(self, content: str) -> list:
         """
         从 Markdown 内容中提取图片 URL
 
         支持格式: ![alt text](url) 或 ![](url)
         """
-        import re
         # 匹配 ![任意文字](url) 格式
         pattern = r'!\[.*?\]\((https?://[^\s\)]+)\)'
         urls = re.findall(pattern, content)
@@ -342,7 +494,7 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         """下载图片并返回二进制数据"""
         logger.info(f"下载图片: {url[:100]}...")
         try:
-            response = requests.get(url, timeout=60)
+            response = self.session.get(url, timeout=(self.connect_timeout, self.download_timeout))
             if response.status_code == 200:
                 logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
                 return response.content
@@ -353,6 +505,23 @@ class OpenAICompatibleGenerator(ImageGeneratorBase):
         except Exception as e:
             raise Exception(f"❌ 下载图片失败: {str(e)}")
 
+    async def _download_image_async(self, url: str) -> bytes:
+        """异步下载图片并返回二进制数据"""
+        logger.info(f"下载图片: {url[:100]}...")
+        try:
+            response = await self._get_async_client().get(
+                url, timeout=httpx.Timeout(self.download_timeout, connect=self.connect_timeout)
+            )
+            if response.status_code == 200:
+                logger.info(f"✅ 图片下载成功: {len(response.content)} bytes")
+                return response.content
+            else:
+                raise Exception(f"下载图片失败: HTTP {response.status_code}")
+        except httpx.TimeoutException:
+            raise Exception("❌ 下载图片超时，请重试")
+        except Exception as e:
+            raise Exception(f"❌ 下载图片失败: {str(e)}")
+
     def get_supported_sizes(self) -> list:
         """获取支持的图片尺寸"""
         # 默认OpenAI支持的尺寸
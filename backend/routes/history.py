@@ -79,17 +79,25 @@ def list_history():
         page = int(request.args.get('page', 1))
         page_size = int(request.args.get('page_size', 20))
         status = request.args.get('status')
+        # 游标分页：传入上一页返回的 next_cursor
+        cursor = request.args.get('cursor')
 
         storage = get_storage()
         result = storage.get_user_history_records(
             user_id=user.id,
             page=page,
             page_size=page_size,
-            status=status
+            status=status,
+            cursor=cursor
         )
 
         return jsonify(result)
 
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'参数错误：{str(e)}'
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -251,12 +259,11 @@ def get_history_stats():
 
     try:
         storage = get_storage()
-        # 这里需要实现统计逻辑
-        # 暂时返回空统计
+        stats = storage.get_user_history_stats(user.id)
         return jsonify({
             'success': True,
-            'total': 0,
-            'by_status': {}
+            **stats,
+            'record_cache': storage.get_history_cache_stats()
         })
 
     except Exception as e:
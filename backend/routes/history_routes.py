@@ -10,11 +10,12 @@
 """
 
 import os
-import io
-import zipfile
 import logging
-from flask import Blueprint, request, jsonify, send_file
+from urllib.parse import quote
+from flask import Blueprint, Response, request, jsonify, send_file
 from backend.services.history import get_history_service
+from backend.services.task_archive import get_task_archives
+from backend.utils.zip_stream import StreamingZip
 from backend.routes.auth import get_current_user
 
 logger = logging.getLogger(__name__)
@@ -76,26 +77,37 @@ def create_history_blueprint():
         - page: 页码（默认 1）
         - page_size: 每页数量（默认 20）
         - status: 状态过滤（可选：all/completed/draft）
+        - cursor: 游标（可选，上一页返回的 next_cursor；传入时忽略 page）
+        - with_total: 游标分页时是否统计总数（默认 false，第一页已返回总数）
 
         返回：
         - success: 是否成功
         - records: 记录列表
-        - total: 总数
-        - total_pages: 总页数
+        - total: 总数（游标分页且未指定 with_total 时为 null）
+        - total_pages: 总页数（同上）
+        - next_cursor: 下一页游标（没有更多记录时为 null）
         """
         try:
             page = int(request.args.get('page', 1))
             page_size = int(request.args.get('page_size', 20))
             status = request.args.get('status')
+            cursor = request.args.get('cursor')
+            with_total = request.args.get('with_total', 'false').lower() == 'true'
 
             history_service = get_history_service()
-            result = history_service.list_records(page, page_size, status)
+            result = history_service.list_records(page, page_size, status, cursor=cursor, with_total=with_total)
 
             return jsonify({
                 "success": True,
                 **result
             }), 200
 
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": f"参数错误：{str(e)}"
+            }), 400
+
         except Exception as e:
             error_msg = str(e)
             return jsonify({
@@ -224,17 +236,23 @@ def create_history_blueprint():
     @history_bp.route('/history/search', methods=['GET'])
     def search_history():
         """
-        搜索历史记录
+        全文搜索历史记录（标题和大纲内容，按相关度排序）
 
         查询参数：
         - keyword: 搜索关键词（必填）
+        - page: 页码（默认 1）
+        - page_size: 每页数量（默认 20）
 
         返回：
         - success: 是否成功
-        - records: 匹配的记录列表
+        - records: 匹配的记录列表（带相关度 score）
+        - total: 匹配总数
+        - page / page_size / total_pages: 分页信息
         """
         try:
             keyword = request.args.get('keyword', '')
+            page = int(request.args.get('page', 1))
+            page_size = int(request.args.get('page_size', 20))
 
             if not keyword:
                 return jsonify({
@@ -243,11 +261,11 @@ def create_history_blueprint():
                 }), 400
 
             history_service = get_history_service()
-            results = history_service.search_records(keyword)
+            result = history_service.search_records(keyword, page=page, page_size=page_size)
 
             return jsonify({
                 "success": True,
-                "records": results
+                **result
             }), 200
 
         except Exception as e:
@@ -266,6 +284,10 @@ def create_history_blueprint():
         - success: 是否成功
         - total: 总记录数
         - by_status: 按状态分组的统计
+        - last_24h: 最近 24 小时新建的记录数
+        - last_7d: 最近 7 天新建的记录数
+        - record_cache: 记录读缓存指标（条目数/命中/未命中/过期/命中率）
+        - archives: 下载归档预生成指标（是否启用/排队数/已生成/失败）
         """
         try:
             history_service = get_history_service()
@@ -273,7 +295,9 @@ def create_history_blueprint():
 
             return jsonify({
                 "success": True,
-                **stats
+                **stats,
+                "record_cache": history_service.get_record_cache_stats(),
+                "archives": history_service.archives.get_stats()
             }), 200
 
         except Exception as e:
@@ -316,18 +340,24 @@ def create_history_blueprint():
     @history_bp.route('/history/scan-all', methods=['POST'])
     def scan_all_tasks():
         """
-        扫描所有任务并同步图片列表
+        扫描所有任务并同步图片列表（增量扫描，未变化的任务直接跳过）
+
+        查询参数：
+        - force: 为 true 时忽略检查点，重新同步所有任务
 
         返回：
         - success: 是否成功
         - total_tasks: 扫描的任务总数
         - synced: 成功同步的任务数
+        - skipped: 未变化而跳过的任务数
         - failed: 失败的任务数
         - orphan_tasks: 孤立任务列表（有图片但无记录）
+        - elapsed_ms: 扫描耗时（毫秒）
         """
         try:
+            force = request.args.get('force', 'false').lower() == 'true'
             history_service = get_history_service()
-            result = history_service.scan_all_tasks()
+            result = history_service.scan_all_tasks(force=force)
 
             if not result.get("success"):
                 return jsonify(result), 500
@@ -341,6 +371,55 @@ def create_history_blueprint():
                 "error": f"扫描所有任务失败。\n错误详情: {error_msg}"
             }), 500
 
+    @history_bp.route('/history/rebuild-task-index', methods=['POST'])
+    def rebuild_task_index():
+        """
+        按记录文件重建 task_id -> record_id 反向索引
+
+        返回：
+        - success: 是否成功
+        - checked: 检查的记录数
+        - fixed: 修复的索引条目数
+        """
+        try:
+            history_service = get_history_service()
+            result = history_service.rebuild_task_index()
+            return jsonify(result), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"重建任务索引失败。\n错误详情: {error_msg}"
+            }), 500
+
+    @history_bp.route('/history/stats/check', methods=['POST'])
+    def check_history_stats():
+        """
+        全量重新统计并与统计计数器比对
+
+        查询参数：
+        - repair: 不一致时是否修复（默认 true）
+
+        返回：
+        - success: 是否成功
+        - consistent: 计数器是否与实际一致（统计期间有写入时为 null）
+        - repaired: 是否已修复
+        - differences: 不一致的计数
+        """
+        try:
+            repair = request.args.get('repair', 'true').lower() != 'false'
+            history_service = get_history_service()
+            result = history_service.check_statistics(repair=repair)
+            return jsonify(result), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"统计自检失败。\n错误详情: {error_msg}"
+            }), 500
+
     # ==================== 下载功能 ====================
 
     @history_bp.route('/history/<record_id>/download', methods=['GET'])
@@ -380,20 +459,36 @@ def create_history_blueprint():
                     "error": f"任务目录不存在：{task_id}"
                 }), 404
 
-            # 创建内存中的 ZIP 文件
-            zip_buffer = _create_images_zip(task_dir)
-
             # 生成安全的下载文件名
             title = record.get('title', 'images')
             safe_title = _sanitize_filename(title)
             filename = f"{safe_title}.zip"
 
-            return send_file(
-                zip_buffer,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name=filename
-            )
+            # 与当前图片一致的预生成归档直接发送（sendfile、ETag、Range）
+            archives = get_task_archives()
+            archive_path, entries, fingerprint = archives.find(task_dir)
+            if archive_path is not None:
+                return send_file(
+                    archive_path,
+                    mimetype='application/zip',
+                    as_attachment=True,
+                    download_name=filename,
+                    etag=fingerprint,
+                    conditional=True
+                )
+
+            # 否则流式打包：边读图片边发送，不在内存中生成整个归档
+            archive = StreamingZip(entries)
+            if record.get('status') == 'completed':
+                archives.schedule(task_dir)
+
+            headers = {
+                'Content-Disposition': _attachment_header(filename),
+                'X-Accel-Buffering': 'no',
+            }
+            if archive.content_length is not None:
+                headers['Content-Length'] = str(archive.content_length)
+            return Response(archive, mimetype='application/zip', headers=headers, direct_passthrough=True)
 
         except Exception as e:
             error_msg = str(e)
@@ -405,40 +500,14 @@ def create_history_blueprint():
     return history_bp
 
 
-def _create_images_zip(task_dir: str) -> io.BytesIO:
-    """
-    创建包含所有图片的 ZIP 文件
-
-    Args:
-        task_dir: 任务目录路径
-
-    Returns:
-        io.BytesIO: 内存中的 ZIP 文件
-    """
-    memory_file = io.BytesIO()
-
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # 遍历任务目录中的所有图片（排除缩略图）
-        for filename in os.listdir(task_dir):
-            # 跳过缩略图文件
-            if filename.startswith('thumb_'):
-                continue
-
-            if filename.endswith(('.png', '.jpg', '.jpeg')):
-                file_path = os.path.join(task_dir, filename)
-
-                # 生成归档文件名（page_N.png 格式）
-                try:
-                    index = int(filename.split('.')[0])
-                    archive_name = f"page_{index + 1}.png"
-                except ValueError:
-                    archive_name = filename
-
-                zf.write(file_path, archive_name)
-
-    # 将指针移到开始位置
-    memory_file.seek(0)
-    return memory_file
+def _attachment_header(filename: str) -> str:
+    """附件下载的 Content-Disposition（非 ASCII 文件名按 RFC 5987 编码）"""
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii').strip()
+    if not os.path.splitext(ascii_name)[0].strip():
+        ascii_name = 'images.zip'
+    if ascii_name == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
 
 
 def _sanitize_filename(title: str) -> str:
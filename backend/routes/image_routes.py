@@ -3,22 +3,43 @@
 
 包含功能：
 - 批量生成图片（SSE 流式返回）
-- 获取图片
+- 获取图片（ETag / 304 / Range）、按内容地址获取图片及其历史版本
+- 批量获取缩略图（multipart/mixed）
 - 重试/重新生成单张图片
 - 批量重试失败图片
 - 获取任务状态
+- 获取生成调度器指标
 """
 
 import os
 import json
 import base64
 import logging
+from urllib.parse import quote
 from flask import Blueprint, request, jsonify, Response, send_file
+from backend.services.blob_store import get_blob_store, is_blob_id
 from backend.services.image import get_image_service
+from backend.services.derivatives import get_derivative_pipeline
+from backend.services.scheduler import get_generation_scheduler
+from backend.utils.image_cache import get_image_cache
+from backend.utils.image_digest import get_image_digest_store, served_image_names
+from backend.utils.multipart_stream import MultipartStream
 from .utils import log_request, log_error
 
 logger = logging.getLogger(__name__)
 
+# 图片根目录（history/<task_id>/<filename>）
+HISTORY_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "history")
+
+# 带内容版本的图片地址的缓存时间（一年）
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# v 参数的最短长度（sha256 前缀太短时不视为内容地址）
+MIN_VERSION_LENGTH = 12
+
+# 批量获取图片一次最多返回的图片数
+MAX_BATCH_IMAGES = int(os.getenv('MAX_BATCH_IMAGES') or 200)
+
 
 def create_image_blueprint():
     """创建图片路由蓝图（工厂函数，支持多次调用）"""
@@ -115,6 +136,13 @@ def create_image_blueprint():
 
         查询参数：
         - thumbnail: 是否返回缩略图（默认 true）
+        - v: 内容版本（图片 sha256 或其前缀，生成事件、历史列表的 thumbnail_url 中已附带）。与返回的图片一致时按不可变资源长期缓存
+
+        缓存：
+        - ETag 为图片内容的 sha256（保存时计算），If-None-Match 命中时返回 304
+        - 带匹配 v 参数的地址：Cache-Control: public, max-age=一年, immutable
+        - 其他地址：Cache-Control: no-cache（每次用 ETag 重新验证）
+        - 支持 Range 请求（206）
 
         返回：
         - 成功：图片文件
@@ -125,40 +153,206 @@ def create_image_blueprint():
 
             # 检查是否请求缩略图
             thumbnail = request.args.get('thumbnail', 'true').lower() == 'true'
+            version = request.args.get('v', '').lower()
 
-            # 构建 history 目录路径
-            history_root = os.path.join(
-                os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-                "history"
+            filepath, stat = _resolve_image(task_id, filename, thumbnail)
+            if filepath is None:
+                return jsonify({
+                    "success": False,
+                    "error": f"图片不存在：{task_id}/{filename}"
+                }), 404
+
+            digest = get_image_digest_store().get(filepath, stat)
+            immutable = len(version) >= MIN_VERSION_LENGTH and digest.sha256.startswith(version)
+
+            response = send_file(
+                filepath,
+                mimetype=digest.mimetype,
+                etag=digest.etag,
+                last_modified=stat.st_mtime,
+                max_age=IMMUTABLE_MAX_AGE if immutable else None,
+                conditional=True
             )
+            if immutable:
+                response.cache_control.immutable = True
+            else:
+                response.cache_control.no_cache = True
+            return response
 
-            if thumbnail:
-                # 尝试返回缩略图
-                thumb_filename = f"thumb_{filename}"
-                thumb_filepath = os.path.join(history_root, task_id, thumb_filename)
+        except Exception as e:
+            log_error('/images', e)
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"获取图片失败: {error_msg}"
+            }), 500
 
-                if os.path.exists(thumb_filepath):
-                    return send_file(thumb_filepath, mimetype='image/png')
+    @image_bp.route('/blobs/<blob_id>', methods=['GET'])
+    def get_blob(blob_id):
+        """
+        按内容地址获取图片（内容不会变化，按不可变资源长期缓存）
 
-            # 返回原图
-            filepath = os.path.join(history_root, task_id, filename)
+        路径参数：
+        - blob_id: 图片内容的 sha256（见记录的 images.blobs）
 
-            if not os.path.exists(filepath):
+        返回：
+        - 成功：图片文件（支持 304 和 Range）
+        - 失败：JSON 错误信息
+        """
+        try:
+            blobs = get_blob_store()
+            if not is_blob_id(blob_id):
                 return jsonify({
                     "success": False,
-                    "error": f"图片不存在：{task_id}/{filename}"
+                    "error": f"参数错误：无效的图片内容地址 {blob_id}"
+                }), 400
+
+            filepath = blobs.blob_path(blob_id)
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                return jsonify({
+                    "success": False,
+                    "error": f"图片不存在：{blob_id}"
                 }), 404
 
-            return send_file(filepath, mimetype='image/png')
+            digest = blobs.digests.get(filepath, stat)
+            response = send_file(
+                filepath,
+                mimetype=digest.mimetype,
+                etag=blob_id,
+                last_modified=stat.st_mtime,
+                max_age=IMMUTABLE_MAX_AGE,
+                conditional=True
+            )
+            response.cache_control.immutable = True
+            return response
 
         except Exception as e:
-            log_error('/images', e)
+            log_error('/blobs', e)
             error_msg = str(e)
             return jsonify({
                 "success": False,
                 "error": f"获取图片失败: {error_msg}"
             }), 500
 
+    @image_bp.route('/images/<task_id>/<filename>/versions', methods=['GET'])
+    def list_image_versions(task_id, filename):
+        """
+        获取图片的历史版本（重新生成前的内容）
+
+        返回：
+        - success: 是否成功
+        - current: 当前内容的 blob ID
+        - versions: 历史版本列表（从旧到新），包含 blob、replaced_at（时间戳）和 url
+        """
+        try:
+            blobs = get_blob_store()
+            versions = [
+                {**version, "url": f"/api/blobs/{version['blob']}"}
+                for version in blobs.list_versions(task_id, filename)
+            ]
+            return jsonify({
+                "success": True,
+                "current": blobs.blob_of(os.path.join(HISTORY_ROOT, task_id, filename)),
+                "versions": versions
+            }), 200
+
+        except Exception as e:
+            log_error('/images/versions', e)
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"获取图片历史版本失败: {error_msg}"
+            }), 500
+
+    @image_bp.route('/images/batch', methods=['POST'])
+    def get_images_batch():
+        """
+        批量获取图片（一个 multipart/mixed 响应返回多张缩略图，减少历史网格加载时的请求数）
+
+        请求体：
+        - images: [{"task_id", "filename", "etag"（可选，客户端已缓存内容的 ETag）}]，最多 MAX_BATCH_IMAGES 个
+        - thumbnail: 是否返回缩略图（默认 true，缩略图不存在时返回原图）
+
+        返回：
+        multipart/mixed 响应，按请求顺序每张图片一个部分，部分头部：
+        - Content-Location: 该图片的单图地址 /api/images/<task_id>/<filename>（名称经过 URL 编码，400 时没有）
+        - X-Status: 200（带图片内容）/ 304（etag 与当前内容一致，无内容）/ 400（条目不是对象或名称不合法）/ 404（图片不存在）
+        - Content-Type、ETag（200 和 304 时）、Content-Length
+        """
+        try:
+            data = request.get_json(silent=True) or {}
+            items = data.get('images')
+            # 与单图接口的 ?thumbnail= 一致：只有 true / "true" 表示缩略图
+            thumbnail = data.get('thumbnail', True)
+            if not isinstance(thumbnail, bool):
+                thumbnail = str(thumbnail).lower() == 'true'
+
+            if not isinstance(items, list) or not items:
+                return jsonify({
+                    "success": False,
+                    "error": "参数错误：images 不能为空。\n请提供要获取的图片列表（task_id 和 filename）。"
+                }), 400
+            if len(items) > MAX_BATCH_IMAGES:
+                return jsonify({
+                    "success": False,
+                    "error": f"参数错误：一次最多获取 {MAX_BATCH_IMAGES} 张图片，当前 {len(items)} 张。\n请分批请求。"
+                }), 400
+
+            digests = get_image_digest_store()
+            stream = MultipartStream()
+            for item in items:
+                if not isinstance(item, dict):
+                    stream.add_part({"X-Status": "400"})
+                    continue
+                task_id = str(item.get('task_id') or '')
+                filename = str(item.get('filename') or '')
+                if not _is_safe_name(task_id) or not _is_safe_name(filename):
+                    # 名称未通过校验，不回显到头部中
+                    stream.add_part({"X-Status": "400"})
+                    continue
+                location = (f"/api/images/{quote(task_id, safe='')}/{quote(filename, safe='')}"
+                            f"?thumbnail={'true' if thumbnail else 'false'}")
+
+                filepath, stat = _resolve_image(task_id, filename, thumbnail)
+                try:
+                    digest = digests.get(filepath, stat) if filepath else None
+                except FileNotFoundError:
+                    digest = None
+                if digest is None:
+                    stream.add_part({"Content-Location": location, "X-Status": "404"})
+                    continue
+
+                headers = {
+                    "Content-Location": location,
+                    "Content-Type": digest.mimetype,
+                    "ETag": f'"{digest.etag}"'
+                }
+                if str(item.get('etag') or '').strip('"') == digest.etag:
+                    stream.add_part({**headers, "X-Status": "304"})
+                else:
+                    # 文件在发送到该部分时才打开
+                    stream.add_part({**headers, "X-Status": "200"}, filepath, stat.st_size)
+
+            return Response(
+                stream,
+                mimetype=stream.content_type,
+                headers={
+                    'Content-Length': str(stream.content_length),
+                    'Cache-Control': 'no-store'
+                },
+                direct_passthrough=True
+            )
+
+        except Exception as e:
+            log_error('/images/batch', e)
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"批量获取图片失败: {error_msg}"
+            }), 500
+
     # ==================== 重试和重新生成 ====================
 
     @image_bp.route('/retry', methods=['POST'])
@@ -375,6 +569,41 @@ def create_image_blueprint():
                 "error": f"获取任务状态失败。\n错误详情: {error_msg}"
             }), 500
 
+    @image_bp.route('/scheduler/stats', methods=['GET'])
+    def get_scheduler_stats():
+        """
+        获取图片生成调度器指标
+
+        返回：
+        - success: 是否成功
+        - stats: 调度器指标
+          - max_concurrent: 全局并发上限
+          - active: 正在执行的生成请求数
+          - queued: 排队中的生成请求数
+          - queued_tasks: 有请求在排队的任务数
+          - oldest_wait_seconds: 当前排队最久的请求已等待秒数
+          - wait_seconds: 最近请求的排队等待时间（avg/p95/max）
+          - providers: 各服务商的上限/活跃数/排队数
+        - derivatives: 缩略图等派生图流水线指标（执行器类型/排队数/处理中/完成数/失败数）
+        - image_cache: 参考图压缩缓存指标（条目数/占用字节/命中率）
+        - image_digests: 图片摘要缓存指标（条目数/命中率/重新计算次数）
+        """
+        try:
+            return jsonify({
+                "success": True,
+                "stats": get_generation_scheduler().get_stats(),
+                "derivatives": get_derivative_pipeline().get_stats(),
+                "image_cache": get_image_cache().get_stats(),
+                "image_digests": get_image_digest_store().get_stats()
+            }), 200
+
+        except Exception as e:
+            error_msg = str(e)
+            return jsonify({
+                "success": False,
+                "error": f"获取调度器指标失败。\n错误详情: {error_msg}"
+            }), 500
+
     # ==================== 健康检查 ====================
 
     @image_bp.route('/health', methods=['GET'])
@@ -396,6 +625,39 @@ def create_image_blueprint():
 
 # ==================== 辅助函数 ====================
 
+def _is_safe_name(name: str) -> bool:
+    """
+    task_id / filename 是否为单个普通路径段
+
+    批量接口的参数来自请求体，需防止路径穿越，并拒绝控制字符（回车换行会注入响应头，空字符会使文件操作报错）
+    """
+    return (
+        bool(name) and not name.startswith('.') and '/' not in name and '\\' not in name
+        and not any(ord(ch) < 0x20 or ord(ch) == 0x7f for ch in name)
+    )
+
+
+def _resolve_image(task_id: str, filename: str, thumbnail: bool):
+    """
+    定位要返回的图片文件（请求缩略图且缩略图已生成时返回缩略图，否则返回原图）
+
+    Returns:
+        (文件路径, os.stat_result)，图片不存在时为 (None, None)
+    """
+    task_dir = os.path.join(HISTORY_ROOT, task_id)
+    for candidate in served_image_names(filename, thumbnail):
+        filepath = os.path.join(task_dir, candidate)
+        try:
+            return filepath, os.stat(filepath)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        except OSError as e:
+            # 名称过长等无法访问的路径按不存在处理
+            logger.debug(f"无法访问图片 {filepath}: {e}")
+            continue
+    return None, None
+
+
 def _parse_base64_images(images_base64: list) -> list:
     """
     解析 base64 编码的图片列表
@@ -0,0 +1,307 @@
+"""图片内容寻址存储
+
+生成的图片保存为 history/<task_id>/<index>.png，重新生成时原地覆盖，前面的缓存/CDN 会拿到旧内容，
+重复的图片也各占一份磁盘。这里把图片按内容 sha256 存为 history/.blobs/<sha 前两位>/<sha>：
+
+- 任务目录中的图片是 blob 的硬链接：内容相同的图片（重复或复制的图文）只占一份空间
+- 引用计数即硬链接数：blob 的 st_nlink - 1 是引用它的文件数，为 1 时没有引用，可被回收
+- 重新生成时旧内容保留为 <task_id>/.versions/<文件名>/<时间>-<sha> 的硬链接（每个文件保留
+  最近 IMAGE_VERSIONS_KEEP 个），作为低成本的历史快照
+- 记录的 images.blobs 保存 文件名 -> sha 的清单，/api/blobs/<sha> 按不可变资源长期缓存
+
+约定：任务目录中的图片只能通过临时文件 + rename 整体替换，不能原地修改（会同时改掉共享的 blob）。
+文件系统不支持硬链接时退化为普通文件（不去重、不保留历史版本）。
+
+命令行：
+    python -m backend.services.blob_store --gc    # 回收没有引用的 blob
+
+环境变量：
+- IMAGE_VERSIONS_KEEP: 每个图片保留的历史版本数（默认 5，0 表示不保留）
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from backend.utils.image_digest import ImageDigestStore, digest_path_for, get_image_digest_store
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = ".blobs"
+VERSIONS_DIR = ".versions"
+VERSIONS_KEEP = int(os.getenv('IMAGE_VERSIONS_KEEP') or 5)
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# 替换/链接遇到并发回收时的重试次数
+_LINK_ATTEMPTS = 3
+
+
+def is_blob_id(value: str) -> bool:
+    """是否为合法的 blob ID（小写 sha256）"""
+    return bool(_SHA256_RE.match(value or ""))
+
+
+class BlobStore:
+    """按内容 sha256 存储的图片，任务目录中的文件为其硬链接"""
+
+    def __init__(
+        self,
+        root_dir: str,
+        digests: Optional[ImageDigestStore] = None,
+        versions_keep: int = VERSIONS_KEEP
+    ):
+        """
+        Args:
+            root_dir: 历史图片根目录（任务目录的上级目录）
+            digests: 图片摘要存储（默认使用全局实例）
+            versions_keep: 每个图片保留的历史版本数
+        """
+        self.root_dir = root_dir
+        self.blob_dir = os.path.join(root_dir, BLOB_DIR)
+        self.digests = digests or get_image_digest_store()
+        self.versions_keep = versions_keep
+        self._hardlinks = True
+        self._lock = threading.Lock()
+
+    def _contains(self, path: str) -> bool:
+        """文件是否位于根目录下（根目录以外的图片只记录摘要，不纳入存储）"""
+        root = os.path.abspath(self.root_dir)
+        return os.path.commonpath([root, os.path.abspath(path)]) == root
+
+    def blob_path(self, blob_id: str) -> str:
+        """blob 文件路径"""
+        return os.path.join(self.blob_dir, blob_id[:2], blob_id)
+
+    def blob_of(self, path: str) -> Optional[str]:
+        """文件当前内容的 blob ID（文件不存在时返回 None）"""
+        try:
+            return self.digests.get(path).sha256
+        except FileNotFoundError:
+            return None
+
+    def manifest(self, task_id: str, filenames: Iterable[str]) -> Dict[str, str]:
+        """任务图片的 文件名 -> blob ID 清单（不存在的文件不列出）"""
+        task_dir = os.path.join(self.root_dir, task_id)
+        result = {}
+        for filename in filenames:
+            blob_id = self.blob_of(os.path.join(task_dir, filename))
+            if blob_id:
+                result[filename] = blob_id
+        return result
+
+    # ==================== 写入 ====================
+
+    def ingest(self, path: str, data: Optional[bytes] = None, previous: Optional[str] = None) -> Optional[str]:
+        """
+        把刚保存的图片纳入存储（图片保存后调用）
+
+        内容已存在时把文件替换为已有 blob 的硬链接，否则把文件链接为新 blob。
+
+        Args:
+            path: 图片路径
+            data: 已写入的图片数据（省去重新读取）
+            previous: 覆盖前的 blob ID，与新内容不同时保留为历史版本
+
+        Returns:
+            blob ID；文件系统不支持硬链接或文件不在根目录下时返回 None（文件保持原样）
+        """
+        digest = self.digests.record(path, data)
+        blob_id = digest.sha256
+        if not self._hardlinks or not self._contains(path):
+            return None
+
+        blob_path = self.blob_path(blob_id)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        for _ in range(_LINK_ATTEMPTS):
+            try:
+                os.link(path, blob_path)
+                self.digests.store(blob_path, digest)
+                break
+            except FileExistsError:
+                pass
+            except OSError as e:
+                self._disable_hardlinks(e)
+                return None
+
+            if os.path.samefile(path, blob_path):
+                break
+            # 内容已存在：替换为已有 blob 的硬链接（去重）
+            if self._replace_with_link(blob_path, path):
+                self.digests.store(path, digest)
+                break
+
+        if previous and previous != blob_id:
+            self.keep_version(path, previous)
+        return blob_id
+
+    def _replace_with_link(self, blob_path: str, dest_path: str) -> bool:
+        """原子地把 dest_path 替换为 blob 的硬链接（blob 刚被回收时返回 False）"""
+        directory, filename = os.path.split(dest_path)
+        temp_path = os.path.join(directory, f".{filename}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            os.link(blob_path, temp_path)
+        except FileNotFoundError:
+            return False
+        try:
+            os.replace(temp_path, dest_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return True
+
+    def _disable_hardlinks(self, error: OSError):
+        with self._lock:
+            if self._hardlinks:
+                logger.warning(f"文件系统不支持硬链接，图片内容寻址存储已停用: {error}")
+            self._hardlinks = False
+
+    def keep_version(self, path: str, blob_id: str):
+        """把旧内容保留为历史版本（blob 已被回收时忽略）"""
+        if self.versions_keep <= 0:
+            return
+        directory, filename = os.path.split(path)
+        versions_dir = os.path.join(directory, VERSIONS_DIR, filename)
+        os.makedirs(versions_dir, exist_ok=True)
+        try:
+            os.link(self.blob_path(blob_id), os.path.join(versions_dir, f"{time.time_ns()}-{blob_id}"))
+        except (FileNotFoundError, FileExistsError):
+            return
+
+        versions = sorted(os.listdir(versions_dir))
+        for name in versions[:-self.versions_keep]:
+            try:
+                os.remove(os.path.join(versions_dir, name))
+            except FileNotFoundError:
+                pass
+            self._release(name.split("-", 1)[-1])
+
+    def list_versions(self, task_id: str, filename: str) -> List[Dict[str, object]]:
+        """图片的历史版本（从旧到新）：[{"blob", "replaced_at"}]"""
+        versions_dir = os.path.join(self.root_dir, task_id, VERSIONS_DIR, filename)
+        try:
+            names = sorted(os.listdir(versions_dir))
+        except FileNotFoundError:
+            return []
+        result = []
+        for name in names:
+            timestamp, _, blob_id = name.partition("-")
+            result.append({"blob": blob_id, "replaced_at": int(timestamp) / 1e9})
+        return result
+
+    # ==================== 回收 ====================
+
+    def _release(self, blob_id: str) -> int:
+        """没有其他引用时删除 blob，返回释放的字节数"""
+        if not is_blob_id(blob_id):
+            return 0
+        blob_path = self.blob_path(blob_id)
+        try:
+            stat = os.stat(blob_path)
+        except FileNotFoundError:
+            return 0
+        if stat.st_nlink > 1:
+            return 0
+        try:
+            os.remove(blob_path)
+        except FileNotFoundError:
+            return 0
+        try:
+            os.remove(digest_path_for(blob_path))
+        except FileNotFoundError:
+            pass
+        return stat.st_size
+
+    def remove_task_dir(self, task_dir: str) -> int:
+        """
+        删除任务目录，并回收只被该目录引用的 blob
+
+        Returns:
+            回收的字节数
+        """
+        blob_ids = set()
+        for directory, dirnames, filenames in os.walk(task_dir):
+            # 只统计图片和历史版本（跳过摘要、归档等其他隐藏目录）
+            dirnames[:] = [name for name in dirnames if not name.startswith(".") or name == VERSIONS_DIR]
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                if os.path.basename(os.path.dirname(directory)) == VERSIONS_DIR:
+                    # 历史版本：文件名即 <时间>-<blob ID>
+                    blob_ids.add(filename.split("-", 1)[-1])
+                    continue
+                blob_id = self.blob_of(os.path.join(directory, filename))
+                if blob_id:
+                    blob_ids.add(blob_id)
+        shutil.rmtree(task_dir)
+        freed = sum(self._release(blob_id) for blob_id in blob_ids)
+        logger.info(f"已删除任务目录: {task_dir}（回收 {freed} 字节）")
+        return freed
+
+    def gc(self) -> Dict[str, int]:
+        """
+        回收所有没有引用的 blob
+
+        Returns:
+            {"blobs": 剩余 blob 数, "bytes": 剩余字节数, "removed": 回收数, "freed_bytes": 回收字节数}
+        """
+        result = {"blobs": 0, "bytes": 0, "removed": 0, "freed_bytes": 0}
+        if not os.path.isdir(self.blob_dir):
+            return result
+        with os.scandir(self.blob_dir) as shards:
+            for shard in shards:
+                if not shard.is_dir():
+                    continue
+                with os.scandir(shard.path) as entries:
+                    for entry in entries:
+                        if not is_blob_id(entry.name):
+                            continue
+                        freed = self._release(entry.name)
+                        if freed:
+                            result["removed"] += 1
+                            result["freed_bytes"] += freed
+                        else:
+                            result["blobs"] += 1
+                            result["bytes"] += entry.stat().st_size
+        logger.info(f"blob 回收完成: {result}")
+        return result
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """获取全局图片内容寻址存储（根目录为项目的 history 目录）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BlobStore(os.path.join(
+                    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                    "history"
+                ))
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片内容寻址存储维护")
+    parser.add_argument('--gc', action='store_true', help="回收没有引用的 blob")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.gc:
+        result = get_blob_store().gc()
+        print(f"剩余 {result['blobs']} 个 blob（{result['bytes'] / 1024 / 1024:.1f}MB），"
+              f"回收 {result['removed']} 个（{result['freed_bytes'] / 1024 / 1024:.1f}MB）")
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
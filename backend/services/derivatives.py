@@ -0,0 +1,281 @@
+"""派生图流水线
+
+原图保存后，缩略图等派生图在后台进程池中生成，不占用图片生成的关键路径：
+- 页面生成完成后立即推送原图地址，派生图完成后再通过回调/Future 通知（SSE 事件 thumbnail_ready）
+- PIL 缩放和 JPEG 编码是 CPU 密集型操作，使用有界进程池；进程池不可用时退回线程池
+- 派生图规格可注册，增加新尺寸（如 400px 预览图）无需改动生成流程
+
+环境变量：
+- DERIVATIVE_WORKERS: 工作进程数（默认 min(4, CPU 核数)）
+- DERIVATIVE_EXECUTOR: process（默认）或 thread
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from backend.services.blob_store import get_blob_store
+from backend.utils.b64_stream import write_file_atomic
+from backend.utils.image_compressor import compress_image_file
+from backend.utils.image_digest import THUMBNAIL_PREFIX
+
+logger = logging.getLogger(__name__)
+
+
+class DerivativeSpec:
+    """派生图规格"""
+
+    def __init__(self, name: str, prefix: str, max_size_kb: int, max_dimension: int = 2048):
+        """
+        Args:
+            name: 规格名称（如 thumb、preview）
+            prefix: 文件名前缀（派生图文件名 = prefix + 原图文件名）
+            max_size_kb: 最大文件大小（KB）
+            max_dimension: 最大边长（像素）
+        """
+        self.name = name
+        self.prefix = prefix
+        self.max_size_kb = max_size_kb
+        self.max_dimension = max_dimension
+
+    def filename_for(self, filename: str) -> str:
+        """派生图文件名"""
+        return f"{self.prefix}{filename}"
+
+
+# 默认规格：50KB 左右的缩略图（文件名 thumb_<index>.png，与 /api/images 的缩略图约定一致）
+THUMBNAIL_SPEC = DerivativeSpec("thumb", THUMBNAIL_PREFIX, max_size_kb=50)
+
+
+def build_derivative(source_path: str, dest_path: str, max_size_kb: int, max_dimension: int) -> int:
+    """
+    生成一张派生图（在工作进程中执行）
+
+    Returns:
+        派生图字节数
+    """
+    data = compress_image_file(source_path, max_size_kb=max_size_kb, max_dimension=max_dimension)
+    write_file_atomic(dest_path, data)
+    get_blob_store().ingest(dest_path, data)
+    return len(data)
+
+
+class _Job:
+    """排队中的派生图任务"""
+
+    __slots__ = ("spec", "source_path", "dest_path", "future", "attempts")
+
+    def __init__(self, spec: DerivativeSpec, source_path: str, dest_path: str):
+        self.spec = spec
+        self.source_path = source_path
+        self.dest_path = dest_path
+        self.future: Future = Future()
+        self.attempts = 0
+
+
+class DerivativePipeline:
+    """派生图流水线"""
+
+    def __init__(self, max_workers: Optional[int] = None, executor_type: Optional[str] = None):
+        if max_workers is None:
+            max_workers = int(os.getenv('DERIVATIVE_WORKERS') or min(4, os.cpu_count() or 1))
+        self.max_workers = max(1, max_workers)
+        self.executor_type = (executor_type or os.getenv('DERIVATIVE_EXECUTOR', 'process')).lower()
+        # 同时交给执行器的任务数上限，其余在队列中等待，避免执行器内部积压
+        self.max_in_flight = self.max_workers * 2
+
+        self._specs: "OrderedDict[str, DerivativeSpec]" = OrderedDict()
+        self.register(THUMBNAIL_SPEC)
+
+        self._executor = None
+        self._lock = threading.RLock()
+        self._queue: Deque[_Job] = deque()
+        self._in_flight = 0
+
+        # 指标
+        self._completed = 0
+        self._failed = 0
+
+    # ==================== 规格 ====================
+
+    def register(self, spec: DerivativeSpec):
+        """注册派生图规格（同名规格会被覆盖）"""
+        self._specs[spec.name] = spec
+
+    def unregister(self, name: str):
+        """移除派生图规格"""
+        self._specs.pop(name, None)
+
+    def get_specs(self) -> List[DerivativeSpec]:
+        """获取已注册的派生图规格"""
+        return list(self._specs.values())
+
+    # ==================== 提交 ====================
+
+    def submit(
+        self,
+        source_path: str,
+        on_ready: Optional[Callable[[DerivativeSpec, str, Optional[BaseException]], None]] = None
+    ) -> Dict[Future, DerivativeSpec]:
+        """
+        为原图生成所有已注册规格的派生图
+
+        旧的派生图会先被删除，在新派生图就绪之前 /api/images 会回退到原图，不会返回过期内容。
+
+        Args:
+            source_path: 原图路径
+            on_ready: 每个派生图完成（或失败）时的回调 (spec, dest_path, error)
+
+        Returns:
+            {future: spec}，future 的结果为派生图路径
+        """
+        directory, filename = os.path.split(source_path)
+        jobs = []
+        for spec in self.get_specs():
+            dest_path = os.path.join(directory, spec.filename_for(filename))
+            try:
+                os.remove(dest_path)
+            except FileNotFoundError:
+                pass
+
+            job = _Job(spec, source_path, dest_path)
+            if on_ready is not None:
+                job.future.add_done_callback(
+                    lambda f, job=job: f.cancelled() or on_ready(job.spec, job.dest_path, f.exception())
+                )
+            jobs.append(job)
+
+        with self._lock:
+            self._queue.extend(jobs)
+            self._dispatch_locked()
+
+        return {job.future: job.spec for job in jobs}
+
+    def _get_executor(self):
+        """懒加载执行器"""
+        if self._executor is None:
+            if self.executor_type == 'process':
+                try:
+                    # 使用 spawn 避免在多线程的 Web 进程中 fork
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    logger.info(f"派生图进程池已启动: workers={self.max_workers}")
+                except (OSError, NotImplementedError, ImportError) as e:
+                    logger.warning(f"无法创建派生图进程池，改用线程池: {e}")
+                    self.executor_type = 'thread'
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="derivative"
+                )
+        return self._executor
+
+    def _dispatch_locked(self):
+        while self._queue and self._in_flight < self.max_in_flight:
+            job = self._queue.popleft()
+            if job.future.cancelled():
+                continue
+
+            job.attempts += 1
+            self._in_flight += 1
+            try:
+                inner = self._get_executor().submit(
+                    build_derivative, job.source_path, job.dest_path,
+                    job.spec.max_size_kb, job.spec.max_dimension
+                )
+            except Exception as e:
+                self._in_flight -= 1
+                if self.executor_type == 'process':
+                    # 无法启动工作进程（如运行环境不支持 spawn），改用线程池后重新提交
+                    logger.warning(f"派生图进程池不可用，改用线程池: {e}")
+                    self._reset_executor_locked()
+                    job.attempts -= 1
+                    self._queue.appendleft(job)
+                    continue
+                self._finish(job, error=e)
+                continue
+            inner.add_done_callback(lambda f, job=job: self._on_job_done(job, f))
+
+    def _on_job_done(self, job: _Job, inner: Future):
+        # 执行器被重置时未开始的任务会被取消，按进程池损坏处理
+        error = BrokenProcessPool() if inner.cancelled() else inner.exception()
+
+        with self._lock:
+            self._in_flight -= 1
+            if isinstance(error, BrokenProcessPool) and job.attempts < 2:
+                # 工作进程异常退出（如被 OOM 终止），退回线程池后重新执行
+                logger.warning("派生图进程池已损坏，改用线程池")
+                self._reset_executor_locked()
+                self._queue.appendleft(job)
+                self._dispatch_locked()
+                return
+            self._dispatch_locked()
+
+        self._finish(job, error=error)
+
+    def _reset_executor_locked(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.executor_type = 'thread'
+
+    def _finish(self, job: _Job, error: Optional[BaseException] = None):
+        if job.future.done():
+            # 调用方已取消
+            return
+        with self._lock:
+            if error is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+        # future 的回调在锁外执行
+        if error is None:
+            job.future.set_result(job.dest_path)
+        else:
+            logger.warning(f"派生图 [{job.spec.name}] 生成失败: {job.source_path}, {error}")
+            job.future.set_exception(error)
+
+    # ==================== 管理 ====================
+
+    def shutdown(self, wait: bool = True):
+        """关闭执行器（未开始的任务会被取消）"""
+        with self._lock:
+            while self._queue:
+                self._queue.popleft().future.cancel()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取流水线指标"""
+        with self._lock:
+            return {
+                "executor": self.executor_type,
+                "workers": self.max_workers,
+                "queued": len(self._queue),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "specs": [spec.name for spec in self._specs.values()],
+            }
+
+
+# 全局流水线实例
+_pipeline_instance = None
+_pipeline_lock = threading.Lock()
+
+
+def get_derivative_pipeline() -> DerivativePipeline:
+    """获取进程级派生图流水线"""
+    global _pipeline_instance
+    if _pipeline_instance is None:
+        with _pipeline_lock:
+            if _pipeline_instance is None:
+                _pipeline_instance = DerivativePipeline()
+    return _pipeline_instance
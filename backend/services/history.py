@@ -1,40 +1,69 @@
 import os
-import json
+import hashlib
+import logging
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 
+from backend.services.blob_store import BlobStore, get_blob_store
+from backend.services.history_index import create_history_index, entry_from_record
+from backend.services.history_journal import HistoryJournal, JournalEntry
+from backend.services.history_stats import HistoryStats
+from backend.services.record_format import RecordFiles, migrate_records
+from backend.services.search_index import iter_search_documents, record_search_content
+from backend.services.task_archive import get_task_archives, list_task_images
+from backend.utils.image_digest import versioned_image_url
+from backend.utils.pagination import cursor_for
+
+logger = logging.getLogger(__name__)
 
 class HistoryService:
-    def __init__(self):
-        self.history_dir = os.path.join(
+    # scan_all_tasks 并行同步的线程数（环境变量 HISTORY_SCAN_WORKERS）
+    SCAN_WORKERS = int(os.getenv('HISTORY_SCAN_WORKERS') or 8)
+
+    def __init__(self, history_dir: Optional[str] = None):
+        """
+        Args:
+            history_dir: 历史记录目录（默认为项目的 history 目录）
+        """
+        self.history_dir = history_dir or os.path.join(
             os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
             "history"
         )
         os.makedirs(self.history_dir, exist_ok=True)
 
-        self.index_file = os.path.join(self.history_dir, "index.json")
-        self._init_index()
+        # 记录摘要索引（默认 SQLite，可用 HISTORY_INDEX_BACKEND=json 切换回 index.json）
+        self.index = create_history_index(self.history_dir)
 
-    def _init_index(self):
-        if not os.path.exists(self.index_file):
-            with open(self.index_file, "w", encoding="utf-8") as f:
-                json.dump({"records": []}, f, ensure_ascii=False, indent=2)
+        # 记录文件（格式由 HISTORY_RECORD_FORMAT 决定，读取兼容旧的 .json 文件）
+        self.record_files = RecordFiles(self.history_dir)
 
-    def _load_index(self) -> Dict:
-        try:
-            with open(self.index_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {"records": []}
+        # 写前日志：记录文件和索引的修改先写日志再落盘，启动时重放上次未落盘的修改
+        self.journal = HistoryJournal(
+            os.path.join(self.history_dir, ".journal"), self._materialize, sync=self._sync_materialized
+        )
+        replayed = self.journal.replay()
+        if replayed:
+            self.index.index_documents(iter_search_documents(
+                entry.record for entry in replayed if entry.op == "put"
+            ))
+
+        # 全文检索索引首次搜索时按已有记录补建
+        self._search_index_ready = False
+        self._search_index_lock = threading.Lock()
 
-    def _save_index(self, index: Dict):
-        with open(self.index_file, "w", encoding="utf-8") as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
+        # 统计计数器（首次读取时按索引构建，之后随增删改增量维护）
+        self.stats = HistoryStats(self.index.all)
 
-    def _get_record_path(self, record_id: str) -> str:
-        return os.path.join(self.history_dir, f"{record_id}.json")
+        # 图片内容寻址存储（记录的 images.blobs 清单、删除时回收）
+        self.blobs = get_blob_store() if history_dir is None else BlobStore(self.history_dir)
+
+        # 预生成的下载归档（记录完成时在后台生成）
+        self.archives = get_task_archives()
 
     def create_record(
         self,
@@ -59,36 +88,17 @@ class HistoryService:
             "thumbnail": None
         }
 
-        record_path = self._get_record_path(record_id)
-        with open(record_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
+        # 经日志落盘记录文件和索引
+        with self.journal.transaction() as txn:
+            txn.put(record_id, record)
 
-        index = self._load_index()
-        index["records"].insert(0, {
-            "id": record_id,
-            "title": topic,
-            "created_at": now,
-            "updated_at": now,
-            "status": "draft",
-            "thumbnail": None,
-            "page_count": len(outline.get("pages", [])),
-            "task_id": task_id
-        })
-        self._save_index(index)
+        self.index.index_documents([(record_id, topic, record_search_content(record))])
+        self.stats.record_added(record)
 
         return record_id
 
     def get_record(self, record_id: str) -> Optional[Dict]:
-        record_path = self._get_record_path(record_id)
-
-        if not os.path.exists(record_path):
-            return None
-
-        try:
-            with open(record_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return None
+        return self.record_files.read(record_id)
 
     def update_record(
         self,
@@ -98,130 +108,266 @@ class HistoryService:
         status: Optional[str] = None,
         thumbnail: Optional[str] = None
     ) -> bool:
-        record = self.get_record(record_id)
-        if not record:
+        record = self._write_record_update(record_id, outline, images, status, thumbnail)
+        if record is None:
             return False
 
-        now = datetime.now().isoformat()
-        record["updated_at"] = now
-
         if outline is not None:
-            record["outline"] = outline
+            # 大纲变化时重建该记录的全文检索文档
+            self.index.index_documents(iter_search_documents([record]))
+        return True
+
+    def _write_record_update(
+        self,
+        record_id: str,
+        outline: Optional[Dict] = None,
+        images: Optional[Dict] = None,
+        status: Optional[str] = None,
+        thumbnail: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        在日志事务中读-改-写记录（记录文件和索引由日志一起落盘）
 
+        Returns:
+            更新后的记录，记录不存在时返回 None
+        """
         if images is not None:
-            record["images"] = images
+            images = self._with_blob_manifest(images)
+
+        with self.journal.transaction() as txn:
+            record = txn.read(record_id, self.get_record)
+            if not record:
+                return None
+
+            record["updated_at"] = datetime.now().isoformat()
+            old_status = record.get("status")
+
+            if outline is not None:
+                record["outline"] = outline
+
+            if images is not None:
+                record["images"] = images
+
+            if status is not None:
+                record["status"] = status
+
+            if thumbnail is not None:
+                record["thumbnail"] = thumbnail
+
+            txn.put(record_id, record)
 
         if status is not None:
-            record["status"] = status
-
-        if thumbnail is not None:
-            record["thumbnail"] = thumbnail
-
-        record_path = self._get_record_path(record_id)
-        with open(record_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
-
-        index = self._load_index()
-        for idx_record in index["records"]:
-            if idx_record["id"] == record_id:
-                idx_record["updated_at"] = now
-                if status:
-                    idx_record["status"] = status
-                if thumbnail:
-                    idx_record["thumbnail"] = thumbnail
-                if outline:
-                    idx_record["page_count"] = len(outline.get("pages", []))
-                if images is not None and images.get("task_id"):
-                    idx_record["task_id"] = images.get("task_id")
-                break
-
-        self._save_index(index)
-        return True
+            self.stats.status_changed(record, old_status, status)
+        if (status is not None or images is not None) and record.get("status") == "completed":
+            task_id = (record.get("images") or {}).get("task_id")
+            if task_id:
+                self.archives.schedule(os.path.join(self.history_dir, task_id))
+        return record
+
+    def _with_blob_manifest(self, images: Dict) -> Dict:
+        """为图片信息附加 文件名 -> blob ID 清单（images.blobs）"""
+        task_id = images.get("task_id")
+        if not task_id:
+            return images
+        return {**images, "blobs": self.blobs.manifest(task_id, images.get("generated") or [])}
 
     def delete_record(self, record_id: str) -> bool:
         record = self.get_record(record_id)
         if not record:
             return False
 
-        # 删除任务图片目录
+        # 删除任务图片目录（只被该任务引用的 blob 一并回收）
         if record.get("images") and record["images"].get("task_id"):
             task_id = record["images"]["task_id"]
             task_dir = os.path.join(self.history_dir, task_id)
             if os.path.exists(task_dir) and os.path.isdir(task_dir):
                 try:
-                    import shutil
-                    shutil.rmtree(task_dir)
-                    print(f"已删除任务目录: {task_dir}")
+                    self.blobs.remove_task_dir(task_dir)
                 except Exception as e:
-                    print(f"删除任务目录失败: {task_dir}, {e}")
+                    logger.error(f"删除任务目录失败: {task_dir}, {e}")
 
-        # 删除记录JSON文件
-        record_path = self._get_record_path(record_id)
-        try:
-            os.remove(record_path)
-        except Exception:
-            return False
-
-        # 更新索引
-        index = self._load_index()
-        index["records"] = [r for r in index["records"] if r["id"] != record_id]
-        self._save_index(index)
+        # 经日志删除记录文件和索引条目
+        with self.journal.transaction() as txn:
+            record = txn.read(record_id, self.get_record)
+            if not record:
+                return False
+            txn.delete(record_id)
 
+        self.stats.record_removed(record)
         return True
 
+    def _materialize(self, entries: List[JournalEntry]):
+        """把日志中的一批修改落盘到记录文件和索引（由 HistoryJournal 调用）"""
+        upserts = []
+        for entry in entries:
+            if entry.op == "put":
+                self.record_files.write(entry.record_id, entry.record)
+                upserts.append(entry_from_record(entry.record))
+            else:
+                self.record_files.delete(entry.record_id)
+                self.index.remove(entry.record_id)
+        self.index.upsert_many(upserts)
+
+    def _sync_materialized(self):
+        """把落盘过的记录文件和索引刷到磁盘（截断日志前由 HistoryJournal 调用）"""
+        self.record_files.sync()
+        self.index.sync()
+
     def list_records(
         self,
         page: int = 1,
         page_size: int = 20,
-        status: Optional[str] = None
+        status: Optional[str] = None,
+        cursor: Optional[str] = None,
+        with_total: bool = False
     ) -> Dict:
-        index = self._load_index()
-        records = index.get("records", [])
+        """
+        获取记录列表（按创建时间倒序）
+
+        传入 cursor 时使用游标分页（忽略 page），深页与第一页开销相同：不统计总数
+        （total / total_pages 为 None，客户端沿用第一页的结果），除非 with_total 为 True。
+        两种方式都会返回 next_cursor，没有更多记录时为 None。
+
+        Raises:
+            ValueError: 游标格式不正确
+        """
+        if cursor:
+            page_records, next_cursor = self.index.list_after(status, cursor, limit=page_size)
+            total = self.index.count(status) if with_total else None
+            return {
+                "records": self._with_thumbnail_urls(page_records),
+                "total": total,
+                "page_size": page_size,
+                "total_pages": (total + page_size - 1) // page_size if total is not None else None,
+                "next_cursor": next_cursor
+            }
 
-        if status:
-            records = [r for r in records if r.get("status") == status]
+        total = self.index.count(status)
 
-        total = len(records)
-        start = (page - 1) * page_size
-        end = start + page_size
-        page_records = records[start:end]
+        offset = (page - 1) * page_size
+        page_records = self.index.list_page(status, offset=offset, limit=page_size)
+        has_more = bool(page_records) and offset + len(page_records) < total
 
         return {
-            "records": page_records,
+            "records": self._with_thumbnail_urls(page_records),
             "total": total,
             "page": page,
             "page_size": page_size,
-            "total_pages": (total + page_size - 1) // page_size
+            "total_pages": (total + page_size - 1) // page_size,
+            "next_cursor": cursor_for(page_records[-1]) if has_more else None
         }
 
-    def search_records(self, keyword: str) -> List[Dict]:
-        index = self._load_index()
-        records = index.get("records", [])
+    def search_records(self, keyword: str, page: int = 1, page_size: int = 20) -> Dict:
+        """
+        全文检索标题和大纲内容，按相关度排序分页返回
 
-        keyword_lower = keyword.lower()
-        results = [
-            r for r in records
-            if keyword_lower in r.get("title", "").lower()
-        ]
+        Args:
+            keyword: 搜索关键词（中文按 bigram 匹配，等价于子串搜索）
+            page: 页码
+            page_size: 每页数量
+        """
+        self._ensure_search_index()
+        total, records = self.index.search_documents(
+            keyword, offset=(page - 1) * page_size, limit=page_size
+        )
+        return {
+            "records": self._with_thumbnail_urls(records),
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (total + page_size - 1) // page_size
+        }
 
-        return results
+    def _with_thumbnail_urls(self, records: List[Dict]) -> List[Dict]:
+        """为列表条目附加带内容版本的缩略图地址（thumbnail_url，见 versioned_image_url）"""
+        result = []
+        for record in records:
+            if record.get("task_id") and record.get("thumbnail"):
+                record = {
+                    **record,
+                    "thumbnail_url": versioned_image_url(self.history_dir, record["task_id"], record["thumbnail"])
+                }
+            result.append(record)
+        return result
+
+    def _ensure_search_index(self):
+        """为全文检索索引补建已有记录（每个索引只执行一次）"""
+        if self._search_index_ready:
+            return
+        with self._search_index_lock:
+            if self._search_index_ready:
+                return
+            if not self.index.search_ready():
+                started = time.perf_counter()
+                records = (self.get_record(entry["id"]) for entry in self.index.all())
+                self.index.index_documents(iter_search_documents(record for record in records if record))
+                self.index.mark_search_ready()
+                logger.info(f"全文检索索引构建完成，耗时 {time.perf_counter() - started:.2f}s")
+            self._search_index_ready = True
 
     def get_statistics(self) -> Dict:
-        index = self._load_index()
-        records = index.get("records", [])
+        """
+        获取统计（读取增量计数器，不遍历记录）
 
-        total = len(records)
-        status_count = {}
+        Returns:
+            {"total", "by_status", "last_24h", "last_7d"}
+        """
+        return self.stats.snapshot()
 
-        for record in records:
-            status = record.get("status", "draft")
-            status_count[status] = status_count.get(status, 0) + 1
+    def get_record_cache_stats(self) -> Dict[str, Any]:
+        """获取记录读缓存指标（条目数/命中/未命中/过期）"""
+        return self.record_files.get_cache_stats()
 
+    def check_statistics(self, repair: bool = True) -> Dict[str, Any]:
+        """全量重新统计并与计数器比对，不一致时修复"""
         return {
-            "total": total,
-            "by_status": status_count
+            "success": True,
+            **self.stats.self_check(repair=repair)
+        }
+
+    def migrate_record_format(self, batch_size: int = 200, progress=None) -> Dict[str, Any]:
+        """
+        把已有记录改写为当前配置的格式（HISTORY_RECORD_FORMAT），可在服务运行时执行
+
+        Returns:
+            迁移结果统计
+        """
+        record_ids = [entry["id"] for entry in self.index.all()]
+        return migrate_records(self.journal, self.record_files, record_ids, batch_size, progress)
+
+    def rebuild_task_index(self) -> Dict[str, Any]:
+        """
+        按记录文件重建 task_id -> record_id 反向索引
+
+        正常情况下索引随增删改自动维护，只有记录文件被外部修改后才需要重建。
+
+        Returns:
+            重建结果统计
+        """
+        checked = 0
+        fixed = 0
+        for entry in self.index.all():
+            record = self.get_record(entry["id"])
+            if not record:
+                continue
+            checked += 1
+            task_id = (record.get("images") or {}).get("task_id")
+            if task_id != entry.get("task_id"):
+                self.index.update(entry["id"], {"task_id": task_id})
+                fixed += 1
+
+        logger.info(f"task_id 反向索引重建完成: checked={checked}, fixed={fixed}")
+        return {
+            "success": True,
+            "checked": checked,
+            "fixed": fixed
         }
 
+    @staticmethod
+    def _fingerprint(image_files: List[str]) -> str:
+        """任务目录图片文件集合的指纹"""
+        return hashlib.sha1("\n".join(sorted(image_files)).encode("utf-8")).hexdigest()
+
     def scan_and_sync_task_images(self, task_id: str) -> Dict[str, Any]:
         """
         扫描任务文件夹，同步图片列表
@@ -241,69 +387,30 @@ class HistoryService:
             }
 
         try:
-            # 扫描目录下所有图片文件（排除缩略图）
-            image_files = []
-            for filename in os.listdir(task_dir):
-                # 跳过缩略图文件（以 thumb_ 开头）
-                if filename.startswith('thumb_'):
-                    continue
-                if filename.endswith('.png') or filename.endswith('.jpg') or filename.endswith('.jpeg'):
-                    image_files.append(filename)
-
-            # 按文件名排序（数字排序）
-            def get_index(filename):
-                try:
-                    return int(filename.split('.')[0])
-                except:
-                    return 999
-
-            image_files.sort(key=get_index)
-
-            # 查找关联的历史记录
-            index = self._load_index()
-            record_id = None
-            for rec in index.get("records", []):
-                # 通过遍历所有记录，找到 task_id 匹配的记录
-                record_detail = self.get_record(rec["id"])
-                if record_detail and record_detail.get("images", {}).get("task_id") == task_id:
-                    record_id = rec["id"]
-                    break
-
-            if record_id:
-                # 更新历史记录
-                record = self.get_record(record_id)
-                if record:
-                    # 判断状态
-                    expected_count = len(record.get("outline", {}).get("pages", []))
-                    actual_count = len(image_files)
-
-                    if actual_count == 0:
-                        status = "draft"
-                    elif actual_count >= expected_count:
-                        status = "completed"
-                    else:
-                        status = "partial"
-
-                    # 更新图片列表和状态
-                    self.update_record(
-                        record_id,
-                        images={
-                            "task_id": task_id,
-                            "generated": image_files
-                        },
-                        status=status,
-                        thumbnail=image_files[0] if image_files else None
-                    )
-
-                    return {
-                        "success": True,
-                        "record_id": record_id,
-                        "task_id": task_id,
-                        "images_count": len(image_files),
-                        "images": image_files,
-                        "status": status
-                    }
+            return self._sync_task(task_id, list_task_images(task_dir))
 
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"扫描任务失败: {str(e)}"
+            }
+
+    def _sync_task(self, task_id: str, image_files: List[str]) -> Dict[str, Any]:
+        """
+        按图片文件同步关联记录的图片列表和状态
+
+        Returns:
+            扫描结果
+        """
+        # 通过 task_id 反向索引查找关联的历史记录
+        record_id = self.index.find_by_task_id(task_id)
+        record = self.get_record(record_id) if record_id else None
+        if record and record.get("images", {}).get("task_id") != task_id:
+            # 索引与记录文件不一致（如记录文件被手动修改），可调用 rebuild_task_index 修复
+            logger.warning(f"任务 {task_id} 的索引已过期: record_id={record_id}")
+            record = None
+
+        if not record:
             # 没有关联的记录，返回扫描结果
             return {
                 "success": True,
@@ -313,16 +420,48 @@ class HistoryService:
                 "no_record": True
             }
 
-        except Exception as e:
-            return {
-                "success": False,
-                "error": f"扫描任务失败: {str(e)}"
-            }
+        # 判断状态
+        expected_count = len(record.get("outline", {}).get("pages", []))
+        actual_count = len(image_files)
+
+        if actual_count == 0:
+            status = "draft"
+        elif actual_count >= expected_count:
+            status = "completed"
+        else:
+            status = "partial"
+
+        images = self._with_blob_manifest({
+            "task_id": task_id,
+            "generated": image_files
+        })
+        thumbnail = image_files[0] if image_files else None
+
+        if (record.get("images") != images or record.get("status") != status
+                or (thumbnail is not None and record.get("thumbnail") != thumbnail)):
+            # 更新图片列表和状态（记录已是最新时不重写）
+            self._write_record_update(record_id, images=images, status=status, thumbnail=thumbnail)
 
-    def scan_all_tasks(self) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "record_id": record_id,
+            "task_id": task_id,
+            "images_count": len(image_files),
+            "images": image_files,
+            "status": status
+        }
+
+    def scan_all_tasks(self, force: bool = False) -> Dict[str, Any]:
         """
         扫描所有任务文件夹，同步图片列表
 
+        增量扫描：为每个任务目录保存 mtime 和图片文件集合指纹，
+        目录未变化（或只有缩略图等非原图文件变化）且关联记录未变的任务直接跳过；
+        有变化的任务在线程池中并行同步，并发的记录更新经日志组提交（见 history_journal）。
+
+        Args:
+            force: 忽略检查点，重新同步所有任务
+
         Returns:
             扫描结果统计
         """
@@ -332,42 +471,99 @@ class HistoryService:
                 "error": "历史记录目录不存在"
             }
 
+        started = time.perf_counter()
         try:
+            checkpoints = self.index.get_scan_checkpoints()
+            orphan_tasks = []  # 没有关联记录的任务
+            skipped_count = 0
+            pending = []  # [(task_id, mtime_ns, record_id)]
+            present = set()
+
+            # 遍历 history 目录，只处理目录（任务文件夹，跳过 .task_state 等隐藏目录）
+            with os.scandir(self.history_dir) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.') or not entry.is_dir():
+                        continue
+
+                    # 假设任务文件夹名就是 task_id
+                    task_id = entry.name
+                    present.add(task_id)
+                    mtime_ns = entry.stat().st_mtime_ns
+                    record_id = self.index.find_by_task_id(task_id)
+
+                    checkpoint = checkpoints.get(task_id)
+                    if (not force and checkpoint and checkpoint["mtime_ns"] == mtime_ns
+                            and checkpoint.get("record_id") == record_id):
+                        skipped_count += 1
+                        if record_id is None:
+                            orphan_tasks.append(task_id)
+                        continue
+                    pending.append((task_id, mtime_ns, record_id))
+
+            def scan_one(task_id: str, mtime_ns: int, record_id: Optional[str]):
+                image_files = list_task_images(os.path.join(self.history_dir, task_id))
+                fingerprint = self._fingerprint(image_files)
+                checkpoint = checkpoints.get(task_id)
+                if (not force and checkpoint and checkpoint["fingerprint"] == fingerprint
+                        and checkpoint.get("record_id") == record_id):
+                    # 目录有变化但图片集合不变（如新生成了缩略图），只更新检查点
+                    return task_id, mtime_ns, fingerprint, None
+                return task_id, mtime_ns, fingerprint, self._sync_task(task_id, image_files)
+
             synced_count = 0
             failed_count = 0
-            orphan_tasks = []  # 没有关联记录的任务
             results = []
-
-            # 遍历 history 目录
-            for item in os.listdir(self.history_dir):
-                item_path = os.path.join(self.history_dir, item)
-
-                # 只处理目录（任务文件夹）
-                if not os.path.isdir(item_path):
-                    continue
-
-                # 假设任务文件夹名就是 task_id
-                task_id = item
-
-                # 扫描并同步
-                result = self.scan_and_sync_task_images(task_id)
-                results.append(result)
-
-                if result.get("success"):
-                    if result.get("no_record"):
-                        orphan_tasks.append(task_id)
-                    else:
-                        synced_count += 1
-                else:
-                    failed_count += 1
+            new_checkpoints = {}
+
+            if pending:
+                workers = min(self.SCAN_WORKERS, len(pending))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="history-scan") as executor:
+                    futures = {executor.submit(scan_one, *item): item for item in pending}
+                    for future in as_completed(futures):
+                        task_id, mtime_ns, record_id = futures[future]
+                        try:
+                            task_id, mtime_ns, fingerprint, result = future.result()
+                        except Exception as e:
+                            failed_count += 1
+                            results.append({
+                                "success": False,
+                                "task_id": task_id,
+                                "error": f"扫描任务失败: {str(e)}"
+                            })
+                            continue
+
+                        if result is None:
+                            skipped_count += 1
+                            if record_id is None:
+                                orphan_tasks.append(task_id)
+                        else:
+                            results.append(result)
+                            if result.get("no_record"):
+                                orphan_tasks.append(task_id)
+                            else:
+                                synced_count += 1
+                            record_id = result.get("record_id")
+                        new_checkpoints[task_id] = {
+                            "mtime_ns": mtime_ns,
+                            "fingerprint": fingerprint,
+                            "record_id": record_id
+                        }
+
+            # 检查点在一次提交中完成
+            self.index.save_scan_checkpoints(
+                new_checkpoints,
+                removed=[task_id for task_id in checkpoints if task_id not in present]
+            )
 
             return {
                 "success": True,
-                "total_tasks": len(results),
+                "total_tasks": len(present),
                 "synced": synced_count,
+                "skipped": skipped_count,
                 "failed": failed_count,
                 "orphan_tasks": orphan_tasks,
-                "results": results
+                "results": results,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
             }
 
         except Exception as e:
@@ -0,0 +1,796 @@
+"""历史记录索引
+
+索引保存每条历史记录的摘要（标题、状态、时间、缩略图、页数、任务ID），供列表、搜索和统计使用；
+完整的记录内容仍保存在 history/<record_id>.json。
+
+提供两种可替换的实现：
+- SqliteHistoryIndex（默认）：history/index.db，WAL 模式，created_at / status / task_id 建有索引，
+  单条记录的增删改只影响一行，多个写入方由 SQLite 串行化，不会互相覆盖
+- JsonHistoryIndex：history/index.json，每次修改重写整个文件（兼容旧版本），
+  task_id -> record_id 反向索引保存在内存中
+
+首次使用 SQLite 索引时会自动导入已有的 index.json。
+
+两种索引都带有标题和大纲内容的全文检索（CJK bigram 切词，见 search_index）：
+SQLite 使用 FTS5 表，JSON 索引使用内存倒排索引。
+
+环境变量：
+- HISTORY_INDEX_BACKEND: sqlite（默认）或 json
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.services.search_index import (
+    SEARCH_COUNT_LIMIT, TITLE_WEIGHT, InvertedIndex, parse_query, to_fts_query, tokenize
+)
+from backend.utils.b64_stream import fsync_paths, write_file_atomic
+from backend.utils.pagination import SortedEntries, cursor_for, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+# 索引条目的字段（与 index.json 中的条目一致）
+INDEX_FIELDS = ("id", "title", "created_at", "updated_at", "status", "thumbnail", "page_count", "task_id")
+
+
+def entry_from_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """由完整记录生成索引条目"""
+    return {
+        "id": record["id"],
+        "title": record.get("title", ""),
+        "created_at": record.get("created_at"),
+        "updated_at": record.get("updated_at"),
+        "status": record.get("status", "draft"),
+        "thumbnail": record.get("thumbnail"),
+        "page_count": len((record.get("outline") or {}).get("pages", [])),
+        "task_id": (record.get("images") or {}).get("task_id"),
+    }
+
+
+class HistoryIndex(ABC):
+    """历史记录索引抽象基类"""
+
+    @abstractmethod
+    def add(self, entry: Dict[str, Any]):
+        """添加索引条目（新记录排在最前）"""
+        pass
+
+    @abstractmethod
+    def update(self, record_id: str, fields: Dict[str, Any]) -> bool:
+        """更新索引条目的部分字段，条目不存在时返回 False"""
+        pass
+
+    @abstractmethod
+    def remove(self, record_id: str) -> bool:
+        """删除索引条目，条目不存在时返回 False"""
+        pass
+
+    @abstractmethod
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """获取单个索引条目"""
+        pass
+
+    @abstractmethod
+    def list_page(self, status: Optional[str] = None, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """按创建时间倒序分页获取索引条目"""
+        pass
+
+    @abstractmethod
+    def list_after(
+        self,
+        status: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        游标分页：读取游标之后的一页（按创建时间倒序）
+
+        Args:
+            status: 状态过滤
+            cursor: 上一页返回的 next_cursor（为空时从第一条开始）
+            limit: 每页数量
+
+        Returns:
+            (条目列表, 下一页游标；没有更多时为 None)
+
+        Raises:
+            ValueError: 游标格式不正确
+        """
+        pass
+
+    @abstractmethod
+    def count(self, status: Optional[str] = None) -> int:
+        """统计索引条目数"""
+        pass
+
+    # ---------- 全文检索 ----------
+
+    @abstractmethod
+    def index_documents(self, documents: Iterable[Tuple[str, str, str]]):
+        """添加或替换全文检索文档 [(record_id, 标题, 正文)]（删除索引条目时对应文档会一并删除）"""
+        pass
+
+    @abstractmethod
+    def search_documents(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        全文检索，按相关度排序分页返回
+
+        Returns:
+            (命中总数（超过 SEARCH_COUNT_LIMIT 时为该上限）, 索引条目列表（带 score 字段）)
+        """
+        pass
+
+    @abstractmethod
+    def search_ready(self) -> bool:
+        """全文检索索引是否已包含所有已有记录"""
+        pass
+
+    @abstractmethod
+    def mark_search_ready(self):
+        """标记全文检索索引已完成初始构建"""
+        pass
+
+    @abstractmethod
+    def count_by_status(self) -> Dict[str, int]:
+        """按状态统计条目数"""
+        pass
+
+    @abstractmethod
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        """查找关联任务的记录ID（多条记录关联同一任务时返回最新的一条）"""
+        pass
+
+    @abstractmethod
+    def all(self) -> List[Dict[str, Any]]:
+        """按创建时间倒序返回全部条目"""
+        pass
+
+    def update_many(self, updates: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        批量更新索引条目（默认逐条更新，子类可在一次提交中完成）
+
+        Returns:
+            更新成功的条目数
+        """
+        return sum(1 for record_id, fields in updates if self.update(record_id, fields))
+
+    def upsert_many(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """
+        批量写入完整的索引条目：已存在的整条替换，不存在的新增（默认逐条写入，子类可在一次提交中完成）
+
+        Returns:
+            写入的条目数
+        """
+        count = 0
+        for entry in entries:
+            fields = {key: value for key, value in entry.items() if key != "id"}
+            if not self.update(entry["id"], fields):
+                self.add(entry)
+            count += 1
+        return count
+
+    # ---------- 扫描检查点（scan_all_tasks 增量扫描使用） ----------
+
+    @abstractmethod
+    def get_scan_checkpoints(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有任务目录的扫描检查点 {task_id: {"mtime_ns", "fingerprint", "record_id"}}"""
+        pass
+
+    @abstractmethod
+    def save_scan_checkpoints(self, checkpoints: Dict[str, Dict[str, Any]], removed: Iterable[str] = ()):
+        """保存（覆盖）扫描检查点，并删除 removed 中任务目录的检查点"""
+        pass
+
+    def sync(self):
+        """把已写入的索引刷到磁盘（截断写前日志前调用）"""
+        pass
+
+    def close(self):
+        """释放资源"""
+        pass
+
+
+class JsonHistoryIndex(HistoryIndex):
+    """基于 index.json 的索引（每次修改重写整个文件）"""
+
+    def __init__(self, index_file: str):
+        self.index_file = index_file
+        self.checkpoint_file = os.path.join(os.path.dirname(index_file), "scan_checkpoints.json")
+        # 读-改-写 期间加锁，避免同一进程内的并发修改互相覆盖
+        self._lock = threading.RLock()
+        # task_id -> record_id 反向索引（随增删改维护，index.json 被外部修改时重建）
+        self._task_map: Optional[Dict[str, str]] = None
+        self._task_map_signature = None
+        # 全文检索（内存倒排索引，进程启动后首次搜索时构建）
+        self._search_index = InvertedIndex()
+        self._search_ready = False
+        self._entries_cache = None
+        # 按状态预排序的条目 (文件签名, {status: SortedEntries})，index.json 变化后重建
+        self._sorted_cache = None
+        if not os.path.exists(self.index_file):
+            self._save({"records": []})
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {"records": []}
+
+    def _save(self, index: Dict):
+        data = json.dumps(index, ensure_ascii=False, indent=2).encode("utf-8")
+        write_file_atomic(self.index_file, data)
+        self._task_map_signature = self._file_signature()
+
+    def sync(self):
+        with self._lock:
+            fsync_paths([self.index_file])
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.index_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _build_task_map(records: List[Dict[str, Any]]) -> Dict[str, str]:
+        task_map = {}
+        # 条目按新到旧排列，同一任务保留最新的记录
+        for entry in reversed(records):
+            if entry.get("task_id"):
+                task_map[entry["task_id"]] = entry["id"]
+        return task_map
+
+    def add(self, entry: Dict[str, Any]):
+        with self._lock:
+            index = self._load()
+            index["records"].insert(0, dict(entry))
+            self._save(index)
+            if self._task_map is not None and entry.get("task_id"):
+                self._task_map[entry["task_id"]] = entry["id"]
+
+    def update(self, record_id: str, fields: Dict[str, Any]) -> bool:
+        with self._lock:
+            index = self._load()
+            for entry in index["records"]:
+                if entry["id"] == record_id:
+                    entry.update(fields)
+                    self._save(index)
+                    if "task_id" in fields:
+                        self._task_map = self._build_task_map(index["records"])
+                    return True
+            return False
+
+    def remove(self, record_id: str) -> bool:
+        with self._lock:
+            index = self._load()
+            records = [r for r in index["records"] if r["id"] != record_id]
+            if len(records) == len(index["records"]):
+                return False
+            index["records"] = records
+            self._save(index)
+            self._task_map = self._build_task_map(records)
+            self._search_index.remove(record_id)
+            return True
+
+    def update_many(self, updates: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        updates = dict(updates)
+        if not updates:
+            return 0
+        with self._lock:
+            index = self._load()
+            updated = 0
+            for entry in index["records"]:
+                fields = updates.get(entry["id"])
+                if fields is not None:
+                    entry.update(fields)
+                    updated += 1
+            if updated:
+                self._save(index)
+                if any("task_id" in fields for fields in updates.values()):
+                    self._task_map = self._build_task_map(index["records"])
+            return updated
+
+    def upsert_many(self, entries: Iterable[Dict[str, Any]]) -> int:
+        entries = list(entries)
+        if not entries:
+            return 0
+        with self._lock:
+            index = self._load()
+            positions = {entry["id"]: i for i, entry in enumerate(index["records"])}
+            new_entries = []
+            for entry in entries:
+                i = positions.get(entry["id"])
+                if i is None:
+                    new_entries.append(dict(entry))
+                else:
+                    index["records"][i] = dict(entry)
+            # 新记录排在最前（后写入的更新）
+            index["records"][:0] = new_entries[::-1]
+            self._save(index)
+            if self._task_map is not None:
+                self._task_map = self._build_task_map(index["records"])
+            return len(entries)
+
+    def get_scan_checkpoints(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_scan_checkpoints(self, checkpoints: Dict[str, Dict[str, Any]], removed: Iterable[str] = ()):
+        with self._lock:
+            data = self.get_scan_checkpoints()
+            data.update(checkpoints)
+            for task_id in removed:
+                data.pop(task_id, None)
+            write_file_atomic(
+                self.checkpoint_file,
+                json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+            )
+
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            if self._task_map is None or self._task_map_signature != self._file_signature():
+                self._task_map_signature = self._file_signature()
+                self._task_map = self._build_task_map(self._load().get("records", []))
+            return self._task_map.get(task_id)
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        for entry in self._load().get("records", []):
+            if entry["id"] == record_id:
+                return entry
+        return None
+
+    def _filtered(self, status: Optional[str]) -> List[Dict[str, Any]]:
+        records = self._load().get("records", [])
+        if status:
+            records = [r for r in records if r.get("status") == status]
+        return records
+
+    def _sorted(self, status: Optional[str]) -> SortedEntries:
+        """按 (created_at, id) 预排序的条目（按状态分别缓存）"""
+        with self._lock:
+            signature = self._file_signature()
+            if self._sorted_cache is None or self._sorted_cache[0] != signature:
+                self._sorted_cache = (signature, {})
+            views = self._sorted_cache[1]
+            view = views.get(status)
+            if view is None:
+                view = views[status] = SortedEntries(self._filtered(status))
+            return view
+
+    def list_page(self, status: Optional[str] = None, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        return self._sorted(status).page_at(offset, limit)
+
+    def list_after(
+        self,
+        status: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        key = decode_cursor(cursor) if cursor else None
+        return self._sorted(status).page_after(key, limit)
+
+    def count(self, status: Optional[str] = None) -> int:
+        return len(self._sorted(status))
+
+    def index_documents(self, documents: Iterable[Tuple[str, str, str]]):
+        for record_id, title, content in documents:
+            self._search_index.add(record_id, title, content)
+
+    def search_documents(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        entries = self._entries_by_id()
+        hits = [(record_id, score) for record_id, score in self._search_index.search(query) if record_id in entries]
+        results = [
+            {**entries[record_id], "score": round(score, 4)}
+            for record_id, score in hits[offset:offset + limit]
+        ]
+        return min(len(hits), SEARCH_COUNT_LIMIT), results
+
+    def _entries_by_id(self) -> Dict[str, Dict[str, Any]]:
+        """按 id 映射的索引条目（index.json 未变化时复用）"""
+        with self._lock:
+            signature = self._file_signature()
+            if self._entries_cache is None or self._entries_cache[0] != signature:
+                self._entries_cache = (signature, {entry["id"]: entry for entry in self._filtered(None)})
+            return self._entries_cache[1]
+
+    def search_ready(self) -> bool:
+        return self._search_ready
+
+    def mark_search_ready(self):
+        self._search_ready = True
+
+    def count_by_status(self) -> Dict[str, int]:
+        status_count = {}
+        for record in self._filtered(None):
+            status = record.get("status", "draft")
+            status_count[status] = status_count.get(status, 0) + 1
+        return status_count
+
+    def all(self) -> List[Dict[str, Any]]:
+        return self._filtered(None)
+
+
+class SqliteHistoryIndex(HistoryIndex):
+    """基于 SQLite（WAL 模式）的索引"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history_index (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL DEFAULT '',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'draft',
+            thumbnail TEXT,
+            page_count INTEGER NOT NULL DEFAULT 0,
+            task_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_created_at ON history_index (created_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_history_status ON history_index (status, created_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_history_task_id ON history_index (task_id);
+        CREATE TABLE IF NOT EXISTS history_fts_docs (
+            doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            record_id TEXT NOT NULL UNIQUE
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+            title, content, tokenize = 'unicode61 remove_diacritics 0', prefix = '1 2'
+        );
+        CREATE TABLE IF NOT EXISTS scan_checkpoints (
+            task_id TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            record_id TEXT
+        );
+        CREATE TABLE IF NOT EXISTS index_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    # 与 JSON 索引一致：新记录在前，创建时间相同时按 id 排序保证分页稳定
+    ORDER_BY = "ORDER BY created_at DESC, id DESC"
+
+    def __init__(self, db_path: str, import_json_path: Optional[str] = None):
+        """
+        Args:
+            db_path: 数据库文件路径
+            import_json_path: 首次使用时导入的 index.json 路径（可选）
+        """
+        self.db_path = db_path
+        # 每个线程使用独立连接（WAL 模式下读写互不阻塞）
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+
+        if import_json_path and os.path.exists(import_json_path):
+            row = conn.execute("SELECT value FROM index_meta WHERE key = 'json_imported'").fetchone()
+            if row is None:
+                count = self.import_json(import_json_path)
+                logger.info(f"已从 {import_json_path} 导入 {count} 条历史记录索引")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：自行控制事务，写操作使用 BEGIN IMMEDIATE 尽早获取写锁
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _write(self, sql: str, params=()) -> int:
+        with self._transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    @contextmanager
+    def _transaction(self):
+        """写事务（BEGIN IMMEDIATE ... COMMIT，异常时回滚）"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _row_to_entry(row: sqlite3.Row) -> Dict[str, Any]:
+        return {field: row[field] for field in INDEX_FIELDS}
+
+    @staticmethod
+    def _entry_params(entry: Dict[str, Any]) -> tuple:
+        return (
+            entry["id"],
+            entry.get("title") or "",
+            entry.get("created_at") or "",
+            entry.get("updated_at") or entry.get("created_at") or "",
+            entry.get("status") or "draft",
+            entry.get("thumbnail"),
+            entry.get("page_count") or 0,
+            entry.get("task_id"),
+        )
+
+    def add(self, entry: Dict[str, Any]):
+        self._write(
+            f"INSERT OR REPLACE INTO history_index ({', '.join(INDEX_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self._entry_params(entry)
+        )
+
+    @staticmethod
+    def _update_statement(record_id: str, fields: Dict[str, Any]) -> Optional[Tuple[str, list]]:
+        columns = [key for key in fields if key in INDEX_FIELDS and key != "id"]
+        if not columns:
+            return None
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        params = [fields[column] for column in columns] + [record_id]
+        return f"UPDATE history_index SET {assignments} WHERE id = ?", params
+
+    def update(self, record_id: str, fields: Dict[str, Any]) -> bool:
+        statement = self._update_statement(record_id, fields)
+        if statement is None:
+            return self.get(record_id) is not None
+        return self._write(*statement) > 0
+
+    def update_many(self, updates: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        statements = [self._update_statement(record_id, fields) for record_id, fields in updates]
+        statements = [statement for statement in statements if statement is not None]
+        if not statements:
+            return 0
+        updated = 0
+        with self._transaction() as conn:
+            for sql, params in statements:
+                updated += conn.execute(sql, params).rowcount
+        return updated
+
+    def upsert_many(self, entries: Iterable[Dict[str, Any]]) -> int:
+        params = [self._entry_params(entry) for entry in entries]
+        if not params:
+            return 0
+        assignments = ", ".join(f"{field} = excluded.{field}" for field in INDEX_FIELDS if field != "id")
+        with self._transaction() as conn:
+            conn.executemany(
+                f"INSERT INTO history_index ({', '.join(INDEX_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                f"ON CONFLICT(id) DO UPDATE SET {assignments}",
+                params
+            )
+        return len(params)
+
+    def get_scan_checkpoints(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._conn().execute("SELECT task_id, mtime_ns, fingerprint, record_id FROM scan_checkpoints")
+        return {
+            task_id: {"mtime_ns": mtime_ns, "fingerprint": fingerprint, "record_id": record_id}
+            for task_id, mtime_ns, fingerprint, record_id in rows
+        }
+
+    def save_scan_checkpoints(self, checkpoints: Dict[str, Dict[str, Any]], removed: Iterable[str] = ()):
+        removed = [(task_id,) for task_id in removed]
+        if not checkpoints and not removed:
+            return
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO scan_checkpoints (task_id, mtime_ns, fingerprint, record_id) VALUES (?, ?, ?, ?)",
+                [
+                    (task_id, cp["mtime_ns"], cp["fingerprint"], cp.get("record_id"))
+                    for task_id, cp in checkpoints.items()
+                ]
+            )
+            conn.executemany("DELETE FROM scan_checkpoints WHERE task_id = ?", removed)
+
+    def remove(self, record_id: str) -> bool:
+        with self._transaction() as conn:
+            doc_id = self._remove_document(conn, record_id)
+            if doc_id is not None:
+                conn.execute("DELETE FROM history_fts_docs WHERE doc_id = ?", (doc_id,))
+            return conn.execute("DELETE FROM history_index WHERE id = ?", (record_id,)).rowcount > 0
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM history_index WHERE id = ?", (record_id,)).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def list_page(self, status: Optional[str] = None, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        if status:
+            rows = self._conn().execute(
+                f"SELECT * FROM history_index WHERE status = ? {self.ORDER_BY} LIMIT ? OFFSET ?",
+                (status, limit, offset)
+            )
+        else:
+            rows = self._conn().execute(
+                f"SELECT * FROM history_index {self.ORDER_BY} LIMIT ? OFFSET ?",
+                (limit, offset)
+            )
+        return [self._row_to_entry(row) for row in rows]
+
+    def list_after(
+        self,
+        status: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if cursor:
+            created_at, record_id = decode_cursor(cursor)
+            # 与 ORDER BY created_at DESC, id DESC 对应，走 created_at / status 复合索引
+            conditions.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([created_at, created_at, record_id])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # 多取一条判断是否还有下一页
+        rows = self._conn().execute(
+            f"SELECT * FROM history_index {where} {self.ORDER_BY} LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        entries = [self._row_to_entry(row) for row in rows[:limit]]
+        next_cursor = cursor_for(entries[-1]) if len(rows) > limit else None
+        return entries, next_cursor
+
+    def count(self, status: Optional[str] = None) -> int:
+        if status:
+            row = self._conn().execute("SELECT COUNT(*) FROM history_index WHERE status = ?", (status,)).fetchone()
+        else:
+            row = self._conn().execute("SELECT COUNT(*) FROM history_index").fetchone()
+        return row[0]
+
+    @staticmethod
+    def _remove_document(conn: sqlite3.Connection, record_id: str) -> Optional[int]:
+        row = conn.execute("SELECT doc_id FROM history_fts_docs WHERE record_id = ?", (record_id,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("DELETE FROM history_fts WHERE rowid = ?", (row[0],))
+        return row[0]
+
+    def index_documents(self, documents: Iterable[Tuple[str, str, str]]):
+        with self._transaction() as conn:
+            for record_id, title, content in documents:
+                doc_id = self._remove_document(conn, record_id)
+                if doc_id is None:
+                    doc_id = conn.execute(
+                        "INSERT INTO history_fts_docs (record_id) VALUES (?)", (record_id,)
+                    ).lastrowid
+                # 存入切好的词（空格分隔），FTS5 的 unicode61 分词器会按空格还原
+                conn.execute(
+                    "INSERT INTO history_fts (rowid, title, content) VALUES (?, ?, ?)",
+                    (doc_id, " ".join(tokenize(title)), " ".join(tokenize(content)))
+                )
+
+    def search_documents(self, query: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[Dict[str, Any]]]:
+        terms = parse_query(query)
+        if not terms:
+            return 0, []
+        match = to_fts_query(terms)
+        conn = self._conn()
+
+        total = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM history_fts WHERE history_fts MATCH ? LIMIT ?)",
+            (match, SEARCH_COUNT_LIMIT)
+        ).fetchone()[0]
+        if total == 0 or offset >= total:
+            return total, []
+
+        # 在 FTS5 内按 bm25() 对全部命中排序（标题列加权），分数相同时新记录在前（doc_id 自增，越大越新）；
+        # 只取当前页，翻页时顺序保持一致
+        rows = conn.execute(
+            "SELECT rowid, bm25(history_fts, ?, 1.0) AS rank FROM history_fts WHERE history_fts MATCH ? "
+            "ORDER BY rank, rowid DESC LIMIT ? OFFSET ?",
+            (TITLE_WEIGHT, match, limit, offset)
+        ).fetchall()
+        # bm25() 越小越相关，取反后与 JSON 索引一致（越高越相关）
+        scores = {doc_id: -rank for doc_id, rank in rows}
+        hits = [doc_id for doc_id, _ in rows]
+
+        if not hits:
+            return total, []
+        placeholders = ", ".join("?" for _ in hits)
+        rows = conn.execute(
+            f"SELECT d.doc_id, h.* FROM history_fts_docs d JOIN history_index h ON h.id = d.record_id "
+            f"WHERE d.doc_id IN ({placeholders})",
+            hits
+        )
+        entries = {row["doc_id"]: self._row_to_entry(row) for row in rows}
+        return total, [
+            {**entries[doc_id], "score": round(scores[doc_id], 4)}
+            for doc_id in hits if doc_id in entries
+        ]
+
+    def search_ready(self) -> bool:
+        row = self._conn().execute("SELECT value FROM index_meta WHERE key = 'fts_built'").fetchone()
+        return row is not None
+
+    def mark_search_ready(self):
+        self._write("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('fts_built', '1')")
+
+    def count_by_status(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM history_index GROUP BY status")
+        return {status: count for status, count in rows}
+
+    def find_by_task_id(self, task_id: str) -> Optional[str]:
+        row = self._conn().execute(
+            f"SELECT id FROM history_index WHERE task_id = ? {self.ORDER_BY} LIMIT 1",
+            (task_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(f"SELECT * FROM history_index {self.ORDER_BY}")
+        return [self._row_to_entry(row) for row in rows]
+
+    def import_json(self, index_file: str) -> int:
+        """
+        从 index.json 导入索引条目（已存在的条目会被覆盖）
+
+        Returns:
+            导入的条目数
+        """
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                records = json.load(f).get("records", [])
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取 {index_file} 失败，跳过导入: {e}")
+            records = []
+
+        with self._transaction() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO history_index ({', '.join(INDEX_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._entry_params(entry) for entry in records if entry.get("id")]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO index_meta (key, value) VALUES ('json_imported', ?)",
+                (str(len(records)),)
+            )
+        return len(records)
+
+    def sync(self):
+        # synchronous=NORMAL 下提交不 fsync；检查点会先 fsync WAL，之前提交的事务随之持久化
+        self._conn().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+def create_history_index(history_dir: str, backend: Optional[str] = None) -> HistoryIndex:
+    """
+    创建历史记录索引
+
+    Args:
+        history_dir: 历史记录目录
+        backend: sqlite 或 json（默认读取环境变量 HISTORY_INDEX_BACKEND，未设置时为 sqlite）
+    """
+    backend = (backend or os.getenv('HISTORY_INDEX_BACKEND') or 'sqlite').lower()
+    index_file = os.path.join(history_dir, "index.json")
+
+    if backend == 'json':
+        return JsonHistoryIndex(index_file)
+    if backend == 'sqlite':
+        return SqliteHistoryIndex(os.path.join(history_dir, "index.db"), import_json_path=index_file)
+
+    raise ValueError(
+        f"不支持的历史记录索引类型: {backend}\n"
+        "支持的类型: sqlite, json\n"
+        "解决方案：检查环境变量 HISTORY_INDEX_BACKEND"
+    )
@@ -0,0 +1,340 @@
+"""历史记录写前日志（journal）
+
+记录文件（history/<id>.json）和索引是分开写的，中途崩溃会让两者不一致；多个 worker 进程同时
+读-改-写同一条记录也会互相覆盖。这里把每次修改先追加到 .journal/journal.log，再落盘记录文件和索引：
+
+- 事务：读-改-写在进程内互斥锁和跨进程文件锁（fcntl.flock）保护下进行，修改以一行 JSON 追加到日志
+- 组提交：并发事务追加的日志一起提交，随后整批落盘。同一批里对同一记录的多次修改只写最后一次，
+  索引在一次批量写入中更新
+- 提交窗口：HISTORY_JOURNAL_COMMIT_DELAY（秒，默认 0.05）大于 0 时，事务落盘后即返回，窗口内追加的
+  日志（包括同一线程顺序提交的多次状态更新）在窗口结束时由一次 fsync 提交；崩溃最多丢失最近一个
+  窗口内的修改。设为 0 时每批修改都先 fsync 日志再落盘
+- 落盘：记录文件通过临时文件 + rename 原子替换（不单独 fsync，持久性由日志保证）
+- 恢复：启动时重放日志（幂等，末尾写了一半的行会被忽略），然后截断日志
+
+日志超过 HISTORY_JOURNAL_CHECKPOINT_BYTES 且没有未落盘的修改时，fsync 落盘过的记录文件和索引
+（由调用方的 sync 回调完成）后截断。
+本进程有未落盘的修改期间一直持有文件锁，其他进程的事务会等待落盘完成后再读取记录。
+"""
+import copy
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只做进程内互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_CHECKPOINT_BYTES = int(os.getenv('HISTORY_JOURNAL_CHECKPOINT_BYTES') or 4 * 1024 * 1024)
+JOURNAL_COMMIT_DELAY = float(os.getenv('HISTORY_JOURNAL_COMMIT_DELAY') or 0.05)
+
+# 已删除（尚未落盘）的记录
+_DELETED = object()
+
+
+class JournalEntry(NamedTuple):
+    """一次修改"""
+    op: str  # put（整条写入）/ delete
+    record_id: str
+    record: Optional[Dict[str, Any]] = None
+
+
+def latest_entries(entries: List[JournalEntry]) -> List[JournalEntry]:
+    """同一记录只保留最后一次修改（按最后修改的顺序排列）"""
+    latest: Dict[str, JournalEntry] = {}
+    for entry in entries:
+        latest.pop(entry.record_id, None)
+        latest[entry.record_id] = entry
+    return list(latest.values())
+
+
+class JournalTransaction:
+    """一个事务内的修改（由 HistoryJournal.transaction 创建）"""
+
+    def __init__(self, pending: Dict[str, Any]):
+        self._pending = pending
+        self._local: Dict[str, Any] = {}
+        self.entries: List[JournalEntry] = []
+
+    def read(self, record_id: str, loader: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        读取记录的最新状态（包括本事务和尚未落盘的修改）
+
+        Args:
+            record_id: 记录ID
+            loader: 没有未落盘的修改时从文件读取记录
+        """
+        value = self._local.get(record_id, self._pending.get(record_id))
+        if value is None:
+            return loader(record_id)
+        if value is _DELETED:
+            return None
+        return copy.deepcopy(value)
+
+    def put(self, record_id: str, record: Dict[str, Any]):
+        """写入整条记录（之后不要再修改 record）"""
+        self._local[record_id] = record
+        self.entries.append(JournalEntry("put", record_id, record))
+
+    def delete(self, record_id: str):
+        """删除记录"""
+        self._local[record_id] = _DELETED
+        self.entries.append(JournalEntry("delete", record_id))
+
+
+class HistoryJournal:
+    """历史记录写前日志"""
+
+    def __init__(
+        self,
+        journal_dir: str,
+        materialize: Callable[[List[JournalEntry]], None],
+        checkpoint_bytes: int = JOURNAL_CHECKPOINT_BYTES,
+        commit_delay: float = JOURNAL_COMMIT_DELAY,
+        sync: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            journal_dir: 日志目录
+            materialize: 把一批修改落盘到记录文件和索引（每条记录只出现一次，须幂等）
+            checkpoint_bytes: 日志超过该大小时截断
+            commit_delay: 提交窗口（秒），窗口内追加的日志由一次 fsync 提交；0 表示每批修改落盘前 fsync
+            sync: 把落盘过的记录文件和索引刷到磁盘（截断日志前调用）
+        """
+        os.makedirs(journal_dir, exist_ok=True)
+        self.journal_path = os.path.join(journal_dir, "journal.log")
+        self.lock_path = os.path.join(journal_dir, "lock")
+        self.checkpoint_bytes = checkpoint_bytes
+        self.commit_delay = max(0.0, commit_delay)
+        self._materialize = materialize
+        self._sync = sync
+
+        # 事务的读-改-写和追加日志
+        self._mutex = threading.Lock()
+        # 组提交：同一时间只有一个线程 fsync 并落盘
+        self._flush_lock = threading.Lock()
+        # 已追加但未落盘的最新状态 {record_id: record 或 _DELETED}
+        self._pending: Dict[str, Any] = {}
+        self._unflushed: List[Tuple[int, List[JournalEntry]]] = []
+        self._seq = 0
+        self._flushed_seq = 0
+        self._failed: Dict[int, BaseException] = {}
+        # 持有文件锁的事务数（进行中 + 未落盘）
+        self._holders = 0
+        self._pid: Optional[int] = None
+        self._journal_fd: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        # 提交窗口结束时 fsync 日志的定时器
+        self._sync_timer: Optional[threading.Timer] = None
+
+        # 统计
+        self.transactions = 0
+        self.flushes = 0
+        self.syncs = 0
+
+    # ==================== 文件与锁 ====================
+
+    def _open_locked(self):
+        # fork 出的子进程与父进程共享打开的文件描述，flock 无法互斥，需要重新打开
+        if self._pid == os.getpid():
+            return
+        self._journal_fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._pid = os.getpid()
+        self._holders = 0
+        self._sync_timer = None
+
+    def _acquire_file_lock_locked(self):
+        self._open_locked()
+        if self._holders == 0 and fcntl is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        self._holders += 1
+
+    def _release_file_lock_locked(self, count: int = 1):
+        self._holders -= count
+        if self._holders == 0 and fcntl is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # ==================== 事务 ====================
+
+    @contextmanager
+    def transaction(self) -> Iterator[JournalTransaction]:
+        """
+        写事务
+
+        用法：
+            with journal.transaction() as txn:
+                record = txn.read(record_id, load_record)
+                record["status"] = "completed"
+                txn.put(record_id, record)
+
+        退出时修改已写入日志，且已落盘到记录文件和索引。commit_delay 为 0 时日志已 fsync，
+        否则在提交窗口结束时 fsync。
+        """
+        with self._mutex:
+            self._acquire_file_lock_locked()
+            txn = JournalTransaction(self._pending)
+            try:
+                yield txn
+                seq = self._append_locked(txn.entries) if txn.entries else None
+            except BaseException:
+                self._release_file_lock_locked()
+                raise
+            if seq is None:
+                self._release_file_lock_locked()
+                return
+        self._flush(seq)
+
+    def _append_locked(self, entries: List[JournalEntry]) -> int:
+        # 一个事务一行，崩溃时写了一半的事务整行被忽略
+        line = json.dumps(
+            {"ops": [{"op": e.op, "id": e.record_id, "record": e.record} for e in entries]},
+            ensure_ascii=False,
+            separators=(',', ':')
+        ).encode("utf-8") + b"\n"
+        view = memoryview(line)
+        while view:
+            written = os.write(self._journal_fd, view)
+            view = view[written:]
+
+        self._seq += 1
+        for entry in entries:
+            self._pending[entry.record_id] = entry.record if entry.op == "put" else _DELETED
+        self._unflushed.append((self._seq, entries))
+        self.transactions += 1
+        return self._seq
+
+    def _flush(self, seq: int):
+        """组提交：提交日志并落盘所有已追加的修改（其他线程已完成时直接返回）"""
+        with self._flush_lock:
+            if self._flushed_seq < seq:
+                with self._mutex:
+                    batch, self._unflushed = self._unflushed, []
+                    target = self._seq
+                entries = latest_entries([entry for _, txn_entries in batch for entry in txn_entries])
+                error = None
+                try:
+                    if self.commit_delay:
+                        with self._mutex:
+                            self._schedule_sync_locked()
+                    else:
+                        os.fsync(self._journal_fd)
+                        self.syncs += 1
+                    self._materialize(entries)
+                except BaseException as e:
+                    # 已写入日志的修改会在下次启动时重放
+                    logger.error(f"历史记录日志提交失败: {e}")
+                    error = e
+                finally:
+                    with self._mutex:
+                        for entry in entries:
+                            current = self._pending.get(entry.record_id)
+                            if current is entry.record or (entry.op == "delete" and current is _DELETED):
+                                del self._pending[entry.record_id]
+                        self._flushed_seq = target
+                        if error is not None:
+                            for txn_seq, _ in batch:
+                                self._failed[txn_seq] = error
+                        if self._holders == len(batch) and not self._pending:
+                            self._maybe_checkpoint_locked()
+                        self._release_file_lock_locked(len(batch))
+                        self.flushes += 1
+
+            error = self._failed.pop(seq, None)
+        if error is not None:
+            raise error
+
+    def _schedule_sync_locked(self):
+        if self._sync_timer is None:
+            self._sync_timer = threading.Timer(self.commit_delay, self._sync_journal)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _sync_journal(self):
+        """提交窗口结束：一次 fsync 提交窗口内追加的所有日志"""
+        with self._mutex:
+            if self._sync_timer is None or self._pid != os.getpid():
+                return
+            self._sync_timer = None
+            self._sync_journal_locked()
+
+    def _sync_journal_locked(self):
+        try:
+            os.fsync(self._journal_fd)
+            self.syncs += 1
+        except OSError as e:
+            logger.warning(f"提交历史记录日志失败: {e}")
+
+    # ==================== 检查点与恢复 ====================
+
+    def _maybe_checkpoint_locked(self):
+        try:
+            if os.fstat(self._journal_fd).st_size < self.checkpoint_bytes:
+                return
+            self._checkpoint_locked()
+        except OSError as e:
+            logger.warning(f"截断历史记录日志失败: {e}")
+
+    def _checkpoint_locked(self):
+        # 落盘的记录文件和索引没有单独 fsync，截断日志前先刷到磁盘
+        if self._sync is not None:
+            self._sync()
+        os.ftruncate(self._journal_fd, 0)
+        os.fsync(self._journal_fd)
+
+    def _read_journal(self) -> List[JournalEntry]:
+        entries: List[JournalEntry] = []
+        try:
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        ops = json.loads(line)["ops"]
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning("历史记录日志末尾的事务不完整，已忽略")
+                        break
+                    entries.extend(JournalEntry(op["op"], op["id"], op.get("record")) for op in ops)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def replay(self) -> List[JournalEntry]:
+        """
+        重放日志中的修改并截断日志（启动时调用）
+
+        Returns:
+            重放的修改（每条记录只保留最后一次）
+        """
+        with self._mutex:
+            self._acquire_file_lock_locked()
+            try:
+                entries = latest_entries(self._read_journal())
+                if entries:
+                    self._materialize(entries)
+                    logger.info(f"已从历史记录日志恢复 {len(entries)} 条记录的修改")
+                if os.fstat(self._journal_fd).st_size:
+                    self._checkpoint_locked()
+                return entries
+            finally:
+                self._release_file_lock_locked()
+
+    def close(self):
+        """关闭文件（提交窗口内的日志先 fsync）"""
+        with self._mutex:
+            if self._sync_timer is not None and self._pid == os.getpid():
+                self._sync_timer.cancel()
+                self._sync_timer = None
+                self._sync_journal_locked()
+            for fd in (self._journal_fd, self._lock_fd):
+                if fd is not None:
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            self._journal_fd = self._lock_fd = None
+            self._pid = None
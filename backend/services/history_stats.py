@@ -0,0 +1,287 @@
+"""历史记录统计计数器
+
+统计接口会被前端轮询，不能每次都遍历全部记录。这里在内存中维护：
+- 按状态的记录数
+- 按用户、按状态的记录数（条目带 user_id 时）
+- 按创建时间（小时）分桶的记录数，只保留最近 7 天，用于统计最近 24 小时 / 7 天新建的记录
+
+计数器在首次读取时由全量条目构建，之后随创建、状态变化、删除增量维护，读取的开销与记录数无关。
+多进程部署或索引被外部修改时计数可能漂移，因此会定期（HISTORY_STATS_CHECK_INTERVAL 秒）
+在后台线程中全量重新统计一次，与计数器不一致时记录日志并修复。
+
+环境变量：
+- HISTORY_STATS_CHECK_INTERVAL: 自检间隔（秒），默认 3600，0 表示不自动自检
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 时间分桶保留的小时数（7 天）
+BUCKET_HOURS = 7 * 24
+
+# 统计窗口（小时）
+WINDOWS = {"last_24h": 24, "last_7d": BUCKET_HOURS}
+
+STATS_CHECK_INTERVAL = float(os.getenv('HISTORY_STATS_CHECK_INTERVAL') or 3600)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class _Counts:
+    """一组计数：按状态 + 按创建小时分桶"""
+
+    __slots__ = ("by_status", "buckets")
+
+    def __init__(self):
+        self.by_status: Counter = Counter()
+        self.buckets: Counter = Counter()
+
+    def add(self, status: str, hour: Optional[int], delta: int):
+        self.by_status[status] += delta
+        if self.by_status[status] <= 0:
+            del self.by_status[status]
+        if hour is not None:
+            self.buckets[hour] += delta
+            if self.buckets[hour] <= 0:
+                del self.buckets[hour]
+
+    def prune(self, oldest_hour: int):
+        for hour in [hour for hour in self.buckets if hour < oldest_hour]:
+            del self.buckets[hour]
+
+    def snapshot(self, current_hour: int) -> Dict[str, Any]:
+        result = {
+            "total": sum(self.by_status.values()),
+            "by_status": dict(self.by_status),
+        }
+        for name, hours in WINDOWS.items():
+            # 当前小时也计入窗口（精度为 1 小时）
+            result[name] = sum(count for hour, count in self.buckets.items() if hour > current_hour - hours)
+        return result
+
+    def diff(self, other: "_Counts") -> Dict[str, Any]:
+        differences = {}
+        if self.by_status != other.by_status:
+            differences["by_status"] = {"counted": dict(self.by_status), "actual": dict(other.by_status)}
+        if self.buckets != other.buckets:
+            hours = sorted(set(self.buckets) | set(other.buckets))
+            differences["buckets"] = {
+                (_EPOCH + timedelta(hours=hour)).isoformat(timespec="hours"): {
+                    "counted": self.buckets.get(hour, 0),
+                    "actual": other.buckets.get(hour, 0)
+                }
+                for hour in hours if self.buckets.get(hour, 0) != other.buckets.get(hour, 0)
+            }
+        return differences
+
+
+class HistoryStats:
+    """历史记录的增量统计计数器"""
+
+    def __init__(
+        self,
+        loader: Callable[[], Iterable[Dict[str, Any]]],
+        utc: bool = False,
+        check_interval: float = STATS_CHECK_INTERVAL
+    ):
+        """
+        Args:
+            loader: 返回全部索引条目（需含 status、created_at，可选 user_id），用于构建和自检
+            utc: 条目中不带时区的 created_at 是否为 UTC 时间（否则按本地时间处理）
+            check_interval: 自检间隔（秒），0 表示不自动自检
+        """
+        self._loader = loader
+        self._utc = utc
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._total = _Counts()
+        self._by_user: Dict[str, _Counts] = {}
+        # 每次修改计数器时递增，自检期间有修改时放弃本次修复
+        self._version = 0
+        self._last_check = 0.0
+        self._checking = False
+
+    # ==================== 时间分桶 ====================
+
+    def _now(self) -> datetime:
+        return datetime.utcnow() if self._utc else datetime.now()
+
+    def _hour_of(self, created_at: Optional[str]) -> Optional[int]:
+        if not created_at:
+            return None
+        try:
+            dt = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            return None
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc if self._utc else None).replace(tzinfo=None)
+        return int((dt - _EPOCH).total_seconds() // 3600)
+
+    def _current_hour(self) -> int:
+        return int((self._now() - _EPOCH).total_seconds() // 3600)
+
+    # ==================== 增量维护 ====================
+
+    def _apply_locked(self, entry: Dict[str, Any], status: Optional[str], delta: int):
+        hour = self._hour_of(entry.get("created_at"))
+        if hour is not None and hour <= self._current_hour() - BUCKET_HOURS:
+            # 超出保留范围的记录不计入时间分桶
+            hour = None
+        status = status or "draft"
+        self._total.add(status, hour, delta)
+        user_id = entry.get("user_id")
+        if user_id is not None:
+            counts = self._by_user.get(user_id)
+            if counts is None:
+                counts = self._by_user[user_id] = _Counts()
+            counts.add(status, hour, delta)
+            if not counts.by_status:
+                del self._by_user[user_id]
+        self._version += 1
+
+    def record_added(self, entry: Dict[str, Any]):
+        """新建记录后调用"""
+        with self._lock:
+            if self._loaded:
+                self._apply_locked(entry, entry.get("status"), 1)
+
+    def record_removed(self, entry: Dict[str, Any]):
+        """删除记录后调用（entry 为删除前的条目）"""
+        with self._lock:
+            if self._loaded:
+                self._apply_locked(entry, entry.get("status"), -1)
+
+    def status_changed(self, entry: Dict[str, Any], old_status: Optional[str], new_status: Optional[str]):
+        """记录状态变化后调用"""
+        if (old_status or "draft") == (new_status or "draft"):
+            return
+        with self._lock:
+            if self._loaded:
+                self._apply_locked(entry, old_status, -1)
+                self._apply_locked(entry, new_status, 1)
+
+    # ==================== 读取 ====================
+
+    def _count_entries(self, entries: Iterable[Dict[str, Any]]):
+        total = _Counts()
+        by_user: Dict[str, _Counts] = {}
+        oldest_hour = self._current_hour() - BUCKET_HOURS
+        for entry in entries:
+            hour = self._hour_of(entry.get("created_at"))
+            if hour is not None and hour <= oldest_hour:
+                hour = None
+            status = entry.get("status") or "draft"
+            total.add(status, hour, 1)
+            user_id = entry.get("user_id")
+            if user_id is not None:
+                counts = by_user.get(user_id)
+                if counts is None:
+                    counts = by_user[user_id] = _Counts()
+                counts.add(status, hour, 1)
+        return total, by_user
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            self._total, self._by_user = self._count_entries(self._loader())
+            self._loaded = True
+            self._last_check = time.monotonic()
+            logger.info(f"历史记录统计计数器构建完成，耗时 {time.perf_counter() - started:.2f}s")
+
+    def snapshot(self, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        读取统计
+
+        Args:
+            user_id: 只统计该用户的记录（不传时统计全部）
+
+        Returns:
+            {"total", "by_status", "last_24h", "last_7d"}
+        """
+        self._ensure_loaded()
+        self._maybe_schedule_check()
+        with self._lock:
+            current_hour = self._current_hour()
+            self._total.prune(current_hour - BUCKET_HOURS + 1)
+            if user_id is None:
+                return self._total.snapshot(current_hour)
+            counts = self._by_user.get(user_id)
+            if counts is None:
+                return _Counts().snapshot(current_hour)
+            counts.prune(current_hour - BUCKET_HOURS + 1)
+            return counts.snapshot(current_hour)
+
+    # ==================== 自检 ====================
+
+    def _maybe_schedule_check(self):
+        if self.check_interval <= 0:
+            return
+        with self._lock:
+            if self._checking or time.monotonic() - self._last_check < self.check_interval:
+                return
+            self._checking = True
+        threading.Thread(target=self._background_check, name="history-stats-check", daemon=True).start()
+
+    def _background_check(self):
+        try:
+            self.self_check(repair=True)
+        except Exception as e:
+            logger.warning(f"历史记录统计自检失败: {e}")
+        finally:
+            with self._lock:
+                self._checking = False
+
+    def self_check(self, repair: bool = True) -> Dict[str, Any]:
+        """
+        全量重新统计并与计数器比对
+
+        Args:
+            repair: 不一致时用重新统计的结果替换计数器
+
+        Returns:
+            {"consistent", "repaired", "differences"}；统计期间计数器被修改时 consistent 为 None
+        """
+        self._ensure_loaded()
+        with self._lock:
+            version = self._version
+        total, by_user = self._count_entries(self._loader())
+
+        with self._lock:
+            self._last_check = time.monotonic()
+            if self._version != version:
+                # 统计期间有写入，结果可能已过期，等下次自检
+                logger.debug("历史记录统计自检期间有写入，跳过本次比对")
+                return {"consistent": None, "repaired": False, "differences": {}}
+
+            oldest_hour = self._current_hour() - BUCKET_HOURS + 1
+            self._total.prune(oldest_hour)
+            differences = {}
+            total_diff = self._total.diff(total)
+            if total_diff:
+                differences["total"] = total_diff
+            for user_id in set(self._by_user) | set(by_user):
+                counted = self._by_user.get(user_id) or _Counts()
+                counted.prune(oldest_hour)
+                user_diff = counted.diff(by_user.get(user_id) or _Counts())
+                if user_diff:
+                    differences.setdefault("users", {})[user_id] = user_diff
+
+            repaired = False
+            if differences:
+                logger.warning(f"历史记录统计计数器与实际不一致: {differences}")
+                if repair:
+                    self._total, self._by_user = total, by_user
+                    self._version += 1
+                    repaired = True
+
+        return {"consistent": not differences, "repaired": repaired, "differences": differences}
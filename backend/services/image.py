@@ -1,14 +1,20 @@
 """图片生成服务"""
+import asyncio
 import logging
 import os
 import uuid
-import time
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from typing import Dict, Any, Generator, List, Optional, Tuple
 from backend.config import Config
 from backend.generators.factory import ImageGeneratorFactory
-from backend.utils.image_compressor import compress_image
+from backend.services.blob_store import get_blob_store
+from backend.services.derivatives import THUMBNAIL_SPEC, get_derivative_pipeline
+from backend.services.scheduler import get_generation_scheduler
+from backend.services.task_archive import get_task_archives
+from backend.services.task_store import get_task_state_store
+from backend.utils.async_runtime import run_sync, submit
+from backend.utils.image_cache import get_image_cache
+from backend.utils.image_digest import versioned_image_url
 
 logger = logging.getLogger(__name__)
 
@@ -16,9 +22,10 @@ logger = logging.getLogger(__name__)
 class ImageService:
     """图片生成服务类"""
 
-    # 并发配置
+    # 并发配置（单个服务商的默认并发上限，可在服务商配置中用 max_concurrent 覆盖）
     MAX_CONCURRENT = 15  # 最大并发数
     AUTO_RETRY_COUNT = 3  # 自动重试次数
+    DERIVATIVE_WAIT_TIMEOUT = 30  # 任务结束前等待缩略图等派生图的最长时间（秒）
 
     def __init__(self, provider_name: str = None):
         """
@@ -45,6 +52,23 @@ class ImageService:
         self.provider_name = provider_name
         self.provider_config = provider_config
 
+        # 注册到进程级调度器（全局并发 + 服务商并发 + 任务间公平排队）
+        self.scheduler = get_generation_scheduler()
+        self.scheduler.configure(Config.get_generation_max_concurrent())
+        self.scheduler.set_provider_limit(
+            provider_name,
+            provider_config.get('max_concurrent', self.MAX_CONCURRENT)
+        )
+
+        # 缩略图等派生图在后台流水线中生成，不阻塞页面完成事件
+        self.derivatives = get_derivative_pipeline()
+
+        # 图片内容寻址存储（去重、历史版本）
+        self.blobs = get_blob_store()
+
+        # 预生成的下载归档（重新生成图片时失效）
+        self.archives = get_task_archives()
+
         # 检查是否启用短 prompt 模式
         self.use_short_prompt = provider_config.get('short_prompt', False)
 
@@ -59,14 +83,17 @@ class ImageService:
         )
         os.makedirs(self.history_root_dir, exist_ok=True)
 
-        # 当前任务的输出目录（每个任务一个子文件夹）
-        self.current_task_dir = None
-
-        # 存储任务状态（用于重试）
-        self._task_states: Dict[str, Dict] = {}
+        # 存储任务状态（用于重试；LRU + TTL + 内存预算，淘汰的任务落盘到任务目录）
+        self._task_states = get_task_state_store(self.history_root_dir)
 
         logger.info(f"ImageService 初始化完成: provider={provider_name}, type={provider_type}")
 
+    def _get_task_dir(self, task_id: str) -> str:
+        """获取任务输出目录（每个任务一个子文件夹，不存在时创建）"""
+        task_dir = os.path.join(self.history_root_dir, task_id)
+        os.makedirs(task_dir, exist_ok=True)
+        return task_dir
+
     def _load_prompt_template(self, short: bool = False) -> str:
         """加载 Prompt 模板"""
         filename = "image_prompt_short.txt" if short else "image_prompt.txt"
@@ -81,39 +108,27 @@ class ImageService:
         with open(prompt_path, "r", encoding="utf-8") as f:
             return f.read()
 
-    def _save_image(self, image_data: bytes, filename: str, task_dir: str = None) -> str:
+    def _generate_single_image(
+        self,
+        page: Dict,
+        task_id: str,
+        reference_image: Optional[bytes] = None,
+        retry_count: int = 0,
+        full_outline: str = "",
+        user_images: Optional[List[bytes]] = None,
+        user_topic: str = ""
+    ) -> Tuple[int, bool, Optional[str], Optional[str]]:
         """
-        保存图片到本地，同时生成缩略图
-
-        Args:
-            image_data: 图片二进制数据
-            filename: 文件名
-            task_dir: 任务目录（如果为None则使用当前任务目录）
+        生成单张图片（同步接口，在后台事件循环中执行并等待结果）
 
-        Returns:
-            保存的文件路径
+        参数和返回值同 _generate_single_image_async
         """
-        if task_dir is None:
-            task_dir = self.current_task_dir
-
-        if task_dir is None:
-            raise ValueError("任务目录未设置")
-
-        # 保存原图
-        filepath = os.path.join(task_dir, filename)
-        with open(filepath, "wb") as f:
-            f.write(image_data)
+        return run_sync(self._generate_single_image_async(
+            page, task_id, reference_image, retry_count,
+            full_outline, user_images, user_topic
+        ))
 
-        # 生成缩略图（50KB左右）
-        thumbnail_data = compress_image(image_data, max_size_kb=50)
-        thumbnail_filename = f"thumb_{filename}"
-        thumbnail_path = os.path.join(task_dir, thumbnail_filename)
-        with open(thumbnail_path, "wb") as f:
-            f.write(thumbnail_data)
-
-        return filepath
-
-    def _generate_single_image(
+    async def _generate_single_image_async(
         self,
         page: Dict,
         task_id: str,
@@ -165,45 +180,57 @@ class ImageService:
                         user_topic=user_topic if user_topic else "未提供"
                     )
 
-                # 调用生成器生成图片
-                if self.provider_config.get('type') == 'google_genai':
-                    logger.debug(f"  使用 Google GenAI 生成器")
-                    image_data = self.generator.generate_image(
-                        prompt=prompt,
-                        aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
-                        temperature=self.provider_config.get('temperature', 1.0),
-                        model=self.provider_config.get('model', 'gemini-3-pro-image-preview'),
-                        reference_image=reference_image,
-                    )
-                elif self.provider_config.get('type') == 'image_api':
-                    logger.debug(f"  使用 Image API 生成器")
-                    # Image API 支持多张参考图片
-                    # 组合参考图片：用户上传的图片 + 封面图
-                    reference_images = []
-                    if user_images:
-                        reference_images.extend(user_images)
-                    if reference_image:
-                        reference_images.append(reference_image)
-
-                    image_data = self.generator.generate_image(
-                        prompt=prompt,
-                        aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
-                        temperature=self.provider_config.get('temperature', 1.0),
-                        model=self.provider_config.get('model', 'nano-banana-2'),
-                        reference_images=reference_images if reference_images else None,
-                    )
-                else:
-                    logger.debug(f"  使用 OpenAI 兼容生成器")
-                    image_data = self.generator.generate_image(
-                        prompt=prompt,
-                        size=self.provider_config.get('default_size', '1024x1024'),
-                        model=self.provider_config.get('model'),
-                        quality=self.provider_config.get('quality', 'standard'),
-                    )
-
-                # 保存图片（使用当前任务目录）
+                # 生成器直接把图片写入任务目录（先写临时文件再原子重命名）
+                # 目录由 task_id 决定，同一个 ImageService 并发执行多个任务时互不干扰
                 filename = f"{index}.png"
-                self._save_image(image_data, filename, self.current_task_dir)
+                filepath = os.path.join(self._get_task_dir(task_id), filename)
+                # 重新生成时旧内容保留为历史版本
+                previous_blob = await asyncio.to_thread(self.blobs.blob_of, filepath)
+
+                # 调用生成器生成图片（生成器每次请求上游前向调度器申请槽位，重试退避期间不占用）
+                with self.scheduler.per_attempt(task_id, self.provider_name):
+                    if self.provider_config.get('type') == 'google_genai':
+                        logger.debug(f"  使用 Google GenAI 生成器")
+                        await self.generator.generate_image_to_file_async(
+                            prompt=prompt,
+                            dest_path=filepath,
+                            aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
+                            temperature=self.provider_config.get('temperature', 1.0),
+                            model=self.provider_config.get('model', 'gemini-3-pro-image-preview'),
+                            reference_image=reference_image,
+                        )
+                    elif self.provider_config.get('type') == 'image_api':
+                        logger.debug(f"  使用 Image API 生成器")
+                        # Image API 支持多张参考图片
+                        # 组合参考图片：用户上传的图片 + 封面图
+                        reference_images = []
+                        if user_images:
+                            reference_images.extend(user_images)
+                        if reference_image:
+                            reference_images.append(reference_image)
+
+                        await self.generator.generate_image_to_file_async(
+                            prompt=prompt,
+                            dest_path=filepath,
+                            aspect_ratio=self.provider_config.get('default_aspect_ratio', '3:4'),
+                            temperature=self.provider_config.get('temperature', 1.0),
+                            model=self.provider_config.get('model', 'nano-banana-2'),
+                            reference_images=reference_images if reference_images else None,
+                        )
+                    else:
+                        logger.debug(f"  使用 OpenAI 兼容生成器")
+                        await self.generator.generate_image_to_file_async(
+                            prompt=prompt,
+                            dest_path=filepath,
+                            size=self.provider_config.get('default_size', '1024x1024'),
+                            model=self.provider_config.get('model'),
+                            quality=self.provider_config.get('quality', 'standard'),
+                        )
+                # 保存时计算内容摘要并纳入内容寻址存储（/api/images 的 ETag、去重和历史版本）
+                await asyncio.to_thread(self.blobs.ingest, filepath, None, previous_blob)
+                if previous_blob is not None:
+                    # 重新生成：已预生成的下载归档失效
+                    await asyncio.to_thread(self.archives.invalidate, os.path.dirname(filepath))
                 logger.info(f"✅ 图片 [{index}] 生成成功: {filename}")
 
                 return (index, True, filename, None)
@@ -216,7 +243,7 @@ class ImageService:
                     # 等待后重试
                     wait_time = 2 ** attempt
                     logger.debug(f"  等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
+                    await asyncio.sleep(wait_time)
                     continue
 
                 logger.error(f"❌ 图片 [{index}] 生成失败，已达最大重试次数")
@@ -224,6 +251,98 @@ class ImageService:
 
         return (index, False, None, "超过最大重试次数")
 
+    def _submit_pages(
+        self,
+        pages: List[Dict],
+        task_id: str,
+        reference_image: Optional[bytes] = None,
+        full_outline: str = "",
+        user_images: Optional[List[bytes]] = None,
+        user_topic: str = ""
+    ) -> Dict[Future, Dict]:
+        """
+        把多个页面提交到后台事件循环并发生成
+
+        所有页面共享一个事件循环，不再为每个任务创建线程池；
+        实际并发由进程级调度器控制（全局上限、服务商上限和任务间公平排队）。
+
+        Returns:
+            {future: page} 映射，可配合 wait / as_completed 按完成顺序收集结果
+        """
+        return {
+            submit(self._generate_single_image_async(
+                page, task_id, reference_image, 0,
+                full_outline, user_images, user_topic
+            )): page
+            for page in pages
+        }
+
+    @staticmethod
+    def _cancel_pending(futures):
+        """取消尚未完成的生成任务（如客户端断开 SSE 连接）"""
+        for future in futures:
+            future.cancel()
+
+    def _image_url(self, task_id: str, filename: str, thumbnail: bool = True) -> str:
+        """图片地址（带内容版本，见 versioned_image_url）"""
+        return versioned_image_url(self.history_root_dir, task_id, filename, thumbnail)
+
+    def _submit_derivatives(self, task_id: str, index: int, filename: str) -> Dict[Future, Dict]:
+        """
+        把缩略图等派生图提交到后台流水线
+
+        Returns:
+            {future: 派生图完成后推送的事件数据（image_url 在派生图完成后按其内容生成）}
+        """
+        source_path = os.path.join(self.history_root_dir, task_id, filename)
+        return {
+            future: {
+                "index": index,
+                "derivative": spec.name,
+                "task_id": task_id,
+                "filename": filename,
+                "derivative_filename": spec.filename_for(filename)
+            }
+            for future, spec in self.derivatives.submit(source_path).items()
+        }
+
+    def _derivative_url(self, data: Dict) -> str:
+        """派生图地址：缩略图使用与历史列表相同的缩略图地址（版本按缩略图内容计算），其他派生图直接按文件名"""
+        if data["derivative"] == THUMBNAIL_SPEC.name:
+            return self._image_url(data["task_id"], data["filename"])
+        return self._image_url(data["task_id"], data["derivative_filename"], thumbnail=False)
+
+    def _collect_derivatives(
+        self,
+        derivative_futures: Dict[Future, Dict],
+        timeout: float = 0
+    ) -> Generator[Dict[str, Any], None, None]:
+        """
+        推送已完成的派生图事件（thumbnail_ready）
+
+        Args:
+            derivative_futures: _submit_derivatives 返回的映射，已推送的会被移除
+            timeout: 等待未完成派生图的最长时间（0 表示只推送已完成的）
+        """
+        if not derivative_futures:
+            return
+
+        done, _ = wait(list(derivative_futures), timeout=timeout)
+        for future in done:
+            data = derivative_futures.pop(future)
+            # 派生图失败不影响页面结果，/api/images 会回退到原图
+            if future.cancelled() or future.exception() is not None:
+                continue
+            yield {
+                "event": "thumbnail_ready",
+                "data": {
+                    "index": data["index"],
+                    "derivative": data["derivative"],
+                    "image_url": self._derivative_url(data),
+                    "status": "done"
+                }
+            }
+
     def generate_images(
         self,
         pages: list,
@@ -252,22 +371,22 @@ class ImageService:
         logger.info(f"开始图片生成任务: task_id={task_id}, pages={len(pages)}")
 
         # 创建任务专属目录
-        self.current_task_dir = os.path.join(self.history_root_dir, task_id)
-        os.makedirs(self.current_task_dir, exist_ok=True)
-        logger.debug(f"任务目录: {self.current_task_dir}")
+        task_dir = self._get_task_dir(task_id)
+        logger.debug(f"任务目录: {task_dir}")
 
         total = len(pages)
         generated_images = []
         failed_pages = []
         cover_image_data = None
+        derivative_futures: Dict[Future, Dict] = {}
 
         # 压缩用户上传的参考图到200KB以内（减少内存和传输开销）
         compressed_user_images = None
         if user_images:
-            compressed_user_images = [compress_image(img, max_size_kb=200) for img in user_images]
+            compressed_user_images = [get_image_cache().compress(img, max_size_kb=200) for img in user_images]
 
         # 初始化任务状态
-        self._task_states[task_id] = {
+        self._task_states.put(task_id, {
             "pages": pages,
             "generated": {},
             "failed": {},
@@ -275,7 +394,7 @@ class ImageService:
             "full_outline": full_outline,
             "user_images": compressed_user_images,
             "user_topic": user_topic
-        }
+        })
 
         # ==================== 第一阶段：生成封面 ====================
         cover_page = None
@@ -314,29 +433,31 @@ class ImageService:
 
             if success:
                 generated_images.append(filename)
-                self._task_states[task_id]["generated"][index] = filename
+                self._task_states.record_generated(task_id, index, filename)
+                derivative_futures.update(self._submit_derivatives(task_id, index, filename))
 
                 # 读取封面图片作为参考，并立即压缩到200KB以内
-                cover_path = os.path.join(self.current_task_dir, filename)
+                cover_path = os.path.join(task_dir, filename)
                 with open(cover_path, "rb") as f:
                     cover_image_data = f.read()
 
-                # 压缩封面图（减少内存占用和后续传输开销）
-                cover_image_data = compress_image(cover_image_data, max_size_kb=200)
-                self._task_states[task_id]["cover_image"] = cover_image_data
+                # 压缩封面图（减少内存占用和后续传输开销；各页请求复用同一份压缩和编码结果）
+                cover_image_data = get_image_cache().compress(cover_image_data, max_size_kb=200)
+                self._task_states.set_cover_image(task_id, cover_image_data)
 
                 yield {
                     "event": "complete",
                     "data": {
                         "index": index,
                         "status": "done",
-                        "image_url": f"/api/images/{task_id}/{filename}",
+                        "image_url": self._image_url(task_id, filename),
                         "phase": "cover"
                     }
                 }
+                yield from self._collect_derivatives(derivative_futures)
             else:
                 failed_pages.append(cover_page)
-                self._task_states[task_id]["failed"][index] = error
+                self._task_states.record_failed(task_id, index, error)
 
                 yield {
                     "event": "error",
@@ -367,23 +488,17 @@ class ImageService:
                     }
                 }
 
-                # 使用线程池并发生成
-                with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
-                    # 提交所有任务
-                    future_to_page = {
-                        executor.submit(
-                            self._generate_single_image,
-                            page,
-                            task_id,
-                            cover_image_data,  # 使用封面作为参考
-                            0,  # retry_count
-                            full_outline,  # 传入完整大纲
-                            compressed_user_images,  # 用户上传的参考图片（已压缩）
-                            user_topic  # 用户原始输入
-                        ): page
-                        for page in other_pages
-                    }
+                # 提交到后台事件循环并发生成（使用封面作为参考）
+                future_to_page = self._submit_pages(
+                    other_pages,
+                    task_id,
+                    cover_image_data,
+                    full_outline,
+                    compressed_user_images,
+                    user_topic
+                )
 
+                try:
                     # 发送每个页面的进度
                     for page in other_pages:
                         yield {
@@ -397,55 +512,64 @@ class ImageService:
                             }
                         }
 
-                    # 收集结果
-                    for future in as_completed(future_to_page):
-                        page = future_to_page[future]
-                        try:
-                            index, success, filename, error = future.result()
-
-                            if success:
-                                generated_images.append(filename)
-                                self._task_states[task_id]["generated"][index] = filename
-
-                                yield {
-                                    "event": "complete",
-                                    "data": {
-                                        "index": index,
-                                        "status": "done",
-                                        "image_url": f"/api/images/{task_id}/{filename}",
-                                        "phase": "content"
+                    # 收集结果（页面和派生图谁先完成就先推送谁）
+                    remaining = set(future_to_page)
+                    while remaining:
+                        wait(remaining | derivative_futures.keys(), return_when=FIRST_COMPLETED)
+                        yield from self._collect_derivatives(derivative_futures)
+
+                        for future in [f for f in remaining if f.done()]:
+                            remaining.discard(future)
+                            page = future_to_page[future]
+                            try:
+                                index, success, filename, error = future.result()
+
+                                if success:
+                                    generated_images.append(filename)
+                                    self._task_states.record_generated(task_id, index, filename)
+                                    derivative_futures.update(self._submit_derivatives(task_id, index, filename))
+
+                                    yield {
+                                        "event": "complete",
+                                        "data": {
+                                            "index": index,
+                                            "status": "done",
+                                            "image_url": self._image_url(task_id, filename),
+                                            "phase": "content"
+                                        }
                                     }
-                                }
-                            else:
+                                else:
+                                    failed_pages.append(page)
+                                    self._task_states.record_failed(task_id, index, error)
+
+                                    yield {
+                                        "event": "error",
+                                        "data": {
+                                            "index": index,
+                                            "status": "error",
+                                            "message": error,
+                                            "retryable": True,
+                                            "phase": "content"
+                                        }
+                                    }
+
+                            except Exception as e:
                                 failed_pages.append(page)
-                                self._task_states[task_id]["failed"][index] = error
+                                error_msg = str(e)
+                                self._task_states.record_failed(task_id, page["index"], error_msg)
 
                                 yield {
                                     "event": "error",
                                     "data": {
-                                        "index": index,
+                                        "index": page["index"],
                                         "status": "error",
-                                        "message": error,
+                                        "message": error_msg,
                                         "retryable": True,
                                         "phase": "content"
                                     }
                                 }
-
-                        except Exception as e:
-                            failed_pages.append(page)
-                            error_msg = str(e)
-                            self._task_states[task_id]["failed"][page["index"]] = error_msg
-
-                            yield {
-                                "event": "error",
-                                "data": {
-                                    "index": page["index"],
-                                    "status": "error",
-                                    "message": error_msg,
-                                    "retryable": True,
-                                    "phase": "content"
-                                }
-                            }
+                finally:
+                    self._cancel_pending(future_to_page)
             else:
                 # 顺序模式：逐个生成
                 yield {
@@ -485,20 +609,22 @@ class ImageService:
 
                     if success:
                         generated_images.append(filename)
-                        self._task_states[task_id]["generated"][index] = filename
+                        self._task_states.record_generated(task_id, index, filename)
+                        derivative_futures.update(self._submit_derivatives(task_id, index, filename))
 
                         yield {
                             "event": "complete",
                             "data": {
                                 "index": index,
                                 "status": "done",
-                                "image_url": f"/api/images/{task_id}/{filename}",
+                                "image_url": self._image_url(task_id, filename),
                                 "phase": "content"
                             }
                         }
+                        yield from self._collect_derivatives(derivative_futures)
                     else:
                         failed_pages.append(page)
-                        self._task_states[task_id]["failed"][index] = error
+                        self._task_states.record_failed(task_id, index, error)
 
                         yield {
                             "event": "error",
@@ -512,6 +638,9 @@ class ImageService:
                         }
 
         # ==================== 完成 ====================
+        # 等待剩余的缩略图（有上限，超时的派生图继续在后台生成）
+        yield from self._collect_derivatives(derivative_futures, timeout=self.DERIVATIVE_WAIT_TIMEOUT)
+
         yield {
             "event": "finish",
             "data": {
@@ -546,15 +675,14 @@ class ImageService:
         Returns:
             生成结果
         """
-        self.current_task_dir = os.path.join(self.history_root_dir, task_id)
-        os.makedirs(self.current_task_dir, exist_ok=True)
+        task_dir = self._get_task_dir(task_id)
 
         reference_image = None
         user_images = None
 
-        # 首先尝试从任务状态中获取上下文
-        if task_id in self._task_states:
-            task_state = self._task_states[task_id]
+        # 首先尝试从任务状态中获取上下文（已落盘的任务会自动加载）
+        task_state = self._task_states.get(task_id)
+        if task_state is not None:
             if use_reference:
                 reference_image = task_state.get("cover_image")
             # 如果没有传入上下文，则使用任务状态中的
@@ -566,12 +694,12 @@ class ImageService:
 
         # 如果任务状态中没有封面图，尝试从文件系统加载
         if use_reference and reference_image is None:
-            cover_path = os.path.join(self.current_task_dir, "0.png")
+            cover_path = os.path.join(task_dir, "0.png")
             if os.path.exists(cover_path):
                 with open(cover_path, "rb") as f:
                     cover_data = f.read()
-                # 压缩封面图到 200KB
-                reference_image = compress_image(cover_data, max_size_kb=200)
+                # 压缩封面图到 200KB（多次重试同一任务时命中缓存）
+                reference_image = get_image_cache().compress(cover_data, max_size_kb=200)
 
         index, success, filename, error = self._generate_single_image(
             page,
@@ -584,15 +712,15 @@ class ImageService:
         )
 
         if success:
-            if task_id in self._task_states:
-                self._task_states[task_id]["generated"][index] = filename
-                if index in self._task_states[task_id]["failed"]:
-                    del self._task_states[task_id]["failed"][index]
+            # 缩略图在后台生成，就绪前 /api/images 返回原图
+            self._submit_derivatives(task_id, index, filename)
+
+            self._task_states.record_generated(task_id, index, filename)
 
             return {
                 "success": True,
                 "index": index,
-                "image_url": f"/api/images/{task_id}/{filename}"
+                "image_url": self._image_url(task_id, filename)
             }
         else:
             return {
@@ -619,8 +747,9 @@ class ImageService:
         """
         # 获取参考图
         reference_image = None
-        if task_id in self._task_states:
-            reference_image = self._task_states[task_id].get("cover_image")
+        task_state = self._task_states.get(task_id)
+        if task_state is not None:
+            reference_image = task_state.get("cover_image")
 
         total = len(pages)
         success_count = 0
@@ -637,65 +766,69 @@ class ImageService:
         # 并发重试
         # 从任务状态中获取完整大纲
         full_outline = ""
-        if task_id in self._task_states:
-            full_outline = self._task_states[task_id].get("full_outline", "")
-
-        with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT) as executor:
-            future_to_page = {
-                executor.submit(
-                    self._generate_single_image,
-                    page,
-                    task_id,
-                    reference_image,
-                    0,  # retry_count
-                    full_outline  # 传入完整大纲
-                ): page
-                for page in pages
-            }
+        if task_state is not None:
+            full_outline = task_state.get("full_outline", "")
 
-            for future in as_completed(future_to_page):
-                page = future_to_page[future]
-                try:
-                    index, success, filename, error = future.result()
+        future_to_page = self._submit_pages(
+            pages,
+            task_id,
+            reference_image,
+            full_outline  # 传入完整大纲
+        )
 
-                    if success:
-                        success_count += 1
-                        if task_id in self._task_states:
-                            self._task_states[task_id]["generated"][index] = filename
-                            if index in self._task_states[task_id]["failed"]:
-                                del self._task_states[task_id]["failed"][index]
+        derivative_futures: Dict[Future, Dict] = {}
+        try:
+            remaining = set(future_to_page)
+            while remaining:
+                wait(remaining | derivative_futures.keys(), return_when=FIRST_COMPLETED)
+                yield from self._collect_derivatives(derivative_futures)
 
-                        yield {
-                            "event": "complete",
-                            "data": {
-                                "index": index,
-                                "status": "done",
-                                "image_url": f"/api/images/{task_id}/{filename}"
+                for future in [f for f in remaining if f.done()]:
+                    remaining.discard(future)
+                    page = future_to_page[future]
+                    try:
+                        index, success, filename, error = future.result()
+
+                        if success:
+                            success_count += 1
+                            derivative_futures.update(self._submit_derivatives(task_id, index, filename))
+                            self._task_states.record_generated(task_id, index, filename)
+
+                            yield {
+                                "event": "complete",
+                                "data": {
+                                    "index": index,
+                                    "status": "done",
+                                    "image_url": self._image_url(task_id, filename)
+                                }
                             }
-                        }
-                    else:
+                        else:
+                            failed_count += 1
+                            yield {
+                                "event": "error",
+                                "data": {
+                                    "index": index,
+                                    "status": "error",
+                                    "message": error,
+                                    "retryable": True
+                                }
+                            }
+
+                    except Exception as e:
                         failed_count += 1
                         yield {
                             "event": "error",
                             "data": {
-                                "index": index,
+                                "index": page["index"],
                                 "status": "error",
-                                "message": error,
+                                "message": str(e),
                                 "retryable": True
                             }
                         }
+        finally:
+            self._cancel_pending(future_to_page)
 
-                except Exception as e:
-                    failed_count += 1
-                    yield {
-                        "event": "error",
-                        "data": {
-                            "index": page["index"],
-                            "status": "error",
-                            "message": str(e),
-                            "retryable": True
-                        }
-                    }
+        yield from self._collect_derivatives(derivative_futures, timeout=self.DERIVATIVE_WAIT_TIMEOUT)
 
         yield {
             "event": "retry_finish",
@@ -749,13 +882,12 @@ class ImageService:
         return os.path.join(task_dir, filename)
 
     def get_task_state(self, task_id: str) -> Optional[Dict]:
-        """获取任务状态"""
+        """获取任务状态（已落盘的任务会自动加载）"""
         return self._task_states.get(task_id)
 
     def cleanup_task(self, task_id: str):
-        """清理任务状态（释放内存）"""
-        if task_id in self._task_states:
-            del self._task_states[task_id]
+        """清理任务状态（释放内存并删除落盘数据）"""
+        self._task_states.discard(task_id)
 
 
 # 全局服务实例
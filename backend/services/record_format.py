@@ -0,0 +1,401 @@
+"""历史记录文件格式
+
+记录默认保存为带缩进的 JSON（<record_id>.json），大纲全文和分页内容使磁盘占用和解析时间都偏大。
+可通过环境变量 HISTORY_RECORD_FORMAT 选择紧凑格式：
+
+- json（默认）：<record_id>.json，indent=2 的 JSON，兼容旧版本
+- compact：<record_id>.rec，无缩进的 JSON
+- zlib：<record_id>.rec，紧凑 JSON + zlib 压缩（标准库，无额外依赖）
+- zstd：<record_id>.rec，紧凑 JSON + zstd 压缩（需要安装 zstandard）
+- msgpack：<record_id>.rec，MessagePack（需要安装 msgpack）
+
+.rec 文件以 4 字节魔数和 1 字节格式编号开头，读取时按文件头解码，与当前配置无关；
+找不到当前格式的文件时回退读取另一种扩展名，因此切换格式后旧记录无需迁移即可读取，
+之后写入时会以新格式保存并删除旧文件。
+
+读取经过进程内的 LRU 缓存（环境变量 HISTORY_RECORD_CACHE_SIZE 条，默认 512，0 表示关闭）：
+命中前检查文件的 inode / mtime / 大小，记录文件都通过 rename 原子替换，文件变化后签名必然不同；
+本进程写入时直接更新缓存。缓存的记录不会交给调用方，每次返回副本，调用方可以随意修改。
+
+已有记录可在服务运行时迁移（经写前日志，与正常写入互斥）：
+    python -m backend.services.record_format
+    python -m backend.services.record_format --store history --batch-size 500
+"""
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.utils.b64_stream import fsync_paths, write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+RECORD_MAGIC = b"RDKR"
+
+# 格式名 -> .rec 文件头中的格式编号（json 为旧格式，没有文件头）
+FORMAT_CODES = {"compact": 0, "zlib": 1, "zstd": 2, "msgpack": 3}
+RECORD_FORMATS = ("json",) + tuple(FORMAT_CODES)
+
+# 可选依赖：格式 -> 包名
+_OPTIONAL_PACKAGES = {"zstd": "zstandard", "msgpack": "msgpack"}
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+RECORD_CACHE_SIZE = int(os.getenv('HISTORY_RECORD_CACHE_SIZE') or 512)
+
+
+def _import_optional(format_name: str):
+    package = _OPTIONAL_PACKAGES[format_name]
+    try:
+        return __import__(package)
+    except ImportError:
+        raise ValueError(
+            f"历史记录格式 {format_name} 需要安装 {package}\n"
+            f"解决方案：pip install {package}，或把 HISTORY_RECORD_FORMAT 改为 zlib / compact"
+        )
+
+
+def _compact_json(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+
+
+def encode_record(record: Dict[str, Any], format_name: str) -> bytes:
+    """按指定格式编码记录"""
+    if format_name == "json":
+        return json.dumps(record, ensure_ascii=False, indent=2).encode("utf-8")
+
+    if format_name == "compact":
+        payload = _compact_json(record)
+    elif format_name == "zlib":
+        payload = zlib.compress(_compact_json(record), ZLIB_LEVEL)
+    elif format_name == "zstd":
+        payload = _import_optional("zstd").ZstdCompressor(level=ZSTD_LEVEL).compress(_compact_json(record))
+    elif format_name == "msgpack":
+        payload = _import_optional("msgpack").packb(record, use_bin_type=True)
+    else:
+        raise ValueError(f"不支持的历史记录格式: {format_name}")
+    return RECORD_MAGIC + bytes([FORMAT_CODES[format_name]]) + payload
+
+
+def record_format_of(data: bytes) -> str:
+    """根据文件头判断记录格式"""
+    if data[:4] != RECORD_MAGIC or len(data) < 5:
+        return "json"
+    for name, code in FORMAT_CODES.items():
+        if data[4] == code:
+            return name
+    raise ValueError(f"未知的历史记录格式编号: {data[4]}")
+
+
+def decode_record(data: bytes) -> Dict[str, Any]:
+    """解码记录（任意格式）"""
+    format_name = record_format_of(data)
+    if format_name == "json":
+        return json.loads(data)
+
+    payload = data[5:]
+    if format_name == "compact":
+        return json.loads(payload)
+    if format_name == "zlib":
+        return json.loads(zlib.decompress(payload))
+    if format_name == "zstd":
+        return json.loads(_import_optional("zstd").ZstdDecompressor().decompress(payload))
+    return _import_optional("msgpack").unpackb(payload, raw=False)
+
+
+def copy_record(value: Any) -> Any:
+    """复制记录（只含 JSON 类型，比 copy.deepcopy 快数倍）"""
+    if isinstance(value, dict):
+        return {key: copy_record(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_record(item) for item in value]
+    return value
+
+
+def get_record_format(format_name: Optional[str] = None) -> str:
+    """
+    读取并校验记录格式配置
+
+    Args:
+        format_name: 格式名（默认读取环境变量 HISTORY_RECORD_FORMAT，未设置时为 json）
+
+    Raises:
+        ValueError: 格式不支持或缺少依赖
+    """
+    format_name = (format_name or os.getenv('HISTORY_RECORD_FORMAT') or 'json').lower()
+    if format_name not in RECORD_FORMATS:
+        raise ValueError(
+            f"不支持的历史记录格式: {format_name}\n"
+            f"支持的格式: {', '.join(RECORD_FORMATS)}\n"
+            "解决方案：检查环境变量 HISTORY_RECORD_FORMAT"
+        )
+    if format_name in _OPTIONAL_PACKAGES:
+        _import_optional(format_name)
+    return format_name
+
+
+class RecordFiles:
+    """历史记录文件的读写（按配置的格式写入，读取兼容所有格式，带 LRU 读缓存）"""
+
+    def __init__(
+        self,
+        directory: str,
+        format_name: Optional[str] = None,
+        cache_size: int = RECORD_CACHE_SIZE,
+        shard_chars: int = 0
+    ):
+        """
+        Args:
+            directory: 记录目录
+            format_name: 写入格式（默认读取 HISTORY_RECORD_FORMAT）
+            cache_size: 读缓存条目数（0 表示关闭）
+            shard_chars: 按 ID 前几个字符分子目录（0 表示不分），避免单个目录下文件过多
+        """
+        self.directory = str(directory)
+        self.shard_chars = shard_chars
+        self.format = get_record_format(format_name)
+        self.extension = ".json" if self.format == "json" else ".rec"
+        self._other_extension = ".rec" if self.extension == ".json" else ".json"
+
+        # record_id -> (文件签名, 记录)
+        self.cache_size = max(0, cache_size)
+        self._cache: "OrderedDict[str, Tuple[tuple, Dict[str, Any]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+
+        # 未 fsync 的写入和删除（sync() 时刷到磁盘）
+        self._unsynced: Set[str] = set()
+        self._unsynced_lock = threading.Lock()
+
+    def _path(self, record_id: str, extension: str) -> str:
+        if self.shard_chars:
+            return os.path.join(self.directory, record_id[:self.shard_chars], f"{record_id}{extension}")
+        return os.path.join(self.directory, f"{record_id}{extension}")
+
+    def path_for(self, record_id: str) -> str:
+        """当前格式下记录文件的路径"""
+        return self._path(record_id, self.extension)
+
+    def _legacy_path(self, record_id: str) -> str:
+        return self._path(record_id, self._other_extension)
+
+    @staticmethod
+    def _signature(path: str, stat: os.stat_result) -> tuple:
+        return (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def read(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """读取记录（返回副本），不存在或无法解析时返回 None"""
+        for path in (self.path_for(record_id), self._legacy_path(record_id)):
+            try:
+                signature = self._signature(path, os.stat(path))
+            except FileNotFoundError:
+                continue
+
+            with self._cache_lock:
+                cached = self._cache.get(record_id)
+                if cached is not None and cached[0] == signature:
+                    self._cache.move_to_end(record_id)
+                    self._hits += 1
+                    return copy_record(cached[1])
+                self._misses += 1
+                if cached is not None:
+                    self._stale += 1
+
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            try:
+                record = decode_record(data)
+            except Exception as e:
+                logger.warning(f"解析历史记录失败: {record_id}, {e}")
+                return None
+            # 文件在 stat 和读取之间被替换时签名偏旧，下次读取会重新加载，不会返回过期内容
+            self._cache_put(record_id, signature, record)
+            return copy_record(record)
+
+        self._cache_discard(record_id)
+        return None
+
+    def _cache_put(self, record_id: str, signature: tuple, record: Dict[str, Any]):
+        if not self.cache_size:
+            return
+        with self._cache_lock:
+            self._cache[record_id] = (signature, record)
+            self._cache.move_to_end(record_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_discard(self, record_id: str):
+        with self._cache_lock:
+            self._cache.pop(record_id, None)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取读缓存指标"""
+        with self._cache_lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._cache),
+                "max_entries": self.cache_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "hit_rate": round(self._hits / total, 3) if total else 0.0,
+            }
+
+    def exists(self, record_id: str) -> bool:
+        return os.path.exists(self.path_for(record_id)) or os.path.exists(self._legacy_path(record_id))
+
+    def write(self, record_id: str, record: Dict[str, Any], fsync: bool = False):
+        """以当前格式原子写入记录，并删除另一种扩展名的旧文件（同时更新读缓存）"""
+        path = self.path_for(record_id)
+        if self.shard_chars:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file_atomic(path, encode_record(record, self.format), fsync=fsync)
+        removed = False
+        try:
+            os.remove(self._legacy_path(record_id))
+            removed = True
+        except FileNotFoundError:
+            pass
+        if not fsync or removed:
+            with self._unsynced_lock:
+                self._unsynced.add(path)
+        if self.cache_size:
+            self._cache_put(record_id, self._signature(path, os.stat(path)), copy_record(record))
+
+    def delete(self, record_id: str):
+        """删除记录文件（所有格式）"""
+        self._cache_discard(record_id)
+        for path in (self.path_for(record_id), self._legacy_path(record_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            with self._unsynced_lock:
+                self._unsynced.add(path)
+
+    def sync(self):
+        """把 fsync=False 写入和删除的记录文件刷到磁盘（只处理上次 sync 之后修改的文件）"""
+        with self._unsynced_lock:
+            paths, self._unsynced = self._unsynced, set()
+        try:
+            fsync_paths(paths)
+        except BaseException:
+            with self._unsynced_lock:
+                self._unsynced |= paths
+            raise
+
+    def needs_migration(self, record_id: str) -> bool:
+        """记录文件是否不是当前格式"""
+        if os.path.exists(self._legacy_path(record_id)):
+            return True
+        if self.format == "json":
+            return False
+        try:
+            with open(self.path_for(record_id), "rb") as f:
+                header = f.read(5)
+        except FileNotFoundError:
+            return False
+        try:
+            return record_format_of(header) != self.format
+        except ValueError:
+            return False
+
+    def file_size(self, record_id: str) -> int:
+        for path in (self.path_for(record_id), self._legacy_path(record_id)):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                continue
+        return 0
+
+
+def migrate_records(
+    journal,
+    record_files: RecordFiles,
+    record_ids: Iterable[str],
+    batch_size: int = 200,
+    progress: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, Any]:
+    """
+    把记录改写为当前格式
+
+    每批记录在一个日志事务中读取并重新写入，与服务的正常写入互斥，可以在服务运行时执行。
+
+    Args:
+        journal: 记录所在存储的 HistoryJournal
+        record_files: 记录所在存储的 RecordFiles
+        record_ids: 需要检查的记录ID
+        batch_size: 每个事务改写的记录数
+        progress: 每批完成后回调当前统计
+
+    Returns:
+        迁移结果统计
+    """
+    result = {"migrated": 0, "skipped": 0, "missing": 0, "bytes_before": 0, "bytes_after": 0}
+
+    def migrate_batch(batch: List[str]):
+        with journal.transaction() as txn:
+            for record_id in batch:
+                record = txn.read(record_id, record_files.read)
+                if record is None:
+                    result["missing"] += 1
+                    continue
+                result["bytes_before"] += record_files.file_size(record_id)
+                txn.put(record_id, record)
+                result["migrated"] += 1
+        for record_id in batch:
+            result["bytes_after"] += record_files.file_size(record_id)
+
+    batch: List[str] = []
+    for record_id in record_ids:
+        if not record_files.needs_migration(record_id):
+            result["skipped"] += 1
+            continue
+        batch.append(record_id)
+        if len(batch) >= batch_size:
+            migrate_batch(batch)
+            batch = []
+            if progress:
+                progress(result)
+    if batch:
+        migrate_batch(batch)
+
+    logger.info(f"历史记录格式迁移完成（{record_files.format}）: {result}")
+    return {"success": True, "format": record_files.format, **result}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="把已有历史记录迁移为 HISTORY_RECORD_FORMAT 指定的格式")
+    parser.add_argument('--store', choices=['history', 'storage', 'all'], default='all',
+                        help="history: history/ 目录（HistoryService）；storage: data/history/（FileStorage）")
+    parser.add_argument('--batch-size', type=int, default=200, help="每个事务改写的记录数")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    def report(stats: Dict[str, int]):
+        print(f"  已迁移 {stats['migrated']} 条，跳过 {stats['skipped']} 条", flush=True)
+
+    if args.store in ('history', 'all'):
+        from backend.services.history import get_history_service
+        print("迁移 history/ ...")
+        print(get_history_service().migrate_record_format(args.batch_size, progress=report))
+    if args.store in ('storage', 'all'):
+        from backend.storage.file_storage import get_storage
+        print("迁移 data/history/ ...")
+        print(get_storage().migrate_history_format(args.batch_size, progress=report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""图片生成调度器
+
+进程内所有图片生成请求（/api/generate、/api/retry-failed、单张重试等）
+都通过同一个调度器申请"生成槽位"：
+
+- 全局并发上限：限制整个进程同时发往上游的请求数
+- 服务商并发上限：按 image_providers.yaml 中每个服务商的 max_concurrent 限制
+- 任务间公平排队：按任务轮询分配槽位，20 页的大任务不会饿死 4 页的小任务
+- 指标：排队深度、活跃数、排队等待时间
+
+槽位按每次上游请求申请：ImageService 用 per_attempt() 指明当前任务和服务商，生成器的重试装饰器
+在每次尝试时先取得限流令牌，再用 attempt_slot() 申请槽位，等待令牌和重试前的退避都不占用槽位。
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncContextManager, Callable, Deque, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 当前协程每次尝试申请槽位的方式（由 GenerationScheduler.per_attempt 设置）
+_attempt_slot_factory: ContextVar[Optional[Callable[[], AsyncContextManager]]] = ContextVar(
+    "generation_attempt_slot_factory", default=None
+)
+# 当前协程是否已持有槽位（嵌套的重试装饰器不重复申请）
+_attempt_slot_held: ContextVar[bool] = ContextVar("generation_attempt_slot_held", default=False)
+
+
+@asynccontextmanager
+async def attempt_slot():
+    """
+    一次上游请求尝试期间占用的生成槽位
+
+    生成器的重试装饰器用它包住每次尝试（不包住退避等待）。没有通过 per_attempt 指明任务时
+    （如测试连接、直接调用生成器）不申请槽位；已持有槽位时不重复申请。
+    """
+    factory = _attempt_slot_factory.get()
+    if factory is None or _attempt_slot_held.get():
+        yield
+        return
+    async with factory():
+        token = _attempt_slot_held.set(True)
+        try:
+            yield
+        finally:
+            _attempt_slot_held.reset(token)
+
+
+class _Waiter:
+    """排队中的槽位申请"""
+
+    __slots__ = ("task_id", "provider", "future", "loop", "enqueued_at", "granted")
+
+    def __init__(self, task_id: str, provider: str, future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.task_id = task_id
+        self.provider = provider
+        self.future = future
+        self.loop = loop
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class GenerationScheduler:
+    """进程级图片生成调度器"""
+
+    DEFAULT_MAX_CONCURRENT = 30  # 默认全局并发上限
+    DEFAULT_PROVIDER_CONCURRENT = 15  # 默认单个服务商并发上限
+    WAIT_SAMPLE_SIZE = 1000  # 用于统计等待时间的最近样本数
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._provider_limits: Dict[str, int] = {}
+
+        self._lock = threading.Lock()
+        # 按任务分组的等待队列，OrderedDict 的顺序即轮询顺序
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._active_total = 0
+        self._active_by_provider: Dict[str, int] = {}
+
+        # 指标
+        self._granted_total = 0
+        self._wait_samples: Deque[float] = deque(maxlen=self.WAIT_SAMPLE_SIZE)
+
+    # ==================== 配置 ====================
+
+    def configure(self, max_concurrent: Optional[int] = None):
+        """更新全局并发上限（配置变更后调用）"""
+        if max_concurrent is None:
+            return
+        with self._lock:
+            self.max_concurrent = max(1, int(max_concurrent))
+            self._dispatch_locked()
+
+    def set_provider_limit(self, provider: str, limit: Optional[int]):
+        """设置服务商并发上限（None 表示使用默认值）"""
+        with self._lock:
+            if limit is None:
+                self._provider_limits.pop(provider, None)
+            else:
+                self._provider_limits[provider] = max(1, int(limit))
+            self._dispatch_locked()
+
+    def get_provider_limit(self, provider: str) -> int:
+        """获取服务商并发上限"""
+        return self._provider_limits.get(provider, self.DEFAULT_PROVIDER_CONCURRENT)
+
+    # ==================== 槽位申请与释放 ====================
+
+    async def acquire(self, task_id: str, provider: str):
+        """
+        申请一个生成槽位（排队直到全局和服务商都有空闲）
+
+        Args:
+            task_id: 任务ID（用于任务间公平轮询）
+            provider: 服务商名称
+        """
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(task_id, provider, loop.create_future(), loop)
+
+        with self._lock:
+            self._queues.setdefault(task_id, deque()).append(waiter)
+            self._dispatch_locked()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # 已分配槽位但调用方已取消，归还槽位
+                    self._release_locked(provider)
+                else:
+                    self._remove_waiter_locked(waiter)
+            raise
+
+    def release(self, provider: str):
+        """释放一个生成槽位"""
+        with self._lock:
+            self._release_locked(provider)
+
+    @asynccontextmanager
+    async def slot(self, task_id: str, provider: str):
+        """
+        槽位上下文管理器
+
+        用法：
+            async with scheduler.slot(task_id, provider):
+                await generator.generate_image_async(...)
+        """
+        await self.acquire(task_id, provider)
+        try:
+            yield
+        finally:
+            self.release(provider)
+
+    @contextmanager
+    def per_attempt(self, task_id: str, provider: str) -> Iterator[None]:
+        """
+        指明当前协程中生成器请求所属的任务和服务商，生成器每次尝试时用 attempt_slot() 申请槽位
+
+        用法：
+            with scheduler.per_attempt(task_id, provider):
+                await generator.generate_image_to_file_async(...)
+        """
+        token = _attempt_slot_factory.set(lambda: self.slot(task_id, provider))
+        try:
+            yield
+        finally:
+            _attempt_slot_factory.reset(token)
+
+    def _release_locked(self, provider: str):
+        self._active_total = max(0, self._active_total - 1)
+        count = self._active_by_provider.get(provider, 0) - 1
+        if count > 0:
+            self._active_by_provider[provider] = count
+        else:
+            self._active_by_provider.pop(provider, None)
+        self._dispatch_locked()
+
+    def _remove_waiter_locked(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.task_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[waiter.task_id]
+
+    def _has_capacity_locked(self, provider: str) -> bool:
+        return self._active_by_provider.get(provider, 0) < self.get_provider_limit(provider)
+
+    def _dispatch_locked(self):
+        """按任务轮询分配空闲槽位"""
+        progressed = True
+        while progressed and self._active_total < self.max_concurrent and self._queues:
+            progressed = False
+            for task_id in list(self._queues.keys()):
+                if self._active_total >= self.max_concurrent:
+                    break
+
+                queue = self._queues[task_id]
+                waiter = next((w for w in queue if self._has_capacity_locked(w.provider)), None)
+                if waiter is None:
+                    continue
+
+                queue.remove(waiter)
+                if queue:
+                    # 该任务还有排队请求，移到轮询队尾
+                    self._queues.move_to_end(task_id)
+                else:
+                    del self._queues[task_id]
+
+                self._grant_locked(waiter)
+                progressed = True
+
+    def _grant_locked(self, waiter: _Waiter):
+        waiter.granted = True
+        self._active_total += 1
+        self._active_by_provider[waiter.provider] = self._active_by_provider.get(waiter.provider, 0) + 1
+        self._granted_total += 1
+        self._wait_samples.append(time.monotonic() - waiter.enqueued_at)
+        waiter.loop.call_soon_threadsafe(self._resolve, waiter.future)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    # ==================== 指标 ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度器指标"""
+        with self._lock:
+            queued_by_provider: Dict[str, int] = {}
+            for queue in self._queues.values():
+                for waiter in queue:
+                    queued_by_provider[waiter.provider] = queued_by_provider.get(waiter.provider, 0) + 1
+
+            now = time.monotonic()
+            oldest_wait = max(
+                (now - queue[0].enqueued_at for queue in self._queues.values() if queue),
+                default=0.0
+            )
+
+            samples = sorted(self._wait_samples)
+            if samples:
+                wait_stats = {
+                    "avg": round(sum(samples) / len(samples), 3),
+                    "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+                    "max": round(samples[-1], 3),
+                }
+            else:
+                wait_stats = {"avg": 0.0, "p95": 0.0, "max": 0.0}
+
+            providers = set(self._active_by_provider) | set(queued_by_provider) | set(self._provider_limits)
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self._active_total,
+                "queued": sum(queued_by_provider.values()),
+                "queued_tasks": len(self._queues),
+                "oldest_wait_seconds": round(oldest_wait, 3),
+                "granted_total": self._granted_total,
+                "wait_seconds": wait_stats,
+                "providers": {
+                    name: {
+                        "limit": self.get_provider_limit(name),
+                        "active": self._active_by_provider.get(name, 0),
+                        "queued": queued_by_provider.get(name, 0),
+                    }
+                    for name in sorted(providers)
+                }
+            }
+
+
+# 全局调度器实例
+_scheduler_instance = None
+_scheduler_lock = threading.Lock()
+
+
+def get_generation_scheduler() -> GenerationScheduler:
+    """获取进程级图片生成调度器"""
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        with _scheduler_lock:
+            if _scheduler_instance is None:
+                from backend.config import Config
+                _scheduler_instance = GenerationScheduler(Config.get_generation_max_concurrent())
+    return _scheduler_instance
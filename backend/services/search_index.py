@@ -0,0 +1,216 @@
+"""历史记录全文检索
+
+标题和大纲页面内容以中文为主，按以下规则切词：
+- 中日韩文字连续片段切成相邻二元组（bigram），并补上片段的最后一个字，
+  「秋季穿搭」-> 秋季 / 季穿 / 穿搭 / 搭
+- 其他字母数字片段按整词（小写）切分
+
+查询时中文片段转换为 bigram 短语（相邻 bigram 必须连续出现，等价于子串匹配），
+单个汉字和字母数字词按前缀匹配，多个片段之间为 AND 关系。
+
+SQLite 索引把切好的词存入 FTS5 表；JSON 索引使用这里的内存倒排索引 InvertedIndex。
+SQLite 索引在 FTS5 内用 bm25() 排序，JSON 索引按 BM25 的词频公式打分，两者标题命中的权重都更高。
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# 中日韩文字（汉字、假名、谚文）
+_CJK_RANGES = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_TOKEN_RE = re.compile(rf"(?P<cjk>[{_CJK_RANGES}]+)|(?P<word>[^\W_{_CJK_RANGES}]+)")
+
+# 标题命中的权重（相对正文）
+TITLE_WEIGHT = 3.0
+
+# 命中总数的统计上限（常见词命中数万条时不再精确计数）
+SEARCH_COUNT_LIMIT = 10000
+
+# BM25 词频饱和与长度归一化参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class QueryTerm(NamedTuple):
+    """查询片段"""
+    tokens: Tuple[str, ...]  # 需要连续出现的词
+    prefix: bool  # 是否按前缀匹配（仅单个词时）
+    text: str  # 规范化后的原始片段（用于子串校验）
+
+
+def normalize(text: str) -> str:
+    """全角转半角、统一小写"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """把文档切成词（按出现顺序）"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(normalize(text)):
+        run = match.group("cjk")
+        if run is None:
+            tokens.append(match.group("word"))
+            continue
+        if len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return tokens
+
+
+def parse_query(query: str) -> List[QueryTerm]:
+    """把查询切成片段"""
+    terms = []
+    for match in _TOKEN_RE.finditer(normalize(query)):
+        run = match.group("cjk")
+        if run is None:
+            word = match.group("word")
+            terms.append(QueryTerm((word,), True, word))
+        elif len(run) == 1:
+            terms.append(QueryTerm((run,), True, run))
+        else:
+            terms.append(QueryTerm(tuple(run[i:i + 2] for i in range(len(run) - 1)), False, run))
+    return terms
+
+
+def to_fts_query(terms: List[QueryTerm]) -> str:
+    """转换为 FTS5 查询语句（词只含文字和数字，无需转义引号）"""
+    parts = []
+    for term in terms:
+        phrase = '"' + " ".join(term.tokens) + '"'
+        parts.append(phrase + "*" if term.prefix else phrase)
+    return " AND ".join(parts)
+
+
+def bm25_tf(tf: int, length: int, avg_length: float) -> float:
+    """BM25 的词频部分（命中文档都包含全部查询片段，IDF 对排序影响不大，这里省略）"""
+    if tf <= 0:
+        return 0.0
+    norm = 1 - BM25_B + BM25_B * length / max(avg_length, 1.0)
+    return tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+
+class _Document(NamedTuple):
+    title: str
+    content: str
+    tokens: Set[str]
+
+
+class InvertedIndex:
+    """内存倒排索引（词 -> 记录ID 集合）"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Set[str]] = {}
+        self._documents: Dict[str, _Document] = {}
+        # 有序词表，用于前缀查询（新增词后延迟重建）
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, doc_id: str, title: str, content: str):
+        """添加或替换文档"""
+        title_norm, content_norm = normalize(title), normalize(content)
+        tokens = set(tokenize(title_norm)) | set(tokenize(content_norm))
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._documents[doc_id] = _Document(title_norm, content_norm, tokens)
+            for token in tokens:
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = set()
+                    self._vocabulary_dirty = True
+                postings.add(doc_id)
+
+    def remove(self, doc_id: str):
+        """删除文档"""
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str):
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+        for token in document.tokens:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[token]
+                    self._vocabulary_dirty = True
+
+    def _prefix_postings_locked(self, prefix: str) -> Set[str]:
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        result: Set[str] = set()
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            result |= self._postings[token]
+        return result
+
+    def search(self, query: str) -> List[Tuple[str, float]]:
+        """
+        搜索文档
+
+        Returns:
+            [(doc_id, score)]，按得分从高到低排列
+        """
+        terms = parse_query(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            candidates: Optional[Set[str]] = None
+            # 先用最短的倒排列表求交集
+            for term in terms:
+                if term.prefix:
+                    matched = self._prefix_postings_locked(term.tokens[0])
+                else:
+                    lists = sorted((self._postings.get(token, set()) for token in term.tokens), key=len)
+                    matched = set(lists[0]).intersection(*lists[1:])
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    return []
+
+            documents = [(doc_id, self._documents[doc_id]) for doc_id in candidates]
+            avg_title = sum(len(document.title) for _, document in documents) / len(documents)
+            avg_content = sum(len(document.content) for _, document in documents) / len(documents)
+
+            scored = []
+            for doc_id, document in documents:
+                score = 0.0
+                for term in terms:
+                    title_hits = document.title.count(term.text)
+                    content_hits = document.content.count(term.text)
+                    if not title_hits and not content_hits:
+                        # bigram 都出现但不相邻，不算命中
+                        break
+                    score += TITLE_WEIGHT * bm25_tf(title_hits, len(document.title), avg_title)
+                    score += bm25_tf(content_hits, len(document.content), avg_content)
+                else:
+                    scored.append((doc_id, score))
+
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
+
+def iter_search_documents(records: Iterable[Dict]) -> Iterable[Tuple[str, str, str]]:
+    """把记录转换为 (record_id, 标题, 正文) 供索引使用"""
+    for record in records:
+        yield record["id"], record.get("title") or "", record_search_content(record)
+
+
+def record_search_content(record: Dict) -> str:
+    """记录中参与全文检索的正文（大纲各页内容，没有分页时使用原始大纲）"""
+    outline = record.get("outline") or {}
+    pages = outline.get("pages") or []
+    if pages:
+        return "\n".join(str(page.get("content", "")) for page in pages if isinstance(page, dict))
+    return str(outline.get("raw", ""))
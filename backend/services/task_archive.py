@@ -0,0 +1,198 @@
+"""任务图片的预生成 ZIP 归档
+
+每次打包下载都要重新读取整套图片生成 ZIP，即使内容自上次下载以来没有变化。这里在记录变为
+completed 时于后台生成一次归档，保存为 <task_id>/.archive/<指纹>.zip：
+
+- 指纹由归档内文件名和图片内容 sha256（见 image_digest）计算，图片被重新生成后指纹随之变化，
+  旧归档不会再被使用，并在新归档生成或图片重新生成时删除
+- 下载时指纹匹配的归档直接走 send_file（sendfile、ETag、Range），否则退回流式打包并安排后台生成
+
+环境变量：
+- HISTORY_ZIP_PREBUILD: 是否在记录完成时预生成归档（默认 true）
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+from backend.utils.b64_stream import atomic_write_stream
+from backend.utils.image_digest import ImageDigestStore, get_image_digest_store
+from backend.utils.zip_stream import StreamingZip
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = ".archive"
+ZIP_PREBUILD = os.getenv('HISTORY_ZIP_PREBUILD', 'true').lower() == 'true'
+
+_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def list_task_images(task_dir: str) -> List[str]:
+    """列出任务目录下的图片文件（排除缩略图），按页码排序"""
+    image_files = [
+        filename for filename in os.listdir(task_dir)
+        if not filename.startswith('thumb_') and filename.endswith(_IMAGE_EXTENSIONS)
+    ]
+
+    def get_index(filename):
+        try:
+            return int(filename.split('.')[0])
+        except ValueError:
+            return 999
+
+    image_files.sort(key=get_index)
+    return image_files
+
+
+def archive_entries(task_dir: str) -> List[Tuple[str, str]]:
+    """任务图片在归档中的 [(归档内文件名 page_N.png, 文件路径)]"""
+    entries = []
+    for filename in list_task_images(task_dir):
+        try:
+            index = int(filename.split('.')[0])
+            archive_name = f"page_{index + 1}{os.path.splitext(filename)[1]}"
+        except ValueError:
+            archive_name = filename
+        entries.append((archive_name, os.path.join(task_dir, filename)))
+    return entries
+
+
+class TaskArchives:
+    """任务图片 ZIP 归档的生成、查找和失效"""
+
+    def __init__(self, digests: Optional[ImageDigestStore] = None, prebuild: bool = ZIP_PREBUILD):
+        """
+        Args:
+            digests: 图片摘要存储（默认使用全局实例）
+            prebuild: 是否允许后台预生成（关闭时 schedule 不做任何事）
+        """
+        self.digests = digests or get_image_digest_store()
+        self.prebuild = prebuild
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._inflight: Set[str] = set()
+        self._lock = threading.Lock()
+
+        # 指标
+        self._built = 0
+        self._failed = 0
+
+    def fingerprint(self, entries: List[Tuple[str, str]]) -> str:
+        """归档内容的指纹（文件名 + 图片内容哈希）"""
+        hasher = hashlib.sha256()
+        for archive_name, path in entries:
+            hasher.update(f"{archive_name}\0{self.digests.get(path).sha256}\n".encode("utf-8"))
+        return hasher.hexdigest()[:32]
+
+    @staticmethod
+    def archive_path(task_dir: str, fingerprint: str) -> str:
+        """归档文件路径"""
+        return os.path.join(task_dir, ARCHIVE_DIR, f"{fingerprint}.zip")
+
+    def find(self, task_dir: str) -> Tuple[Optional[str], List[Tuple[str, str]], str]:
+        """
+        查找与当前图片一致的归档
+
+        Returns:
+            (归档路径或 None, 归档条目, 指纹)
+        """
+        entries = archive_entries(task_dir)
+        fingerprint = self.fingerprint(entries)
+        path = self.archive_path(task_dir, fingerprint)
+        return (path if os.path.exists(path) else None), entries, fingerprint
+
+    def build(self, task_dir: str) -> Optional[str]:
+        """
+        生成（或复用）与当前图片一致的归档，并删除过期的归档
+
+        Returns:
+            归档路径，任务没有图片时返回 None
+        """
+        path, entries, fingerprint = self.find(task_dir)
+        if not entries:
+            return None
+        if path is None:
+            path = self.archive_path(task_dir, fingerprint)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_write_stream(path) as f:
+                for chunk in StreamingZip(entries, digests=self.digests):
+                    f.write(chunk)
+            logger.info(f"已生成任务归档: {path}")
+        self._remove_archives(task_dir, keep=os.path.basename(path))
+        return path
+
+    def invalidate(self, task_dir: str):
+        """删除任务的所有归档（图片被重新生成时调用）"""
+        self._remove_archives(task_dir)
+
+    @staticmethod
+    def _remove_archives(task_dir: str, keep: Optional[str] = None):
+        archive_dir = os.path.join(task_dir, ARCHIVE_DIR)
+        if keep is None:
+            shutil.rmtree(archive_dir, ignore_errors=True)
+            return
+        try:
+            names = os.listdir(archive_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            # 正在写入的临时文件以 . 开头，留给写入方清理
+            if name != keep and not name.startswith("."):
+                try:
+                    os.remove(os.path.join(archive_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    # ==================== 后台生成 ====================
+
+    def schedule(self, task_dir: str):
+        """在后台生成归档（同一任务已在排队时忽略）"""
+        if not self.prebuild:
+            return
+        with self._lock:
+            if task_dir in self._inflight:
+                return
+            self._inflight.add(task_dir)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-archive")
+        self._executor.submit(self._build_in_background, task_dir)
+
+    def _build_in_background(self, task_dir: str):
+        try:
+            if os.path.isdir(task_dir):
+                self.build(task_dir)
+                with self._lock:
+                    self._built += 1
+        except Exception as e:
+            logger.warning(f"生成任务归档失败 {task_dir}: {e}")
+            with self._lock:
+                self._failed += 1
+        finally:
+            with self._lock:
+                self._inflight.discard(task_dir)
+
+    def get_stats(self) -> dict:
+        """后台生成指标"""
+        with self._lock:
+            return {
+                "prebuild": self.prebuild,
+                "pending": len(self._inflight),
+                "built": self._built,
+                "failed": self._failed
+            }
+
+
+_archives: Optional[TaskArchives] = None
+_archives_lock = threading.Lock()
+
+
+def get_task_archives() -> TaskArchives:
+    """获取全局任务归档管理器"""
+    global _archives
+    if _archives is None:
+        with _archives_lock:
+            if _archives is None:
+                _archives = TaskArchives()
+    return _archives
@@ -0,0 +1,337 @@
+"""任务状态存储
+
+ImageService 为每个任务保存重试所需的上下文（页面、大纲、压缩后的用户参考图和封面图）。
+长期运行的进程中任务越来越多，这里对内存中的任务状态做限制：
+- LRU：超过条目数上限时淘汰最久未访问的任务
+- TTL：超过空闲时间的任务被淘汰
+- 内存预算：按参考图字节数和文本长度估算占用，超出预算时淘汰
+被淘汰的任务不会丢失，而是以紧凑形式落盘到任务目录（.task_state/），再次访问时自动加载。
+
+环境变量：
+- TASK_STATE_MAX_ENTRIES: 内存中最多保留的任务数（默认 200）
+- TASK_STATE_TTL: 空闲多少秒后淘汰（默认 3600）
+- TASK_STATE_MEMORY_MB: 内存预算（默认 256MB）
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.utils.b64_stream import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+SPILL_DIRNAME = ".task_state"
+SPILL_STATE_FILE = "state.json"
+SPILL_FORMAT_VERSION = 1
+
+# 按二进制字段存储的参考图（其余字段写入 state.json）
+_BLOB_FIELDS = ("cover_image", "user_images")
+
+
+def estimate_state_size(state: Dict[str, Any]) -> int:
+    """估算任务状态占用的内存（字节）"""
+    size = 512
+    cover = state.get("cover_image")
+    if cover:
+        size += len(cover)
+    for img in state.get("user_images") or []:
+        size += len(img)
+    size += len(state.get("full_outline") or "") * 3
+    size += len(state.get("user_topic") or "") * 3
+    for page in state.get("pages") or []:
+        size += 256 + len(str(page.get("content", ""))) * 3
+    size += 128 * (len(state.get("generated") or {}) + len(state.get("failed") or {}))
+    return size
+
+
+class TaskStateStore:
+    """任务状态存储（LRU + TTL + 内存预算，淘汰时落盘）"""
+
+    DEFAULT_MAX_ENTRIES = 200
+    DEFAULT_TTL_SECONDS = 3600
+    DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+    def __init__(
+        self,
+        root_dir: str,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        memory_budget: Optional[int] = None
+    ):
+        """
+        Args:
+            root_dir: 历史记录根目录（任务目录为 root_dir/<task_id>）
+            max_entries: 内存中最多保留的任务数
+            ttl_seconds: 空闲淘汰时间（秒）
+            memory_budget: 内存预算（字节）
+        """
+        self.root_dir = root_dir
+        self.max_entries = max_entries or int(os.getenv('TASK_STATE_MAX_ENTRIES') or self.DEFAULT_MAX_ENTRIES)
+        self.ttl_seconds = ttl_seconds or float(os.getenv('TASK_STATE_TTL') or self.DEFAULT_TTL_SECONDS)
+        if memory_budget is None:
+            memory_mb = os.getenv('TASK_STATE_MEMORY_MB')
+            memory_budget = int(float(memory_mb) * 1024 * 1024) if memory_mb else self.DEFAULT_MEMORY_BUDGET
+        self.memory_budget = memory_budget
+
+        self._lock = threading.RLock()
+        # task_id -> (state, 估算大小, 最近访问时间)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        self._memory_used = 0
+        # 正在落盘的任务（落盘完成前仍可从这里读取）
+        self._spilling: Dict[str, Dict[str, Any]] = {}
+
+        # 指标
+        self._spilled = 0
+        self._rehydrated = 0
+
+    # ==================== 读写 ====================
+
+    def put(self, task_id: str, state: Dict[str, Any]):
+        """保存任务状态（覆盖已有状态）"""
+        with self._lock:
+            self._remove_locked(task_id)
+            self._insert_locked(task_id, state)
+            evicted = self._evict_locked()
+        self._spill_all(evicted)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务状态（内存中没有时从任务目录加载）
+
+        返回的是存储中的同一个字典，修改请使用 record_* / set_cover_image，以便更新内存估算。
+        """
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is not None:
+                state, size, _ = entry
+                self._entries[task_id] = (state, size, time.monotonic())
+                self._entries.move_to_end(task_id)
+                evicted = self._evict_locked()
+            else:
+                # 正在落盘的任务被再次访问，重新放回内存（内存中的状态为准）
+                state = self._spilling.get(task_id)
+                evicted = []
+                if state is not None:
+                    self._insert_locked(task_id, state)
+                    evicted = self._evict_locked()
+        self._spill_all(evicted)
+
+        if state is not None:
+            return state
+        return self._rehydrate(task_id)
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def record_generated(self, task_id: str, index: int, filename: str):
+        """记录生成成功的页面（同时清除该页的失败记录）"""
+        state = self.get(task_id)
+        if state is None:
+            return
+        with self._lock:
+            state["generated"][index] = filename
+            state["failed"].pop(index, None)
+
+    def record_failed(self, task_id: str, index: int, error: str):
+        """记录生成失败的页面"""
+        state = self.get(task_id)
+        if state is None:
+            return
+        with self._lock:
+            state["failed"][index] = error
+
+    def set_cover_image(self, task_id: str, cover_image: Optional[bytes]):
+        """设置封面参考图（压缩后的数据）"""
+        state = self.get(task_id)
+        if state is None:
+            return
+        with self._lock:
+            state["cover_image"] = cover_image
+            self._resize_locked(task_id)
+            evicted = self._evict_locked()
+        self._spill_all(evicted)
+
+    def discard(self, task_id: str):
+        """删除任务状态（包括已落盘的数据）"""
+        with self._lock:
+            self._remove_locked(task_id)
+            self._spilling.pop(task_id, None)
+        shutil.rmtree(self._spill_dir(task_id), ignore_errors=True)
+
+    # ==================== 淘汰 ====================
+
+    def _insert_locked(self, task_id: str, state: Dict[str, Any]):
+        size = estimate_state_size(state)
+        self._entries[task_id] = (state, size, time.monotonic())
+        self._memory_used += size
+
+    def _remove_locked(self, task_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return None
+        self._memory_used -= entry[1]
+        return entry[0]
+
+    def _resize_locked(self, task_id: str):
+        entry = self._entries.get(task_id)
+        if entry is None:
+            return
+        state, size, accessed = entry
+        new_size = estimate_state_size(state)
+        self._entries[task_id] = (state, new_size, accessed)
+        self._memory_used += new_size - size
+
+    def _evict_locked(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """淘汰过期、超出条目数或内存预算的任务，返回需要落盘的 [(task_id, state)]"""
+        evicted = []
+        now = time.monotonic()
+
+        # 过期：OrderedDict 按访问顺序排列，从最久未访问的开始检查
+        while self._entries:
+            task_id, (state, _, accessed) = next(iter(self._entries.items()))
+            if now - accessed <= self.ttl_seconds:
+                break
+            evicted.append((task_id, self._remove_locked(task_id)))
+
+        # 条目数和内存预算（至少保留最近访问的一个任务）
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._memory_used > self.memory_budget
+        ):
+            task_id = next(iter(self._entries))
+            evicted.append((task_id, self._remove_locked(task_id)))
+
+        for task_id, state in evicted:
+            self._spilling[task_id] = state
+        return evicted
+
+    # ==================== 落盘与加载 ====================
+
+    def _spill_dir(self, task_id: str) -> str:
+        return os.path.join(self.root_dir, task_id, SPILL_DIRNAME)
+
+    def _spill_all(self, evicted: List[Tuple[str, Dict[str, Any]]]):
+        for task_id, state in evicted:
+            try:
+                self._spill(task_id, state)
+            except Exception as e:
+                logger.warning(f"任务状态落盘失败: {task_id}, {e}")
+            finally:
+                with self._lock:
+                    # 落盘期间任务可能又被访问并重新载入，只移除同一份状态
+                    if self._spilling.get(task_id) is state:
+                        del self._spilling[task_id]
+
+    def _spill(self, task_id: str, state: Dict[str, Any]):
+        """把任务状态写入任务目录：参考图保存为独立文件，其余字段写入 state.json"""
+        spill_dir = self._spill_dir(task_id)
+        os.makedirs(spill_dir, exist_ok=True)
+
+        with self._lock:
+            data = {key: value for key, value in state.items() if key not in _BLOB_FIELDS}
+            data["generated"] = dict(state.get("generated") or {})
+            data["failed"] = dict(state.get("failed") or {})
+            cover_image = state.get("cover_image")
+            user_images = list(state.get("user_images") or [])
+
+        data["version"] = SPILL_FORMAT_VERSION
+        data["has_cover_image"] = cover_image is not None
+        data["user_image_count"] = len(user_images)
+        data["has_user_images"] = state.get("user_images") is not None
+
+        if cover_image is not None:
+            write_file_atomic(os.path.join(spill_dir, "cover.jpg"), cover_image)
+        for i, img in enumerate(user_images):
+            write_file_atomic(os.path.join(spill_dir, f"user_{i}.jpg"), img)
+
+        # state.json 最后写入，存在即表示落盘完整
+        write_file_atomic(
+            os.path.join(spill_dir, SPILL_STATE_FILE),
+            json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        )
+        with self._lock:
+            self._spilled += 1
+        logger.debug(f"任务状态已落盘: {task_id}")
+
+    def _rehydrate(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """从任务目录加载落盘的任务状态"""
+        spill_dir = self._spill_dir(task_id)
+        state_path = os.path.join(spill_dir, SPILL_STATE_FILE)
+        if not os.path.exists(state_path):
+            return None
+
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            cover_image = None
+            if data.pop("has_cover_image", False):
+                with open(os.path.join(spill_dir, "cover.jpg"), 'rb') as f:
+                    cover_image = f.read()
+
+            user_images = None
+            count = data.pop("user_image_count", 0)
+            if data.pop("has_user_images", False):
+                user_images = []
+                for i in range(count):
+                    with open(os.path.join(spill_dir, f"user_{i}.jpg"), 'rb') as f:
+                        user_images.append(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"加载落盘的任务状态失败: {task_id}, {e}")
+            return None
+
+        data.pop("version", None)
+        # JSON 的键都是字符串，恢复为页面索引
+        data["generated"] = {int(k): v for k, v in (data.get("generated") or {}).items()}
+        data["failed"] = {int(k): v for k, v in (data.get("failed") or {}).items()}
+        data["cover_image"] = cover_image
+        data["user_images"] = user_images
+
+        with self._lock:
+            # 并发加载时以先放入内存的为准
+            entry = self._entries.get(task_id)
+            if entry is not None:
+                return entry[0]
+            self._insert_locked(task_id, data)
+            self._entries.move_to_end(task_id)
+            self._rehydrated += 1
+            evicted = self._evict_locked()
+        self._spill_all(evicted)
+
+        logger.debug(f"任务状态已从磁盘加载: {task_id}")
+        return data
+
+    # ==================== 指标 ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储指标"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_used,
+                "memory_budget": self.memory_budget,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "spilled": self._spilled,
+                "rehydrated": self._rehydrated,
+            }
+
+
+# 按历史记录根目录共享的存储实例（ImageService 因配置更新重建时任务状态不丢失）
+_store_instances: Dict[str, TaskStateStore] = {}
+_store_lock = threading.Lock()
+
+
+def get_task_state_store(root_dir: str) -> TaskStateStore:
+    """获取指定历史记录根目录的任务状态存储"""
+    key = os.path.abspath(root_dir)
+    with _store_lock:
+        store = _store_instances.get(key)
+        if store is None:
+            store = TaskStateStore(key)
+            _store_instances[key] = store
+        return store
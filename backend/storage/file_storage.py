@@ -2,11 +2,26 @@
 
 import os
 import json
+import hashlib
+import logging
+import threading
 import uuid
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 
+from backend.services.blob_store import get_blob_store
+from backend.services.history_journal import HistoryJournal, JournalEntry
+from backend.services.history_stats import HistoryStats
+from backend.services.record_format import RecordFiles, migrate_records
+from backend.utils.b64_stream import fsync_paths, write_file_atomic
+from backend.utils.pagination import SortedEntries, cursor_for, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+# 进程内缓存的用户数（用户文件和邮箱索引各自计数）
+USER_CACHE_SIZE = 4096
+
 
 class FileStorage:
     """基于文件系统的存储实现"""
@@ -28,62 +43,124 @@ class FileStorage:
         self.history_dir = self.base_dir / "history"
         self.history_dir.mkdir(exist_ok=True)
 
-        # 索引文件
+        # 用户文件 users/<id 前两位>/<id>.json，邮箱索引 users/by_email/<sha1 前两位>/<sha1>.json
+        # （读取带进程内缓存，按文件签名失效；旧版 users/index.json 在启动时迁移）
+        self._user_files = RecordFiles(str(self.users_dir), "json", cache_size=USER_CACHE_SIZE, shard_chars=2)
+        self._email_files = RecordFiles(
+            str(self.users_dir / "by_email"), "json", cache_size=USER_CACHE_SIZE, shard_chars=2
+        )
         self.users_index = self.users_dir / "index.json"
+        self._migrate_users_index()
+
+        # 索引文件
         self.history_index = self.history_dir / "index.json"
 
+        # 历史记录列表缓存：(索引文件签名, {user_id: 记录}, {(user_id, status): SortedEntries})
+        self._history_cache = None
+        self._history_cache_lock = threading.Lock()
+
+        # 按用户/状态的统计计数器（created_at 为 UTC 时间）
+        self.history_stats = HistoryStats(lambda: self._load_history_index()["records"], utc=True)
+
         self._init_indexes()
 
+        # 历史记录文件（格式由 HISTORY_RECORD_FORMAT 决定，读取兼容旧的 .json 文件）
+        self._record_files = RecordFiles(str(self.history_dir))
+
+        # 历史记录写前日志（启动时重放上次未落盘的修改）
+        self._history_journal = HistoryJournal(
+            str(self.history_dir / ".journal"), self._materialize_history, sync=self._sync_history
+        )
+        self._history_journal.replay()
+
     def _init_indexes(self):
         """初始化索引文件"""
-        if not self.users_index.exists():
-            with open(self.users_index, "w", encoding="utf-8") as f:
-                json.dump({"users": {}}, f, ensure_ascii=False, indent=2)
-
         if not self.history_index.exists():
             with open(self.history_index, "w", encoding="utf-8") as f:
                 json.dump({"records": []}, f, ensure_ascii=False, indent=2)
 
     # ==================== 用户相关操作 ====================
 
+    @staticmethod
+    def normalize_email(email: str) -> str:
+        """规范化邮箱（去除首尾空白、转小写），作为邮箱索引的键"""
+        return (email or "").strip().lower()
+
+    @staticmethod
+    def _email_key(email: str) -> str:
+        return hashlib.sha1(FileStorage.normalize_email(email).encode("utf-8")).hexdigest()
+
     def create_user(self, user_data: Dict) -> None:
         """创建用户"""
-        users = self._load_users_index()
-        users["users"][user_data["id"]] = user_data
-        self._save_users_index(users)
+        self._user_files.write(user_data["id"], user_data, fsync=True)
+        self._write_email_index(user_data)
 
     def get_user(self, user_id: str) -> Optional[Dict]:
-        """获取用户"""
-        users = self._load_users_index()
-        return users["users"].get(user_id)
+        """获取用户（每次认证都会调用，命中缓存时只需一次 stat）"""
+        return self._user_files.read(user_id)
 
     def get_user_by_email(self, email: str) -> Optional[Dict]:
         """通过邮箱获取用户"""
-        users = self._load_users_index()
-        for user in users["users"].values():
-            if user.get("email", "").lower() == email.lower():
-                return user
-        return None
+        pointer = self._email_files.read(self._email_key(email))
+        if not pointer:
+            return None
+        user = self.get_user(pointer["user_id"])
+        if not user or self.normalize_email(user.get("email")) != self.normalize_email(email):
+            return None
+        return user
 
     def update_user(self, user_data: Dict) -> None:
         """更新用户"""
-        users = self._load_users_index()
-        if user_data["id"] in users["users"]:
-            users["users"][user_data["id"]] = user_data
-            self._save_users_index(users)
+        previous = self.get_user(user_data["id"])
+        if previous is None:
+            return
+        self._user_files.write(user_data["id"], user_data, fsync=True)
+        if self.normalize_email(previous.get("email")) != self.normalize_email(user_data.get("email")):
+            self._email_files.delete(self._email_key(previous.get("email")))
+            self._write_email_index(user_data)
+
+    def _write_email_index(self, user_data: Dict, fsync: bool = True) -> None:
+        email = self.normalize_email(user_data.get("email"))
+        if email:
+            self._email_files.write(
+                self._email_key(email), {"email": email, "user_id": user_data["id"]}, fsync=fsync
+            )
+
+    def _migrate_users_index(self) -> None:
+        """
+        把旧版 users/index.json 拆分为每个用户一个文件，完成后重命名为 index.json.migrated
 
-    def _load_users_index(self) -> Dict:
-        """加载用户索引"""
+        已有用户文件的用户跳过（上次迁移中断后重新执行时不覆盖之后的修改）；
+        写入的文件最后统一 fsync，再重命名旧索引。
+        """
+        if not self.users_index.exists():
+            return
         try:
             with open(self.users_index, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {"users": {}}
+                users = json.load(f).get("users", {})
+        except Exception as e:
+            logger.warning(f"读取旧版用户索引失败，跳过迁移: {e}")
+            return
 
-    def _save_users_index(self, data: Dict) -> None:
-        """保存用户索引"""
-        with open(self.users_index, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        migrated = 0
+        for user in users.values():
+            if self._user_files.exists(user["id"]):
+                continue
+            self._user_files.write(user["id"], user)
+            self._write_email_index(user, fsync=False)
+            migrated += 1
+        self._user_files.sync()
+        self._email_files.sync()
+
+        migrated_index = self.users_index.with_name("index.json.migrated")
+        try:
+            self.users_index.rename(migrated_index)
+        except FileNotFoundError:
+            # 其他进程已完成迁移
+            pass
+        else:
+            fsync_paths([str(migrated_index)])
+        logger.info(f"已把 {migrated} 个用户从 users/index.json 迁移为单独的用户文件")
 
     # ==================== 历史记录相关操作 ====================
 
@@ -92,66 +169,51 @@ class FileStorage:
         # 添加用户ID
         record_data["user_id"] = user_id
 
-        # 保存记录文件
-        record_path = self.history_dir / f"{record_data['id']}.json"
-        with open(record_path, "w", encoding="utf-8") as f:
-            json.dump(record_data, f, ensure_ascii=False, indent=2)
+        # 经日志保存记录文件并更新索引
+        with self._history_journal.transaction() as txn:
+            txn.put(record_data["id"], record_data)
 
-        # 更新索引
-        records = self._load_history_index()
-        records["records"].insert(0, {
-            "id": record_data["id"],
-            "user_id": user_id,
-            "title": record_data.get("title", ""),
-            "created_at": record_data.get("created_at"),
-            "updated_at": record_data.get("updated_at"),
-            "status": record_data.get("status", "draft"),
-            "thumbnail": record_data.get("thumbnail"),
-            "page_count": len(record_data.get("outline", {}).get("pages", [])),
-            "task_id": record_data.get("images", {}).get("task_id")
-        })
-        self._save_history_index(records)
+        self.history_stats.record_added(self._history_index_entry(record_data))
 
     def get_history_record(self, record_id: str) -> Optional[Dict]:
         """获取历史记录"""
-        record_path = self.history_dir / f"{record_id}.json"
-        if not record_path.exists():
-            return None
-
-        try:
-            with open(record_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return None
+        return self._record_files.read(record_id)
 
     def get_user_history_records(
         self,
         user_id: str,
         page: int = 1,
         page_size: int = 20,
-        status: Optional[str] = None
+        status: Optional[str] = None,
+        cursor: Optional[str] = None
     ) -> Dict:
-        """获取用户的历史记录列表"""
-        records = self._load_history_index()
+        """
+        获取用户的历史记录列表（最新在前）
 
-        # 过滤用户记录
-        user_records = [
-            r for r in records["records"]
-            if r.get("user_id") == user_id
-        ]
+        传入 cursor 时使用游标分页（忽略 page）；两种方式都会返回 next_cursor，没有更多记录时为 None。
 
-        # 过滤状态
-        if status:
-            user_records = [r for r in user_records if r.get("status") == status]
+        Raises:
+            ValueError: 游标格式不正确
+        """
+        # 按用户和状态预排序的列表（索引文件未变化时复用）
+        user_records = self._sorted_history(user_id, status)
+        total = len(user_records)
 
-        # 排序（最新在前）
-        user_records.sort(key=lambda x: x.get("created_at", ""), reverse=True)
+        if cursor:
+            page_records, next_cursor = user_records.page_after(decode_cursor(cursor), page_size)
+            return {
+                "success": True,
+                "records": page_records,
+                "total": total,
+                "page_size": page_size,
+                "total_pages": (total + page_size - 1) // page_size,
+                "next_cursor": next_cursor
+            }
 
         # 分页
-        total = len(user_records)
         start = (page - 1) * page_size
-        end = start + page_size
-        page_records = user_records[start:end]
+        page_records = user_records.page_at(start, page_size)
+        has_more = bool(page_records) and start + len(page_records) < total
 
         return {
             "success": True,
@@ -159,60 +221,127 @@ class FileStorage:
             "total": total,
             "page": page,
             "page_size": page_size,
-            "total_pages": (total + page_size - 1) // page_size
+            "total_pages": (total + page_size - 1) // page_size,
+            "next_cursor": cursor_for(page_records[-1]) if has_more else None
         }
 
+    def _sorted_history(self, user_id: str, status: Optional[str]) -> SortedEntries:
+        """按 (用户, 状态) 缓存的预排序记录列表，索引文件变化后重建"""
+        with self._history_cache_lock:
+            try:
+                stat = self.history_index.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                signature = None
+
+            if self._history_cache is None or self._history_cache[0] != signature:
+                by_user: Dict[str, List[Dict]] = {}
+                for r in self._load_history_index()["records"]:
+                    by_user.setdefault(r.get("user_id"), []).append(r)
+                self._history_cache = (signature, by_user, {})
+
+            _, by_user, views = self._history_cache
+            view = views.get((user_id, status))
+            if view is None:
+                records = by_user.get(user_id, [])
+                if status:
+                    records = [r for r in records if r.get("status") == status]
+                view = views[(user_id, status)] = SortedEntries(records)
+            return view
+
     def update_history_record(self, record_id: str, updates: Dict) -> None:
         """更新历史记录"""
-        record_path = self.history_dir / f"{record_id}.json"
-        if not record_path.exists():
-            return
+        images = updates.get("images")
+        if images and images.get("task_id"):
+            # 附加 文件名 -> blob ID 清单，前端可用 /api/blobs/<id> 的不可变地址
+            blobs = get_blob_store().manifest(images["task_id"], images.get("generated") or [])
+            updates = {**updates, "images": {**images, "blobs": blobs}}
+
+        with self._history_journal.transaction() as txn:
+            # 加载并更新记录
+            record = txn.read(record_id, self.get_history_record)
+            if not record:
+                return
+            old_status = record.get("status", "draft")
+
+            record.update(updates)
+            record["updated_at"] = datetime.utcnow().isoformat()
+            txn.put(record_id, record)
+
+        self.history_stats.status_changed(
+            self._history_index_entry(record), old_status, record.get("status", "draft")
+        )
 
-        # 加载并更新记录
-        with open(record_path, "r", encoding="utf-8") as f:
-            record = json.load(f)
+    def delete_history_record(self, record_id: str, user_id: str) -> bool:
+        """删除历史记录"""
+        with self._history_journal.transaction() as txn:
+            record = txn.read(record_id, self.get_history_record)
+            if not record or record.get("user_id") != user_id:
+                return False
+            txn.delete(record_id)
 
-        record.update(updates)
-        record["updated_at"] = datetime.utcnow().isoformat()
+        self.history_stats.record_removed(self._history_index_entry(record))
+        return True
 
-        # 保存记录
-        with open(record_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
+    def get_history_cache_stats(self) -> Dict:
+        """获取历史记录读缓存指标（条目数/命中/未命中/过期）"""
+        return self._record_files.get_cache_stats()
 
-        # 更新索引
-        records = self._load_history_index()
-        for i, r in enumerate(records["records"]):
-            if r["id"] == record_id:
-                records["records"][i].update({
-                    "title": record.get("title", r["title"]),
-                    "updated_at": record["updated_at"],
-                    "status": record.get("status", r["status"]),
-                    "thumbnail": record.get("thumbnail", r["thumbnail"]),
-                    "page_count": len(record.get("outline", {}).get("pages", []))
-                })
-                break
-        self._save_history_index(records)
+    def migrate_history_format(self, batch_size: int = 200, progress=None) -> Dict:
+        """把已有历史记录改写为当前配置的格式（HISTORY_RECORD_FORMAT），可在服务运行时执行"""
+        record_ids = [r["id"] for r in self._load_history_index()["records"]]
+        return migrate_records(self._history_journal, self._record_files, record_ids, batch_size, progress)
 
-    def delete_history_record(self, record_id: str, user_id: str) -> bool:
-        """删除历史记录"""
-        record = self.get_history_record(record_id)
-        if not record or record.get("user_id") != user_id:
-            return False
+    @staticmethod
+    def _history_index_entry(record: Dict) -> Dict:
+        """由完整记录生成索引条目"""
+        return {
+            "id": record["id"],
+            "user_id": record.get("user_id"),
+            "title": record.get("title", ""),
+            "created_at": record.get("created_at"),
+            "updated_at": record.get("updated_at"),
+            "status": record.get("status", "draft"),
+            "thumbnail": record.get("thumbnail"),
+            "page_count": len(record.get("outline", {}).get("pages", [])),
+            "task_id": record.get("images", {}).get("task_id")
+        }
 
-        # 删除记录文件
-        record_path = self.history_dir / f"{record_id}.json"
-        if record_path.exists():
-            record_path.unlink()
+    def _materialize_history(self, entries: List[JournalEntry]) -> None:
+        """把日志中的一批修改落盘到记录文件和索引（索引只重写一次）"""
+        upserts = {}
+        deleted = set()
+        for entry in entries:
+            if entry.op == "put":
+                self._record_files.write(entry.record_id, entry.record)
+                upserts[entry.record_id] = self._history_index_entry(entry.record)
+            else:
+                self._record_files.delete(entry.record_id)
+                deleted.add(entry.record_id)
 
-        # 从索引中删除
         records = self._load_history_index()
-        records["records"] = [
-            r for r in records["records"]
-            if r["id"] != record_id
-        ]
+        kept = []
+        for r in records["records"]:
+            if r["id"] in deleted:
+                continue
+            kept.append(upserts.pop(r["id"], r))
+        # 新记录排在最前
+        records["records"] = list(upserts.values())[::-1] + kept
         self._save_history_index(records)
 
-        return True
+    def _sync_history(self) -> None:
+        """把落盘过的记录文件和索引刷到磁盘（截断日志前由 HistoryJournal 调用）"""
+        self._record_files.sync()
+        fsync_paths([str(self.history_index)])
+
+    def get_user_history_stats(self, user_id: str) -> Dict:
+        """
+        获取用户的历史记录统计（读取增量计数器，不遍历记录）
+
+        Returns:
+            {"total", "by_status", "last_24h", "last_7d"}
+        """
+        return self.history_stats.snapshot(user_id)
 
     def _load_history_index(self) -> Dict:
         """加载历史记录索引"""
@@ -223,9 +352,12 @@ class FileStorage:
             return {"records": []}
 
     def _save_history_index(self, data: Dict) -> None:
-        """保存历史记录索引"""
-        with open(self.history_index, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """保存历史记录索引（原子替换，持久性由写前日志保证）"""
+        write_file_atomic(
+            str(self.history_index),
+            json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"),
+            fsync=False
+        )
 
 
 # 全局存储实例
@@ -0,0 +1,63 @@
+"""后台异步运行时
+
+进程内维护一个常驻事件循环（运行在独立的守护线程中），
+同步代码（Flask 视图、SSE 生成器）通过 submit / run_sync 把协程提交到该循环执行。
+一个事件循环即可同时承载数百个进行中的图片生成请求，无需为每个请求占用一个线程。
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    """事件循环线程入口"""
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    获取进程级后台事件循环（首次调用时启动）
+
+    fork 出的子进程（如 gunicorn worker）不会继承父进程的循环线程，
+    因此按进程 ID 判断是否需要重新创建。
+    """
+    global _loop, _loop_pid
+    with _lock:
+        if _loop is None or _loop.is_closed() or _loop_pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=_run_loop,
+                args=(loop,),
+                name="redink-async-loop",
+                daemon=True
+            )
+            thread.start()
+            _loop = loop
+            _loop_pid = os.getpid()
+            logger.debug("后台事件循环已启动")
+    return _loop
+
+
+def submit(coro: Coroutine) -> Future:
+    """
+    提交协程到后台事件循环
+
+    Returns:
+        concurrent.futures.Future，可配合 as_completed / result 使用
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+
+def run_sync(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """在后台事件循环中执行协程，并阻塞等待结果"""
+    return submit(coro).result(timeout)
@@ -0,0 +1,380 @@
+"""流式 Base64 图片解码
+
+图片接口返回形如 {"data": [{"b64_json": "<几 MB 的 base64>"}]} 的 JSON。
+一次性 response.json() + b64decode 会同时在内存中保留 JSON 文本、base64 字符串和解码后的图片。
+
+这里按块处理响应：
+- JsonStringFieldExtractor: 增量扫描 JSON，只把指定字段的字符串值按块交给下游
+- Base64StreamDecoder: 按 4 字符对齐分块解码，直接写入文件
+- atomic_write_stream: 先写入同目录临时文件，完成后原子重命名（fsync_paths 事后补刷未 fsync 的文件）
+- Base64JsonFileWriter: 组合以上三者，把响应直接写成图片文件
+- AsyncBase64JsonFileWriter: 异步版本，解码、写入、fsync 和重命名都在线程池中执行，不占用事件循环
+
+每张图片的内存占用只有一个固定大小的缓冲区。
+"""
+import asyncio
+import base64
+import binascii
+import os
+import uuid
+from typing import BinaryIO, Callable, Iterable, List, Optional
+
+STREAM_CHUNK_SIZE = 64 * 1024  # 读取响应的分块大小
+ASYNC_BATCH_SIZE = 256 * 1024  # 异步写入时攒批交给线程池的大小（减少线程切换）
+
+# JSON 字符串中的转义字符（base64 中只会出现 \/，其余仅为兼容）
+_JSON_ESCAPES = {
+    ord('/'): b'/',
+    ord('\\'): b'\\',
+    ord('"'): b'"',
+    ord('n'): b'',
+    ord('r'): b'',
+    ord('t'): b'',
+    ord('b'): b'',
+    ord('f'): b'',
+}
+
+_WHITESPACE = b' \t\r\n'
+
+
+class Base64StreamDecoder:
+    """分块 base64 解码器，解码结果直接写入 sink"""
+
+    def __init__(self, sink: BinaryIO):
+        self.sink = sink
+        self.bytes_written = 0
+        self._pending = b''
+        self._prefix_checked = False
+
+    def feed(self, chunk: bytes):
+        """输入一段 base64 文本（可包含空白字符和 data URI 前缀）"""
+        if not chunk:
+            return
+
+        data = self._pending + chunk.translate(None, _WHITESPACE)
+
+        # 兼容 data:image/png;base64,xxx 形式
+        if not self._prefix_checked:
+            if len(data) < 5:
+                self._pending = data
+                return
+            if data.startswith(b'data:'):
+                comma = data.find(b',')
+                if comma < 0:
+                    self._pending = data
+                    return
+                data = data[comma + 1:]
+            self._prefix_checked = True
+
+        usable = len(data) - len(data) % 4
+        if usable:
+            self._write(data[:usable])
+        self._pending = data[usable:]
+
+    def close(self):
+        """处理剩余数据（补齐缺失的 padding）"""
+        if not self._prefix_checked:
+            self._prefix_checked = True
+        if self._pending:
+            padded = self._pending + b'=' * (-len(self._pending) % 4)
+            self._pending = b''
+            self._write(padded)
+
+    def _write(self, data: bytes):
+        try:
+            decoded = base64.b64decode(data)
+        except binascii.Error as e:
+            raise ValueError(f"图片数据 base64 解码失败: {e}")
+        self.sink.write(decoded)
+        self.bytes_written += len(decoded)
+
+
+class JsonStringFieldExtractor:
+    """
+    增量 JSON 字段提取器
+
+    按块输入 JSON 文本，找到第一个 "<field>": "..." 后，把字符串值（已去除 JSON 转义）
+    按块回调给 on_value_chunk。不解析整个 JSON，不保留已处理的数据。
+    """
+
+    _SEARCH, _AFTER_KEY, _IN_VALUE, _DONE = range(4)
+    PREVIEW_SIZE = 500  # 保留响应开头用于错误提示
+
+    def __init__(self, field: str, on_value_chunk: Callable[[bytes], None]):
+        self._key = b'"' + field.encode('utf-8') + b'"'
+        self._on_value_chunk = on_value_chunk
+        self._state = self._SEARCH
+        self._tail = b''
+        self._escape = False
+        self.preview = b''
+
+    @property
+    def found(self) -> bool:
+        """是否已找到字段"""
+        return self._state in (self._IN_VALUE, self._DONE)
+
+    @property
+    def done(self) -> bool:
+        """字段值是否已完整读取"""
+        return self._state == self._DONE
+
+    def feed(self, chunk: bytes):
+        """输入一段 JSON 文本"""
+        if len(self.preview) < self.PREVIEW_SIZE:
+            self.preview += chunk[:self.PREVIEW_SIZE - len(self.preview)]
+
+        pos = 0
+        while pos < len(chunk) and self._state != self._DONE:
+            if self._state == self._SEARCH:
+                data = self._tail + chunk[pos:]
+                idx = data.find(self._key)
+                if idx < 0:
+                    # 保留可能被分块截断的键名前缀
+                    self._tail = data[-(len(self._key) - 1):]
+                    return
+                consumed = idx + len(self._key) - len(self._tail)
+                self._tail = b''
+                pos += consumed
+                self._state = self._AFTER_KEY
+
+            elif self._state == self._AFTER_KEY:
+                byte = chunk[pos]
+                pos += 1
+                if byte in _WHITESPACE or byte == ord(':'):
+                    continue
+                if byte == ord('"'):
+                    self._state = self._IN_VALUE
+                else:
+                    # 值不是字符串（如 null），继续寻找下一个同名字段
+                    self._state = self._SEARCH
+
+            elif self._state == self._IN_VALUE:
+                pos = self._scan_value(chunk, pos)
+
+    def _scan_value(self, chunk: bytes, pos: int) -> int:
+        if self._escape:
+            self._escape = False
+            escaped = _JSON_ESCAPES.get(chunk[pos])
+            if escaped is None:
+                raise ValueError("图片数据中包含不支持的 JSON 转义字符")
+            if escaped:
+                self._on_value_chunk(escaped)
+            return pos + 1
+
+        quote = chunk.find(b'"', pos)
+        backslash = chunk.find(b'\\', pos)
+        stops = [i for i in (quote, backslash) if i >= 0]
+        end = min(stops) if stops else len(chunk)
+
+        if end > pos:
+            self._on_value_chunk(chunk[pos:end])
+        if end == len(chunk):
+            return end
+        if end == backslash:
+            self._escape = True
+        else:
+            self._state = self._DONE
+        return end + 1
+
+
+def _temp_path_for(dest_path: str) -> str:
+    directory, filename = os.path.split(dest_path)
+    return os.path.join(directory, f".{filename}.{uuid.uuid4().hex[:8]}.tmp")
+
+
+class atomic_write_stream:
+    """
+    原子写文件上下文管理器
+
+    写入同目录下的临时文件，正常退出时 fsync 并重命名为目标文件；
+    发生异常时删除临时文件，目标文件保持不变。
+
+    fsync=False 时只保证原子替换（读者不会看到写了一半的文件），不保证断电后落盘，
+    用于已由写前日志保证持久性的文件。
+    """
+
+    def __init__(self, dest_path: str, fsync: bool = True):
+        self.dest_path = dest_path
+        self.temp_path = _temp_path_for(dest_path)
+        self._fsync = fsync
+        self._file: Optional[BinaryIO] = None
+
+    def __enter__(self) -> BinaryIO:
+        self._file = open(self.temp_path, 'wb')
+        return self._file
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and self._fsync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if exc_type is None:
+                os.replace(self.temp_path, self.dest_path)
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        return False
+
+
+def write_file_atomic(dest_path: str, data: bytes, fsync: bool = True):
+    """原子写入完整的二进制数据"""
+    with atomic_write_stream(dest_path, fsync=fsync) as f:
+        f.write(data)
+
+
+def fsync_paths(paths: Iterable[str]):
+    """
+    把文件和所在目录刷到磁盘（用于 fsync=False 写入或删除的文件，已不存在的文件只同步目录）
+    """
+    directories = set()
+    for path in paths:
+        directories.add(os.path.dirname(path) or ".")
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    # 目录 fsync 让 rename / 删除持久化（Windows 不支持打开目录）
+    if os.name == "nt":
+        return
+    for directory in directories:
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class Base64JsonFileWriter:
+    """
+    把 JSON 响应中的 base64 图片字段流式解码并原子写入文件
+
+    用法：
+        with Base64JsonFileWriter(dest_path) as writer:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                writer.feed(chunk)
+            size = writer.finish()
+
+    finish() 之前发生异常（包括未找到字段）时，目标文件保持不变。
+    """
+
+    def __init__(self, dest_path: str, field: str = 'b64_json'):
+        self.dest_path = dest_path
+        self._field = field
+        self._atomic = atomic_write_stream(dest_path)
+        self._decoder: Optional[Base64StreamDecoder] = None
+        self._extractor: Optional[JsonStringFieldExtractor] = None
+
+    def __enter__(self) -> "Base64JsonFileWriter":
+        sink = self._atomic.__enter__()
+        self._decoder = Base64StreamDecoder(sink)
+        self._extractor = JsonStringFieldExtractor(self._field, self._decoder.feed)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._atomic.__exit__(exc_type, exc, tb)
+
+    @property
+    def found(self) -> bool:
+        """是否已找到图片字段"""
+        return self._extractor.found
+
+    @property
+    def preview(self) -> str:
+        """响应开头的片段（用于错误提示）"""
+        return self._extractor.preview.decode('utf-8', errors='replace')
+
+    def feed(self, chunk: bytes):
+        """输入一段响应数据"""
+        if chunk and not self._extractor.done:
+            self._extractor.feed(chunk)
+
+    def finish(self) -> int:
+        """
+        结束写入
+
+        Returns:
+            写入的图片字节数
+        """
+        if not self._extractor.done:
+            raise ValueError("响应中的图片数据不完整")
+        self._decoder.close()
+        if self._decoder.bytes_written == 0:
+            raise ValueError("响应中的图片数据为空")
+        return self._decoder.bytes_written
+
+
+class AsyncBase64JsonFileWriter:
+    """
+    Base64JsonFileWriter 的异步版本（用于事件循环中的流式响应）
+
+    用法：
+        async with AsyncBase64JsonFileWriter(dest_path) as writer:
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                await writer.feed(chunk)
+            await writer.flush()
+            if not writer.found:
+                ...
+            size = await writer.finish()
+
+    打开临时文件、解码写入、fsync 和重命名都在线程池中执行；输入攒到 batch_size 后才交给线程池。
+    """
+
+    def __init__(self, dest_path: str, field: str = 'b64_json', batch_size: int = ASYNC_BATCH_SIZE):
+        self.dest_path = dest_path
+        self._writer = Base64JsonFileWriter(dest_path, field)
+        self._batch_size = batch_size
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+
+    async def __aenter__(self) -> "AsyncBase64JsonFileWriter":
+        await asyncio.to_thread(self._writer.__enter__)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await asyncio.to_thread(self._writer.__exit__, exc_type, exc, tb)
+
+    @property
+    def found(self) -> bool:
+        """是否已找到图片字段（只反映已 flush 的数据）"""
+        return self._writer.found
+
+    @property
+    def preview(self) -> str:
+        """响应开头的片段（用于错误提示）"""
+        return self._writer.preview
+
+    async def feed(self, chunk: bytes):
+        """输入一段响应数据"""
+        if not chunk:
+            return
+        self._buffer.append(chunk)
+        self._buffered += len(chunk)
+        if self._buffered >= self._batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """把已缓冲的数据交给线程池解码写入"""
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+        await asyncio.to_thread(self._writer.feed, data)
+
+    async def finish(self) -> int:
+        """
+        结束写入
+
+        Returns:
+            写入的图片字节数
+        """
+        await self.flush()
+        return await asyncio.to_thread(self._writer.finish)
@@ -4,6 +4,7 @@ import random
 from functools import wraps
 from google import genai
 from google.genai import types
+from .rate_limiter import ProviderRateLimits
 
 # 导入统一的错误解析函数
 from ..generators.google_genai import parse_genai_error
@@ -64,7 +65,7 @@ def retry_on_429(max_retries=3, base_delay=2):
 class GenAIClient:
     """GenAI 客户端封装类（已弃用，请使用 GoogleGenAIGenerator）"""
 
-    def __init__(self, api_key: str = None, base_url: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None, rpm: float = None):
         self.api_key = api_key
         if not self.api_key:
             raise ValueError(
@@ -88,6 +89,14 @@ class GenAIClient:
 
         self.client = genai.Client(**client_kwargs)
 
+        # 主动限流（每分钟请求数，未配置时不限流）
+        self.rate_limits = ProviderRateLimits({
+            "api_key": self.api_key,
+            "base_url": base_url,
+            "type": "google_gemini",
+            "rpm": rpm
+        })
+
         # 默认安全设置：全部关闭
         self.default_safety_settings = [
             types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
@@ -161,6 +170,7 @@ class GenAIClient:
 
         generate_content_config = types.GenerateContentConfig(**config_kwargs)
 
+        self.rate_limits.acquire()
         result = ""
         for chunk in self.client.models.generate_content_stream(
             model=model,
@@ -213,6 +223,7 @@ class GenAIClient:
         )
 
         image_data = None
+        self.rate_limits.acquire(images=True)
         for chunk in self.client.models.generate_content_stream(
             model=model,
             contents=contents,
@@ -0,0 +1,158 @@
+"""HTTP 连接池
+
+所有服务商客户端共享按上游地址缓存的连接池（keep-alive），
+避免每次请求都重新进行 TCP + TLS 握手。同步的 requests 会话和异步的 httpx 客户端都按上游地址缓存，
+服务实例因配置更新被重建时复用已有连接池，不会每次重建都遗留一个未关闭的连接池。
+
+服务商配置中可选的超时参数：
+- connect_timeout: 建立连接超时（秒），默认 10
+- read_timeout: 读取响应超时（秒），默认由调用方决定（图片生成 300，文本生成 300）
+- download_timeout: 下载生成结果图片的读取超时（秒），默认 60
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+DEFAULT_DOWNLOAD_TIMEOUT = 60
+DEFAULT_POOL_SIZE = 15
+
+_sessions: Dict[str, requests.Session] = {}
+_session_pool_sizes: Dict[str, int] = {}
+_sessions_lock = threading.Lock()
+
+# (事件循环, 名称, 连接池大小, 连接超时, 读取超时) -> 异步客户端
+_async_clients: Dict[Tuple[asyncio.AbstractEventLoop, str, int, float, float], httpx.AsyncClient] = {}
+_async_clients_lock = threading.Lock()
+
+
+def _to_seconds(value: Any, default: float) -> float:
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return default
+    return seconds if seconds > 0 else default
+
+
+def get_timeouts(
+    config: Dict[str, Any],
+    default_read: float = DEFAULT_READ_TIMEOUT
+) -> Tuple[float, float, float]:
+    """
+    从服务商配置中读取超时设置
+
+    Returns:
+        (connect_timeout, read_timeout, download_timeout)
+    """
+    return (
+        _to_seconds(config.get('connect_timeout'), DEFAULT_CONNECT_TIMEOUT),
+        _to_seconds(config.get('read_timeout'), default_read),
+        _to_seconds(config.get('download_timeout'), DEFAULT_DOWNLOAD_TIMEOUT),
+    )
+
+
+def get_pool_size(config: Dict[str, Any]) -> int:
+    """连接池大小与调度器中该服务商的并发上限保持一致"""
+    try:
+        return max(1, int(config.get('max_concurrent') or DEFAULT_POOL_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_POOL_SIZE
+
+
+def get_session(name: str, pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """
+    获取共享的 requests 会话（按名称缓存，通常为上游 base_url）
+
+    服务实例可能因配置更新被重建，会话按名称复用，已建立的连接不会丢失。
+    如果新的连接池大小大于已有会话，会重新挂载更大的连接池。
+
+    Args:
+        name: 会话名称
+        pool_size: 连接池大小（每个主机的最大保持连接数）
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is not None and _session_pool_sizes.get(name, 0) >= pool_size:
+            return session
+
+        if session is None:
+            session = requests.Session()
+            _sessions[name] = session
+
+        # 失败重试由各生成器的重试装饰器负责，这里不做自动重试
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session_pool_sizes[name] = pool_size
+        logger.debug(f"HTTP 连接池已就绪: {name}, pool_size={pool_size}")
+        return session
+
+
+def create_async_client(
+    pool_size: int = DEFAULT_POOL_SIZE,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT
+) -> httpx.AsyncClient:
+    """创建带连接池和超时设置的异步 HTTP 客户端"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+    )
+
+
+def get_async_client(
+    name: str,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT
+) -> httpx.AsyncClient:
+    """
+    获取当前事件循环中共享的异步 HTTP 客户端（按名称和连接设置缓存，通常名称为上游 base_url）
+
+    必须在事件循环中调用。httpx 客户端不能跨事件循环使用，因此按循环分别缓存；
+    已关闭的循环对应的客户端会在下次调用时移除。
+    """
+    loop = asyncio.get_running_loop()
+    key = (loop, name, pool_size, connect_timeout, read_timeout)
+    with _async_clients_lock:
+        client = _async_clients.get(key)
+        if client is None:
+            for stale in [k for k in _async_clients if k[0].is_closed()]:
+                del _async_clients[stale]
+            client = create_async_client(pool_size, connect_timeout, read_timeout)
+            _async_clients[key] = client
+            logger.debug(f"异步 HTTP 连接池已就绪: {name}, pool_size={pool_size}")
+        return client
+
+
+async def close_async_clients():
+    """关闭当前事件循环中的所有共享异步客户端（在该事件循环中调用）"""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = [client for key, client in _async_clients.items() if key[0] is loop]
+        for key in [key for key in _async_clients if key[0] is loop]:
+            del _async_clients[key]
+    for client in clients:
+        await client.aclose()
+
+
+def close_sessions(name: Optional[str] = None):
+    """关闭共享会话（name 为空时关闭全部）"""
+    with _sessions_lock:
+        names = [name] if name else list(_sessions.keys())
+        for key in names:
+            session = _sessions.pop(key, None)
+            _session_pool_sizes.pop(key, None)
+            if session is not None:
+                session.close()
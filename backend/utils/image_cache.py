@@ -0,0 +1,169 @@
+"""参考图压缩缓存
+
+同一套图文中，封面和用户上传的参考图会在每一页的请求里重复压缩和 base64 编码。
+这里按「图片内容哈希 + 目标大小」缓存压缩结果及其 data URI：
+- LRU 淘汰，总容量按字节数限制（环境变量 IMAGE_CACHE_MAX_MB，默认 64MB）
+- 并发请求同一张图时只计算一次，其余调用等待结果
+"""
+import base64
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple, Union
+
+from .image_compressor import compress_image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+CacheKey = Tuple[str, str, int]
+
+
+class CompressedImageCache:
+    """按内容哈希缓存的压缩图片（LRU，按字节数限制容量）"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: "OrderedDict[CacheKey, Union[bytes, str]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # 指标
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def content_hash(image_data: bytes) -> str:
+        """图片内容哈希"""
+        return hashlib.sha256(image_data).hexdigest()
+
+    def compress(self, image_data: bytes, max_size_kb: int = 200) -> bytes:
+        """
+        压缩图片到 max_size_kb 以内（结果按内容缓存）
+
+        Args:
+            image_data: 原始图片数据
+            max_size_kb: 最大文件大小（KB）
+
+        Returns:
+            压缩后的图片数据
+        """
+        # 已经足够小的图片 compress_image 会原样返回，无需缓存
+        if len(image_data) <= max_size_kb * 1024:
+            return image_data
+
+        key = (self.content_hash(image_data), "bytes", max_size_kb)
+        return self._get_or_compute(key, lambda: compress_image(image_data, max_size_kb=max_size_kb))
+
+    def data_uri(self, image_data: bytes, max_size_kb: int = 200, mime_type: str = "image/png") -> str:
+        """
+        压缩图片并编码为 base64 data URI（结果按内容缓存）
+
+        Args:
+            image_data: 原始图片数据
+            max_size_kb: 最大文件大小（KB）
+            mime_type: data URI 中声明的图片类型
+
+        Returns:
+            data:<mime_type>;base64,... 字符串
+        """
+        key = (self.content_hash(image_data), f"uri:{mime_type}", max_size_kb)
+
+        def build() -> str:
+            compressed = self.compress(image_data, max_size_kb)
+            return f"data:{mime_type};base64,{base64.b64encode(compressed).decode('utf-8')}"
+
+        return self._get_or_compute(key, build)
+
+    def _get_or_compute(self, key: CacheKey, compute: Callable[[], Any]):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return value
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                # 由当前调用负责计算
+                pending = Future()
+                self._inflight[key] = pending
+                owner = True
+                self._misses += 1
+            else:
+                owner = False
+                self._hits += 1
+
+        if not owner:
+            return pending.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._store_locked(key, value)
+        pending.set_result(value)
+        return value
+
+    def _store_locked(self, key: CacheKey, value: Union[bytes, str]):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+
+        self._entries[key] = value
+        self._size += size
+
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存指标"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else 0.0,
+            }
+
+
+# 全局缓存实例
+_cache_instance = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> CompressedImageCache:
+    """获取进程级参考图压缩缓存"""
+    global _cache_instance
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                max_mb = os.getenv('IMAGE_CACHE_MAX_MB')
+                max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+                _cache_instance = CompressedImageCache(max_bytes)
+    return _cache_instance
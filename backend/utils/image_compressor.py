@@ -1,7 +1,16 @@
 """图片压缩工具"""
 import io
+import math
+import os
 from PIL import Image
-from typing import Optional
+from typing import Optional, Tuple
+
+MIN_DIMENSION = 512  # 缩小尺寸时长边的下限（像素）
+QUALITY_TOLERANCE = 2  # 查找质量的精度
+SIZE_TOLERANCE = 0.9  # 体积达到上限的 90% 即认为足够接近，不再提高质量
+LOG_SIZE_PER_QUALITY = 0.027  # 质量每变化 1，ln(JPEG 体积) 的近似变化量（optimize=True 实测）
+SIZE_ESTIMATE_MARGIN = 0.95  # 按体积估算缩放比例时预留的余量
+REDUCING_GAP = 2.0  # 缩放时先用 reduce 做整数倍缩小，再用 LANCZOS 精确缩放
 
 
 def compress_image(
@@ -33,64 +42,214 @@ def compress_image(
     try:
         # 打开图片
         img = Image.open(io.BytesIO(image_data))
-
-        # 转换为 RGB（处理 RGBA 等格式）
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # 如果图片尺寸过大，先缩小
-        width, height = img.size
-        if width > max_dimension or height > max_dimension:
-            ratio = min(max_dimension / width, max_dimension / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # 逐步降低质量直到满足大小要求
-        quality = quality_start
-        compressed_data = None
-
-        while quality >= quality_min:
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=quality, optimize=True)
-            compressed_data = output.getvalue()
-
-            if len(compressed_data) <= max_size_bytes:
-                break
-
-            quality -= 5
-
-        # 如果还是太大，进一步缩小尺寸
-        if len(compressed_data) > max_size_bytes:
-            width, height = img.size
-            while len(compressed_data) > max_size_bytes and max(width, height) > 512:
-                width = int(width * 0.9)
-                height = int(height * 0.9)
-                img_resized = img.resize((width, height), Image.Resampling.LANCZOS)
-
-                output = io.BytesIO()
-                img_resized.save(output, format='JPEG', quality=quality_min, optimize=True)
-                compressed_data = output.getvalue()
-
-        original_size_kb = len(image_data) / 1024
-        compressed_size_kb = len(compressed_data) / 1024
-        compression_ratio = (1 - compressed_size_kb / original_size_kb) * 100
-
-        print(f"[图片压缩] {original_size_kb:.1f}KB → {compressed_size_kb:.1f}KB (压缩 {compression_ratio:.1f}%)")
-
-        return compressed_data
+        return _compress_opened_image(
+            img, len(image_data), max_size_bytes, quality_start, quality_min, max_dimension
+        )
 
     except Exception as e:
         print(f"[图片压缩] 压缩失败，返回原图: {e}")
         return image_data
 
 
+def compress_image_file(
+    image_path: str,
+    max_size_kb: int = 200,
+    quality_start: int = 85,
+    quality_min: int = 20,
+    max_dimension: int = 2048
+) -> bytes:
+    """
+    从文件压缩图片到指定大小以内（原图不整体读入内存，由 PIL 从文件解码）
+
+    Args:
+        image_path: 原始图片路径
+        其余参数同 compress_image
+
+    Returns:
+        压缩后的图片数据
+    """
+    max_size_bytes = max_size_kb * 1024
+    original_size = os.path.getsize(image_path)
+
+    if original_size <= max_size_bytes:
+        with open(image_path, 'rb') as f:
+            return f.read()
+
+    try:
+        with Image.open(image_path) as img:
+            return _compress_opened_image(
+                img, original_size, max_size_bytes, quality_start, quality_min, max_dimension
+            )
+
+    except Exception as e:
+        print(f"[图片压缩] 压缩失败，返回原图: {e}")
+        with open(image_path, 'rb') as f:
+            return f.read()
+
+
+def _prepare_image(img: Image.Image, max_dimension: int) -> Image.Image:
+    """
+    解码并缩小到 max_dimension 以内，转换为 RGB
+
+    - JPEG 原图：用 draft 让解码器直接按 1/2、1/4、1/8 缩小解码
+    - 其他格式：resize 时先用 reduce 做整数倍快速缩小，再用 LANCZOS 精确缩放
+    """
+    width, height = img.size
+    ratio = min(1.0, max_dimension / max(width, height))
+    target = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+
+    if img.format == 'JPEG' and ratio < 1.0:
+        img.draft('RGB', target)
+
+    # 调色板图片不能直接用 LANCZOS 缩放
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+
+    if img.size != target and ratio < 1.0:
+        img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+    # 转换为 RGB（处理 RGBA 等格式）
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    return img
+
+
+def _encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def _estimate_size(size: int, quality: int, target_quality: int) -> float:
+    """按 ln(体积) 与质量近似成线性关系，估算另一质量下的编码体积"""
+    return size * math.exp(LOG_SIZE_PER_QUALITY * (target_quality - quality))
+
+
+def _interpolate_quality(low_quality: int, low_size: float, high_quality: int, high_size: int, target: float) -> int:
+    """在 ln(体积)-质量 曲线上插值出体积约为 target 的质量"""
+    if not 0 < low_size < high_size:
+        return (low_quality + high_quality) // 2
+    position = (math.log(target) - math.log(low_size)) / (math.log(high_size) - math.log(low_size))
+    return int(low_quality + position * (high_quality - low_quality))
+
+
+def _search_quality(
+    img: Image.Image,
+    max_size_bytes: int,
+    quality_min: int,
+    quality_max: int,
+    size_at_max: int
+) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """
+    查找满足大小要求的最高质量
+
+    在 ln(体积)-质量 曲线上插值查找，连续两次落在同一侧时改用二分；
+    结果体积达到上限的 SIZE_TOLERANCE 或质量区间收敛到 QUALITY_TOLERANCE 以内即停止。
+
+    Args:
+        size_at_max: quality_max 下的编码体积（已确认超出上限）
+
+    Returns:
+        (满足要求的编码结果, None)，或 quality_min 下仍然过大时返回 (None, quality_min 下的编码结果)
+    """
+    target = max_size_bytes * (1 + SIZE_TOLERANCE) / 2
+    low, low_size, best = None, None, None
+    high, high_size = quality_max, size_at_max
+    previous_fits = None
+    same_side = False
+
+    while low is None or (high - low > QUALITY_TOLERANCE and low_size < max_size_bytes * SIZE_TOLERANCE):
+        floor = quality_min if low is None else low + 1
+        if same_side:
+            quality = (floor + high) // 2
+        elif low is None:
+            # 还没有满足要求的质量，用模型估算 quality_min 处的体积作为插值端点
+            estimated = _estimate_size(high_size, high, quality_min)
+            quality = _interpolate_quality(quality_min, estimated, high, high_size, target)
+        else:
+            quality = _interpolate_quality(low, low_size, high, high_size, target)
+        quality = min(max(quality, floor), high - 1)
+
+        data = _encode_jpeg(img, quality)
+        fits = len(data) <= max_size_bytes
+        if fits:
+            low, low_size, best = quality, len(data), data
+        else:
+            high, high_size = quality, len(data)
+            if quality <= quality_min:
+                return None, data
+
+        same_side = fits == previous_fits
+        previous_fits = fits
+
+    return best, None
+
+
+def _shrink(base: Image.Image, current: Image.Image, size: int, max_size_bytes: int) -> Image.Image:
+    """按体积与像素数近似成正比，估算满足大小要求的尺寸并从 base 缩放"""
+    scale = math.sqrt(max_size_bytes / size) * SIZE_ESTIMATE_MARGIN
+    long_edge = max(MIN_DIMENSION, int(max(current.size) * scale))
+    ratio = long_edge / max(base.size)
+    new_size = (max(1, int(base.width * ratio)), max(1, int(base.height * ratio)))
+    return base.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+
+def _compress_opened_image(
+    img: Image.Image,
+    original_size: int,
+    max_size_bytes: int,
+    quality_start: int,
+    quality_min: int,
+    max_dimension: int
+) -> bytes:
+    """
+    压缩已打开的图片
+
+    1. 以 quality_start 编码一次，满足要求直接返回
+    2. 用这次的体积估算 quality_min 下的体积，仍然过大时直接缩放到估算的目标分辨率
+    3. 在 [quality_min, quality_start] 之间查找满足要求的最高质量
+    """
+    base = _prepare_image(img, max_dimension)
+    current = base
+
+    compressed_data = _encode_jpeg(current, quality_start)
+    while len(compressed_data) > max_size_bytes:
+        can_shrink = max(current.size) > MIN_DIMENSION
+        estimated_min = _estimate_size(len(compressed_data), quality_start, quality_min)
+        if estimated_min > max_size_bytes and can_shrink:
+            current = _shrink(base, current, estimated_min, max_size_bytes)
+            compressed_data = _encode_jpeg(current, quality_start)
+            continue
+
+        best, data_at_min = _search_quality(
+            current, max_size_bytes, quality_min, quality_start, len(compressed_data)
+        )
+        if best is not None:
+            compressed_data = best
+        elif can_shrink:
+            # 估算偏乐观，按实际的最低质量体积继续缩小
+            current = _shrink(base, current, len(data_at_min), max_size_bytes)
+            compressed_data = _encode_jpeg(current, quality_start)
+            continue
+        else:
+            # 已缩到最小尺寸，返回能得到的最小结果
+            compressed_data = data_at_min
+        break
+
+    original_size_kb = original_size / 1024
+    compressed_size_kb = len(compressed_data) / 1024
+    compression_ratio = (1 - compressed_size_kb / original_size_kb) * 100
+
+    print(f"[图片压缩] {original_size_kb:.1f}KB → {compressed_size_kb:.1f}KB (压缩 {compression_ratio:.1f}%)")
+
+    return compressed_data
+
+
 def compress_images(images: list[bytes], max_size_kb: int = 200) -> list[bytes]:
     """
     批量压缩图片
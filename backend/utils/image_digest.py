@@ -0,0 +1,245 @@
+"""图片内容摘要
+
+/api/images 需要强 ETag（内容哈希）和正确的 MIME 类型，每次请求都重新哈希整张图片代价太高。
+这里在图片保存时计算 sha256、CRC32（流式 ZIP 下载需要预先写入文件头）并嗅探格式，
+写入同目录下的 .digests/<文件名>.json：
+- 摘要文件记录图片的 (size, mtime_ns)，图片被替换而摘要未更新时视为失效，读取时重新计算并回写
+  （历史数据没有摘要文件时也走这条路径，第一次请求后即补齐）
+- 进程内 LRU 缓存最近使用的摘要，命中时一次 stat 即可得到 ETag
+- versioned_image_url 生成带内容版本（v=<sha256 前缀>）的图片地址，/api/images 对版本匹配的请求
+  按不可变资源长期缓存
+
+环境变量：
+- IMAGE_DIGEST_CACHE_SIZE: 缓存的摘要条目数（默认 4096）
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+from .b64_stream import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+DIGEST_DIR = ".digests"
+DIGEST_CACHE_SIZE = int(os.getenv('IMAGE_DIGEST_CACHE_SIZE') or 4096)
+
+# /api/images 的缩略图文件名前缀（thumb_<文件名>，派生图流水线按此生成）
+THUMBNAIL_PREFIX = "thumb_"
+
+# 图片地址中 v 参数的长度（sha256 前缀，不短于 /api/images 要求的最短长度）
+URL_VERSION_LENGTH = 16
+
+_HASH_CHUNK_SIZE = 256 * 1024
+
+# 文件头 -> MIME 类型
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class ImageDigest(NamedTuple):
+    """图片摘要"""
+    sha256: str
+    mimetype: str
+    size: int
+    mtime_ns: int
+    crc32: Optional[int] = None
+
+    @property
+    def etag(self) -> str:
+        """强 ETag（不含引号）"""
+        return self.sha256
+
+
+def sniff_mimetype(head: bytes, filename: str = "") -> str:
+    """根据文件头判断图片 MIME 类型（无法识别时按扩展名猜测）"""
+    for signature, mimetype in _SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def digest_path_for(image_path: str) -> str:
+    """图片对应的摘要文件路径"""
+    directory, filename = os.path.split(image_path)
+    return os.path.join(directory, DIGEST_DIR, f"{filename}.json")
+
+
+def _signature(stat: os.stat_result) -> Tuple[int, int]:
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ImageDigestStore:
+    """图片摘要的计算、持久化和缓存"""
+
+    def __init__(self, cache_size: int = DIGEST_CACHE_SIZE):
+        self.cache_size = max(0, cache_size)
+        self._cache: "OrderedDict[str, ImageDigest]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 指标
+        self._hits = 0
+        self._misses = 0
+        self._computed = 0
+
+    def _remember(self, path: str, digest: ImageDigest):
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[path] = digest
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _save(self, path: str, digest: ImageDigest):
+        digest_path = digest_path_for(path)
+        try:
+            os.makedirs(os.path.dirname(digest_path), exist_ok=True)
+            write_file_atomic(digest_path, json.dumps(digest._asdict()).encode("utf-8"), fsync=False)
+        except OSError as e:
+            # 摘要只是缓存，写入失败时下次请求重新计算
+            logger.warning(f"保存图片摘要失败 {path}: {e}")
+
+    def record(self, path: str, data: Optional[bytes] = None) -> ImageDigest:
+        """
+        计算并保存图片摘要（图片保存后调用）
+
+        Args:
+            path: 图片路径
+            data: 已写入的图片数据（不传时从文件读取）
+        """
+        stat = os.stat(path)
+        if data is not None and len(data) == stat.st_size:
+            sha256 = hashlib.sha256(data).hexdigest()
+            crc32 = zlib.crc32(data)
+            head = data[:16]
+        else:
+            hasher = hashlib.sha256()
+            with open(path, "rb") as f:
+                head = f.read(_HASH_CHUNK_SIZE)
+                hasher.update(head)
+                crc32 = zlib.crc32(head)
+                for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+                    crc32 = zlib.crc32(chunk, crc32)
+            sha256 = hasher.hexdigest()
+        digest = ImageDigest(sha256, sniff_mimetype(head[:16], path), *_signature(stat), crc32)
+        self._save(path, digest)
+        self._remember(path, digest)
+        with self._lock:
+            self._computed += 1
+        return digest
+
+    def store(self, path: str, digest: ImageDigest) -> ImageDigest:
+        """
+        已知内容摘要时直接保存（如文件被替换为相同内容的硬链接后），按文件当前状态更新签名
+        """
+        digest = digest._replace(**dict(zip(("size", "mtime_ns"), _signature(os.stat(path)))))
+        self._save(path, digest)
+        self._remember(path, digest)
+        return digest
+
+    def get(self, path: str, stat: Optional[os.stat_result] = None) -> ImageDigest:
+        """
+        获取图片摘要（缓存 -> 摘要文件 -> 重新计算）
+
+        Args:
+            path: 图片路径
+            stat: 已取得的文件状态（省去一次 stat）
+
+        Raises:
+            FileNotFoundError: 图片不存在
+        """
+        if stat is None:
+            stat = os.stat(path)
+        signature = _signature(stat)
+
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and (cached.size, cached.mtime_ns) == signature:
+                self._cache.move_to_end(path)
+                self._hits += 1
+                return cached
+            self._misses += 1
+
+        try:
+            with open(digest_path_for(path), "rb") as f:
+                digest = ImageDigest(**json.loads(f.read()))
+            # 旧版摘要文件没有 CRC32，按失效处理
+            if (digest.size, digest.mtime_ns) == signature and digest.crc32 is not None:
+                self._remember(path, digest)
+                return digest
+        except (OSError, ValueError, TypeError):
+            pass
+        return self.record(path)
+
+    def get_stats(self) -> dict:
+        """缓存指标"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._cache),
+                "max_entries": self.cache_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "computed": self._computed,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0
+            }
+
+
+_store: Optional[ImageDigestStore] = None
+_store_lock = threading.Lock()
+
+
+def get_image_digest_store() -> ImageDigestStore:
+    """获取全局图片摘要存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ImageDigestStore()
+    return _store
+
+
+def served_image_names(filename: str, thumbnail: bool = True) -> Tuple[str, ...]:
+    """/api/images 按顺序尝试返回的文件名（请求缩略图时优先返回已生成的缩略图）"""
+    return (f"{THUMBNAIL_PREFIX}{filename}", filename) if thumbnail else (filename,)
+
+
+def versioned_image_url(history_root: str, task_id: str, filename: str, thumbnail: bool = True) -> str:
+    """
+    /api/images 图片地址，附带 /api/images 实际返回文件的内容版本 v=<sha256 前缀>
+
+    thumbnail 为 True 且缩略图已生成时按缩略图计算版本，否则按原图计算。/api/images 只在返回的文件
+    与版本一致时按不可变资源长期缓存：版本按原图计算而之后缩略图生成、或文件被替换时，该地址退回为每次
+    用 ETag 重新验证，不会长期缓存过期内容。文件不存在时返回不带版本的地址。
+
+    Args:
+        history_root: 历史图片根目录
+        task_id: 任务ID
+        filename: 图片文件名
+        thumbnail: 是否优先返回缩略图（与 /api/images 的 thumbnail 参数一致）
+    """
+    params = [] if thumbnail else ["thumbnail=false"]
+    store = get_image_digest_store()
+    for name in served_image_names(filename, thumbnail):
+        try:
+            digest = store.get(os.path.join(history_root, task_id, name))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        params.append(f"v={digest.sha256[:URL_VERSION_LENGTH]}")
+        break
+
+    url = f"/api/images/{task_id}/{filename}"
+    return f"{url}?{'&'.join(params)}" if params else url
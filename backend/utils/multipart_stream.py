@@ -0,0 +1,98 @@
+"""流式 multipart/mixed 响应
+
+把多个文件放进一个 multipart/mixed 响应中逐块发送（批量获取缩略图等场景），避免每个文件一个请求。
+各部分只记录文件路径和大小，发送到该部分时才打开文件（同一时刻最多占用一个文件描述符），
+响应长度可在发送前算出（Content-Length），内存占用只有一个读缓冲区。
+"""
+import uuid
+import os
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+MULTIPART_CHUNK_SIZE = 64 * 1024
+
+
+class MultipartStream:
+    """
+    multipart/mixed 响应体（可迭代对象，逐块产出数据）
+
+    用法：
+        stream = MultipartStream()
+        stream.add_part({"Content-Type": "image/jpeg"}, path, size)
+        stream.add_part({"X-Status": "404"})
+        return Response(stream, mimetype=stream.content_type, headers={"Content-Length": str(stream.content_length)})
+
+    迭代结束或调用 close() 时关闭正在发送的文件（WSGI 服务器在响应结束时会调用 close）。
+    文件在添加后被替换为不同大小的内容时，发送到该部分会抛出 IOError（响应长度已经发出，无法更正）。
+    """
+
+    def __init__(self, boundary: Optional[str] = None, chunk_size: int = MULTIPART_CHUNK_SIZE):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._parts: List[Tuple[bytes, Optional[str], int]] = []
+        self._file: Optional[BinaryIO] = None
+
+    @property
+    def content_type(self) -> str:
+        """响应的 Content-Type（含 boundary）"""
+        return f"multipart/mixed; boundary={self.boundary}"
+
+    def add_part(self, headers: Dict[str, str], path: Optional[str] = None, size: int = 0):
+        """
+        添加一个部分
+
+        Args:
+            headers: 该部分的头部
+            path: 内容文件路径（发送时打开；None 表示没有内容）
+            size: 内容字节数（通常取自 os.stat，path 为 None 时忽略）
+        """
+        if path is None:
+            size = 0
+        for name, value in headers.items():
+            if any(ch in f"{name}{value}" for ch in "\r\n\0"):
+                raise ValueError(f"头部不能包含换行或空字符: {name!r}")
+        lines = [f"--{self.boundary}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        lines.append(f"Content-Length: {size}")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+        self._parts.append((head, path, size))
+
+    def _closing(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode("ascii")
+
+    @property
+    def content_length(self) -> int:
+        """响应体总长度"""
+        # 每个部分：头部 + 内容 + 结尾的 \r\n
+        return sum(len(head) + size + 2 for head, _, size in self._parts) + len(self._closing())
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            for head, path, size in self._parts:
+                yield head
+                if path is not None:
+                    yield from self._file_data(path, size)
+                yield b"\r\n"
+            yield self._closing()
+        finally:
+            self.close()
+
+    def _file_data(self, path: str, size: int) -> Iterator[bytes]:
+        self._file = open(path, "rb")
+        try:
+            if os.fstat(self._file.fileno()).st_size != size:
+                raise IOError(f"发送前文件已被替换: {path}")
+            remaining = size
+            while remaining:
+                chunk = self._file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"发送过程中文件被截断: {path}")
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        """关闭正在发送的文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
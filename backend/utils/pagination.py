@@ -0,0 +1,76 @@
+"""游标分页（keyset pagination）
+
+列表按 (created_at, id) 倒序排列，游标记录上一页最后一条的 (created_at, id)，
+下一页只需从该位置继续读取，深页与第一页的开销相同，且翻页期间插入新记录不会造成重复或遗漏。
+"""
+import base64
+import bisect
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CursorKey = Tuple[str, str]
+
+
+def encode_cursor(created_at: Optional[str], record_id: str) -> str:
+    """把 (created_at, id) 编码为不透明的游标字符串"""
+    raw = json.dumps([created_at or "", record_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> CursorKey:
+    """
+    解析游标
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
+    if not isinstance(created_at, str) or not isinstance(record_id, str):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return created_at, record_id
+
+
+def entry_key(entry: Dict[str, Any]) -> CursorKey:
+    """索引条目的排序键"""
+    return entry.get("created_at") or "", entry["id"]
+
+
+def cursor_for(entry: Dict[str, Any]) -> str:
+    """指向某条目之后的游标"""
+    return encode_cursor(*entry_key(entry))
+
+
+class SortedEntries:
+    """按 (created_at, id) 预排序的索引条目，支持从游标位置二分查找"""
+
+    def __init__(self, entries: Iterable[Dict[str, Any]]):
+        # 升序存储，从尾部向前读取即为倒序
+        self._entries: List[Dict[str, Any]] = sorted(entries, key=entry_key)
+        self._keys: List[CursorKey] = [entry_key(entry) for entry in self._entries]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def page_after(self, cursor: Optional[CursorKey], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        读取游标之后（更旧）的一页
+
+        Returns:
+            (条目列表（倒序）, 下一页游标；没有更多时为 None)
+        """
+        end = len(self._entries) if cursor is None else bisect.bisect_left(self._keys, cursor)
+        start = max(0, end - limit)
+        page = self._entries[start:end][::-1]
+        next_cursor = cursor_for(page[-1]) if page and start > 0 else None
+        return page, next_cursor
+
+    def page_at(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """按偏移量读取一页（兼容页码分页）"""
+        end = len(self._entries) - offset
+        if end <= 0:
+            return []
+        return self._entries[max(0, end - limit):end][::-1]
@@ -0,0 +1,278 @@
+"""令牌桶限流器
+
+在请求发出之前主动限流，让吞吐稳定在服务商配额附近，而不是等 429 之后再退避重试。
+
+- 按「服务商 + API Key」分桶，同一个上游和 Key 的所有调用共享配额
+- 配额来自服务商配置：
+    rpm: 每分钟请求数
+    ipm: 每分钟图片数（仅图片模型）
+    rate_limit_burst: 令牌桶容量（可选，默认为 10 秒的配额）
+- 状态存储可插拔：
+    memory: 进程内共享（默认）
+    sqlite: 通过 SQLite 文件在多个进程（如多 worker 的 gunicorn）之间共享
+  通过环境变量 RATE_LIMIT_BACKEND / RATE_LIMIT_DB 选择
+- 同一次请求涉及多个桶（rpm + ipm）时原子地一起取令牌：任何一个桶不足时都不扣减，
+  避免等待 ipm 期间白白消耗 rpm 配额
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitBackend(ABC):
+    """令牌桶状态存储后端"""
+
+    # take 是否可能阻塞（如等待文件锁），为 True 时异步调用方在线程池中执行
+    blocking = False
+
+    @abstractmethod
+    def take(self, limits: List[Tuple[str, float, float]], cost: float = 1) -> float:
+        """
+        尝试从所有令牌桶中各取出令牌（全部足够时才扣减，否则都不扣减）
+
+        Args:
+            limits: [(桶的键, 容量, 每秒补充令牌数), ...]
+            cost: 每个桶本次需要的令牌数
+
+        Returns:
+            0 表示已取到令牌；否则为需要等待的秒数（各桶中最长的）
+        """
+        pass
+
+
+def _refill(tokens: float, updated: float, now: float, capacity: float, refill_per_second: float) -> float:
+    """按经过的时间补充令牌"""
+    elapsed = max(0.0, now - updated)
+    return min(capacity, tokens + elapsed * refill_per_second)
+
+
+def _take_all(
+    buckets: List[Tuple[str, float, float]],
+    cost: float
+) -> Tuple[float, Dict[str, float]]:
+    """
+    计算多个桶一起取令牌的结果
+
+    Args:
+        buckets: [(桶的键, 补充后的令牌数, 每秒补充令牌数), ...]
+        cost: 每个桶需要的令牌数
+
+    Returns:
+        (需要等待的秒数, 各桶新的令牌数)
+    """
+    wait = max(
+        ((cost - tokens) / refill_per_second for _, tokens, refill_per_second in buckets if tokens < cost),
+        default=0.0
+    )
+    if wait > 0:
+        return wait, {key: tokens for key, tokens, _ in buckets}
+    return 0.0, {key: tokens - cost for key, tokens, _ in buckets}
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """进程内令牌桶（线程安全）"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, limits: List[Tuple[str, float, float]], cost: float = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            for key, capacity, refill_per_second in limits:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                buckets.append((key, _refill(tokens, updated, now, capacity, refill_per_second), refill_per_second))
+
+            wait, remaining = _take_all(buckets, cost)
+            for key, tokens in remaining.items():
+                self._buckets[key] = (tokens, now)
+            return wait
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """基于 SQLite 文件的令牌桶（多进程共享）"""
+
+    blocking = True
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " key TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated REAL NOT NULL"
+            ")"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, limits: List[Tuple[str, float, float]], cost: float = 1) -> float:
+        conn = self._connect()
+        # 跨进程共享，使用墙上时间
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            buckets = []
+            for key, capacity, refill_per_second in limits:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                buckets.append((key, _refill(tokens, updated, now, capacity, refill_per_second), refill_per_second))
+
+            wait, remaining = _take_all(buckets, cost)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, tokens, now) for key, tokens in remaining.items()]
+            )
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class RateLimiter:
+    """令牌桶限流器"""
+
+    MAX_SINGLE_WAIT = 5.0  # 单次等待上限（秒），等待后重新竞争令牌
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+
+    def acquire(self, limits: List[Tuple[str, float, float]]):
+        """
+        阻塞直到所有桶都取到令牌
+
+        Args:
+            limits: [(桶的键, 容量, 每秒补充令牌数), ...]
+        """
+        started = time.monotonic()
+        while True:
+            wait = self.backend.take(limits)
+            if wait <= 0:
+                break
+            time.sleep(min(wait, self.MAX_SINGLE_WAIT))
+        self._log_wait(started)
+
+    async def acquire_async(self, limits: List[Tuple[str, float, float]]):
+        """异步等待直到所有桶都取到令牌（参数同 acquire；可能阻塞的后端在线程池中访问，不占用事件循环）"""
+        started = time.monotonic()
+        while True:
+            if self.backend.blocking:
+                wait = await asyncio.to_thread(self.backend.take, limits)
+            else:
+                wait = self.backend.take(limits)
+            if wait <= 0:
+                break
+            await asyncio.sleep(min(wait, self.MAX_SINGLE_WAIT))
+        self._log_wait(started)
+
+    @staticmethod
+    def _log_wait(started: float):
+        waited = time.monotonic() - started
+        if waited > 0.05:
+            logger.debug(f"限流等待 {waited:.2f} 秒")
+
+
+class ProviderRateLimits:
+    """
+    单个服务商的限流配置
+
+    从服务商配置中读取 rpm / ipm / rate_limit_burst，未配置时所有操作均为空操作
+    """
+
+    def __init__(self, config: Dict[str, Any], provider: Optional[str] = None):
+        provider = provider or config.get('base_url') or config.get('type') or 'default'
+        api_key = config.get('api_key') or ''
+        key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+        self._key_prefix = f"{provider}:{key_hash}"
+
+        self._burst = config.get('rate_limit_burst')
+        self._rpm = self._parse_rate(config.get('rpm'))
+        self._ipm = self._parse_rate(config.get('ipm'))
+
+    @staticmethod
+    def _parse_rate(value) -> Optional[float]:
+        try:
+            rate = float(value)
+        except (TypeError, ValueError):
+            return None
+        return rate if rate > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._rpm is not None or self._ipm is not None
+
+    def _bucket(self, name: str, per_minute: float) -> Tuple[str, float, float]:
+        if self._burst:
+            capacity = max(1.0, float(self._burst))
+        else:
+            capacity = max(1.0, math.ceil(per_minute / 6))
+        return (f"{self._key_prefix}:{name}", capacity, per_minute / 60.0)
+
+    def _limits(self, images: bool) -> List[Tuple[str, float, float]]:
+        limits = []
+        if self._rpm is not None:
+            limits.append(self._bucket("rpm", self._rpm))
+        if images and self._ipm is not None:
+            limits.append(self._bucket("ipm", self._ipm))
+        return limits
+
+    def acquire(self, images: bool = False):
+        """发送请求前调用（阻塞）"""
+        if self.enabled:
+            get_rate_limiter().acquire(self._limits(images))
+
+    async def acquire_async(self, images: bool = False):
+        """发送请求前调用（异步）"""
+        if self.enabled:
+            await get_rate_limiter().acquire_async(self._limits(images))
+
+
+# 全局限流器实例
+_limiter_instance = None
+_limiter_lock = threading.Lock()
+
+
+def _create_backend() -> RateLimitBackend:
+    """根据环境变量创建状态存储后端"""
+    backend = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+    if backend == 'sqlite':
+        db_path = os.getenv('RATE_LIMIT_DB') or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+            "data",
+            "rate_limit.db"
+        )
+        logger.info(f"限流器使用 SQLite 后端: {db_path}")
+        return SQLiteRateLimitBackend(db_path)
+    return MemoryRateLimitBackend()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程级限流器"""
+    global _limiter_instance
+    if _limiter_instance is None:
+        with _limiter_lock:
+            if _limiter_instance is None:
+                _limiter_instance = RateLimiter(_create_backend())
+    return _limiter_instance
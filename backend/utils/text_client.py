@@ -2,10 +2,11 @@
 import time
 import random
 import base64
-import requests
 from functools import wraps
 from typing import List, Optional, Union
-from .image_compressor import compress_image
+from .http_client import get_session, get_timeouts
+from .image_cache import get_image_cache
+from .rate_limiter import ProviderRateLimits
 
 
 def retry_on_429(max_retries=3, base_delay=2):
@@ -40,7 +41,15 @@ def retry_on_429(max_retries=3, base_delay=2):
 class TextChatClient:
     """Text API 客户端封装类"""
 
-    def __init__(self, api_key: str = None, base_url: str = None, endpoint_type: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        endpoint_type: str = None,
+        rpm: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None
+    ):
         self.api_key = api_key
         if not self.api_key:
             raise ValueError(
@@ -57,6 +66,20 @@ class TextChatClient:
             endpoint = '/' + endpoint
         self.chat_endpoint = f"{self.base_url}{endpoint}"
 
+        # 共享连接池（keep-alive）与超时配置
+        self.session = get_session(self.base_url)
+        self.connect_timeout, self.read_timeout, _ = get_timeouts({
+            "connect_timeout": connect_timeout,
+            "read_timeout": read_timeout
+        })
+
+        # 主动限流（每分钟请求数，未配置时不限流）
+        self.rate_limits = ProviderRateLimits({
+            "api_key": self.api_key,
+            "base_url": self.base_url,
+            "rpm": rpm
+        })
+
     def _encode_image_to_base64(self, image_data: bytes) -> str:
         """将图片数据编码为 base64"""
         return base64.b64encode(image_data).decode('utf-8')
@@ -83,11 +106,8 @@ class TextChatClient:
 
         for img in images:
             if isinstance(img, bytes):
-                # 压缩图片到 200KB 以内
-                compressed_img = compress_image(img, max_size_kb=200)
-                # 图片数据，转为 base64 data URL
-                base64_data = self._encode_image_to_base64(compressed_img)
-                image_url = f"data:image/png;base64,{base64_data}"
+                # 压缩图片到 200KB 以内并转为 base64 data URL（按内容缓存）
+                image_url = get_image_cache().data_uri(img, max_size_kb=200)
             else:
                 # 已经是 URL
                 image_url = img
@@ -154,11 +174,12 @@ class TextChatClient:
             "Authorization": f"Bearer {self.api_key}"
         }
 
-        response = requests.post(
+        self.rate_limits.acquire()
+        response = self.session.post(
             self.chat_endpoint,
             json=payload,
             headers=headers,
-            timeout=300  # 5分钟超时
+            timeout=(self.connect_timeout, self.read_timeout)
         )
 
         if response.status_code != 200:
@@ -259,6 +280,8 @@ def get_text_chat_client(provider_config: dict):
             - api_key: API密钥
             - base_url: API基础URL（可选）
             - endpoint_type: 自定义端点路径（可选）
+            - rpm: 每分钟请求数上限（可选，用于主动限流）
+            - connect_timeout / read_timeout: 连接/读取超时秒数（可选）
 
     Returns:
         GenAIClient 或 TextChatClient
@@ -267,9 +290,17 @@ def get_text_chat_client(provider_config: dict):
     api_key = provider_config.get('api_key')
     base_url = provider_config.get('base_url')
     endpoint_type = provider_config.get('endpoint_type')
+    rpm = provider_config.get('rpm')
 
     if provider_type == 'google_gemini':
         from .genai_client import GenAIClient
-        return GenAIClient(api_key=api_key, base_url=base_url)
+        return GenAIClient(api_key=api_key, base_url=base_url, rpm=rpm)
     else:
-        return TextChatClient(api_key=api_key, base_url=base_url, endpoint_type=endpoint_type)
+        return TextChatClient(
+            api_key=api_key,
+            base_url=base_url,
+            endpoint_type=endpoint_type,
+            rpm=rpm,
+            connect_timeout=provider_config.get('connect_timeout'),
+            read_timeout=provider_config.get('read_timeout')
+        )
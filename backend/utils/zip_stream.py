@@ -0,0 +1,221 @@
+"""流式 ZIP 写入
+
+打包下载时先在内存中生成完整的 ZIP 再发送，一套 4K 图文要占用整包大小的内存，还会对已经压缩过的
+PNG/JPEG 再做一遍 deflate。这里边读文件边输出 ZIP 数据块：
+
+- 已压缩的格式（png/jpg/webp/gif/zip 等）以 ZIP_STORED 原样写入；CRC32 取自保存图片时记录的
+  摘要（见 image_digest，与打开的文件不一致时重新计算），文件头可以预先写出，整个归档的长度在发送前
+  即可算出（Content-Length）
+- 其他文件以 ZIP_DEFLATED 流式压缩，大小和 CRC 写在数据之后的数据描述符中，此时长度无法预知
+- 文件在开始输出前全部打开，打包过程中被替换的文件仍按打开时的内容输出
+
+每个下载的内存占用只有一个固定大小的读缓冲区。不支持 ZIP64（单个归档不超过 4GB）。
+"""
+import os
+import struct
+import time
+import zlib
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from .image_digest import ImageDigestStore, get_image_digest_store
+
+ZIP_CHUNK_SIZE = 64 * 1024
+
+# 已压缩、不再 deflate 的扩展名
+STORED_EXTENSIONS = frozenset((".png", ".jpg", ".jpeg", ".webp", ".gif", ".zip", ".gz", ".mp4"))
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_DATA_DESCRIPTOR = struct.Struct("<IIII")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIR = struct.Struct("<IHHHHIIH")
+
+_ZIP_STORED = 0
+_ZIP_DEFLATED = 8
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_VERSION = 20
+_MAX_SIZE = 0xFFFFFFFF
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(max(timestamp, 315532800))  # ZIP 时间从 1980 年开始
+    return (
+        (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    )
+
+
+class _Member:
+    """归档中的一个文件"""
+
+    __slots__ = ("name", "file", "method", "flags", "size", "compressed_size", "crc32", "dos_time",
+                 "dos_date", "offset")
+
+    def __init__(self, archive_name: str, file: BinaryIO, method: int, size: int, crc32: Optional[int],
+                 mtime: float):
+        self.name = archive_name.encode("utf-8")
+        self.file = file
+        self.method = method
+        self.flags = _FLAG_UTF8 | (_FLAG_DATA_DESCRIPTOR if method == _ZIP_DEFLATED else 0)
+        self.size = size
+        self.compressed_size = size if method == _ZIP_STORED else 0
+        self.crc32 = crc32 or 0
+        self.dos_time, self.dos_date = _dos_datetime(mtime)
+        self.offset = 0
+
+    def local_header(self) -> bytes:
+        known = not self.flags & _FLAG_DATA_DESCRIPTOR
+        return _LOCAL_HEADER.pack(
+            0x04034b50, _VERSION, self.flags, self.method, self.dos_time, self.dos_date,
+            self.crc32 if known else 0,
+            self.compressed_size if known else 0,
+            self.size if known else 0,
+            len(self.name), 0
+        ) + self.name
+
+    def central_header(self) -> bytes:
+        return _CENTRAL_HEADER.pack(
+            0x02014b50, _VERSION, _VERSION, self.flags, self.method, self.dos_time, self.dos_date,
+            self.crc32, self.compressed_size, self.size, len(self.name), 0, 0, 0, 0, 0, self.offset
+        ) + self.name
+
+
+class StreamingZip:
+    """
+    流式 ZIP 归档（可迭代对象，逐块产出归档数据）
+
+    用法：
+        archive = StreamingZip([("page_1.png", "/path/0.png"), ...])
+        return Response(archive, headers={"Content-Length": str(archive.content_length)})
+
+    文件在构造时打开，迭代结束或调用 close() 时关闭（WSGI 服务器在响应结束时会调用 close）。
+    """
+
+    def __init__(
+        self,
+        entries: Iterable[Tuple[str, str]],
+        chunk_size: int = ZIP_CHUNK_SIZE,
+        digests: Optional[ImageDigestStore] = None
+    ):
+        """
+        Args:
+            entries: [(归档内文件名, 文件路径)]
+            chunk_size: 读缓冲区大小
+            digests: 提供 CRC32 的图片摘要存储（默认使用全局实例）
+        """
+        self.chunk_size = chunk_size
+        digests = digests or get_image_digest_store()
+        self._members: List[_Member] = []
+        try:
+            for archive_name, path in entries:
+                f = open(path, "rb")
+                try:
+                    stat = os.fstat(f.fileno())
+                    if stat.st_size > _MAX_SIZE:
+                        raise ValueError(f"文件过大，无法打包（不支持 ZIP64）: {path}")
+                    if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+                        member = _Member(archive_name, f, _ZIP_STORED, stat.st_size,
+                                         self._stored_crc32(f, path, stat, digests), stat.st_mtime)
+                    else:
+                        member = _Member(archive_name, f, _ZIP_DEFLATED, stat.st_size, None, stat.st_mtime)
+                except BaseException:
+                    f.close()
+                    raise
+                self._members.append(member)
+        except BaseException:
+            self.close()
+            raise
+
+        self.content_length = self._compute_length()
+
+    def _stored_crc32(self, f: BinaryIO, path: str, stat: os.stat_result, digests: ImageDigestStore) -> int:
+        """
+        已打开文件的 CRC32
+
+        摘要按路径查找，文件在打开后被替换时摘要描述的是新文件；与打开的文件 (大小, mtime) 不一致时
+        从打开的文件重新计算，保证文件头中的 CRC 与输出的内容一致。
+        """
+        digest = digests.get(path, stat)
+        if (digest.size, digest.mtime_ns) == (stat.st_size, stat.st_mtime_ns) and digest.crc32 is not None:
+            return digest.crc32
+        crc32 = 0
+        for chunk in iter(lambda: f.read(self.chunk_size), b""):
+            crc32 = zlib.crc32(chunk, crc32)
+        f.seek(0)
+        return crc32
+
+    def _compute_length(self) -> Optional[int]:
+        """归档总长度（有需要 deflate 的文件时无法预知，返回 None）"""
+        if any(member.method != _ZIP_STORED for member in self._members):
+            return None
+        offset = 0
+        for member in self._members:
+            member.offset = offset
+            offset += _LOCAL_HEADER.size + len(member.name) + member.size
+        central = sum(_CENTRAL_HEADER.size + len(member.name) for member in self._members)
+        total = offset + central + _END_OF_CENTRAL_DIR.size
+        if total > _MAX_SIZE:
+            raise ValueError("归档过大，无法打包（不支持 ZIP64）")
+        return total
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            offset = 0
+            for member in self._members:
+                member.offset = offset
+                header = member.local_header()
+                yield header
+                offset += len(header)
+                for chunk in self._member_data(member):
+                    offset += len(chunk)
+                    yield chunk
+                if member.flags & _FLAG_DATA_DESCRIPTOR:
+                    descriptor = _DATA_DESCRIPTOR.pack(
+                        0x08074b50, member.crc32, member.compressed_size, member.size
+                    )
+                    yield descriptor
+                    offset += len(descriptor)
+
+            central = b"".join(member.central_header() for member in self._members)
+            yield central
+            yield _END_OF_CENTRAL_DIR.pack(
+                0x06054b50, 0, 0, len(self._members), len(self._members), len(central), offset, 0
+            )
+        finally:
+            self.close()
+
+    def _member_data(self, member: _Member) -> Iterator[bytes]:
+        f = member.file
+        remaining = member.size
+        if member.method == _ZIP_STORED:
+            while remaining:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"打包过程中文件被截断: {member.name.decode('utf-8')}")
+                remaining -= len(chunk)
+                yield chunk
+            return
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        crc32 = 0
+        size = 0
+        compressed_size = 0
+        for chunk in iter(lambda: f.read(self.chunk_size), b""):
+            crc32 = zlib.crc32(chunk, crc32)
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield data
+        data = compressor.flush()
+        compressed_size += len(data)
+        if data:
+            yield data
+        if size > _MAX_SIZE or compressed_size > _MAX_SIZE:
+            raise ValueError("文件过大，无法打包（不支持 ZIP64）")
+        member.crc32, member.size, member.compressed_size = crc32, size, compressed_size
+
+    def close(self):
+        """关闭所有已打开的文件"""
+        for member in self._members:
+            member.file.close()
@@ -0,0 +1,135 @@
+"""
+历史记录文件格式基准测试
+
+生成固定随机种子的合成记录（标题 + 原始大纲 + 6~10 页内容 + 图片列表），按每种格式
+（json / compact / zlib，已安装对应依赖时包括 zstd / msgpack）写入临时目录，统计：
+- 磁盘占用（文件大小之和、实际占用块）
+- 写入耗时
+- 全量加载耗时（逐条 RecordFiles.read）与随机读取单条记录的延迟
+
+运行：
+    python benchmarks/bench_history_records.py
+    python benchmarks/bench_history_records.py --records 10000 --formats json zlib
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.record_format import RECORD_FORMATS, RecordFiles, get_record_format  # noqa: E402
+
+SEED = 20240701
+
+TOPICS = ["秋季穿搭", "冬日护肤", "平价好物", "减脂餐", "露营装备", "租房改造", "咖啡探店", "考研经验"]
+PHRASES = ["基础款搭配", "性价比超高", "新手必看", "一周不重样", "亲测有效", "避坑指南", "保姆级教程",
+           "学生党", "小个子", "氛围感", "高级感", "上班族", "懒人必备", "收藏起来", "干货满满", "真实体验"]
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return "".join("，".join(rng.sample(PHRASES, 4)) + "。" for _ in range(sentences))
+
+
+def build_record(rng: random.Random, i: int) -> dict:
+    """生成一条与实际记录结构一致的合成记录"""
+    created_at = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00.{i % 1000000:06d}"
+    page_count = rng.randint(6, 10)
+    pages = [
+        {
+            "index": p,
+            "type": "cover" if p == 0 else "content",
+            "content": f"{rng.choice(TOPICS)}\n" + _paragraph(rng, rng.randint(3, 8)),
+        }
+        for p in range(page_count)
+    ]
+    return {
+        "id": f"rec-{i:07d}",
+        "title": f"{rng.choice(TOPICS)}｜{rng.choice(PHRASES)}",
+        "created_at": created_at,
+        "updated_at": created_at,
+        "outline": {
+            "raw": "\n\n<page>\n\n".join(page["content"] for page in pages),
+            "pages": pages,
+        },
+        "images": {
+            "task_id": f"task_{i:08x}",
+            "generated": [f"{p}.png" for p in range(page_count)],
+        },
+        "status": "completed",
+        "thumbnail": "0.png",
+    }
+
+
+def available_formats(requested):
+    formats = []
+    for name in requested:
+        try:
+            get_record_format(name)
+            formats.append(name)
+        except ValueError as e:
+            print(f"跳过 {name}: {str(e).splitlines()[0]}")
+    return formats
+
+
+def bench_format(format_name: str, count: int, samples: int):
+    directory = tempfile.mkdtemp()
+    try:
+        files = RecordFiles(directory, format_name)
+        rng = random.Random(SEED)
+
+        write_seconds = 0.0
+        for i in range(count):
+            record = build_record(rng, i)
+            t0 = time.perf_counter()
+            files.write(record["id"], record)
+            write_seconds += time.perf_counter() - t0
+
+        size = 0
+        blocks = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                size += stat.st_size
+                blocks += stat.st_blocks * 512
+
+        ids = [f"rec-{i:07d}" for i in range(count)]
+        t0 = time.perf_counter()
+        for record_id in ids:
+            files.read(record_id)
+        load_seconds = time.perf_counter() - t0
+
+        sample_rng = random.Random(SEED + 1)
+        latencies = []
+        for record_id in sample_rng.sample(ids, min(samples, count)):
+            t0 = time.perf_counter()
+            files.read(record_id)
+            latencies.append((time.perf_counter() - t0) * 1e6)
+
+        print(f"  {format_name:<8} 大小={size / 1024 / 1024:8.1f}MB  占用={blocks / 1024 / 1024:8.1f}MB  "
+              f"写入={write_seconds:6.2f}s  全量加载={load_seconds:6.2f}s  "
+              f"单条中位数={statistics.median(latencies):7.1f}us")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史记录文件格式基准测试")
+    parser.add_argument('--records', type=int, nargs='+', default=[10000, 100000], help="记录数")
+    parser.add_argument('--formats', nargs='+', default=list(RECORD_FORMATS), help="记录格式")
+    parser.add_argument('--samples', type=int, default=2000, help="随机读取的次数")
+    args = parser.parse_args()
+
+    formats = available_formats(args.formats)
+    for count in args.records:
+        print(f"{count} 条记录:")
+        for format_name in formats:
+            bench_format(format_name, count, args.samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+历史记录全文检索基准测试
+
+生成固定随机种子的合成语料（中文标题 + 多页大纲内容），构建 SQLite / JSON 两种索引的全文检索，
+统计不同类型查询（常见词、长短语、罕见短语、单字、多片段、英文前缀）的延迟。
+
+运行：
+    python benchmarks/bench_history_search.py
+    python benchmarks/bench_history_search.py --records 100000 --backends sqlite
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.history_index import create_history_index  # noqa: E402
+
+SEED = 20240601
+
+TOPICS = ["秋季穿搭", "冬日护肤", "平价好物", "减脂餐", "露营装备", "租房改造", "咖啡探店", "考研经验",
+          "猫咪日常", "通勤妆容", "旅行攻略", "数码测评", "读书笔记", "健身打卡", "烘焙教程", "职场干货"]
+PHRASES = ["基础款搭配", "性价比超高", "新手必看", "一周不重样", "亲测有效", "避坑指南", "保姆级教程",
+           "学生党", "小个子", "氛围感", "高级感", "上班族", "懒人必备", "收藏起来", "干货满满", "真实体验"]
+WORDS = ["iPhone", "Python", "MUJI", "vlog", "ootd", "DIY", "Switch", "Kindle"]
+QUERIES = {
+    "常见词": "教程",
+    "长短语": "保姆级教程",
+    "罕见短语": "懒人必备收藏",
+    "单字": "猫",
+    "多片段": "穿搭 小个子",
+    "英文前缀": "pyth",
+    "无结果": "量子力学",
+}
+
+
+def _sentence(rng: random.Random) -> str:
+    parts = rng.sample(PHRASES, 3)
+    if rng.random() < 0.3:
+        parts.append(rng.choice(WORDS))
+    return "，".join(parts) + "。"
+
+
+def build_corpus(count: int):
+    """生成固定语料: [(索引条目, 标题, 正文)]"""
+    rng = random.Random(SEED)
+    corpus = []
+    for i in range(count):
+        record_id = f"rec-{i:07d}"
+        title = f"{rng.choice(TOPICS)}｜{rng.choice(PHRASES)}{i % 97}"
+        content = "\n".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+        created_at = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00.{i:06d}"
+        entry = {
+            "id": record_id,
+            "title": title,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "status": "completed",
+            "thumbnail": "0.png",
+            "page_count": 6,
+            "task_id": f"task_{i:07d}",
+        }
+        corpus.append((entry, title, content))
+    return corpus
+
+
+def bench_backend(backend: str, corpus, repeat: int):
+    history_dir = tempfile.mkdtemp()
+    try:
+        # 通过 index.json 批量导入条目（SQLite 首次打开时导入）
+        with open(os.path.join(history_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"records": [entry for entry, _, _ in corpus]}, f, ensure_ascii=False)
+
+        started = time.perf_counter()
+        index = create_history_index(history_dir, backend)
+        index.index_documents((entry["id"], title, content) for entry, title, content in corpus)
+        build_seconds = time.perf_counter() - started
+        print(f"[{backend}] 构建索引 {len(corpus)} 条: {build_seconds:.1f}s")
+
+        for name, query in QUERIES.items():
+            timings = []
+            total = 0
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                total, _ = index.search_documents(query, offset=0, limit=20)
+                timings.append((time.perf_counter() - t0) * 1000)
+            print(f"  {name:<8} {query:<12} 命中={total:<8} 中位数={statistics.median(timings):8.2f}ms  "
+                  f"最大={max(timings):8.2f}ms")
+        index.close()
+    finally:
+        shutil.rmtree(history_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史记录全文检索基准测试")
+    parser.add_argument('--records', type=int, default=100000, help="记录数")
+    parser.add_argument('--repeat', type=int, default=20, help="每个查询运行次数")
+    parser.add_argument('--backends', nargs='+', default=['sqlite', 'json'], help="索引类型")
+    args = parser.parse_args()
+
+    print("生成语料...")
+    corpus = build_corpus(args.records)
+    for backend in args.backends:
+        bench_backend(backend, corpus, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+图片压缩基准测试
+
+对比 compress_image（插值/二分查找质量 + 体积估算分辨率）与 compress_image_linear（旧版线性搜索）
+在固定语料上的 JPEG 编码次数、耗时和输出大小。
+
+语料由固定随机种子生成（渐变背景 + 色块 + 噪点纹理），包含 PNG / JPEG 两种输入格式和 1K/2K/4K 三种尺寸。
+
+运行：
+    python benchmarks/bench_image_compressor.py
+    python benchmarks/bench_image_compressor.py --repeat 3 --targets 50 200
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils import image_compressor  # noqa: E402
+
+SEED = 20240501
+SIZES = {
+    "1K": (768, 1024),
+    "2K": (1536, 2048),
+    "4K": (3072, 4096),
+}
+
+
+def _make_image(rng: random.Random, size) -> Image.Image:
+    """生成一张类似小红书配图的合成图片"""
+    width, height = size
+    top = tuple(rng.randint(120, 255) for _ in range(3))
+    bottom = tuple(rng.randint(0, 120) for _ in range(3))
+
+    # 竖向渐变背景
+    gradient = Image.new('RGB', (1, 256))
+    for y in range(256):
+        t = y / 255
+        gradient.putpixel((0, y), tuple(int(a + (b - a) * t) for a, b in zip(top, bottom)))
+    img = gradient.resize(size, Image.Resampling.BILINEAR)
+
+    # 色块和线条
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(8, 20)):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randint(width // 20, width // 3), y0 + rng.randint(height // 20, height // 4)
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+        else:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+    for _ in range(rng.randint(20, 60)):
+        draw.line(
+            (rng.randrange(width), rng.randrange(height), rng.randrange(width), rng.randrange(height)),
+            fill=tuple(rng.randint(0, 255) for _ in range(3)),
+            width=rng.randint(1, 6)
+        )
+
+    # 噪点纹理（模拟照片细节）
+    noise = Image.effect_noise(size, rng.randint(10, 40)).convert('RGB')
+    return Image.blend(img, noise, 0.15)
+
+
+def build_corpus():
+    """生成固定语料: [(名称, 图片数据)]"""
+    rng = random.Random(SEED)
+    corpus = []
+    for label, size in SIZES.items():
+        for fmt in ('PNG', 'JPEG'):
+            img = _make_image(rng, size)
+            output = io.BytesIO()
+            if fmt == 'JPEG':
+                img.save(output, format='JPEG', quality=95)
+            else:
+                img.save(output, format='PNG')
+            corpus.append((f"{label}-{fmt.lower()}", output.getvalue()))
+    return corpus
+
+
+def compress_image_linear(
+    image_data: bytes,
+    max_size_kb: int = 200,
+    quality_start: int = 85,
+    quality_min: int = 20,
+    max_dimension: int = 2048
+) -> bytes:
+    """
+    压缩图片到指定大小以内（旧版线性搜索策略，作为基准对比）
+
+    质量从 quality_start 起每次降低 5，仍然过大时每次把尺寸缩小到 0.9 倍，每一步都完整编码一次。
+    参数同 image_compressor.compress_image。
+    """
+    max_size_bytes = max_size_kb * 1024
+
+    # 如果原图已经小于目标大小，直接返回
+    if len(image_data) <= max_size_bytes:
+        return image_data
+
+    try:
+        # 打开图片
+        img = Image.open(io.BytesIO(image_data))
+
+        # 转换为 RGB（处理 RGBA 等格式）
+        if img.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # 如果图片尺寸过大，先缩小
+        width, height = img.size
+        if width > max_dimension or height > max_dimension:
+            ratio = min(max_dimension / width, max_dimension / height)
+            new_width = int(width * ratio)
+            new_height = int(height * ratio)
+            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+        # 逐步降低质量直到满足大小要求
+        quality = quality_start
+        compressed_data = None
+
+        while quality >= quality_min:
+            output = io.BytesIO()
+            img.save(output, format='JPEG', quality=quality, optimize=True)
+            compressed_data = output.getvalue()
+
+            if len(compressed_data) <= max_size_bytes:
+                break
+
+            quality -= 5
+
+        # 如果还是太大，进一步缩小尺寸
+        if len(compressed_data) > max_size_bytes:
+            width, height = img.size
+            while len(compressed_data) > max_size_bytes and max(width, height) > 512:
+                width = int(width * 0.9)
+                height = int(height * 0.9)
+                img_resized = img.resize((width, height), Image.Resampling.LANCZOS)
+
+                output = io.BytesIO()
+                img_resized.save(output, format='JPEG', quality=quality_min, optimize=True)
+                compressed_data = output.getvalue()
+
+        return compressed_data
+
+    except Exception as e:
+        print(f"[图片压缩] 压缩失败，返回原图: {e}")
+        return image_data
+
+
+@contextmanager
+def count_encodes():
+    """统计 JPEG 编码次数"""
+    counter = {"encodes": 0}
+    original_save = Image.Image.save
+
+    def counting_save(self, fp, format=None, **params):
+        if (format or '').upper() == 'JPEG':
+            counter["encodes"] += 1
+        return original_save(self, fp, format, **params)
+
+    Image.Image.save = counting_save
+    try:
+        yield counter
+    finally:
+        Image.Image.save = original_save
+
+
+def run(func, data: bytes, max_size_kb: int, repeat: int):
+    """多次运行取耗时中位数"""
+    timings = []
+    result = b''
+    encodes = 0
+    for _ in range(repeat):
+        with count_encodes() as counter:
+            started = time.perf_counter()
+            result = func(data, max_size_kb=max_size_kb)
+            timings.append(time.perf_counter() - started)
+        encodes = counter["encodes"]
+    with Image.open(io.BytesIO(result)) as img:
+        dimensions = img.size
+    return {
+        "encodes": encodes,
+        "seconds": statistics.median(timings),
+        "bytes": len(result),
+        "dimensions": dimensions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片压缩基准测试")
+    parser.add_argument('--repeat', type=int, default=1, help="每个用例运行次数（取耗时中位数）")
+    parser.add_argument('--targets', type=int, nargs='+', default=[50, 200], help="目标大小（KB）")
+    args = parser.parse_args()
+
+    # 基准测试只关心数据，屏蔽压缩函数的日志输出
+    image_compressor.print = lambda *a, **k: None
+
+    print("生成语料...")
+    corpus = build_corpus()
+
+    strategies = [
+        ("linear", compress_image_linear),
+        ("search", image_compressor.compress_image),
+    ]
+    totals = {name: {"encodes": 0, "seconds": 0.0} for name, _ in strategies}
+
+    header = f"{'用例':<14}{'目标':>6}  {'策略':<8}{'编码次数':>8}{'耗时(s)':>10}{'输出(KB)':>10}  尺寸"
+    print(header)
+    print("-" * 72)
+    for name, data in corpus:
+        for target in args.targets:
+            for strategy, func in strategies:
+                stats = run(func, data, target, args.repeat)
+                totals[strategy]["encodes"] += stats["encodes"]
+                totals[strategy]["seconds"] += stats["seconds"]
+                print(
+                    f"{name:<14}{target:>5}K  {strategy:<8}{stats['encodes']:>8}"
+                    f"{stats['seconds']:>10.3f}{stats['bytes'] / 1024:>10.1f}  "
+                    f"{stats['dimensions'][0]}x{stats['dimensions'][1]}"
+                )
+
+    print()
+    for strategy, total in totals.items():
+        print(f"{strategy:<8} 总编码次数={total['encodes']:<5} 总耗时={total['seconds']:.2f}s")
+    baseline, candidate = totals["linear"], totals["search"]
+    if candidate["seconds"] > 0:
+        print(f"加速比: {baseline['seconds'] / candidate['seconds']:.2f}x, "
+              f"编码次数减少: {baseline['encodes'] - candidate['encodes']}")
+
+
+if __name__ == '__main__':
+    main()
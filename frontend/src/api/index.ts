@@ -94,9 +94,11 @@ export async function generateOutline(
 
 // 获取图片 URL（新格式：task_id/filename）
 // thumbnail 参数：true=缩略图（默认），false=原图
-export function getImageUrl(taskId: string, filename: string, thumbnail: boolean = true): string {
+// version 参数：图片内容 sha256（如记录 images.blobs 中的值），带上后内容一致时浏览器长期缓存
+export function getImageUrl(taskId: string, filename: string, thumbnail: boolean = true, version?: string): string {
   const thumbParam = thumbnail ? '?thumbnail=true' : '?thumbnail=false'
-  return `${API_BASE_URL}/images/${taskId}/${filename}${thumbParam}`
+  const versionParam = version ? `&v=${version.slice(0, 16)}` : ''
+  return `${API_BASE_URL}/images/${taskId}/${filename}${thumbParam}${versionParam}`
 }
 
 // 重新生成图片（即使成功的也可以重新生成）
@@ -219,7 +219,7 @@ export async function deleteHistory(recordId: string): Promise<{
 }
 
 // 其他必要的函数
-export function getImageUrl(taskId: string, filename: string, thumbnail: boolean = true): string {
+export function getImageUrl(taskId: string, filename: string, thumbnail: boolean = true, version?: string): string {
   return `https://picsum.photos/400/300?random=${taskId}`
 }
 
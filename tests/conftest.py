@@ -78,3 +78,65 @@ def sample_history_record():
         "created_at": "2025-01-01T00:00:00",
         "updated_at": "2025-01-01T00:00:00"
     }
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def history_service(request, monkeypatch, temp_history_dir):
+    """使用临时目录的历史记录服务（分别使用两种索引后端，不在后台预生成下载归档）"""
+    from backend.services.history import HistoryService
+    from backend.services.task_archive import TaskArchives
+    monkeypatch.setenv('HISTORY_INDEX_BACKEND', request.param)
+    service = HistoryService(temp_history_dir)
+    service.archives = TaskArchives(prebuild=False)
+    yield service
+    service.journal.close()
+
+
+@pytest.fixture
+def image_service(monkeypatch, temp_history_dir):
+    """使用假生成器和临时历史目录的 ImageService（生成的 PNG 文本块中记录提示词）"""
+    import asyncio
+    import io
+    import random
+    from PIL import Image
+    from PIL.PngImagePlugin import PngInfo
+    from backend.config import Config
+    from backend.generators.base import ImageGeneratorBase
+    from backend.generators.factory import ImageGeneratorFactory
+    from backend.services.derivatives import DerivativePipeline
+    from backend.services.image import ImageService
+    from backend.services.task_store import TaskStateStore
+
+    class FakeImageGenerator(ImageGeneratorBase):
+        """假的图片生成器：把提示词写进 PNG 文本块，生成前随机等待以打乱完成顺序"""
+
+        def generate_image(self, prompt: str, **kwargs) -> bytes:
+            info = PngInfo()
+            info.add_text("prompt", prompt)
+            output = io.BytesIO()
+            Image.new('RGB', (64, 64), (200, 100, 50)).save(output, format='PNG', pnginfo=info)
+            return output.getvalue()
+
+        async def generate_image_async(self, prompt: str, **kwargs) -> bytes:
+            await asyncio.sleep(random.uniform(0, 0.02))
+            return self.generate_image(prompt, **kwargs)
+
+        def validate_config(self) -> bool:
+            return True
+
+    monkeypatch.setitem(ImageGeneratorFactory.GENERATORS, 'fake', FakeImageGenerator)
+    monkeypatch.setattr(Config, 'get_active_image_provider', classmethod(lambda cls: 'fake'))
+    monkeypatch.setattr(
+        Config, 'get_image_provider_config',
+        classmethod(lambda cls, provider_name=None: {'type': 'fake', 'short_prompt': True, 'max_concurrent': 32})
+    )
+
+    service = ImageService()
+    service.history_root_dir = temp_history_dir
+    service._task_states = TaskStateStore(temp_history_dir)
+    # 测试中不启动工作进程
+    service.derivatives = DerivativePipeline(max_workers=2, executor_type='thread')
+    # 短 prompt 模板只包含页面类型和内容，便于从图片中读回
+    service.prompt_template_short = "{page_type}|{page_content}"
+    yield service
+    service.derivatives.shutdown()
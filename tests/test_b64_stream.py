@@ -0,0 +1,150 @@
+"""
+流式 base64 解码测试
+
+响应按任意大小分块到达：键名、转义序列、data URI 前缀和 4 字符对齐都可能被块边界截断。
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+
+import pytest
+
+from backend.utils.b64_stream import (
+    AsyncBase64JsonFileWriter, Base64JsonFileWriter, Base64StreamDecoder,
+    JsonStringFieldExtractor, atomic_write_stream
+)
+
+IMAGE = bytes(range(256)) * 40 + b"\xff\xfe\xfd"
+
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _response(image: bytes = IMAGE, prefix: str = "", escape_slashes: bool = True) -> bytes:
+    value = prefix + base64.b64encode(image).decode()
+    body = json.dumps({"created": 1, "data": [{"revised_prompt": "a/b", "b64_json": value}]})
+    if escape_slashes:
+        # 部分服务商把 / 转义为 \/
+        body = body.replace("/", "\\/")
+    return body.encode()
+
+
+def _extract(response: bytes, chunk_size: int, field: str = "b64_json") -> bytes:
+    sink = io.BytesIO()
+    decoder = Base64StreamDecoder(sink)
+    extractor = JsonStringFieldExtractor(field, decoder.feed)
+    for chunk in _chunks(response, chunk_size):
+        extractor.feed(chunk)
+    assert extractor.done
+    decoder.close()
+    return sink.getvalue()
+
+
+# ==================== 块边界 ====================
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64, 4097])
+@pytest.mark.parametrize("escape_slashes", [True, False])
+def test_decodes_across_chunk_boundaries(chunk_size, escape_slashes):
+    response = _response(escape_slashes=escape_slashes)
+    assert _extract(response, chunk_size) == IMAGE
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 11])
+def test_data_uri_prefix_is_stripped(chunk_size):
+    response = _response(prefix="data:image/png;base64,")
+    assert _extract(response, chunk_size) == IMAGE
+
+
+def test_escape_split_from_its_character():
+    response = _response()
+    backslash = response.index(b"\\/", response.index(b'"b64_json"'))
+    extracted = []
+    extractor = JsonStringFieldExtractor("b64_json", extracted.append)
+
+    # 反斜杠恰好在块末尾，被转义的字符在下一块开头
+    extractor.feed(response[:backslash + 1])
+    extractor.feed(response[backslash + 1:])
+
+    assert extractor.done
+    assert base64.b64decode(b"".join(extracted)) == IMAGE
+
+
+def test_key_split_across_chunks_and_non_string_values_are_skipped():
+    response = b'{"b64_json": null, "data": [{"b64_js' + b'on": "' + base64.b64encode(b"abc") + b'"}]}'
+    assert _extract(response, 4) == b"abc"
+
+
+def test_decoder_handles_whitespace_and_missing_padding():
+    sink = io.BytesIO()
+    decoder = Base64StreamDecoder(sink)
+    encoded = base64.b64encode(b"hello world!?").rstrip(b"=")
+    for chunk in _chunks(encoded[:6] + b"\n  " + encoded[6:], 3):
+        decoder.feed(chunk)
+    decoder.close()
+    assert sink.getvalue() == b"hello world!?"
+    assert decoder.bytes_written == len(b"hello world!?")
+
+
+def test_truncated_base64_raises_value_error():
+    decoder = Base64StreamDecoder(io.BytesIO())
+    decoder.feed(b"aGVsbG8")
+    decoder.feed(b"hh")
+    with pytest.raises(ValueError):
+        decoder.close()
+
+
+def test_unsupported_escape_raises_value_error():
+    extractor = JsonStringFieldExtractor("b64_json", lambda chunk: None)
+    with pytest.raises(ValueError):
+        extractor.feed(b'{"b64_json": "ab\\u0041"}')
+
+
+# ==================== 原子写入 ====================
+
+def test_atomic_write_stream_replaces_on_success(tmp_path):
+    dest = tmp_path / "0.png"
+    dest.write_bytes(b"old")
+    with atomic_write_stream(str(dest)) as f:
+        f.write(b"new")
+        # 写入期间目标文件保持旧内容
+        assert dest.read_bytes() == b"old"
+    assert dest.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["0.png"]
+
+
+def test_atomic_write_stream_cleans_up_on_failure(tmp_path):
+    dest = tmp_path / "0.png"
+    dest.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with atomic_write_stream(str(dest)) as f:
+            f.write(b"partial")
+            raise RuntimeError("connection reset")
+    assert dest.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["0.png"]
+
+
+def test_file_writer_keeps_destination_when_field_missing(tmp_path):
+    dest = tmp_path / "0.png"
+    with pytest.raises(ValueError):
+        with Base64JsonFileWriter(str(dest)) as writer:
+            writer.feed(b'{"error": {"message": "quota"}}')
+            assert not writer.found
+            writer.finish()
+    assert not dest.exists()
+    assert os.listdir(tmp_path) == []
+
+
+def test_async_file_writer(tmp_path):
+    dest = tmp_path / "0.png"
+
+    async def run():
+        async with AsyncBase64JsonFileWriter(str(dest), batch_size=100) as writer:
+            for chunk in _chunks(_response(), 37):
+                await writer.feed(chunk)
+            return await writer.finish()
+
+    assert asyncio.run(run()) == len(IMAGE)
+    assert dest.read_bytes() == IMAGE
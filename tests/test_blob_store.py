@@ -0,0 +1,115 @@
+"""
+图片内容寻址存储测试
+
+覆盖重复内容去重、重新生成时保留历史版本，以及按硬链接数回收 blob。
+"""
+import os
+
+import pytest
+
+from backend.services.blob_store import BlobStore, VERSIONS_DIR, is_blob_id
+from backend.utils.b64_stream import write_file_atomic
+from backend.utils.image_digest import ImageDigestStore
+
+
+@pytest.fixture
+def store(temp_history_dir):
+    return BlobStore(temp_history_dir, digests=ImageDigestStore(), versions_keep=2)
+
+
+def _save(store, task_id, filename, data, previous=None):
+    """按生成流程保存图片：原子替换后纳入存储"""
+    path = os.path.join(store.root_dir, task_id, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_file_atomic(path, data)
+    return path, store.ingest(path, data, previous)
+
+
+def _blob_count(store):
+    if not os.path.isdir(store.blob_dir):
+        return 0
+    return sum(1 for _, _, files in os.walk(store.blob_dir) for name in files if is_blob_id(name))
+
+
+def test_identical_images_share_one_blob(store):
+    first, blob_id = _save(store, "task_a", "0.png", b"same image")
+    second, same_id = _save(store, "task_b", "3.png", b"same image")
+
+    assert blob_id == same_id
+    assert os.path.samefile(first, second)
+    assert os.path.samefile(first, store.blob_path(blob_id))
+    # 两个任务文件 + blob 自身
+    assert os.stat(first).st_nlink == 3
+    assert _blob_count(store) == 1
+    assert store.manifest("task_a", ["0.png", "missing.png"]) == {"0.png": blob_id}
+
+
+def test_regenerate_keeps_previous_versions(store):
+    path, v1 = _save(store, "task_a", "0.png", b"version 1")
+    _, v2 = _save(store, "task_a", "0.png", b"version 2", previous=store.blob_of(path))
+    _, v3 = _save(store, "task_a", "0.png", b"version 3", previous=store.blob_of(path))
+    _, v4 = _save(store, "task_a", "0.png", b"version 4", previous=store.blob_of(path))
+
+    versions = store.list_versions("task_a", "0.png")
+    # 只保留最近 versions_keep 个历史版本，更早的 blob 没有其他引用时被回收
+    assert [version["blob"] for version in versions] == [v2, v3]
+    assert not os.path.exists(store.blob_path(v1))
+    assert os.path.exists(store.blob_path(v2))
+    assert store.blob_of(path) == v4
+
+    # 内容未变化时不产生新版本
+    _save(store, "task_a", "0.png", b"version 4", previous=v4)
+    assert len(store.list_versions("task_a", "0.png")) == 2
+
+
+def test_remove_task_dir_releases_only_unshared_blobs(store):
+    _, shared = _save(store, "task_a", "0.png", b"shared")
+    _, own = _save(store, "task_a", "1.png", b"only in a")
+    path, old = _save(store, "task_a", "2.png", b"old content")
+    _save(store, "task_a", "2.png", b"new content", previous=old)
+    _save(store, "task_b", "0.png", b"shared")
+
+    freed = store.remove_task_dir(os.path.join(store.root_dir, "task_a"))
+
+    assert not os.path.exists(os.path.join(store.root_dir, "task_a"))
+    assert freed == len(b"only in a") + len(b"old content") + len(b"new content")
+    assert os.path.exists(store.blob_path(shared))
+    assert not os.path.exists(store.blob_path(own))
+    assert not os.path.exists(store.blob_path(old))
+
+    store.remove_task_dir(os.path.join(store.root_dir, "task_b"))
+    assert _blob_count(store) == 0
+
+
+def test_gc_removes_unreferenced_blobs(store):
+    path, blob_id = _save(store, "task_a", "0.png", b"orphaned later")
+    _, kept = _save(store, "task_a", "1.png", b"still referenced")
+    # 绕过 remove_task_dir 直接删除图片（如手动清理）
+    os.remove(path)
+
+    result = store.gc()
+
+    assert result["removed"] == 1
+    assert result["freed_bytes"] == len(b"orphaned later")
+    assert result["blobs"] == 1
+    assert not os.path.exists(store.blob_path(blob_id))
+    assert os.path.exists(store.blob_path(kept))
+
+
+def test_files_outside_root_are_not_ingested(store, tmp_path):
+    outside = tmp_path / "elsewhere.png"
+    outside.write_bytes(b"outside")
+
+    assert store.ingest(str(outside)) is None
+    assert _blob_count(store) == 0
+
+
+def test_version_entries_point_at_old_blob(store):
+    path, old = _save(store, "task_a", "0.png", b"a")
+    _save(store, "task_a", "0.png", b"b", previous=old)
+
+    versions_dir = os.path.join(store.root_dir, "task_a", VERSIONS_DIR, "0.png")
+    assert len(os.listdir(versions_dir)) == 1
+    # 当前文件指向新内容，历史版本指向旧内容
+    assert store.manifest("task_a", ["0.png"]) == {"0.png": store.blob_of(path)}
+    assert store.list_versions("task_a", "0.png")[0]["blob"] == old
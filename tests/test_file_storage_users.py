@@ -0,0 +1,116 @@
+"""
+FileStorage 用户存储测试
+
+用户按 ID 分片保存为单独的文件，邮箱索引按邮箱哈希分片；旧版 users/index.json 在启动时迁移。
+"""
+import json
+import os
+
+import pytest
+
+from backend.storage import file_storage
+from backend.storage.file_storage import FileStorage
+
+
+@pytest.fixture
+def open_storage(temp_history_dir):
+    """按需创建 FileStorage，测试结束时关闭写前日志"""
+    storages = []
+
+    def open_storage():
+        storage = FileStorage(temp_history_dir)
+        storages.append(storage)
+        return storage
+
+    yield open_storage
+    for storage in storages:
+        storage._history_journal.close()
+
+
+def _user(user_id: str, email: str, **extra):
+    return {"id": user_id, "email": email, "username": user_id, **extra}
+
+
+# ==================== 查找 ====================
+
+def test_users_are_sharded_by_id(open_storage, temp_history_dir):
+    storage = open_storage()
+    storage.create_user(_user("ab12cd", "A@example.com"))
+
+    assert os.path.exists(os.path.join(temp_history_dir, "users", "ab", "ab12cd.json"))
+    assert storage.get_user("ab12cd")["email"] == "A@example.com"
+    assert storage.get_user("missing") is None
+    # 新实例从文件读取
+    assert open_storage().get_user("ab12cd")["username"] == "ab12cd"
+
+
+def test_email_lookup_is_normalized(open_storage):
+    storage = open_storage()
+    storage.create_user(_user("u1", "Alice@Example.com"))
+
+    assert storage.get_user_by_email("  alice@example.COM ")["id"] == "u1"
+    assert storage.get_user_by_email("bob@example.com") is None
+
+
+def test_email_change_moves_index(open_storage):
+    storage = open_storage()
+    storage.create_user(_user("u1", "old@example.com"))
+    storage.update_user(_user("u1", "new@example.com"))
+
+    assert storage.get_user_by_email("old@example.com") is None
+    assert storage.get_user_by_email("new@example.com")["id"] == "u1"
+
+
+def test_stale_email_pointer_is_ignored(open_storage):
+    storage = open_storage()
+    storage.create_user(_user("u1", "a@example.com"))
+    # 用户文件中的邮箱与索引不一致时（例如其他进程修改到一半），不返回该用户
+    storage._user_files.write("u1", _user("u1", "b@example.com"))
+    assert storage.get_user_by_email("a@example.com") is None
+
+
+# ==================== 旧版索引迁移 ====================
+
+def _write_legacy_index(temp_history_dir, users):
+    users_dir = os.path.join(temp_history_dir, "users")
+    os.makedirs(users_dir, exist_ok=True)
+    with open(os.path.join(users_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({"users": {user["id"]: user for user in users}}, f)
+
+
+def test_legacy_index_is_migrated(open_storage, temp_history_dir, monkeypatch):
+    _write_legacy_index(temp_history_dir, [_user("u1", "one@example.com"), _user("u2", "Two@example.com")])
+    synced = []
+    fsync_paths = file_storage.fsync_paths
+
+    def recording_fsync_paths(paths):
+        paths = list(paths)
+        synced.extend(paths)
+        fsync_paths(paths)
+
+    monkeypatch.setattr(file_storage, "fsync_paths", recording_fsync_paths)
+    monkeypatch.setattr(file_storage.os, "sync", lambda: pytest.fail("迁移不应调用全局 os.sync()"), raising=False)
+
+    storage = open_storage()
+
+    users_dir = os.path.join(temp_history_dir, "users")
+    assert not os.path.exists(os.path.join(users_dir, "index.json"))
+    assert os.path.exists(os.path.join(users_dir, "index.json.migrated"))
+    assert storage.get_user("u2")["email"] == "Two@example.com"
+    assert storage.get_user_by_email("two@example.com")["id"] == "u2"
+    assert os.path.join(users_dir, "index.json.migrated") in synced
+
+
+def test_migration_does_not_overwrite_existing_users(open_storage, temp_history_dir):
+    storage = open_storage()
+    storage.create_user(_user("u1", "one@example.com", username="已修改"))
+
+    # 上次迁移在重命名旧索引前中断
+    _write_legacy_index(temp_history_dir, [_user("u1", "one@example.com"), _user("u2", "two@example.com")])
+    storage = open_storage()
+
+    assert storage.get_user("u1")["username"] == "已修改"
+    assert storage.get_user_by_email("two@example.com")["id"] == "u2"
+    # 迁移完成后再次启动不再重复执行
+    assert not os.path.exists(os.path.join(temp_history_dir, "users", "index.json"))
+    assert open_storage().get_user("u2")["id"] == "u2"
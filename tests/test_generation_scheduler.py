@@ -0,0 +1,81 @@
+"""
+生成调度器测试
+
+槽位只在上游请求期间占用：等待限流令牌和重试退避时不占用，其他任务可以先执行。
+"""
+import asyncio
+
+import pytest
+
+from backend.generators import google_genai, image_api, openai_compatible
+from backend.services.scheduler import GenerationScheduler
+
+
+class FakeRateLimits:
+    """记录每次取令牌时调度器中被占用的槽位数"""
+
+    def __init__(self, scheduler, delay: float = 0):
+        self.scheduler = scheduler
+        self.delay = delay
+        self.active_on_acquire = []
+
+    async def acquire_async(self, images: bool = False):
+        self.active_on_acquire.append(self.scheduler.get_stats()["active"])
+        await asyncio.sleep(self.delay)
+
+
+def _flaky_generator(retry_on_error, scheduler, failures: int):
+    class FlakyGenerator:
+        def __init__(self):
+            self.rate_limits = FakeRateLimits(scheduler)
+            self.active_on_attempt = []
+
+        @retry_on_error(max_retries=3, base_delay=0)
+        async def generate_image_async(self, prompt: str) -> bytes:
+            self.active_on_attempt.append(scheduler.get_stats()["active"])
+            if len(self.active_on_attempt) <= failures:
+                raise RuntimeError("timeout")
+            return b"image"
+
+    return FlakyGenerator()
+
+
+@pytest.mark.parametrize("module", [image_api, openai_compatible, google_genai])
+def test_slot_is_held_only_during_attempts(module, monkeypatch):
+    # 不实际等待重试退避
+    monkeypatch.setattr(module.random, "uniform", lambda a, b: 0)
+    if hasattr(module, "_retry_wait_time"):
+        monkeypatch.setattr(module, "_retry_wait_time", lambda *args: 0)
+    scheduler = GenerationScheduler(max_concurrent=1)
+    generator = _flaky_generator(module.retry_on_error, scheduler, failures=2)
+
+    async def run():
+        with scheduler.per_attempt("task_a", "fake"):
+            return await generator.generate_image_async("prompt")
+
+    assert asyncio.run(run()) == b"image"
+    # 每次尝试占用一个槽位；取令牌时不占用
+    assert generator.active_on_attempt == [1, 1, 1]
+    assert generator.rate_limits.active_on_acquire == [0, 0, 0]
+    assert scheduler.get_stats()["active"] == 0
+    assert scheduler.get_stats()["granted_total"] == 3
+
+
+def test_throttled_request_does_not_block_other_tasks():
+    scheduler = GenerationScheduler(max_concurrent=1)
+    throttled = _flaky_generator(image_api.retry_on_error, scheduler, failures=0)
+    throttled.rate_limits.delay = 0.2
+    other = _flaky_generator(image_api.retry_on_error, scheduler, failures=0)
+    finished = []
+
+    async def generate(generator, task_id):
+        with scheduler.per_attempt(task_id, task_id):
+            await generator.generate_image_async("prompt")
+        finished.append(task_id)
+
+    async def run():
+        await asyncio.gather(generate(throttled, "throttled"), generate(other, "other"))
+
+    asyncio.run(run())
+    # 被限流的请求等待令牌时，唯一的槽位留给了另一个任务
+    assert finished == ["other", "throttled"]
@@ -0,0 +1,261 @@
+"""
+历史记录写前日志测试
+
+覆盖组提交、提交窗口、跨实例文件锁、重放与截断，以及扫描没有关联记录的任务目录。
+"""
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from backend.services.history_journal import HistoryJournal, JournalEntry
+
+
+class Materialized:
+    """记录每批落盘的修改"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.batches = []
+        self.records = {}
+
+    def __call__(self, entries):
+        time.sleep(self.delay)
+        self.batches.append(list(entries))
+        for entry in entries:
+            if entry.op == "put":
+                self.records[entry.record_id] = entry.record
+            else:
+                self.records.pop(entry.record_id, None)
+
+
+@pytest.fixture
+def journal_dir(temp_history_dir):
+    return os.path.join(temp_history_dir, ".journal")
+
+
+def test_transaction_materializes_and_reads_pending(journal_dir):
+    materialized = Materialized()
+    journal = HistoryJournal(journal_dir, materialized)
+
+    with journal.transaction() as txn:
+        txn.put("a", {"id": "a", "status": "draft"})
+        # 同一事务内能读到尚未落盘的修改
+        assert txn.read("a", lambda record_id: None) == {"id": "a", "status": "draft"}
+
+    assert materialized.records == {"a": {"id": "a", "status": "draft"}}
+
+    with journal.transaction() as txn:
+        txn.delete("a")
+    assert materialized.records == {}
+    journal.close()
+
+
+def test_group_commit_batches_concurrent_transactions(journal_dir):
+    # 落盘较慢时，等待中的事务应在下一次 fsync 中一起提交
+    materialized = Materialized(delay=0.02)
+    journal = HistoryJournal(journal_dir, materialized)
+    thread_count = 16
+    start = threading.Barrier(thread_count)
+
+    def run(n):
+        start.wait()
+        with journal.transaction() as txn:
+            txn.put(f"r{n}", {"id": f"r{n}"})
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert set(materialized.records) == {f"r{n}" for n in range(thread_count)}
+    assert journal.transactions == thread_count
+    assert journal.flushes < thread_count
+    journal.close()
+
+
+def test_commit_window_batches_sequential_fsyncs(journal_dir):
+    materialized = Materialized()
+    journal = HistoryJournal(journal_dir, materialized, commit_delay=0.2)
+
+    # 同一线程顺序提交的状态更新：每次都立即落盘，日志只在窗口结束时 fsync 一次
+    for n in range(20):
+        with journal.transaction() as txn:
+            txn.put("a", {"id": "a", "progress": n})
+        assert materialized.records["a"]["progress"] == n
+    assert journal.syncs == 0
+
+    time.sleep(0.5)
+    assert journal.syncs == 1
+
+    # 关闭时提交窗口内尚未 fsync 的日志
+    with journal.transaction() as txn:
+        txn.put("a", {"id": "a", "progress": 20})
+    journal.close()
+    assert journal.syncs == 2
+
+
+def test_no_commit_window_fsyncs_every_batch(journal_dir):
+    journal = HistoryJournal(journal_dir, Materialized(), commit_delay=0)
+    for n in range(5):
+        with journal.transaction() as txn:
+            txn.put("a", {"v": n})
+    assert journal.syncs == 5
+    journal.close()
+
+
+def test_same_record_is_materialized_once_per_batch(journal_dir):
+    materialized = Materialized()
+    journal = HistoryJournal(journal_dir, materialized)
+
+    # 直接追加两次修改后一起提交，落盘时只写最后一次
+    with journal._mutex:
+        journal._acquire_file_lock_locked()
+        journal._append_locked([JournalEntry("put", "a", {"v": 1})])
+        journal._acquire_file_lock_locked()
+        seq = journal._append_locked([JournalEntry("put", "a", {"v": 2})])
+    journal._flush(seq)
+
+    assert materialized.batches == [[JournalEntry("put", "a", {"v": 2})]]
+    journal.close()
+
+
+def test_file_lock_serializes_journal_instances(journal_dir):
+    # 两个实例各自打开锁文件，等同于两个进程
+    first = HistoryJournal(journal_dir, Materialized())
+    second = HistoryJournal(journal_dir, Materialized())
+    inside = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def hold():
+        with first.transaction() as txn:
+            inside.set()
+            release.wait(5)
+            order.append("first")
+            txn.put("a", {"id": "a"})
+
+    def wait_for_lock():
+        inside.wait(5)
+        with second.transaction() as txn:
+            order.append("second")
+            txn.put("b", {"id": "b"})
+
+    holder = threading.Thread(target=hold)
+    waiter = threading.Thread(target=wait_for_lock)
+    holder.start()
+    waiter.start()
+    inside.wait(5)
+    time.sleep(0.1)
+    # 第一个实例持有文件锁期间，第二个实例的事务不能开始
+    assert order == []
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+
+    assert order == ["first", "second"]
+    first.close()
+    second.close()
+
+
+def test_replay_recovers_and_truncates(journal_dir):
+    os.makedirs(journal_dir, exist_ok=True)
+    journal_path = os.path.join(journal_dir, "journal.log")
+    lines = [
+        {"ops": [{"op": "put", "id": "a", "record": {"v": 1}}]},
+        {"ops": [{"op": "put", "id": "a", "record": {"v": 2}}, {"op": "put", "id": "b", "record": {"v": 1}}]},
+        {"ops": [{"op": "delete", "id": "b", "record": None}]},
+    ]
+    with open(journal_path, "wb") as f:
+        for line in lines:
+            f.write(json.dumps(line).encode("utf-8") + b"\n")
+        # 崩溃时写了一半的事务
+        f.write(b'{"ops": [{"op": "put", "id": "c"')
+
+    materialized = Materialized()
+    journal = HistoryJournal(journal_dir, materialized)
+    replayed = journal.replay()
+
+    assert replayed == [JournalEntry("put", "a", {"v": 2}), JournalEntry("delete", "b", None)]
+    assert materialized.records == {"a": {"v": 2}}
+    assert os.path.getsize(journal_path) == 0
+
+    # 再次重放没有任何修改（幂等）
+    assert journal.replay() == []
+    journal.close()
+
+
+def test_failed_materialize_is_replayed(journal_dir):
+    def fail(entries):
+        raise OSError("disk full")
+
+    journal = HistoryJournal(journal_dir, fail)
+    with pytest.raises(OSError):
+        with journal.transaction() as txn:
+            txn.put("a", {"v": 1})
+    journal.close()
+
+    # 修改已写入日志，下次启动时恢复
+    materialized = Materialized()
+    recovered = HistoryJournal(journal_dir, materialized)
+    recovered.replay()
+    assert materialized.records == {"a": {"v": 1}}
+    recovered.close()
+
+
+def test_checkpoint_truncates_large_journal(journal_dir):
+    synced = []
+    journal = HistoryJournal(journal_dir, Materialized(), checkpoint_bytes=1, sync=lambda: synced.append(True))
+    with journal.transaction() as txn:
+        txn.put("a", {"v": 1})
+    # 截断前先把落盘过的文件刷到磁盘
+    assert synced == [True]
+    assert os.path.getsize(journal.journal_path) == 0
+    journal.close()
+
+
+def test_checkpoint_syncs_only_written_record_files(history_service, monkeypatch):
+    import backend.services.record_format as record_format
+
+    synced = []
+    monkeypatch.setattr(record_format, "fsync_paths", lambda paths: synced.extend(paths))
+    monkeypatch.setattr(os, "sync", lambda: pytest.fail("不应同步整个文件系统"))
+    history_service.journal.checkpoint_bytes = 1
+
+    record_id = history_service.create_record("记录", {"pages": []})
+
+    assert synced == [history_service.record_files.path_for(record_id)]
+    assert os.path.getsize(history_service.journal.journal_path) == 0
+    # 已同步的文件不会在下次检查点重复同步
+    history_service.record_files.sync()
+    assert synced == [history_service.record_files.path_for(record_id)]
+
+
+def test_scan_reports_orphan_tasks(history_service, temp_history_dir):
+    # 回归：没有关联记录的任务目录曾导致扫描失败
+    os.makedirs(os.path.join(temp_history_dir, "orphan_task"))
+    with open(os.path.join(temp_history_dir, "orphan_task", "0.png"), "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+
+    record_id = history_service.create_record("有记录的任务", {"pages": [{"index": 0}]}, task_id="owned_task")
+    os.makedirs(os.path.join(temp_history_dir, "owned_task"))
+    with open(os.path.join(temp_history_dir, "owned_task", "0.png"), "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+
+    result = history_service.scan_all_tasks()
+
+    assert result["success"], result
+    assert result["failed"] == 0
+    assert result["orphan_tasks"] == ["orphan_task"]
+    assert result["synced"] == 1
+    record = history_service.get_record(record_id)
+    assert record["status"] == "completed"
+    assert record["images"]["generated"] == ["0.png"]
+
+    # 未变化的目录再次扫描时跳过，孤立任务仍然报告
+    again = history_service.scan_all_tasks()
+    assert again["skipped"] == 2
+    assert again["orphan_tasks"] == ["orphan_task"]
@@ -0,0 +1,183 @@
+"""
+/api/images 缓存和批量接口测试
+
+生成事件和历史列表中带内容版本的图片地址应按不可变资源缓存，并支持 ETag 重新验证和 Range 请求。
+批量接口按请求顺序返回 multipart/mixed 部分，名称不合法的条目只返回 X-Status: 400。
+"""
+import os
+
+import pytest
+from PIL import Image
+
+from backend.routes import image_routes
+from backend.utils.image_digest import get_image_digest_store, versioned_image_url
+
+TASK_ID = "task_cache"
+
+
+def _png(path, color, size=(64, 64)):
+    Image.new("RGB", size, color).save(path, format="PNG")
+
+
+@pytest.fixture
+def history_root(monkeypatch, temp_history_dir):
+    monkeypatch.setattr(image_routes, "HISTORY_ROOT", temp_history_dir)
+    os.makedirs(os.path.join(temp_history_dir, TASK_ID))
+    return temp_history_dir
+
+
+def _image_path(history_root, filename):
+    return os.path.join(history_root, TASK_ID, filename)
+
+
+def test_versioned_thumbnail_url_is_immutable(client, history_root):
+    _png(_image_path(history_root, "0.png"), (200, 100, 50), size=(256, 256))
+    _png(_image_path(history_root, "thumb_0.png"), (200, 100, 50))
+
+    url = versioned_image_url(history_root, TASK_ID, "0.png")
+    response = client.get(url)
+
+    assert response.status_code == 200
+    with open(_image_path(history_root, "thumb_0.png"), "rb") as f:
+        assert response.data == f.read()
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "max-age=" in response.headers["Cache-Control"]
+
+    etag = response.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.data == response.data[:10]
+
+
+def test_version_follows_the_served_file(client, history_root):
+    _png(_image_path(history_root, "0.png"), (10, 20, 30), size=(256, 256))
+    before = versioned_image_url(history_root, TASK_ID, "0.png")
+
+    # 缩略图生成后，按原图计算的版本不再与返回的文件一致，退回为重新验证
+    _png(_image_path(history_root, "thumb_0.png"), (10, 20, 30))
+    after = versioned_image_url(history_root, TASK_ID, "0.png")
+    assert after != before
+    assert client.get(before).headers["Cache-Control"] == "no-cache"
+    assert "immutable" in client.get(after).headers["Cache-Control"]
+
+    # 原图地址按原图计算版本
+    original = versioned_image_url(history_root, TASK_ID, "0.png", thumbnail=False)
+    digest = get_image_digest_store().get(_image_path(history_root, "0.png"))
+    assert f"v={digest.sha256[:16]}" in original
+    assert "immutable" in client.get(original).headers["Cache-Control"]
+
+
+def test_unversioned_url_revalidates(client, history_root):
+    _png(_image_path(history_root, "0.png"), (1, 2, 3))
+
+    response = client.get(f"/api/images/{TASK_ID}/0.png")
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert client.get(
+        f"/api/images/{TASK_ID}/0.png", headers={"If-None-Match": response.headers["ETag"]}
+    ).status_code == 304
+
+
+def test_missing_image_has_no_version(client, history_root):
+    assert versioned_image_url(history_root, TASK_ID, "9.png") == f"/api/images/{TASK_ID}/9.png"
+    assert client.get(f"/api/images/{TASK_ID}/9.png").status_code == 404
+
+
+# ==================== 批量接口 ====================
+
+def _parse_multipart(response):
+    """按 Content-Length 拆分 multipart/mixed 响应，返回 [(头部, 内容)]"""
+    boundary = response.headers["Content-Type"].split("boundary=")[1].encode()
+    body = response.data
+    parts = []
+    pos = 0
+    while True:
+        assert body.startswith(b"--" + boundary, pos)
+        pos += len(boundary) + 2
+        if body.startswith(b"--", pos):
+            return parts
+        head_end = body.index(b"\r\n\r\n", pos)
+        headers = dict(
+            line.split(": ", 1) for line in body[pos + 2:head_end].decode("utf-8").split("\r\n")
+        )
+        pos = head_end + 4
+        size = int(headers["Content-Length"])
+        parts.append((headers, body[pos:pos + size]))
+        pos += size
+        assert body[pos:pos + 2] == b"\r\n"
+        pos += 2
+
+
+def test_batch_returns_parts_in_request_order(client, history_root):
+    _png(_image_path(history_root, "0.png"), (5, 5, 5), size=(256, 256))
+    _png(_image_path(history_root, "thumb_0.png"), (5, 5, 5))
+    _png(_image_path(history_root, "1.png"), (6, 6, 6))
+    cached = get_image_digest_store().get(_image_path(history_root, "1.png"))
+
+    response = client.post("/api/images/batch", json={"images": [
+        {"task_id": TASK_ID, "filename": "0.png"},
+        {"task_id": TASK_ID, "filename": "1.png", "etag": f'"{cached.etag}"'},
+        {"task_id": TASK_ID, "filename": "9.png"},
+        "0.png",
+    ]})
+
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-store"
+    assert int(response.headers["Content-Length"]) == len(response.data)
+    parts = _parse_multipart(response)
+    assert [headers["X-Status"] for headers, _ in parts] == ["200", "304", "404", "400"]
+
+    headers, content = parts[0]
+    # 缩略图已生成时返回缩略图
+    with open(_image_path(history_root, "thumb_0.png"), "rb") as f:
+        assert content == f.read()
+    assert headers["Content-Type"] == "image/png"
+    assert headers["Content-Location"] == f"/api/images/{TASK_ID}/0.png?thumbnail=true"
+
+    headers, content = parts[1]
+    assert headers["ETag"] == f'"{cached.etag}"'
+    assert content == b""
+    assert parts[2][0]["Content-Location"] == f"/api/images/{TASK_ID}/9.png?thumbnail=true"
+
+
+@pytest.mark.parametrize("thumbnail", [False, "false", "False", "0"])
+def test_batch_thumbnail_flag_parses_like_get_image(client, history_root, thumbnail):
+    _png(_image_path(history_root, "0.png"), (7, 7, 7), size=(256, 256))
+    _png(_image_path(history_root, "thumb_0.png"), (7, 7, 7))
+
+    response = client.post("/api/images/batch", json={
+        "images": [{"task_id": TASK_ID, "filename": "0.png"}],
+        "thumbnail": thumbnail,
+    })
+
+    (headers, content), = _parse_multipart(response)
+    with open(_image_path(history_root, "0.png"), "rb") as f:
+        assert content == f.read()
+    assert headers["Content-Location"].endswith("?thumbnail=false")
+
+
+@pytest.mark.parametrize("task_id, filename", [
+    ("..", "0.png"),
+    (TASK_ID, "../0.png"),
+    (TASK_ID, "..\\0.png"),
+    (TASK_ID, ".hidden"),
+    (TASK_ID, "0.png\r\nX-Injected: 1"),
+    (TASK_ID, "0.png\x00"),
+    ("", "0.png"),
+])
+def test_batch_rejects_unsafe_names(client, history_root, task_id, filename):
+    _png(_image_path(history_root, "0.png"), (8, 8, 8))
+
+    response = client.post("/api/images/batch", json={"images": [{"task_id": task_id, "filename": filename}]})
+
+    (headers, content), = _parse_multipart(response)
+    assert headers == {"X-Status": "400", "Content-Length": "0"}
+    assert "X-Injected" not in response.headers
+
+
+def test_batch_validates_request(client, history_root):
+    assert client.post("/api/images/batch", json={"images": []}).status_code == 400
+    assert client.post("/api/images/batch", data="not json").status_code == 400
+    too_many = [{"task_id": TASK_ID, "filename": "0.png"}] * (image_routes.MAX_BATCH_IMAGES + 1)
+    assert client.post("/api/images/batch", json={"images": too_many}).status_code == 400
@@ -0,0 +1,84 @@
+"""
+ImageService 并发隔离测试
+
+同一个 ImageService 实例同时执行多个任务时，每张图片都必须写入自己任务的目录。
+"""
+import os
+import threading
+
+from PIL import Image
+
+from backend.utils.image_digest import versioned_image_url
+
+TASK_COUNT = 50
+PAGES_PER_TASK = 4
+
+
+def _pages(task_id):
+    return [
+        {"index": i, "type": "cover" if i == 0 else "content", "content": f"{task_id}#{i}"}
+        for i in range(PAGES_PER_TASK)
+    ]
+
+
+def test_concurrent_tasks_write_to_own_directories(image_service, temp_history_dir):
+    task_ids = [f"task_{n:03d}" for n in range(TASK_COUNT)]
+    results = {}
+    errors = []
+    start = threading.Barrier(TASK_COUNT)
+
+    def run(task_id):
+        try:
+            start.wait()
+            results[task_id] = list(image_service.generate_images(_pages(task_id), task_id=task_id))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(task_id,)) for task_id in task_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+
+    assert not errors
+    assert set(results) == set(task_ids)
+
+    for task_id in task_ids:
+        finish = results[task_id][-1]
+        assert finish["event"] == "finish"
+        assert finish["data"]["success"], finish
+        assert finish["data"]["task_id"] == task_id
+
+        task_dir = os.path.join(temp_history_dir, task_id)
+        originals = sorted(
+            name for name in os.listdir(task_dir)
+            if name.endswith('.png') and not name.startswith('thumb_')
+        )
+        assert originals == [f"{i}.png" for i in range(PAGES_PER_TASK)]
+
+        for i in range(PAGES_PER_TASK):
+            with Image.open(os.path.join(task_dir, f"{i}.png")) as img:
+                assert img.text["prompt"].endswith(f"{task_id}#{i}")
+
+        # 事件中的图片地址也指向本任务
+        for event in results[task_id]:
+            if event["event"] in ("complete", "thumbnail_ready"):
+                assert event["data"]["image_url"].startswith(f"/api/images/{task_id}/")
+            # 缩略图事件给出与历史列表相同的缩略图地址，版本按缩略图内容计算
+            if event["event"] == "thumbnail_ready":
+                filename = f"{event['data']['index']}.png"
+                assert event["data"]["image_url"] == versioned_image_url(temp_history_dir, task_id, filename)
+                assert os.path.exists(os.path.join(task_dir, f"thumb_{filename}"))
+
+
+def test_retry_single_image_uses_task_directory(image_service, temp_history_dir):
+    for task_id in ("task_a", "task_b"):
+        list(image_service.generate_images(_pages(task_id), task_id=task_id))
+
+    result = image_service.retry_single_image("task_a", _pages("task_a")[2])
+    assert result["success"]
+
+    with Image.open(os.path.join(temp_history_dir, "task_a", "2.png")) as img:
+        assert img.text["prompt"].endswith("task_a#2")
+    with Image.open(os.path.join(temp_history_dir, "task_b", "2.png")) as img:
+        assert img.text["prompt"].endswith("task_b#2")
@@ -0,0 +1,80 @@
+"""
+历史记录游标分页测试
+"""
+import pytest
+
+from backend.utils.pagination import SortedEntries, decode_cursor, encode_cursor
+
+RECORD_COUNT = 7
+
+
+@pytest.fixture
+def record_ids(history_service):
+    """按创建顺序返回的记录ID"""
+    return [history_service.create_record(f"记录{n}", {"pages": []}) for n in range(RECORD_COUNT)]
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2025-01-01T00:00:00", "记录-1")
+    assert decode_cursor(cursor) == ("2025-01-01T00:00:00", "记录-1")
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", encode_cursor("x", "y")[:-3], "WzEsMl0"])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_cursor_pages_walk_all_records_newest_first(history_service, record_ids):
+    first = history_service.list_records(page_size=3)
+    assert first["total"] == RECORD_COUNT
+    assert first["total_pages"] == 3
+
+    seen = [record["id"] for record in first["records"]]
+    cursor = first["next_cursor"]
+    while cursor:
+        page = history_service.list_records(page_size=3, cursor=cursor)
+        # 游标页不统计总数
+        assert page["total"] is None
+        assert page["total_pages"] is None
+        seen.extend(record["id"] for record in page["records"])
+        cursor = page["next_cursor"]
+
+    assert seen == list(reversed(record_ids))
+
+
+def test_cursor_page_total_on_request(history_service, record_ids):
+    first = history_service.list_records(page_size=2)
+    page = history_service.list_records(page_size=2, cursor=first["next_cursor"], with_total=True)
+    assert page["total"] == RECORD_COUNT
+    assert page["total_pages"] == 4
+
+
+def test_cursor_is_stable_when_records_are_added(history_service, record_ids):
+    first = history_service.list_records(page_size=3)
+    # 翻页期间插入的新记录排在最前，不会让后续页重复或遗漏
+    history_service.create_record("新记录", {"pages": []})
+
+    second = history_service.list_records(page_size=3, cursor=first["next_cursor"])
+    assert [record["id"] for record in second["records"]] == list(reversed(record_ids))[3:6]
+
+
+def test_last_offset_page_has_no_next_cursor(history_service, record_ids):
+    last = history_service.list_records(page=3, page_size=3)
+    assert [record["id"] for record in last["records"]] == [record_ids[0]]
+    assert last["next_cursor"] is None
+
+
+def test_sorted_entries_page_after():
+    entries = SortedEntries(
+        {"id": f"r{n}", "created_at": f"2025-01-0{n}T00:00:00"} for n in range(1, 6)
+    )
+    page, next_cursor = entries.page_after(None, 2)
+    assert [entry["id"] for entry in page] == ["r5", "r4"]
+
+    page, next_cursor = entries.page_after(decode_cursor(next_cursor), 2)
+    assert [entry["id"] for entry in page] == ["r3", "r2"]
+
+    page, next_cursor = entries.page_after(decode_cursor(next_cursor), 2)
+    assert [entry["id"] for entry in page] == ["r1"]
+    assert next_cursor is None
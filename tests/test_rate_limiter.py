@@ -0,0 +1,181 @@
+"""
+令牌桶限流器测试
+
+覆盖服务商配置解析、多个桶原子取令牌、按时间补充令牌，以及多进程共享的 SQLite 后端。
+"""
+import asyncio
+import multiprocessing
+import threading
+import types
+
+import pytest
+
+from backend.utils import rate_limiter
+from backend.utils.rate_limiter import (
+    MemoryRateLimitBackend, ProviderRateLimits, RateLimiter, SQLiteRateLimitBackend
+)
+
+
+class FakeClock:
+    """可手动拨动的时钟，sleep 直接推进时间"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", types.SimpleNamespace(monotonic=clock, time=clock, sleep=clock.sleep))
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryRateLimitBackend()
+    return SQLiteRateLimitBackend(str(tmp_path / "rate_limit.db"))
+
+
+# ==================== 配置解析 ====================
+
+def test_rpm_and_ipm_buckets():
+    limits = ProviderRateLimits({"api_key": "k", "rpm": "60", "ipm": 12}, provider="p")
+    rpm, ipm = limits._limits(images=True)
+
+    # 默认容量为 10 秒的配额（至少 1 个令牌）
+    assert rpm[1:] == (10, 1.0)
+    assert ipm[1:] == (2, 0.2)
+    assert rpm[0].endswith(":rpm") and ipm[0].endswith(":ipm")
+    # 文本请求只受 rpm 限制
+    assert limits._limits(images=False) == [rpm]
+
+
+def test_burst_overrides_capacity():
+    limits = ProviderRateLimits({"rpm": 600, "rate_limit_burst": 3}, provider="p")
+    assert limits._limits(images=True)[0][1:] == (3.0, 10.0)
+
+
+@pytest.mark.parametrize("config", [{}, {"rpm": 0}, {"rpm": "abc", "ipm": None}, {"ipm": -5}])
+def test_missing_or_invalid_rates_disable_limiting(config):
+    limits = ProviderRateLimits(config, provider="p")
+    assert not limits.enabled
+    assert limits._limits(images=True) == []
+
+
+def test_buckets_are_keyed_by_provider_and_api_key():
+    def rpm_key(provider, api_key):
+        return ProviderRateLimits({"api_key": api_key, "rpm": 60}, provider=provider)._limits(False)[0][0]
+
+    assert rpm_key("p", "k1") == rpm_key("p", "k1")
+    assert rpm_key("p", "k1") != rpm_key("p", "k2")
+    assert rpm_key("p", "k1") != rpm_key("q", "k1")
+    # Key 本身不出现在桶的键中
+    assert "k1" not in rpm_key("p", "k1")
+
+
+# ==================== 令牌桶 ====================
+
+def test_refill_over_time(backend, clock):
+    limits = [("rpm", 2, 1.0)]
+    assert backend.take(limits) == 0
+    assert backend.take(limits) == 0
+    assert backend.take(limits) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert backend.take(limits) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert backend.take(limits) == 0
+
+    # 补充不超过容量
+    clock.now += 60
+    assert [backend.take(limits) for _ in range(3)] == [0, 0, pytest.approx(1.0)]
+
+
+def test_multi_bucket_take_is_atomic(backend, clock):
+    rpm = ("rpm", 5, 1.0)
+    ipm = ("ipm", 1, 0.1)
+    assert backend.take([rpm, ipm]) == 0
+
+    # ipm 不足：返回 ipm 的等待时间，rpm 不被扣减
+    for _ in range(3):
+        assert backend.take([rpm, ipm]) == pytest.approx(10.0)
+    assert [backend.take([rpm]) for _ in range(5)] == [0, 0, 0, 0, pytest.approx(1.0)]
+
+
+def test_acquire_waits_for_the_slowest_bucket(clock):
+    limiter = RateLimiter(MemoryRateLimitBackend())
+    limits = [("rpm", 10, 1.0), ("ipm", 1, 0.5)]
+
+    limiter.acquire(limits)
+    limiter.acquire(limits)
+
+    # 只等待一次 ipm 补充所需的 2 秒，等待期间没有消耗 rpm
+    assert clock.sleeps == [2.0]
+    assert limiter.backend.take([("rpm", 10, 1.0)]) == 0
+
+
+def test_long_waits_are_split(clock):
+    limiter = RateLimiter(MemoryRateLimitBackend())
+    limits = [("ipm", 1, 0.1)]
+    limiter.acquire(limits)
+    limiter.acquire(limits)
+    assert clock.sleeps == [RateLimiter.MAX_SINGLE_WAIT, RateLimiter.MAX_SINGLE_WAIT]
+
+
+def test_blocking_backend_is_taken_off_the_event_loop(tmp_path):
+    assert not MemoryRateLimitBackend.blocking
+    assert SQLiteRateLimitBackend.blocking
+
+    backend = SQLiteRateLimitBackend(str(tmp_path / "rate_limit.db"))
+    threads = []
+    take = backend.take
+
+    def recording_take(limits, cost=1):
+        threads.append(threading.current_thread())
+        return take(limits, cost)
+
+    backend.take = recording_take
+
+    async def run():
+        await RateLimiter(backend).acquire_async([("rpm", 1, 100.0)])
+        await RateLimiter(backend).acquire_async([("rpm", 1, 100.0)])
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) >= 2
+    assert loop_thread not in threads
+
+
+# ==================== 多进程共享 ====================
+
+def _take_in_child(db_path: str, count: int, results):
+    backend = SQLiteRateLimitBackend(db_path)
+    results.put([backend.take([("shared", 5, 0.001)]) for _ in range(count)])
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="需要 fork")
+def test_sqlite_backend_is_shared_across_processes(tmp_path):
+    db_path = str(tmp_path / "rate_limit.db")
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+
+    child = context.Process(target=_take_in_child, args=(db_path, 3, results))
+    child.start()
+    child_waits = results.get(timeout=30)
+    child.join(30)
+
+    assert child_waits == [0, 0, 0]
+    # 子进程取走 3 个令牌后，本进程只剩 2 个
+    backend = SQLiteRateLimitBackend(db_path)
+    waits = [backend.take([("shared", 5, 0.001)]) for _ in range(3)]
+    assert waits[:2] == [0, 0]
+    assert waits[2] > 0
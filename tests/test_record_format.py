@@ -0,0 +1,133 @@
+"""
+历史记录文件格式测试
+
+覆盖各格式的编码往返、切换格式后读取旧文件、读缓存在文件被其他实例改写后失效，以及记录迁移。
+"""
+import os
+
+import pytest
+
+from backend.services.record_format import (
+    RECORD_FORMATS, RecordFiles, decode_record, encode_record, record_format_of
+)
+
+RECORD = {
+    "id": "rec-001",
+    "title": "秋季穿搭指南 / autumn",
+    "outline": {"raw": "大纲\n第二行", "pages": [{"index": 0, "type": "cover", "content": "封面"}]},
+    "images": {"task_id": "task_1", "generated": ["0.png", None]},
+    "status": "completed",
+    "thumbnail": None,
+    "count": 3,
+    "ratio": 0.5,
+    "ok": True,
+}
+
+
+def _require(format_name: str):
+    package = {"zstd": "zstandard", "msgpack": "msgpack"}.get(format_name)
+    if package:
+        pytest.importorskip(package)
+
+
+# ==================== 编码 ====================
+
+@pytest.mark.parametrize("format_name", RECORD_FORMATS)
+def test_encode_round_trip(format_name):
+    _require(format_name)
+    data = encode_record(RECORD, format_name)
+    assert record_format_of(data) == format_name
+    assert decode_record(data) == RECORD
+
+
+@pytest.mark.parametrize("format_name", RECORD_FORMATS)
+def test_record_files_round_trip(tmp_path, format_name):
+    _require(format_name)
+    files = RecordFiles(str(tmp_path), format_name)
+    files.write("rec-001", RECORD)
+
+    expected_name = "rec-001.json" if format_name == "json" else "rec-001.rec"
+    assert os.listdir(tmp_path) == [expected_name]
+    assert not files.needs_migration("rec-001")
+
+    # 新实例（无缓存）按文件头解码
+    assert RecordFiles(str(tmp_path), format_name, cache_size=0).read("rec-001") == RECORD
+
+
+def test_other_format_is_read_and_replaced_on_write(tmp_path):
+    RecordFiles(str(tmp_path), "json").write("rec-001", RECORD)
+    files = RecordFiles(str(tmp_path), "zlib")
+
+    assert files.needs_migration("rec-001")
+    assert files.read("rec-001") == RECORD
+
+    files.write("rec-001", {**RECORD, "status": "partial"})
+    assert os.listdir(tmp_path) == ["rec-001.rec"]
+    assert RecordFiles(str(tmp_path), "json").read("rec-001")["status"] == "partial"
+
+
+def test_unsupported_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        RecordFiles(str(tmp_path), "yaml")
+
+
+# ==================== 读缓存 ====================
+
+def test_cache_returns_copies(tmp_path):
+    files = RecordFiles(str(tmp_path), "compact")
+    files.write("rec-001", RECORD)
+
+    first = files.read("rec-001")
+    first["outline"]["pages"].clear()
+    assert files.read("rec-001") == RECORD
+    assert files.get_cache_stats()["hits"] == 2
+
+
+def test_cache_is_invalidated_when_file_is_rewritten(tmp_path):
+    reader = RecordFiles(str(tmp_path), "zlib")
+    writer = RecordFiles(str(tmp_path), "zlib")
+    writer.write("rec-001", RECORD)
+    assert reader.read("rec-001") == RECORD
+
+    # 其他实例（或进程）改写文件后，缓存签名不再匹配
+    writer.write("rec-001", {**RECORD, "title": "新标题"})
+    assert reader.read("rec-001")["title"] == "新标题"
+    assert reader.get_cache_stats()["stale"] == 1
+
+    writer.delete("rec-001")
+    assert reader.read("rec-001") is None
+    assert reader.get_cache_stats()["entries"] == 0
+
+
+def test_sharded_paths(tmp_path):
+    files = RecordFiles(str(tmp_path), "json", shard_chars=2)
+    files.write("abcdef", RECORD)
+    assert os.path.exists(tmp_path / "ab" / "abcdef.json")
+    assert files.read("abcdef") == RECORD
+
+
+# ==================== 迁移 ====================
+
+def test_migrate_records(history_service):
+    record_ids = [history_service.create_record(f"记录{n}", {"pages": [{"index": n}]}) for n in range(5)]
+    before = {record_id: history_service.get_record(record_id) for record_id in record_ids}
+
+    history_service.record_files = RecordFiles(history_service.history_dir, "zlib")
+    progress = []
+    result = history_service.migrate_record_format(batch_size=2, progress=lambda stats: progress.append(dict(stats)))
+
+    assert result["success"]
+    assert result["format"] == "zlib"
+    assert result["migrated"] == 5
+    assert result["skipped"] == 0
+    assert result["bytes_after"] < result["bytes_before"]
+    assert [stats["migrated"] for stats in progress] == [2, 4]
+
+    reader = RecordFiles(history_service.history_dir, "json", cache_size=0)
+    for record_id in record_ids:
+        assert not history_service.record_files.needs_migration(record_id)
+        assert not os.path.exists(os.path.join(history_service.history_dir, f"{record_id}.json"))
+        assert reader.read(record_id) == before[record_id]
+
+    # 再次迁移时全部跳过
+    assert history_service.migrate_record_format()["skipped"] == 5
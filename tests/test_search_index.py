@@ -0,0 +1,137 @@
+"""
+历史记录全文检索测试（中文 bigram 切词，SQLite FTS5 与内存倒排索引两种实现）
+"""
+import pytest
+
+from backend.services.history_index import JsonHistoryIndex, SqliteHistoryIndex
+from backend.services.search_index import InvertedIndex, parse_query, tokenize
+
+
+def _outline(*contents):
+    return {"pages": [{"index": i, "content": content} for i, content in enumerate(contents)]}
+
+
+@pytest.fixture
+def records(history_service):
+    """{名称: 记录ID}"""
+    return {
+        "autumn": history_service.create_record("秋季穿搭指南", _outline("基础款搭配", "一周不重样")),
+        "skincare": history_service.create_record("冬日护肤", _outline("保湿面霜测评", "秋冬换季护肤步骤")),
+        "coffee": history_service.create_record("咖啡探店 Vlog", _outline("上海 Specialty Coffee 合集")),
+    }
+
+
+def _search_ids(history_service, keyword):
+    return [record["id"] for record in history_service.search_records(keyword)["records"]]
+
+
+def test_tokenize_cjk_bigrams_and_words():
+    assert tokenize("秋季穿搭") == ["秋季", "季穿", "穿搭", "搭"]
+    assert tokenize("Ｖｌｏｇ 咖啡") == ["vlog", "咖啡", "啡"]
+
+
+def test_parse_query_prefix_terms():
+    terms = parse_query("穿搭 co 秋")
+    assert [(term.tokens, term.prefix) for term in terms] == [
+        (("穿搭",), False), (("co",), True), (("秋",), True)
+    ]
+
+
+def test_chinese_substring_matches(history_service, records):
+    assert _search_ids(history_service, "穿搭") == [records["autumn"]]
+    # 跨越 bigram 边界的子串
+    assert _search_ids(history_service, "季穿搭指") == [records["autumn"]]
+    # 大纲正文也参与检索
+    assert _search_ids(history_service, "面霜") == [records["skincare"]]
+
+
+def test_bigrams_must_be_adjacent(history_service, records):
+    # 「穿搭」（标题）和「搭配」（正文）都在秋季穿搭中，但「穿搭配」不是其中的子串
+    assert _search_ids(history_service, "穿搭配") == []
+
+
+def test_single_character_prefix_match(history_service, records):
+    assert set(_search_ids(history_service, "秋")) == {records["autumn"], records["skincare"]}
+
+
+def test_title_hits_rank_higher(history_service, records):
+    # 「秋」在秋季穿搭的标题中，在冬日护肤的正文中
+    assert _search_ids(history_service, "秋") == [records["autumn"], records["skincare"]]
+
+
+def test_mixed_terms_are_and_combined(history_service, records):
+    assert _search_ids(history_service, "咖啡 coffee") == [records["coffee"]]
+    assert _search_ids(history_service, "咖啡 护肤") == []
+    # 全角和大小写统一
+    assert _search_ids(history_service, "ＣＯＦＦＥＥ") == [records["coffee"]]
+
+
+def test_search_reflects_updates_and_deletes(history_service, records):
+    history_service.update_record(records["coffee"], outline=_outline("北京胡同咖啡馆"))
+    assert _search_ids(history_service, "胡同") == [records["coffee"]]
+    assert _search_ids(history_service, "specialty") == []
+
+    history_service.delete_record(records["coffee"])
+    assert _search_ids(history_service, "胡同") == []
+
+
+def test_inverted_index_remove():
+    index = InvertedIndex()
+    index.add("a", "秋季穿搭", "")
+    index.add("b", "穿搭合集", "")
+    assert {doc_id for doc_id, _ in index.search("穿搭")} == {"a", "b"}
+
+    index.remove("a")
+    assert [doc_id for doc_id, _ in index.search("穿搭")] == ["b"]
+    assert len(index) == 1
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def index(request, tmp_path):
+    if request.param == "sqlite":
+        index = SqliteHistoryIndex(str(tmp_path / "index.db"))
+    else:
+        index = JsonHistoryIndex(str(tmp_path / "index.json"))
+    yield index
+    index.close()
+
+
+def _add(index, record_id, title, content):
+    index.add({
+        "id": record_id, "title": title, "created_at": f"2025-01-01T00:00:{record_id}",
+        "updated_at": "", "status": "draft", "thumbnail": None, "page_count": 1, "task_id": None
+    })
+    index.index_documents([(record_id, title, content)])
+
+
+def test_ranking_covers_all_hits(index):
+    # 最早的记录标题命中，之后 300 条只有正文命中
+    _add(index, "000", "秋季穿搭", "")
+    for n in range(1, 301):
+        _add(index, f"{n:03d}", f"记录{n}", "秋季穿搭")
+
+    total, hits = index.search_documents("穿搭", offset=0, limit=5)
+    assert total == 301
+    assert hits[0]["id"] == "000"
+    if isinstance(index, SqliteHistoryIndex):
+        # 正文命中得分相同，新记录在前
+        assert [hit["id"] for hit in hits[1:]] == ["300", "299", "298", "297"]
+
+    # 翻页不重复、不遗漏
+    seen = []
+    for offset in range(0, 301, 50):
+        seen.extend(hit["id"] for hit in index.search_documents("穿搭", offset=offset, limit=50)[1])
+    assert len(seen) == len(set(seen)) == 301
+
+
+def test_sqlite_remove_deletes_document_mapping(tmp_path):
+    index = SqliteHistoryIndex(str(tmp_path / "index.db"))
+    _add(index, "001", "秋季穿搭", "基础款")
+    _add(index, "002", "冬日护肤", "")
+    assert index.remove("001")
+
+    conn = index._conn()
+    assert [row[0] for row in conn.execute("SELECT record_id FROM history_fts_docs")] == ["002"]
+    assert conn.execute("SELECT COUNT(*) FROM history_fts").fetchone()[0] == 1
+    assert index.search_documents("穿搭") == (0, [])
+    index.close()
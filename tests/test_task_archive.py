@@ -0,0 +1,151 @@
+"""
+任务归档测试
+
+记录完成后在后台预生成 ZIP 归档；下载时指纹匹配的归档走 send_file（ETag / 304），
+否则退回流式打包。图片被重新生成后旧归档失效。
+"""
+import io
+import os
+import zipfile
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from backend.routes import history_routes
+from backend.services.task_archive import ARCHIVE_DIR, TaskArchives
+
+TASK_ID = "task_archive"
+
+
+def _png(path, color):
+    Image.new("RGB", (32, 32), color).save(path, format="PNG")
+
+
+@pytest.fixture
+def task_dir(temp_history_dir):
+    task_dir = os.path.join(temp_history_dir, TASK_ID)
+    os.makedirs(task_dir)
+    for i in range(3):
+        _png(os.path.join(task_dir, f"{i}.png"), (i * 40, 10, 10))
+    # 缩略图不进入归档
+    _png(os.path.join(task_dir, "thumb_0.png"), (0, 0, 0))
+    return task_dir
+
+
+def _archives_in(task_dir):
+    try:
+        return os.listdir(os.path.join(task_dir, ARCHIVE_DIR))
+    except FileNotFoundError:
+        return []
+
+
+# ==================== 生成与失效 ====================
+
+def test_archive_is_built_after_completion(history_service, task_dir):
+    history_service.archives = TaskArchives(prebuild=True)
+    record_id = history_service.create_record("归档", {"pages": []}, task_id=TASK_ID)
+
+    history_service.update_record(record_id, status="generating")
+    assert history_service.archives._executor is None
+
+    history_service.update_record(record_id, status="completed")
+    history_service.archives._executor.shutdown(wait=True)
+
+    path, entries, fingerprint = history_service.archives.find(task_dir)
+    assert path is not None
+    assert _archives_in(task_dir) == [f"{fingerprint}.zip"]
+    assert history_service.archives.get_stats()["built"] == 1
+    with zipfile.ZipFile(path) as archive:
+        assert archive.namelist() == ["page_1.png", "page_2.png", "page_3.png"]
+        with open(os.path.join(task_dir, "1.png"), "rb") as f:
+            assert archive.read("page_2.png") == f.read()
+
+
+def test_build_replaces_stale_archives(task_dir):
+    archives = TaskArchives(prebuild=False)
+    first = archives.build(task_dir)
+    assert archives.build(task_dir) == first
+
+    _png(os.path.join(task_dir, "2.png"), (255, 255, 255))
+    assert archives.find(task_dir)[0] is None
+    second = archives.build(task_dir)
+    assert second != first
+    assert _archives_in(task_dir) == [os.path.basename(second)]
+
+
+def test_retry_invalidates_archive(image_service, temp_history_dir):
+    pages = [{"index": i, "type": "content", "content": f"第{i}页"} for i in range(2)]
+    list(image_service.generate_images(pages, task_id=TASK_ID))
+    image_service.archives = TaskArchives(prebuild=False)
+    task_dir = os.path.join(temp_history_dir, TASK_ID)
+    assert image_service.archives.build(task_dir) is not None
+
+    assert image_service.retry_single_image(TASK_ID, pages[1])["success"]
+
+    assert _archives_in(task_dir) == []
+    assert image_service.archives.find(task_dir)[0] is None
+
+
+# ==================== 下载 ====================
+
+@pytest.fixture
+def download(history_service, monkeypatch):
+    # history_routes 的蓝图不在 create_app 中注册，单独挂载
+    app = Flask(__name__)
+    app.register_blueprint(history_routes.create_history_blueprint(), url_prefix="/api")
+    client = app.test_client()
+    archives = TaskArchives(prebuild=False)
+    history_service.archives = archives
+    monkeypatch.setattr(history_routes, "get_history_service", lambda: history_service)
+    monkeypatch.setattr(history_routes, "get_task_archives", lambda: archives)
+    record_id = history_service.create_record("下载测试", {"pages": []}, task_id=TASK_ID)
+
+    def download(**headers):
+        return client.get(f"/api/history/{record_id}/download", headers=headers)
+
+    download.archives = archives
+    return download
+
+
+def _zip_names(data: bytes):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        return archive.namelist()
+
+
+def test_download_streams_without_prebuilt_archive(download, task_dir):
+    response = download()
+
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.headers["X-Accel-Buffering"] == "no"
+    assert int(response.headers["Content-Length"]) == len(response.data)
+    assert _zip_names(response.data) == ["page_1.png", "page_2.png", "page_3.png"]
+
+
+def test_download_sends_prebuilt_archive_with_etag(download, task_dir):
+    path = download.archives.build(task_dir)
+    fingerprint = os.path.splitext(os.path.basename(path))[0]
+
+    response = download()
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{fingerprint}"'
+    with open(path, "rb") as f:
+        assert response.data == f.read()
+
+    assert download(**{"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert download(**{"Range": "bytes=0-3"}).data == b"PK\x03\x04"
+
+
+def test_download_falls_back_to_streaming_after_regeneration(download, task_dir):
+    download.archives.build(task_dir)
+    etag = download().headers["ETag"]
+
+    # 图片被替换后指纹不再匹配：不返回 304，改为流式打包当前图片
+    _png(os.path.join(task_dir, "0.png"), (1, 2, 3))
+    response = download(**{"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        with open(os.path.join(task_dir, "0.png"), "rb") as f:
+            assert archive.read("page_1.png") == f.read()
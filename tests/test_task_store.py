@@ -0,0 +1,171 @@
+"""
+任务状态存储测试
+
+覆盖 LRU / TTL / 内存预算淘汰、落盘后按需加载，以及淘汰后的任务仍能用原上下文重试。
+"""
+import os
+
+import pytest
+
+from backend.services import task_store
+from backend.services.task_store import SPILL_DIRNAME, SPILL_STATE_FILE, TaskStateStore
+
+
+class FakeMonotonic:
+    """可手动拨动的单调时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeMonotonic()
+    monkeypatch.setattr(task_store.time, "monotonic", clock)
+    return clock
+
+
+def _state(content: str = "内容", user_images=None, cover_image=None):
+    return {
+        "pages": [{"index": 0, "type": "cover", "content": content}],
+        "generated": {},
+        "failed": {},
+        "cover_image": cover_image,
+        "full_outline": f"大纲:{content}",
+        "user_images": user_images,
+        "user_topic": f"主题:{content}",
+    }
+
+
+def _spilled(root_dir: str, task_id: str) -> bool:
+    return os.path.exists(os.path.join(root_dir, task_id, SPILL_DIRNAME, SPILL_STATE_FILE))
+
+
+def _in_memory(store: TaskStateStore, task_id: str) -> bool:
+    return task_id in store._entries
+
+
+# ==================== 淘汰 ====================
+
+def test_lru_evicts_least_recently_used(tmp_path, clock):
+    store = TaskStateStore(str(tmp_path), max_entries=2)
+    store.put("a", _state("a"))
+    store.put("b", _state("b"))
+    # 访问 a 后，b 成为最久未访问的任务
+    store.get("a")
+    store.put("c", _state("c"))
+
+    assert _in_memory(store, "a") and _in_memory(store, "c")
+    assert not _in_memory(store, "b")
+    assert _spilled(str(tmp_path), "b")
+    assert store.get_stats()["entries"] == 2
+    assert store.get_stats()["spilled"] == 1
+
+
+def test_ttl_evicts_idle_tasks(tmp_path, clock):
+    store = TaskStateStore(str(tmp_path), ttl_seconds=60)
+    store.put("old", _state("old"))
+    clock.now += 30
+    store.put("recent", _state("recent"))
+
+    clock.now += 40
+    store.get("recent")
+
+    assert not _in_memory(store, "old")
+    assert _spilled(str(tmp_path), "old")
+    assert _in_memory(store, "recent")
+
+
+def test_memory_budget_evicts_large_states(tmp_path, clock):
+    image = b"\x00" * 10_000
+    store = TaskStateStore(str(tmp_path), memory_budget=25_000)
+    store.put("a", _state("a", user_images=[image]))
+    store.put("b", _state("b", user_images=[image]))
+    assert store.get_stats()["entries"] == 2
+
+    # 设置封面后超出预算，淘汰最久未访问的 a
+    store.set_cover_image("b", image)
+    assert not _in_memory(store, "a")
+    assert _in_memory(store, "b")
+    assert store.get_stats()["memory_bytes"] <= 25_000
+
+
+def test_most_recent_task_is_kept_over_budget(tmp_path, clock):
+    store = TaskStateStore(str(tmp_path), memory_budget=1)
+    store.put("a", _state("a"))
+    assert _in_memory(store, "a")
+
+
+# ==================== 落盘与加载 ====================
+
+def test_spilled_state_is_rehydrated(tmp_path, clock):
+    store = TaskStateStore(str(tmp_path), max_entries=1)
+    store.put("a", _state("a", user_images=[b"u0", b"u1"], cover_image=b"cover"))
+    store.record_generated("a", 0, "0.png")
+    store.record_failed("a", 2, "超时")
+    store.put("b", _state("b"))
+    assert not _in_memory(store, "a")
+
+    state = store.get("a")
+    assert state["cover_image"] == b"cover"
+    assert state["user_images"] == [b"u0", b"u1"]
+    # 页面索引恢复为整数
+    assert state["generated"] == {0: "0.png"}
+    assert state["failed"] == {2: "超时"}
+    assert state["full_outline"] == "大纲:a"
+    assert store.get_stats()["rehydrated"] == 1
+    # 加载 a 后 b 被淘汰
+    assert _in_memory(store, "a") and not _in_memory(store, "b")
+
+
+def test_none_user_images_survive_spill(tmp_path, clock):
+    store = TaskStateStore(str(tmp_path), max_entries=1)
+    store.put("a", _state("a"))
+    store.put("b", _state("b", user_images=[]))
+    store.put("c", _state("c"))
+
+    assert store.get("a")["user_images"] is None
+    assert store.get("b")["user_images"] == []
+
+
+def test_discard_removes_spilled_state(tmp_path, clock):
+    store = TaskStateStore(str(tmp_path), max_entries=1)
+    store.put("a", _state("a"))
+    store.put("b", _state("b"))
+    store.discard("a")
+
+    assert not _spilled(str(tmp_path), "a")
+    assert store.get("a") is None
+    assert "a" not in store
+
+
+def test_retry_uses_rehydrated_context(image_service, temp_history_dir, monkeypatch):
+    image_service._task_states = TaskStateStore(temp_history_dir, max_entries=1)
+    pages = [{"index": i, "type": "content", "content": f"第{i}页"} for i in range(2)]
+    list(image_service.generate_images(
+        pages, task_id="task_a", full_outline="完整大纲", user_images=[b"user"], user_topic="用户主题"
+    ))
+    list(image_service.generate_images(pages, task_id="task_b"))
+    assert not _in_memory(image_service._task_states, "task_a")
+    assert _spilled(temp_history_dir, "task_a")
+
+    calls = []
+    generate = image_service._generate_single_image
+
+    def recording_generate(page, task_id, reference_image=None, retry_count=0,
+                           full_outline="", user_images=None, user_topic=""):
+        calls.append((task_id, full_outline, user_images, user_topic))
+        return generate(page, task_id, reference_image, retry_count, full_outline, user_images, user_topic)
+
+    monkeypatch.setattr(image_service, "_generate_single_image", recording_generate)
+
+    result = image_service.retry_single_image("task_a", pages[1])
+    assert result["success"]
+    task_id, full_outline, user_images, user_topic = calls[0]
+    assert (task_id, full_outline, user_topic) == ("task_a", "完整大纲", "用户主题")
+    assert user_images == [b"user"]
+    # 重试结果记录到加载回内存的状态中
+    assert image_service._task_states.get("task_a")["generated"][1] == "1.png"
@@ -0,0 +1,110 @@
+"""
+流式 ZIP 写入测试
+"""
+import io
+import os
+import zipfile
+
+import pytest
+from PIL import Image
+
+from backend.utils.image_digest import ImageDigestStore
+from backend.utils.zip_stream import StreamingZip
+
+
+def _png(path, color):
+    Image.new("RGB", (32, 32), color).save(path, format="PNG")
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def digests():
+    return ImageDigestStore()
+
+
+def _build(entries, digests, chunk_size=1024):
+    archive = StreamingZip(entries, chunk_size=chunk_size, digests=digests)
+    return archive, b"".join(archive)
+
+
+def test_stored_images_have_known_length(temp_history_dir, digests):
+    paths = [os.path.join(temp_history_dir, f"{i}.png") for i in range(3)]
+    contents = [_png(path, (i * 80, 10, 10)) for i, path in enumerate(paths)]
+    entries = [(f"page_{i + 1}.png", path) for i, path in enumerate(paths)]
+
+    archive, data = _build(entries, digests)
+
+    assert archive.content_length == len(data)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["page_1.png", "page_2.png", "page_3.png"]
+        for info, content in zip(zf.infolist(), contents):
+            assert info.compress_type == zipfile.ZIP_STORED
+            assert zf.read(info) == content
+
+
+def test_other_files_are_deflated_with_unknown_length(temp_history_dir, digests):
+    image_path = os.path.join(temp_history_dir, "0.png")
+    image = _png(image_path, (0, 0, 0))
+    text_path = os.path.join(temp_history_dir, "outline.txt")
+    text = "秋季穿搭指南\n".encode("utf-8") * 500
+    with open(text_path, "wb") as f:
+        f.write(text)
+
+    archive, data = _build([("page_1.png", image_path), ("大纲.txt", text_path)], digests)
+
+    assert archive.content_length is None
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.getinfo("大纲.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.read("大纲.txt") == text
+        assert zf.read("page_1.png") == image
+    assert len(data) < len(text)
+
+
+def test_empty_archive(digests):
+    archive, data = _build([], digests)
+    assert archive.content_length == len(data)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.namelist() == []
+
+
+def test_truncated_file_raises(temp_history_dir, digests):
+    path = os.path.join(temp_history_dir, "0.png")
+    _png(path, (1, 2, 3))
+    archive = StreamingZip([("page_1.png", path)], chunk_size=16, digests=digests)
+    chunks = iter(archive)
+    next(chunks)  # 文件头
+
+    # 原地截断（不是替换）会被发现，而不是输出长度不符的归档
+    os.truncate(path, 8)
+    with pytest.raises(IOError):
+        list(chunks)
+    assert archive._members[0].file.closed
+
+
+def test_missing_file_fails_before_streaming(temp_history_dir, digests):
+    with pytest.raises(FileNotFoundError):
+        StreamingZip([("page_1.png", os.path.join(temp_history_dir, "missing.png"))], digests=digests)
+
+
+def test_file_replaced_after_open_keeps_consistent_crc(temp_history_dir, digests):
+    path = os.path.join(temp_history_dir, "0.png")
+    original = _png(path, (1, 2, 3))
+    replacement = os.path.join(temp_history_dir, "new.png")
+    _png(replacement, (200, 200, 200))
+    get = digests.get
+
+    def replacing_get(digest_path, stat=None):
+        # 文件打开后、查找摘要前被原子替换：按路径取得的是新文件的摘要
+        os.replace(replacement, digest_path)
+        return get(digest_path)
+
+    digests.get = replacing_get
+    archive, data = _build([("page_1.png", path)], digests)
+
+    assert archive.content_length == len(data)
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.read("page_1.png") == original